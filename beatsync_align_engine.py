@@ -0,0 +1,794 @@
+#!/usr/bin/env python3
+"""
+BeatSync 对齐计算引擎
+将逐偏移的相关性计算改为批量/向量化计算，供modular版本和V2版本的对齐模块复用
+"""
+
+import os
+import time
+import numpy as np
+from typing import Callable, Optional, Tuple
+
+
+# ==================== 并行打分 ====================
+
+# 全局CPU预算（环境变量）：对齐打分线程数 × 数值库线程数（OMP_NUM_THREADS）不超过该值，默认为CPU核数
+CPU_BUDGET_ENV = "BEATSYNC_CPU_BUDGET"
+# 批量网格每个任务的dance窗口行数：分块方式与线程数无关，结果与串行计算逐位一致
+GRID_TASK_ROWS = 64
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.environ.get(name, default)))
+    except ValueError:
+        return default
+
+
+def resolve_align_workers(workers: Optional[int]) -> int:
+    """
+    对齐打分的实际工作线程数
+
+    参数:
+        workers: 请求的线程数（None或1为串行，0为按CPU预算自动选择）
+
+    返回:
+        不超过 CPU预算 // 数值库线程数 的线程数（至少为1）
+    """
+    budget = _env_int(CPU_BUDGET_ENV, os.cpu_count() or 1)
+    limit = max(1, budget // _env_int("OMP_NUM_THREADS", 1))
+    if workers is None:
+        return 1
+    if workers <= 0:
+        return limit
+    return min(workers, limit)
+
+
+def parallel_map(func: Callable, items, workers: Optional[int] = 1) -> list:
+    """
+    按输入顺序返回 [func(item) ...]，workers > 1 时用线程池分摊
+
+    FFT与矩阵乘法在numpy内部释放GIL，线程池即可占满多核，且无需在进程间拷贝音频；
+    各任务的计算与划分方式无关，合并顺序固定，结果与串行一致。
+    """
+    items = list(items)
+    workers = min(resolve_align_workers(workers), len(items))
+    if workers <= 1:
+        return [func(item) for item in items]
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(func, items))
+
+
+def _fft_size(n: int) -> int:
+    """返回不小于n的2的幂（FFT长度）"""
+    return 1 << max(0, int(n - 1).bit_length())
+
+
+def sliding_window_sums(signal: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    计算每个起点处窗口内的和与平方和（累积和实现，O(n)）
+
+    参数:
+        signal: 一维信号
+        window: 窗口长度（采样点）
+
+    返回:
+        (窗口和, 窗口平方和)，长度均为 len(signal) - window + 1
+    """
+    x = np.asarray(signal, dtype=np.float64)
+    csum = np.concatenate(([0.0], np.cumsum(x)))
+    csq = np.concatenate(([0.0], np.cumsum(x * x)))
+    return csum[window:] - csum[:-window], csq[window:] - csq[:-window]
+
+
+def sliding_dot(signal: np.ndarray, template: np.ndarray) -> np.ndarray:
+    """
+    使用FFT计算模板在信号上每个起点处的点积
+
+    返回:
+        长度为 len(signal) - len(template) + 1 的数组，第k项为 sum(signal[k:k+w] * template)
+    """
+    x = np.asarray(signal, dtype=np.float64)
+    t = np.asarray(template, dtype=np.float64)
+    n, w = len(x), len(t)
+    nfft = _fft_size(n + w - 1)
+    spec = np.fft.rfft(x, nfft) * np.fft.rfft(t[::-1], nfft)
+    full = np.fft.irfft(spec, nfft)
+    return full[w - 1:n]
+
+
+def normalized_xcorr_curve(signal: np.ndarray, template: np.ndarray) -> np.ndarray:
+    """
+    一次性计算模板与信号所有起点窗口的皮尔逊相关系数（采样点分辨率）
+
+    与 calculate_original_correlation 逐点计算的结果一致：
+    分子为去均值后的点积，分母为两段去均值能量的几何平均；能量为0的窗口得分为0。
+
+    参数:
+        signal: 被搜索信号（如dance音频）
+        template: 固定模板（如bgm在某一起点的2秒窗口）
+
+    返回:
+        得分曲线，第k项为 signal[k:k+len(template)] 与 template 的相关系数
+    """
+    x = np.asarray(signal, dtype=np.float64)
+    t = np.asarray(template, dtype=np.float64)
+    w = len(t)
+    if w == 0 or len(x) < w:
+        return np.zeros(0, dtype=np.float64)
+
+    t_centered = t - t.mean()
+    t_energy = float(np.dot(t_centered, t_centered))
+    if t_energy == 0.0:
+        return np.zeros(len(x) - w + 1, dtype=np.float64)
+
+    # 模板已去均值，sum(t_centered)=0，因此窗口无需再去均值即可得到分子
+    numerator = sliding_dot(x, t_centered)
+    sums, sq_sums = sliding_window_sums(x, w)
+    x_energy = sq_sums - sums * sums / w
+
+    # 累积和相减存在舍入误差：低于误差量级的能量视为静音窗口（得分0）
+    energy_floor = np.finfo(np.float64).eps * 64.0 * float(np.dot(x, x))
+    valid = x_energy > energy_floor
+    scores = np.zeros_like(numerator)
+    scores[valid] = numerator[valid] / np.sqrt(x_energy[valid] * t_energy)
+    return np.clip(scores, -1.0, 1.0)
+
+
+def sliding_feature_correlation(features: np.ndarray, template: np.ndarray) -> np.ndarray:
+    """
+    在特征矩阵上沿时间轴滑动模板，计算每个帧起点处展平后的皮尔逊相关系数
+
+    等价于对每个帧起点 j 计算 corrcoef(features[:, j:j+F].flatten(), template.flatten())，
+    分子按特征维逐行FFT互相关后求和，分母由逐帧列和的累积和得到。
+
+    参数:
+        features: (D, T) 特征矩阵（整段音频只计算一次）
+        template: (D, F) 模板特征块
+
+    返回:
+        长度为 T - F + 1 的相关系数曲线，能量为0的窗口得分为0
+    """
+    x = np.asarray(features, dtype=np.float64)
+    t = np.asarray(template, dtype=np.float64)
+    if x.ndim == 1:
+        x = x[np.newaxis, :]
+        t = t[np.newaxis, :]
+    d, frames = t.shape
+    if frames == 0 or x.shape[0] != d or x.shape[1] < frames:
+        return np.zeros(0, dtype=np.float64)
+
+    t_centered = t - t.mean()
+    t_energy = float(np.sum(t_centered * t_centered))
+    n_offsets = x.shape[1] - frames + 1
+    if t_energy == 0.0:
+        return np.zeros(n_offsets, dtype=np.float64)
+
+    nfft = _fft_size(x.shape[1] + frames - 1)
+    spec = np.fft.rfft(x, nfft, axis=1) * np.fft.rfft(t_centered[:, ::-1], nfft, axis=1)
+    numerator = np.fft.irfft(spec.sum(axis=0), nfft)[frames - 1:x.shape[1]]
+
+    col_sums = np.concatenate(([0.0], np.cumsum(x.sum(axis=0))))
+    col_sq = np.concatenate(([0.0], np.cumsum((x * x).sum(axis=0))))
+    sums = col_sums[frames:] - col_sums[:-frames]
+    sq_sums = col_sq[frames:] - col_sq[:-frames]
+    x_energy = sq_sums - sums * sums / (d * frames)
+
+    energy_floor = np.finfo(np.float64).eps * 64.0 * float(col_sq[-1])
+    valid = x_energy > energy_floor
+    scores = np.zeros(n_offsets, dtype=np.float64)
+    scores[valid] = numerator[valid] / np.sqrt(x_energy[valid] * t_energy)
+    return np.clip(scores, -1.0, 1.0)
+
+
+def offset_scores(curve: np.ndarray, starts) -> np.ndarray:
+    """按起点采样得分曲线，越界起点得分为0（与逐点计算的越界处理一致）"""
+    starts = np.asarray(starts, dtype=np.int64)
+    scores = np.zeros(len(starts), dtype=np.float64)
+    valid = (starts >= 0) & (starts < len(curve))
+    scores[valid] = curve[starts[valid]]
+    return scores
+
+
+def _centered_windows(signal: np.ndarray, starts: np.ndarray, window: int, dtype) -> np.ndarray:
+    """按起点取出窗口（拷贝）并逐行去均值，返回 (len(starts), window) 矩阵"""
+    views = np.lib.stride_tricks.sliding_window_view(np.asarray(signal), window)
+    block = views[starts].astype(dtype)
+    block -= block.mean(axis=1, keepdims=True, dtype=np.float64).astype(dtype)
+    return block
+
+
+def _window_energies(signal: np.ndarray, starts: np.ndarray, window: int) -> np.ndarray:
+    """各起点窗口的去均值能量（低于舍入误差量级的视为0）"""
+    sums, sq_sums = sliding_window_sums(signal, window)
+    energy = sq_sums[starts] - sums[starts] ** 2 / window
+    x = np.asarray(signal, dtype=np.float64)
+    energy[energy <= np.finfo(np.float64).eps * 64.0 * float(np.dot(x, x))] = 0.0
+    return energy
+
+
+def pearson_grid(ref_audio: np.ndarray, mov_audio: np.ndarray, ref_starts, mov_starts,
+                 window: int, dtype=np.float32,
+                 max_block_bytes: int = 64 * 1024 * 1024,
+                 workers: Optional[int] = 1) -> np.ndarray:
+    """
+    批量计算 (dance起点 × bgm起点) 的皮尔逊相关系数矩阵
+
+    窗口矩阵去均值后按块做矩阵乘法（BLAS），替代逐对 np.corrcoef。
+    默认以float32计算用于筛选，需要精确值时配合 pearson_pairs 复核。
+
+    参数:
+        ref_audio / mov_audio: 单声道音频
+        ref_starts / mov_starts: 起点（采样点），所有窗口必须在信号范围内
+        window: 窗口长度（采样点）
+        dtype: 矩阵乘法的计算精度
+        max_block_bytes: 单个窗口块的内存上限
+        workers: 并行线程数（dance窗口按块分给各线程，见 parallel_map）
+
+    返回:
+        (len(ref_starts), len(mov_starts)) 得分矩阵，能量为0的窗口得分为0
+    """
+    ref_starts = np.asarray(ref_starts, dtype=np.int64)
+    mov_starts = np.asarray(mov_starts, dtype=np.int64)
+    grid = np.zeros((len(ref_starts), len(mov_starts)), dtype=np.float64)
+    if len(ref_starts) == 0 or len(mov_starts) == 0:
+        return grid
+
+    ref_energy = _window_energies(ref_audio, ref_starts, window)
+    mov_energy = _window_energies(mov_audio, mov_starts, window)
+    rows_per_block = max(1, int(max_block_bytes // (window * np.dtype(dtype).itemsize)))
+
+    # bgm窗口矩阵在内存允许时只构建一次（各线程共享），否则按块重复构建
+    mov_blocks = None
+    if len(mov_starts) <= rows_per_block:
+        mov_blocks = [(0, _centered_windows(mov_audio, mov_starts, window, dtype))]
+
+    def fill_rows(r0: int):
+        ref_block = _centered_windows(ref_audio, ref_starts[r0:r0 + rows_per_task], window, dtype)
+        blocks = mov_blocks if mov_blocks is not None else (
+            (m0, _centered_windows(mov_audio, mov_starts[m0:m0 + rows_per_block], window, dtype))
+            for m0 in range(0, len(mov_starts), rows_per_block)
+        )
+        for m0, mov_block in blocks:
+            grid[r0:r0 + len(ref_block), m0:m0 + len(mov_block)] = ref_block @ mov_block.T
+
+    # 各任务写入互不重叠的行
+    rows_per_task = min(rows_per_block, GRID_TASK_ROWS)
+    parallel_map(fill_rows, range(0, len(ref_starts), rows_per_task), workers)
+
+    denominator = np.sqrt(np.outer(ref_energy, mov_energy))
+    valid = denominator > 0
+    grid[valid] /= denominator[valid]
+    grid[~valid] = 0.0
+    return np.clip(grid, -1.0, 1.0)
+
+
+def pearson_pairs(ref_audio: np.ndarray, mov_audio: np.ndarray, ref_starts, mov_starts,
+                  window: int, chunk: int = 32, workers: Optional[int] = 1) -> np.ndarray:
+    """
+    精确计算（float64）若干 (dance起点, bgm起点) 对的皮尔逊相关系数
+
+    与 np.corrcoef 逐对计算一致：去均值能量为0时得分为0（对应corrcoef的nan）。
+    """
+    ref_starts = np.asarray(ref_starts, dtype=np.int64)
+    mov_starts = np.asarray(mov_starts, dtype=np.int64)
+    scores = np.zeros(len(ref_starts), dtype=np.float64)
+
+    def score_chunk(c0: int):
+        ref_block = _centered_windows(ref_audio, ref_starts[c0:c0 + chunk], window, np.float64)
+        mov_block = _centered_windows(mov_audio, mov_starts[c0:c0 + chunk], window, np.float64)
+        numerator = np.einsum('ij,ij->i', ref_block, mov_block)
+        denominator = np.sqrt(np.einsum('ij,ij->i', ref_block, ref_block) *
+                              np.einsum('ij,ij->i', mov_block, mov_block))
+        valid = denominator > 0
+        part = np.zeros(len(ref_block), dtype=np.float64)
+        part[valid] = numerator[valid] / denominator[valid]
+        scores[c0:c0 + chunk] = part
+
+    parallel_map(score_chunk, range(0, len(ref_starts), chunk), workers)
+    return scores
+
+
+def confident_best(lags, scores, threshold: float, margin: float, separation: int) -> bool:
+    """
+    提前结束判定：最高分不低于 threshold，且比次高分（相对偏移与最高分相差超过 separation 的候选）高出 margin
+
+    参数:
+        lags: 各候选的相对偏移（dance起点 - bgm起点，采样点）
+        scores: 各候选得分
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    lags = np.asarray(lags, dtype=np.int64)
+    if len(scores) == 0:
+        return False
+    best = int(np.argmax(scores))
+    if scores[best] < threshold:
+        return False
+    others = scores[np.abs(lags - lags[best]) > separation]
+    runner_up = max(0.0, float(others.max())) if len(others) > 0 else 0.0
+    return bool(scores[best] - runner_up >= margin)
+
+
+def best_grid_alignment(ref_audio: np.ndarray, mov_audio: np.ndarray, ref_starts, mov_starts,
+                        window: int, verify_tol: float = 1e-3,
+                        max_verify: int = 256, workers: Optional[int] = 1,
+                        exit_threshold: Optional[float] = None, exit_margin: float = 0.2,
+                        stats: Optional[dict] = None) -> Tuple[int, int, float]:
+    """
+    二维网格搜索的最佳对齐（与嵌套循环 + 严格大于比较的结果一致）
+
+    先用float32批量矩阵筛选，再对接近最大值的候选做float64精确复核；
+    得分相同的候选按 (dance起点, bgm起点) 的遍历顺序取第一个。
+
+    设置 exit_threshold 时按dance起点顺序逐块计算，已计算部分满足 confident_best
+    （次高分取相对偏移相差超过 window/8 的候选）即提前结束，结果为已计算部分中的最佳对齐。
+
+    参数:
+        exit_threshold / exit_margin: 提前结束的得分阈值与领先幅度（exit_threshold为None时不提前结束）
+        stats: 传入dict时写入 evaluated / skipped（计算与跳过的候选数）
+
+    返回:
+        (dance起点下标, bgm起点下标, 得分)，没有正得分时返回 (-1, -1, 0.0)
+    """
+    ref_starts = np.asarray(ref_starts, dtype=np.int64)
+    mov_starts = np.asarray(mov_starts, dtype=np.int64)
+    if exit_threshold is None:
+        grid = pearson_grid(ref_audio, mov_audio, ref_starts, mov_starts, window, workers=workers)
+    else:
+        # 每块行数为任务行数的整数倍，分块计算与整体计算的结果逐位一致
+        grid = np.zeros((len(ref_starts), len(mov_starts)), dtype=np.float64)
+        lags = ref_starts[:, None] - mov_starts[None, :]
+        step = GRID_TASK_ROWS * resolve_align_workers(workers)
+        rows = 0
+        for r0 in range(0, len(ref_starts), step):
+            grid[r0:r0 + step] = pearson_grid(ref_audio, mov_audio, ref_starts[r0:r0 + step], mov_starts,
+                                              window, workers=workers)
+            rows = min(len(ref_starts), r0 + step)
+            if confident_best(lags[:rows].ravel(), grid[:rows].ravel(), exit_threshold, exit_margin,
+                              window // 8):
+                break
+        grid = grid[:rows]
+    if stats is not None:
+        stats['evaluated'] = int(grid.size)
+        stats['skipped'] = len(ref_starts) * len(mov_starts) - int(grid.size)
+    if grid.size == 0 or grid.max() <= 0:
+        return -1, -1, 0.0
+
+    flat = grid.ravel()
+    candidates = np.flatnonzero(flat >= flat.max() - verify_tol)
+    if len(candidates) > max_verify:
+        candidates = candidates[np.argsort(-flat[candidates], kind='stable')[:max_verify]]
+    candidates = np.sort(candidates)  # 恢复遍历顺序
+    ri, mi = np.unravel_index(candidates, grid.shape)
+    exact = pearson_pairs(ref_audio, mov_audio, ref_starts[ri], mov_starts[mi], window, workers=workers)
+
+    best = int(np.argmax(exact))  # argmax返回第一个最大值，对应严格大于的更新规则
+    if exact[best] <= 0:
+        return -1, -1, 0.0
+    return int(ri[best]), int(mi[best]), float(exact[best])
+
+
+# ==================== 粗到细（多分辨率）搜索 ====================
+
+def envelope_decimation(sr: int, envelope_rate: float = 700.0) -> int:
+    """包络降采样倍数：使包络采样率约为 envelope_rate"""
+    return max(1, int(round(sr / envelope_rate)))
+
+
+def decimate_envelope(signal: np.ndarray, factor: int) -> np.ndarray:
+    """幅度包络降采样：|x| 按 factor 个采样点分块取平均"""
+    x = np.abs(np.asarray(signal, dtype=np.float64))
+    n = len(x) // factor * factor
+    return x[:n].reshape(-1, factor).mean(axis=1)
+
+
+def top_k_peaks(scores: np.ndarray, k: int, min_distance: int) -> np.ndarray:
+    """
+    选取得分最高的k个峰（非极大值抑制：峰之间至少间隔 min_distance）
+
+    返回:
+        峰所在下标（按得分从高到低）
+    """
+    scores = np.asarray(scores)
+    chosen = []
+    for idx in np.argsort(-scores, kind='stable'):
+        if all(abs(int(idx) - c) >= min_distance for c in chosen):
+            chosen.append(int(idx))
+            if len(chosen) >= k:
+                break
+    return np.asarray(chosen, dtype=np.int64)
+
+
+def refine_offset(signal: np.ndarray, template: np.ndarray, lo: int, hi: int) -> Tuple[int, float]:
+    """
+    在起点范围 [lo, hi] 内以采样点分辨率精确搜索模板的最佳起点
+
+    返回:
+        (最佳起点, 相关系数)；范围内没有有效窗口时返回 (lo, 0.0)
+    """
+    w = len(template)
+    lo = max(0, lo)
+    hi = min(hi, len(signal) - w)
+    if hi < lo:
+        return lo, 0.0
+    curve = normalized_xcorr_curve(signal[lo:hi + w], template)
+    best = int(np.argmax(curve))
+    return lo + best, float(curve[best])
+
+
+def coarse_to_fine_offsets(ref_audio: np.ndarray, template: np.ndarray, max_start: int, sr: int,
+                           topk: int = 5, refine_radius_sec: float = 0.5,
+                           workers: Optional[int] = 1) -> list:
+    """
+    一维粗到细搜索：固定模板（bgm窗口）在dance上的最佳起点
+
+    1. 在降采样幅度包络上做归一化互相关（粗扫）
+    2. 保留Top-K候选（间隔至少一个细化半径）
+    3. 每个候选在原始采样率下于细化半径内精确搜索
+
+    参数:
+        ref_audio: dance音频
+        template: bgm窗口
+        max_start: 允许的最大起点（采样点，不含）
+        topk: 保留的候选数
+        refine_radius_sec: 细化半径（秒）
+        workers: 并行线程数（各候选的细化分给各线程）
+
+    返回:
+        [(起点, 原始相关系数), ...]，按粗扫得分排序
+    """
+    radius = int(refine_radius_sec * sr)
+    last_start = min(max_start - 1, len(ref_audio) - len(template))
+    centers = _coarse_offset_centers(ref_audio, template, max_start, sr, topk, radius)
+    return parallel_map(lambda c: refine_offset(ref_audio, template, c - radius, min(last_start, c + radius)),
+                        centers, workers)
+
+
+def _coarse_offset_centers(ref_audio: np.ndarray, template: np.ndarray, max_start: int, sr: int,
+                           topk: int, radius: int) -> list:
+    """一维粗扫：降采样包络互相关的Top-K峰值（原始采样率下的起点，按得分排序）"""
+    factor = envelope_decimation(sr)
+    ref_env = decimate_envelope(ref_audio, factor)
+    tpl_env = decimate_envelope(template, factor)
+    coarse = normalized_xcorr_curve(ref_env, tpl_env)[:max(1, -(-max_start // factor))]
+    if len(coarse) == 0:
+        return []
+    return [int(peak) * factor for peak in top_k_peaks(coarse, topk, max(1, radius // factor))]
+
+
+def coarse_to_fine_grid(ref_audio: np.ndarray, mov_audio: np.ndarray, ref_starts, mov_starts,
+                        window: int, sr: int, topk: int = 5, refine_radius_sec: float = 0.5,
+                        fine_step_sec: float = 0.1, workers: Optional[int] = 1) -> Tuple[int, int, float]:
+    """
+    二维粗到细搜索：(dance起点 × bgm起点)
+
+    1. 在降采样幅度包络上计算整张候选网格（粗扫）
+    2. 按相对偏移（网格对角线）的平均得分保留Top-K候选，
+       并额外加入 bgm=0 一行的最佳候选（常见情形的先验）
+    3. 每个候选在细化半径内：dance起点按 fine_step_sec 步进，
+       bgm起点以原始采样率（FFT互相关）精确搜索
+
+    参数:
+        ref_starts / mov_starts: 粗扫网格起点（采样点），同时限定细化范围
+        window: 窗口长度（采样点）
+        workers: 并行线程数（粗扫网格与各细化任务分给各线程）
+
+    返回:
+        (dance起点, bgm起点, 相关系数)（采样点），没有正得分时返回 (0, 0, 0.0)
+    """
+    ref_starts = np.asarray(ref_starts, dtype=np.int64)
+    mov_starts = np.asarray(mov_starts, dtype=np.int64)
+    if len(ref_starts) == 0 or len(mov_starts) == 0:
+        return 0, 0, 0.0
+
+    tasks = _grid_refine_tasks(ref_audio, mov_audio, ref_starts, mov_starts, window, sr,
+                               topk, refine_radius_sec, fine_step_sec, workers)
+    refined = parallel_map(lambda t: refine_offset(mov_audio, ref_audio[t[0]:t[0] + window], t[1], t[2]),
+                           tasks, workers)
+    best = (0, 0, 0.0)
+    for (rs, _, _), (ms, score) in zip(tasks, refined):
+        if score > best[2]:
+            best = (rs, ms, score)
+    return best
+
+
+def _grid_refine_tasks(ref_audio: np.ndarray, mov_audio: np.ndarray, ref_starts: np.ndarray,
+                       mov_starts: np.ndarray, window: int, sr: int, topk: int,
+                       refine_radius_sec: float, fine_step_sec: float, workers: Optional[int]) -> list:
+    """
+    二维粗扫并生成细化任务
+
+    返回:
+        [(dance起点, bgm起点下限, bgm起点上限), ...]，按粗扫排名排列
+    """
+    factor = envelope_decimation(sr)
+    ref_env = decimate_envelope(ref_audio, factor)
+    mov_env = decimate_envelope(mov_audio, factor)
+    env_window = max(2, window // factor)
+    env_ref = np.minimum(ref_starts // factor, len(ref_env) - env_window)
+    env_mov = np.minimum(mov_starts // factor, len(mov_env) - env_window)
+    coarse = pearson_grid(ref_env, mov_env, env_ref, env_mov, env_window, workers=workers)
+
+    # 同一相对偏移（dance起点 - bgm起点）的网格单元落在同一条对角线上，
+    # 真实偏移在整条对角线上都相关，孤立的高分单元则多为包络上的偶然相似；
+    # 因此按对角线平均得分选取Top-K个偏移（偏移之间至少间隔一个细化半径），
+    # 每个偏移取对角线上粗扫得分最高的单元作为细化中心
+    radius = int(refine_radius_sec * sr)
+    fine_step = max(1, int(fine_step_sec * sr))
+    lags = np.rint((ref_starts[:, None] - mov_starts[None, :]) / fine_step).astype(np.int64)
+    lag_ids, lag_index = np.unique(lags.ravel(), return_inverse=True)
+    counts = np.bincount(lag_index)
+    lag_means = np.bincount(lag_index, weights=coarse.ravel()) / counts
+    # 只有一两个单元的边缘对角线不可靠
+    lag_means[counts < min(3, counts.max())] = -np.inf
+    chosen = []
+    for li in np.argsort(-lag_means, kind='stable'):
+        if not np.isfinite(lag_means[li]):
+            break
+        if all(abs(int(lag_ids[li]) - c) * fine_step >= radius for c in [l for l, _, _ in chosen]):
+            cells = np.flatnonzero(lag_index == li)
+            ri, mi = np.unravel_index(cells[np.argmax(coarse.ravel()[cells])], coarse.shape)
+            chosen.append((int(lag_ids[li]), int(ref_starts[ri]), int(mov_starts[mi])))
+            if len(chosen) >= topk:
+                break
+    chosen = [(rs, ms) for _, rs, ms in chosen]
+    zero_rows = np.flatnonzero(mov_starts == 0)
+    if len(zero_rows) > 0:
+        ri = int(np.argmax(coarse[:, zero_rows[0]]))
+        if (int(ref_starts[ri]), 0) not in chosen:
+            chosen.append((int(ref_starts[ri]), 0))
+
+    ref_lo, ref_hi = int(ref_starts.min()), int(ref_starts.max())
+    mov_lo, mov_hi = int(mov_starts.min()), int(mov_starts.max())
+    return [(rs, max(mov_lo, ms0 - radius), min(mov_hi, ms0 + radius)) for rs0, ms0 in chosen
+            for rs in range(max(ref_lo, rs0 - radius), min(ref_hi, rs0 + radius) + 1, fine_step)]
+
+
+# ==================== 节拍网格候选剪枝 ====================
+
+def _merge_ranges(centers: np.ndarray, radius: int) -> list:
+    """把 [c - radius, c + radius] 区间（中心已排序）合并为不重叠的区间列表"""
+    ranges = []
+    for c in centers:
+        lo, hi = int(c) - radius, int(c) + radius
+        if ranges and lo <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], hi)
+        else:
+            ranges.append([lo, hi])
+    return [tuple(r) for r in ranges]
+
+
+def beat_pair_starts(ref_beats, mov_beats, ref_lo: int, ref_hi: int,
+                     mov_lo: int, mov_hi: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    节拍对候选：dance节拍点 × bgm节拍点，两个窗口都从节拍点开始
+
+    参数:
+        ref_beats / mov_beats: 节拍点（采样点）
+        ref_lo, ref_hi / mov_lo, mov_hi: 起点范围（采样点，含端点）
+
+    返回:
+        (dance起点数组, bgm起点数组)
+    """
+    ref_beats = np.asarray(ref_beats, dtype=np.int64)
+    mov_beats = np.asarray(mov_beats, dtype=np.int64)
+    a = ref_beats[(ref_beats >= ref_lo) & (ref_beats <= ref_hi)]
+    b = mov_beats[(mov_beats >= mov_lo) & (mov_beats <= mov_hi)]
+    ref_starts, mov_starts = np.meshgrid(a, b, indexing='ij')
+    return ref_starts.ravel(), mov_starts.ravel()
+
+
+def beat_consistent_ranges(ref_beats, mov_beats, mov_start: int,
+                           lo: int, hi: int, tolerance: int) -> list:
+    """
+    bgm起点固定时，能让bgm节拍落在dance节拍上的dance起点范围
+
+    dance起点 = bgm起点 + (dance节拍 - bgm节拍)，每个起点向两侧扩展 tolerance，重叠的范围合并
+
+    返回:
+        [(起点下限, 起点上限), ...]（采样点，含端点），限定在 [lo, hi] 内
+    """
+    ref_beats = np.asarray(ref_beats, dtype=np.int64)
+    mov_beats = np.asarray(mov_beats, dtype=np.int64)
+    starts = np.sort((mov_start + ref_beats[:, None] - mov_beats[None, :]).ravel())
+    starts = starts[(starts >= lo - tolerance) & (starts <= hi + tolerance)]
+    return [(max(lo, r0), min(hi, r1)) for r0, r1 in _merge_ranges(starts, tolerance)]
+
+
+def beat_pair_alignment(ref_audio: np.ndarray, mov_audio: np.ndarray, ref_beats, mov_beats,
+                        ref_starts, mov_starts, window: int, tolerance: int,
+                        topk: int = 5, workers: Optional[int] = 1,
+                        deadline: Optional[float] = None) -> Tuple[int, int, float, int]:
+    """
+    节拍网格剪枝的二维搜索：只评估两个窗口都从节拍点开始的候选
+
+    1. 候选 = 起点范围内的 dance节拍 × bgm节拍，精确计算相关系数
+    2. 按相对偏移去重后保留Top-K
+    3. 每个候选的bgm起点在 ±tolerance 内以采样点分辨率细化（吸收节拍检测的帧误差）
+
+    参数:
+        ref_starts / mov_starts: 原搜索网格起点（采样点），用于限定候选范围
+        tolerance: 细化邻域（采样点）
+        workers: 并行线程数（候选打分与细化分给各线程）
+        deadline: 截止时刻（deadline_after 的返回值），None表示不限时；到达时不再开始候选打分，
+                  细化按排名分批执行、不再开始新的批次（未细化的候选取节拍点上的得分）
+
+    返回:
+        (dance起点, bgm起点, 相关系数, 评估的候选数)；没有候选或正得分时得分为0
+    """
+    ref_starts = np.asarray(ref_starts, dtype=np.int64)
+    mov_starts = np.asarray(mov_starts, dtype=np.int64)
+    if len(ref_starts) == 0 or len(mov_starts) == 0:
+        return 0, 0, 0.0, 0
+    ref_lo, ref_hi = int(ref_starts.min()), int(ref_starts.max())
+    mov_lo, mov_hi = int(mov_starts.min()), int(mov_starts.max())
+    pair_ref, pair_mov = beat_pair_starts(ref_beats, mov_beats, ref_lo, ref_hi, mov_lo, mov_hi)
+    if len(pair_ref) == 0 or deadline_expired(deadline):
+        return 0, 0, 0.0, 0
+
+    scores = pearson_pairs(ref_audio, mov_audio, pair_ref, pair_mov, window, workers=workers)
+    chosen = []
+    for idx in np.argsort(-scores, kind='stable'):
+        lag = int(pair_ref[idx] - pair_mov[idx])
+        if all(abs(lag - c) > tolerance for c in [r - m for r, m, _ in chosen]):
+            chosen.append((int(pair_ref[idx]), int(pair_mov[idx]), float(scores[idx])))
+            if len(chosen) >= topk:
+                break
+
+    refined = run_until_deadline(lambda c: refine_offset(mov_audio, ref_audio[c[0]:c[0] + window],
+                                                         max(mov_lo, c[1] - tolerance), min(mov_hi, c[1] + tolerance)),
+                                 chosen, deadline, workers)
+    # 未细化的候选（到达时限）取节拍点上的得分
+    refined += [(ms, score) for _, ms, score in chosen[len(refined):]]
+    best = (0, 0, 0.0)
+    for (rs, _, _), (ms, score) in zip(chosen, refined):
+        if score > best[2]:
+            best = (rs, ms, score)
+    return best[0], best[1], best[2], len(pair_ref)
+
+
+# ==================== 限时（anytime）搜索 ====================
+
+def deadline_after(seconds: Optional[float]) -> Optional[float]:
+    """从现在起 seconds 秒后的截止时刻（time.monotonic），None表示不限时"""
+    return None if seconds is None else time.monotonic() + seconds
+
+
+def deadline_expired(deadline: Optional[float]) -> bool:
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def run_until_deadline(func: Callable, tasks: list, deadline: Optional[float],
+                       workers: Optional[int] = 1, stop: Optional[Callable] = None) -> list:
+    """
+    按顺序分批（每批 workers 个）执行任务，截止时间到达或 stop(已完成的结果) 为真时不再开始新的批次
+
+    返回:
+        已完成任务的结果（与 tasks 的前缀一一对应）
+    """
+    results = []
+    batch = resolve_align_workers(workers)
+    for b0 in range(0, len(tasks), batch):
+        if deadline_expired(deadline) or (stop is not None and results and stop(results)):
+            break
+        results.extend(parallel_map(func, tasks[b0:b0 + batch], workers))
+    return results
+
+
+def anytime_offsets(ref_audio: np.ndarray, template: np.ndarray, ref_beats, mov_beats, mov_start: int,
+                    max_start: int, sr: int, deadline: Optional[float] = None, tolerance: int = 0,
+                    topk: int = 5, refine_radius_sec: float = 0.5, workers: Optional[int] = 1,
+                    exit_threshold: Optional[float] = None, exit_margin: float = 0.2) -> Tuple[list, dict]:
+    """
+    限时一维搜索：固定模板（bgm窗口）在dance上的候选起点，按优先级评估，截止时间到达时停止
+
+    1. 节拍一致的起点范围（beat_consistent_ranges，逐个范围细化）
+    2. 降采样包络粗扫的Top-K峰值
+    3. Top-K峰值在细化半径内以原始采样率细化
+
+    参数:
+        ref_beats / mov_beats: 节拍点（采样点）
+        mov_start: 模板在bgm中的起点（采样点）
+        deadline: 截止时刻（deadline_after 的返回值），None表示不限时
+        tolerance: 节拍一致起点的细化邻域（采样点）
+        exit_threshold / exit_margin: 已评估的候选满足 confident_best 时提前结束（None表示不提前结束）
+
+    返回:
+        ([(起点, 原始相关系数), ...], 统计)，统计包含 completed（是否完成搜索）、stages（已完成的阶段）、
+        early_exit（是否提前结束）、evaluated / skipped（细化的候选数与跳过的候选数）
+    """
+    stats = {'completed': False, 'stages': [], 'early_exit': False, 'evaluated': 0, 'skipped': 0}
+    last_start = min(max_start - 1, len(ref_audio) - len(template))
+    if last_start < 0:
+        stats['completed'] = True
+        return [], stats
+
+    candidates = []
+
+    def confident(found: list) -> bool:
+        return exit_threshold is not None and confident_best(
+            [start - mov_start for start, _ in candidates + found],
+            [score for _, score in candidates + found], exit_threshold, exit_margin, len(template) // 8)
+
+    ranges = beat_consistent_ranges(ref_beats, mov_beats, mov_start, 0, last_start, tolerance)
+    found = run_until_deadline(lambda r: refine_offset(ref_audio, template, r[0], r[1]),
+                               ranges, deadline, workers, stop=confident)
+    candidates.extend(found)
+    stats['evaluated'] += len(found)
+    if len(found) == len(ranges):
+        stats['stages'].append('beat')
+    if confident([]) or len(found) < len(ranges) or deadline_expired(deadline):
+        # 后续阶段的Top-K候选一并计为跳过
+        stats['skipped'] = len(ranges) - len(found) + topk
+        stats['early_exit'] = stats['completed'] = confident([])
+        return candidates, stats
+
+    radius = int(refine_radius_sec * sr)
+    centers = _coarse_offset_centers(ref_audio, template, max_start, sr, topk, radius)
+    stats['stages'].append('coarse')
+
+    found = run_until_deadline(lambda c: refine_offset(ref_audio, template, c - radius,
+                                                       min(last_start, c + radius)),
+                               centers, deadline, workers, stop=confident)
+    candidates.extend(found)
+    stats['evaluated'] += len(found)
+    stats['skipped'] = len(centers) - len(found)
+    if len(found) == len(centers):
+        stats['stages'].append('refine')
+    stats['early_exit'] = len(found) < len(centers) and confident([])
+    stats['completed'] = len(found) == len(centers) or stats['early_exit']
+    return candidates, stats
+
+
+def anytime_grid_alignment(ref_audio: np.ndarray, mov_audio: np.ndarray, ref_beats, mov_beats,
+                           ref_starts, mov_starts, window: int, sr: int,
+                           deadline: Optional[float] = None, tolerance: int = 0, topk: int = 5,
+                           refine_radius_sec: float = 0.5, fine_step_sec: float = 0.1,
+                           workers: Optional[int] = 1) -> Tuple[int, int, float, dict]:
+    """
+    限时二维搜索：(dance起点 × bgm起点) 按优先级评估，截止时间到达时返回目前最好的结果
+
+    1. 节拍对候选（beat_pair_alignment）
+    2. 降采样包络上的粗扫网格，按对角线得分选出Top-K偏移
+    3. 细化任务按粗扫排名逐批执行
+
+    返回:
+        (dance起点, bgm起点, 相关系数, 统计)，统计同 anytime_offsets（二维搜索没有提前结束，early_exit 总为False；
+        evaluated 为打分的节拍对数加细化的偏移数，skipped 为到达时限时未细化的偏移数）；没有正得分时得分为0
+    """
+    stats = {'completed': False, 'stages': [], 'early_exit': False, 'evaluated': 0, 'skipped': 0}
+    ref_starts = np.asarray(ref_starts, dtype=np.int64)
+    mov_starts = np.asarray(mov_starts, dtype=np.int64)
+    if len(ref_starts) == 0 or len(mov_starts) == 0:
+        stats['completed'] = True
+        return 0, 0, 0.0, stats
+
+    best = (0, 0, 0.0)
+    if deadline_expired(deadline):
+        return best + (stats,)
+    rs, ms, score, beat_candidates = beat_pair_alignment(ref_audio, mov_audio, ref_beats, mov_beats, ref_starts,
+                                                         mov_starts, window, tolerance, topk=topk,
+                                                         workers=workers, deadline=deadline)
+    stats['evaluated'] += beat_candidates
+    if score > best[2]:
+        best = (rs, ms, score)
+    if deadline_expired(deadline):
+        return best + (stats,)
+    stats['stages'].append('beat')
+
+    tasks = _grid_refine_tasks(ref_audio, mov_audio, ref_starts, mov_starts, window, sr,
+                               topk, refine_radius_sec, fine_step_sec, workers)
+    stats['stages'].append('coarse')
+
+    refined = run_until_deadline(lambda t: refine_offset(mov_audio, ref_audio[t[0]:t[0] + window], t[1], t[2]),
+                                 tasks, deadline, workers)
+    stats['evaluated'] += len(refined)
+    stats['skipped'] += len(tasks) - len(refined)
+    for (rs, _, _), (ms, score) in zip(tasks, refined):
+        if score > best[2]:
+            best = (rs, ms, score)
+    if len(refined) == len(tasks):
+        stats['stages'].append('refine')
+        stats['completed'] = True
+    return best + (stats,)
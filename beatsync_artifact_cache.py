@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+BeatSync 分析结果缓存
+节拍、onset包络、音乐特征矩阵等分析结果按 音频内容摘要 + 分析参数 + 算法版本 缓存为 .npz 文件，
+放在缓存目录的 artifacts 子目录中，有自己的索引与上限（LRU淘汰、原子写入，不会挤掉音频缓存）：
+同一首bgm再次处理时直接读取分析结果，不再重新计算；只缓存整段音频的分析结果，不缓存逐窗口的片段
+"""
+
+import os
+import json
+import hashlib
+import threading
+from typing import Callable, Optional
+
+# 分析算法版本：节拍/特征/包络的计算方式变更后递增，旧结果自然失效
+ARTIFACT_CODE_VER = "artifacts_v1"
+
+# 分析结果类型 -> 字段名（读取时字段不完整视为未命中）
+ARTIFACT_FIELDS = {
+    "beats": ("tempo", "beats"),
+    "onset_envelope": ("envelope",),
+    "music_features": ("mfcc", "chroma", "spectral_contrast", "spectral_rolloff"),
+}
+
+# 缓存目录（绝对路径） -> ArtifactCache，同一进程内共用
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def array_digest(array) -> str:
+    """音频数组内容的 SHA-256（含dtype与形状，同样的采样换了精度或声道数不会冲突）"""
+    import numpy as np
+    array = np.ascontiguousarray(array)
+    h = hashlib.sha256(f"{array.dtype.str}{array.shape}".encode("ascii"))
+    h.update(memoryview(array).cast("B"))
+    return h.hexdigest()
+
+
+class ArtifactCache:
+    """
+    单个缓存目录的分析结果缓存（文件登记在分析结果自己的索引中，按LRU淘汰）
+
+    参数:
+        cache_dir: 缓存目录
+    """
+
+    def __init__(self, cache_dir: str):
+        from beatsync_audio_cache import get_cache_index
+        self.index = get_cache_index(cache_dir, kind="artifacts")
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, kind: str, content: str, **params) -> str:
+        """分析结果的缓存键：类型 + 内容摘要 + 分析参数 + 算法版本"""
+        if kind not in ARTIFACT_FIELDS:
+            raise ValueError(f"未知的分析结果类型: {kind}")
+        key_obj = {"kind": kind, "content": content, "code_ver": ARTIFACT_CODE_VER, **params}
+        key_str = json.dumps(key_obj, sort_keys=True, ensure_ascii=False)
+        return "artifact_" + hashlib.sha1(key_str.encode("utf-8")).hexdigest()
+
+    def load(self, kind: str, content: str, **params) -> Optional[dict]:
+        """
+        读取分析结果
+
+        返回:
+            {字段名: 数组}；未命中、字段不完整或文件损坏时返回None
+        """
+        import numpy as np
+        path = self.index.lookup(self.key(kind, content, **params))
+        if path is None:
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if any(name not in data.files for name in ARTIFACT_FIELDS[kind]):
+                    return None
+                return {name: data[name] for name in ARTIFACT_FIELDS[kind]}
+        except (OSError, ValueError) as e:
+            print(f"  警告: 读取分析结果缓存失败 {path}: {e}")
+            return None
+
+    def store(self, kind: str, content: str, arrays: dict, **params) -> Optional[str]:
+        """
+        缓存分析结果：写入同目录的临时文件后原子重命名为正式文件并登记
+
+        返回:
+            缓存文件路径，写入失败时返回None
+        """
+        import numpy as np
+        key = self.key(kind, content, **params)
+        path = self.index.path_for(key, ".npz")
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                np.savez(f, **{name: np.asarray(arrays[name]) for name in ARTIFACT_FIELDS[kind]})
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"  警告: 写入分析结果缓存失败 {path}: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return None
+        self.index.record(key, path)
+        return path
+
+    def get(self, kind: str, content: str, compute: Callable[[], Optional[dict]], **params) -> Optional[dict]:
+        """
+        读取分析结果，未命中时调用 compute() 计算并缓存
+
+        参数:
+            content: 输入内容的摘要（array_digest 或 beatsync_digest.file_digest）
+            compute: 返回 {字段名: 数组} 的计算函数；返回None（计算失败）时不缓存
+            params: 影响结果的分析参数（采样率、帧移、窗口等）
+        """
+        arrays = self.load(kind, content, **params)
+        if arrays is not None:
+            self.hits += 1
+            return arrays
+        self.misses += 1
+        arrays = compute()
+        if arrays is not None:
+            self.store(kind, content, arrays, **params)
+        return arrays
+
+
+def get_artifact_cache(cache_dir: str) -> ArtifactCache:
+    """返回缓存目录的分析结果缓存（同一进程内共用一个实例）"""
+    key = os.path.abspath(cache_dir)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None or not os.path.exists(cache.index.index_path):
+            cache = ArtifactCache(key)
+            _caches[key] = cache
+        return cache
+
+
+def cached_artifact(artifacts: Optional[ArtifactCache], kind: str, audio,
+                    compute: Callable[[], Optional[dict]], **params) -> Optional[dict]:
+    """
+    按音频数组内容查分析结果缓存；artifacts 为None（未开启缓存）时直接计算
+
+    参数:
+        audio: 被分析的音频数组，或已算好的内容摘要（字符串）
+    """
+    if artifacts is None:
+        return compute()
+    content = audio if isinstance(audio, str) else array_digest(audio)
+    return artifacts.get(kind, content, compute, **params)
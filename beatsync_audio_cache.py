@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""
+BeatSync 音频缓存索引
+缓存目录中的 SQLite 索引记录每个缓存文件的键、大小与最后访问时间，并用触发器维护文件数与总大小；
+查找与登记都是按键的单行操作，不再每次遍历目录；超出上限时按最后访问时间（LRU）在后台淘汰。
+音频、分析结果、处理结果各在自己的子目录中，有各自的索引与上限：一类缓存写满不会淘汰其他类
+
+音频以 float32 PCM 的 .npy 文件缓存：命中时返回只读的内存映射数组（不复制、不解码），
+未命中时先写入同目录的临时文件再原子重命名，并发读取方不会读到写了一半的文件
+"""
+
+import os
+import time
+import shutil
+import sqlite3
+import threading
+import contextlib
+from typing import Optional, Tuple
+
+INDEX_NAME = "cache_index.sqlite3"
+# 可被索引登记的缓存文件（.npz 为分析结果缓存；.wav 为旧版本的缓存格式，仅用于导入与淘汰）
+CACHE_EXTENSIONS = (".npy", ".npz", ".wav")
+DEFAULT_MAX_FILES = 100
+DEFAULT_MAX_SIZE_MB = 5000
+
+# 缓存类型 -> (子目录, 默认文件数上限, 默认总大小上限MB)；音频缓存在缓存目录本身（与旧版本位置一致）
+CACHE_KINDS = {
+    "audio": ("", DEFAULT_MAX_FILES, DEFAULT_MAX_SIZE_MB),
+    "artifacts": ("artifacts", 1000, 500),
+    "results": ("results", 40, 2000),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_access ON entries(last_access);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    file_count INTEGER NOT NULL,
+    total_bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO totals VALUES (1, 0, 0);
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+    UPDATE totals SET file_count = file_count + 1, total_bytes = total_bytes + NEW.size WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+    UPDATE totals SET file_count = file_count - 1, total_bytes = total_bytes - OLD.size WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries BEGIN
+    UPDATE totals SET total_bytes = total_bytes - OLD.size + NEW.size WHERE id = 1;
+END;
+"""
+
+# 缓存目录（绝对路径） -> AudioCacheIndex，同一进程内共用
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+class AudioCacheIndex:
+    """
+    单个缓存目录的索引（多进程通过 SQLite 事务共享；多线程共用同一实例）
+
+    参数:
+        cache_dir: 缓存目录
+        max_files / max_size_mb: 文件数与总大小上限，超出后淘汰最久未访问的文件
+    """
+
+    def __init__(self, cache_dir: str, max_files: int = DEFAULT_MAX_FILES,
+                 max_size_mb: float = DEFAULT_MAX_SIZE_MB):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_files = max_files
+        self.max_size_mb = max_size_mb
+        self.index_path = os.path.join(self.cache_dir, INDEX_NAME)
+        self._evict_lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._evict_thread = None
+        os.makedirs(self.cache_dir, exist_ok=True)
+        created = not os.path.exists(self.index_path)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+        if created:
+            self._import_existing()
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # 每次操作使用独立连接：线程与进程之间互不影响，并发写入由 SQLite 加锁串行化
+        conn = sqlite3.connect(self.index_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _import_existing(self):
+        """首次建立索引时登记目录中已有的缓存文件（之后不再遍历目录）"""
+        rows = []
+        for filename in os.listdir(self.cache_dir):
+            if filename.endswith(CACHE_EXTENSIONS):
+                path = os.path.join(self.cache_dir, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                rows.append((os.path.splitext(filename)[0], path, st.st_size, st.st_mtime))
+        if rows:
+            with self._connect() as conn:
+                conn.executemany("INSERT OR IGNORE INTO entries VALUES (?, ?, ?, ?)", rows)
+
+    def path_for(self, key: str, ext: str = ".wav") -> str:
+        """键对应的缓存文件路径"""
+        return os.path.join(self.cache_dir, f"{key}{ext}")
+
+    def lookup(self, key: str) -> Optional[str]:
+        """查找缓存文件并更新最后访问时间；未登记或文件已不存在时返回None"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT path FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if not os.path.exists(row[0]):
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def record(self, key: str, path: str, evict: bool = True):
+        """
+        登记新写入的缓存文件（该键原来登记的是另一个文件时删除旧文件）
+
+        参数:
+            evict: 超出上限时是否在后台淘汰
+        """
+        size = os.path.getsize(path)
+        with self._connect() as conn:
+            row = conn.execute("SELECT path FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[0] != path:
+                try:
+                    os.remove(row[0])
+                except OSError:
+                    pass
+            conn.execute("INSERT INTO entries VALUES (?, ?, ?, ?) "
+                         "ON CONFLICT(key) DO UPDATE SET path = excluded.path, size = excluded.size, "
+                         "last_access = excluded.last_access",
+                         (key, path, size, time.time()))
+        if evict and self.over_limit():
+            self.evict_async()
+
+    def load_array(self, key: str):
+        """
+        读取缓存的数组（只读内存映射，不复制）
+
+        返回:
+            np.memmap 视图；未命中、旧格式（.wav）或文件损坏时返回None
+        """
+        import numpy as np
+        path = self.lookup(key)
+        if path is None or not path.endswith(".npy"):
+            return None
+        try:
+            return np.load(path, mmap_mode="r")
+        except (OSError, ValueError) as e:
+            print(f"  警告: 读取缓存失败 {path}: {e}")
+            return None
+
+    def store_array(self, key: str, array) -> Optional[str]:
+        """
+        缓存数组：写入同目录的临时文件后原子重命名为正式文件并登记
+
+        返回:
+            缓存文件路径，写入失败时返回None
+        """
+        import numpy as np
+        path = self.path_for(key, ".npy")
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                np.save(f, np.ascontiguousarray(array))
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"  警告: 写入缓存失败 {path}: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return None
+        self.record(key, path)
+        return path
+
+    def store_file(self, key: str, source: str, ext: str = ".npy") -> Optional[str]:
+        """
+        把已写好的文件加入缓存：硬链接（不在同一文件系统时复制）到临时名后原子重命名并登记
+
+        返回:
+            缓存文件路径，失败时返回None
+        """
+        path = self.path_for(key, ext)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            _link_or_copy(source, temp_path)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"  警告: 写入缓存失败 {path}: {e}")
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return None
+        self.record(key, path)
+        return path
+
+    def link_file(self, key: str, dest: str) -> bool:
+        """命中缓存时把缓存文件硬链接（不在同一文件系统时复制）到 dest，之后被淘汰也不影响 dest"""
+        path = self.lookup(key)
+        if path is None:
+            return False
+        try:
+            _link_or_copy(path, dest)
+            return True
+        except OSError as e:
+            print(f"  警告: 读取缓存失败 {path}: {e}")
+            return False
+
+    def totals(self) -> Tuple[int, int]:
+        """(文件数, 总字节数)，读取维护中的累计值"""
+        with self._connect() as conn:
+            return conn.execute("SELECT file_count, total_bytes FROM totals WHERE id = 1").fetchone()
+
+    def over_limit(self) -> bool:
+        file_count, total_bytes = self.totals()
+        return file_count > self.max_files or total_bytes > self.max_size_mb * 1024 * 1024
+
+    def evict(self) -> Tuple[int, float]:
+        """
+        按最后访问时间淘汰最旧的文件，直到文件数与总大小都在上限内
+
+        返回:
+            (删除的文件数, 释放的空间MB)
+        """
+        deleted_count = 0
+        freed_bytes = 0
+        max_bytes = self.max_size_mb * 1024 * 1024
+        with self._evict_lock:
+            while True:
+                with self._connect() as conn:
+                    file_count, total_bytes = conn.execute(
+                        "SELECT file_count, total_bytes FROM totals WHERE id = 1").fetchone()
+                    if file_count <= self.max_files and total_bytes <= max_bytes:
+                        break
+                    row = conn.execute(
+                        "SELECT key, path, size FROM entries ORDER BY last_access LIMIT 1").fetchone()
+                    if row is None:
+                        break
+                    key, path, size = row
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+                    except OSError as e:
+                        print(f"  警告: 删除缓存文件失败 {path}: {e}")
+                    conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                deleted_count += 1
+                freed_bytes += size
+        freed_mb = freed_bytes / (1024 * 1024)
+        if deleted_count > 0:
+            print(f"  缓存清理: 删除了 {deleted_count} 个文件，释放了 {freed_mb:.2f}MB")
+        return deleted_count, freed_mb
+
+    def evict_async(self):
+        """在后台线程中淘汰（已有淘汰线程在运行时不再启动）"""
+        with self._thread_lock:
+            if self._evict_thread is not None and self._evict_thread.is_alive():
+                return
+            self._evict_thread = threading.Thread(target=self._evict_quietly, daemon=True)
+            self._evict_thread.start()
+
+    def _evict_quietly(self):
+        try:
+            self.evict()
+        except Exception as e:
+            print(f"  警告: 缓存管理失败: {e}")
+
+    def wait_for_eviction(self, timeout: Optional[float] = None):
+        """等待后台淘汰结束"""
+        thread = self._evict_thread
+        if thread is not None:
+            thread.join(timeout)
+
+
+def _link_or_copy(source: str, dest: str):
+    try:
+        os.link(source, dest)
+    except OSError:
+        shutil.copyfile(source, dest)
+
+
+def get_cache_index(cache_dir: str, max_files: Optional[int] = None,
+                    max_size_mb: Optional[float] = None, kind: str = "audio") -> AudioCacheIndex:
+    """
+    返回缓存目录中某类缓存的索引（同一进程内共用一个实例）；传入上限时更新该实例的上限
+
+    参数:
+        cache_dir: 缓存目录
+        max_files / max_size_mb: 上限，None时使用该类缓存的默认上限（见 CACHE_KINDS）
+        kind: 缓存类型（audio / artifacts / results），每类在自己的子目录中单独索引与淘汰
+    """
+    if kind not in CACHE_KINDS:
+        raise ValueError(f"未知的缓存类型: {kind}")
+    subdir, default_files, default_size_mb = CACHE_KINDS[kind]
+    key = os.path.abspath(os.path.join(cache_dir, subdir))
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None or not os.path.exists(index.index_path):
+            index = AudioCacheIndex(key, max_files=default_files, max_size_mb=default_size_mb)
+            _indexes[key] = index
+        if max_files is not None:
+            index.max_files = max_files
+        if max_size_mb is not None:
+            index.max_size_mb = max_size_mb
+        return index
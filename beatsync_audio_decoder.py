@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+BeatSync 音频解码模块
+ffmpeg 直接输出 float32 PCM（-f f32le pipe:1）到预分配的NumPy缓冲区，
+替代 "提取WAV临时文件 → ffprobe验证 → sf.read读回" 的流程，供modular版本、V2版本与并行处理器复用
+"""
+
+import threading
+import subprocess
+import numpy as np
+from typing import Iterator, Optional, Tuple
+
+# 单次从管道读取的最大字节数
+PIPE_CHUNK_BYTES = 1 << 20
+# 未指定时长时缓冲区的初始容量（秒），不足时按倍数扩容
+INITIAL_CAPACITY_SEC = 60.0
+
+
+def ffmpeg_decode_command(video_path: str, sr: int, channels: int,
+                          duration: Optional[float] = None, offset: Optional[float] = None) -> list:
+    """构建解码命令：输出 sr/channels 的 float32 小端PCM 到标准输出"""
+    cmd = ['ffmpeg', '-nostdin', '-hide_banner', '-v', 'error']
+    if offset:
+        cmd += ['-ss', str(offset)]
+    cmd += ['-i', video_path]
+    if duration is not None:
+        cmd += ['-t', str(duration)]
+    cmd += ['-vn', '-acodec', 'pcm_f32le', '-f', 'f32le', '-ar', str(sr), '-ac', str(channels), 'pipe:1']
+    return cmd
+
+
+def _start_decoder(cmd: list, timeout: Optional[float]):
+    """启动ffmpeg进程；stderr在后台线程中读取（避免管道写满阻塞），超时后终止进程"""
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stderr_chunks = []
+    reader = threading.Thread(target=lambda: stderr_chunks.append(proc.stderr.read()), daemon=True)
+    reader.start()
+    timer = None
+    if timeout:
+        timer = threading.Timer(timeout, proc.kill)
+        timer.daemon = True
+        timer.start()
+    return proc, reader, timer, stderr_chunks
+
+
+def _finish_decoder(proc, reader, timer, stderr_chunks) -> str:
+    """等待进程结束，返回错误信息（成功时为空字符串）"""
+    proc.stdout.close()
+    returncode = proc.wait()
+    reader.join()
+    timed_out = timer is not None and not timer.is_alive() and returncode != 0
+    if timer is not None:
+        timer.cancel()
+    if returncode == 0:
+        return ""
+    if timed_out:
+        return "FFmpeg解码超时，可能文件过大或系统负载过高"
+    stderr = b"".join(c for c in stderr_chunks if c).decode("utf-8", errors="replace")
+    return f"FFmpeg解码失败（返回码 {returncode}）: {stderr[:500] or '无错误输出'}"
+
+
+def decode_audio(video_path: str, sr: int = 22050, channels: int = 1,
+                 duration: Optional[float] = None, offset: Optional[float] = None,
+                 timeout: Optional[float] = 300) -> Tuple[Optional[np.ndarray], str]:
+    """
+    将视频/音频文件的音轨解码为float32数组（不写临时文件）
+
+    参数:
+        video_path: 输入文件路径
+        sr: 输出采样率
+        channels: 输出声道数
+        duration: 只解码前 duration 秒（同时用于预分配缓冲区），None表示整段
+        offset: 从 offset 秒处开始解码
+        timeout: 超时时间（秒）
+
+    返回:
+        (音频, 错误信息)，音频单声道为 (n,)、多声道为 (n, channels)；失败时音频为None
+    """
+    frame_bytes = 4 * channels
+    capacity = int(np.ceil((duration if duration is not None else INITIAL_CAPACITY_SEC) * sr)) + 1
+    buffer = np.empty(capacity * channels, dtype=np.float32)
+    view = memoryview(buffer).cast('B')
+    filled = 0
+
+    try:
+        proc, reader, timer, stderr_chunks = _start_decoder(
+            ffmpeg_decode_command(video_path, sr, channels, duration, offset), timeout)
+    except FileNotFoundError:
+        return None, "FFmpeg未安装或不在PATH中，请确保已安装FFmpeg"
+
+    try:
+        while True:
+            if filled == len(view):
+                # 实际时长超过预估：扩容（只在未指定时长或ffmpeg多输出几个采样时发生）
+                grown = np.empty(len(buffer) * 2, dtype=np.float32)
+                grown[:len(buffer)] = buffer
+                buffer = grown
+                view = memoryview(buffer).cast('B')
+            got = proc.stdout.readinto(view[filled:filled + PIPE_CHUNK_BYTES])
+            if not got:
+                break
+            filled += got
+    finally:
+        error = _finish_decoder(proc, reader, timer, stderr_chunks)
+    if error:
+        return None, error
+
+    frames = filled // frame_bytes
+    if frames == 0:
+        return None, f"没有解码到音频数据（文件可能没有音轨）: {video_path}"
+    audio = buffer[:frames * channels]
+    if len(audio) * 2 < len(buffer):
+        audio = audio.copy()  # 释放多余的预分配空间
+    return (audio.reshape(-1, channels) if channels > 1 else audio), ""
+
+
+def iter_audio_chunks(video_path: str, sr: int = 22050, channels: int = 1, chunk_sec: float = 10.0,
+                      duration: Optional[float] = None, offset: Optional[float] = None,
+                      timeout: Optional[float] = 300) -> Iterator[np.ndarray]:
+    """
+    分块解码：每次产出 chunk_sec 秒的float32数组（最后一块可能更短），形状同 decode_audio
+
+    解码失败时在迭代结束处抛出 RuntimeError
+    """
+    frame_bytes = 4 * channels
+    chunk_frames = max(1, int(chunk_sec * sr))
+    proc, reader, timer, stderr_chunks = _start_decoder(
+        ffmpeg_decode_command(video_path, sr, channels, duration, offset), timeout)
+    try:
+        while True:
+            buffer = np.empty(chunk_frames * channels, dtype=np.float32)
+            view = memoryview(buffer).cast('B')
+            filled = 0
+            while filled < len(view):
+                got = proc.stdout.readinto(view[filled:])
+                if not got:
+                    break
+                filled += got
+            frames = filled // frame_bytes
+            if frames > 0:
+                chunk = buffer[:frames * channels]
+                yield chunk.reshape(-1, channels) if channels > 1 else chunk
+            if filled < len(view):
+                break
+    finally:
+        error = _finish_decoder(proc, reader, timer, stderr_chunks)
+    if error:
+        raise RuntimeError(error)
@@ -4,6 +4,8 @@ BeatSync Badcase修复程序 - 裁剪版本
 采用裁剪而不是填充的方法，避免生成黑色画面
 """
 
+from __future__ import annotations
+
 import os
 import sys
 import subprocess
@@ -16,13 +18,21 @@ try:
     sys.stderr.reconfigure(line_buffering=True)
 except Exception:
     pass
-import numpy as np
-import soundfile as sf
-import librosa
-import cv2
-import hashlib
-import json
-from typing import Optional, Tuple
+from typing import Optional, Tuple, TYPE_CHECKING
+from beatsync_workspace import TaskWorkspace, own_workspace, estimate_scratch_bytes
+from beatsync_artifact_cache import ArtifactCache, cached_artifact, get_artifact_cache
+from beatsync_envelope import RMS_HOP_SEC, TAIL_CHECK_SEC, detect_leading_silence, analyze_trailing_silence
+
+# numpy / soundfile / librosa / cv2 在用到的函数内导入：只做输入验证、--help 或被编排进程导入时不加载
+if TYPE_CHECKING:
+    import numpy as np
+
+# numba 内核缓存目录（librosa 的即时编译结果跨进程复用，需在numba被导入前设置）
+try:
+    from beatsync_warmup import configure_numba_cache
+    configure_numba_cache()
+except ImportError:
+    pass
 
 # ==================== 视频格式兼容性 ====================
 
@@ -77,77 +87,116 @@ def ensure_dir(path: str):
     if path and not os.path.exists(path):
         os.makedirs(path, exist_ok=True)
 
-def file_quick_signature(path: str, max_bytes: int = 4 * 1024 * 1024) -> dict:
-    st = os.stat(path)
-    sig = {"size": st.st_size, "mtime": int(st.st_mtime), "sha1_head": None}
-    try:
-        h = hashlib.sha1()
-        with open(path, "rb") as f:
-            h.update(f.read(max_bytes))
-        sig["sha1_head"] = h.hexdigest()
-    except Exception:
-        sig["sha1_head"] = None
-    return sig
+def build_cache_key(input_path: str, sr: int, channels: int, code_ver: str = "v2_trim_v2") -> str:
+    """基于输入文件内容（完整文件摘要）与关键参数构建缓存key：同一视频换了文件名/路径也能命中"""
+    from beatsync_digest import content_cache_key
+    return content_cache_key(input_path, code_ver, sr=sr, channels=channels)
 
-def build_cache_key(input_path: str, sr: int, channels: int, code_ver: str = "v2_trim_v1") -> str:
-    key_obj = {
-        "input": input_path,
-        "sig": file_quick_signature(input_path),
-        "sr": sr,
-        "channels": channels,
-        "code_ver": code_ver,
-    }
-    key_str = json.dumps(key_obj, sort_keys=True, ensure_ascii=False)
-    return hashlib.sha1(key_str.encode("utf-8")).hexdigest()
+def load_audio_from_video(video_path: str, sr: int = 44100, enable_cache: bool = False,
+                          cache_dir: Optional[str] = None,
+                          ingest_manifest: Optional[dict] = None) -> Optional[np.ndarray]:
+    """
+    解码视频音轨为 (samples, 2) 的float32数组（ffmpeg 直接输出到内存，不写临时WAV）
+    提供ingest清单且包含该视频时，直接使用并行处理器已解码的音频（采样率一致时为mmap视图）；
+    命中缓存时为缓存文件的只读内存映射
+    
+    返回: 音频数组，失败时返回None
+    """
+    try:
+        from beatsync_ingest import ingested_audio
+        audio = ingested_audio(ingest_manifest, video_path, sr)
+        if audio is not None:
+            return audio
+        
+        cache_index = None
+        if enable_cache and cache_dir:
+            # 缓存索引：按键查找，超出上限时在后台按LRU淘汰（不再每次遍历缓存目录）
+            from beatsync_audio_cache import get_cache_index
+            cache_index = get_cache_index(cache_dir)
+            cache_key = build_cache_key(video_path, sr=sr, channels=2)
+            audio = cache_index.load_array(cache_key)
+            if audio is not None:
+                # 命中缓存：直接返回缓存文件的只读内存映射
+                return audio
+        
+        from beatsync_audio_decoder import decode_audio
+        audio, error_msg = decode_audio(video_path, sr=sr, channels=2)
+        if audio is None:
+            print(f"音频提取失败: {error_msg}")
+            return None
+        if cache_index is not None:
+            cache_index.store_array(cache_key, audio)
+        return audio
+    except Exception as e:
+        print(f"音频提取失败: {e}")
+        return None
 
 def extract_audio_from_video(video_path: str, output_path: str, sr: int = 44100,
                              enable_cache: bool = False, cache_dir: Optional[str] = None) -> bool:
-    """从视频中提取音频为 WAV 格式"""
+    """从视频中提取音频为 WAV 格式（需要文件时使用，流程内部直接用 load_audio_from_video）"""
+    import soundfile as sf
+    audio = load_audio_from_video(video_path, sr, enable_cache=enable_cache, cache_dir=cache_dir)
+    if audio is None:
+        return False
     try:
-        if enable_cache and cache_dir:
-            ensure_dir(cache_dir)
-            # 缓存管理：在提取前检查并清理缓存
-            try:
-                from beatsync_utils import manage_cache
-                manage_cache(cache_dir, max_files=100, max_size_mb=5000)
-            except ImportError:
-                pass  # 如果工具模块不可用，跳过缓存管理
-            
-            cache_key = build_cache_key(video_path, sr=sr, channels=2)
-            cache_wav = os.path.join(cache_dir, f"{cache_key}.wav")
-            if os.path.exists(cache_wav):
-                shutil.copyfile(cache_wav, output_path)
-                return True
-        cmd = [
-            "ffmpeg", "-y", "-nostdin", "-hide_banner", "-v", "error",
-            "-i", video_path,
-            "-vn",  # 禁用视频
-            "-acodec", "pcm_s16le",  # 16-bit PCM
-            "-ar", str(sr),  # 采样率
-            "-ac", "2",  # 双声道
-            output_path
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        ok = result.returncode == 0
-        if ok and enable_cache and cache_dir:
-            try:
-                cache_key = build_cache_key(video_path, sr=sr, channels=2)
-                cache_wav = os.path.join(cache_dir, f"{cache_key}.wav")
-                if not os.path.exists(cache_wav):
-                    shutil.copyfile(output_path, cache_wav)
-            except Exception:
-                pass
-        return ok
+        sf.write(output_path, audio, sr, subtype="PCM_16")
+        return True
     except Exception as e:
         print(f"音频提取失败: {e}")
         return False
 
-def find_beat_alignment(ref_audio: np.ndarray, mov_audio: np.ndarray, sr: int) -> tuple:
-    """使用节拍检测找到最佳对齐位置"""
+def find_beat_alignment(ref_audio: np.ndarray, mov_audio: np.ndarray, sr: int,
+                        align_mode: str = "exhaustive",
+                        refine_radius: float = 0.5,
+                        coarse_topk: int = 5,
+                        beat_tolerance: float = 0.1,
+                        align_workers: Optional[int] = 1,
+                        align_deadline: Optional[float] = None,
+                        search_stats: Optional[dict] = None,
+                        exit_threshold: Optional[float] = None,
+                        exit_margin: float = 0.2,
+                        artifacts: Optional[ArtifactCache] = None) -> tuple:
+    """
+    使用节拍检测找到最佳对齐位置
+    
+    参数:
+        align_mode: "exhaustive" 0.1秒网格全量搜索；"coarse_to_fine" 降采样包络粗扫 + Top-K全采样率细化；
+                    "beat_grid" 只评估从节拍点开始的 (dance, bgm) 窗口对；
+                    "anytime" 按 节拍对 → 粗扫网格 → 细化 的优先级搜索，到达 align_deadline 时返回目前最好的结果
+        refine_radius: 粗到细模式的细化半径（秒）
+        coarse_topk: 粗到细/节拍网格模式保留的候选数
+        beat_tolerance: 节拍网格模式的细化邻域（秒）
+        align_workers: 对齐打分的并行线程数（0为按CPU预算自动选择），结果与串行一致
+        align_deadline: anytime与节拍网格模式的时限（秒，从调用开始计时，含节拍检测），None表示不限时；
+                        节拍网格模式到达时限后不再细化剩余候选
+        search_stats: 传入dict时写入搜索统计：completed（是否完成搜索）、stages、elapsed，
+                      全量与anytime模式另有 early_exit、evaluated / skipped（评估与跳过的候选数）
+        exit_threshold / exit_margin: 全量模式按dance起点顺序逐块计算，最高分不低于阈值、
+                                      且领先其他偏移的次高分至少 exit_margin 时提前结束（None表示不提前结束）
+        artifacts: 分析结果缓存：节拍检测结果先按音频内容查缓存（None时直接计算）
+    """
+    import numpy as np
+    import librosa
+    import time
+    search_start = time.time()
+    if search_stats is not None:
+        search_stats.update(completed=True, stages=[align_mode], elapsed=0.0)
     try:
-        # 检测节拍点
-        ref_tempo, ref_beats = librosa.beat.beat_track(y=ref_audio, sr=sr, units='time')
-        mov_tempo, mov_beats = librosa.beat.beat_track(y=mov_audio, sr=sr, units='time')
+        from beatsync_align_engine import parallel_map, resolve_align_workers, deadline_after
+        deadline = deadline_after(align_deadline)
+        align_workers = resolve_align_workers(align_workers)
+        if align_workers > 1:
+            print(f"并行对齐打分: {align_workers} 线程")
+        def detect_beats(audio):
+            def compute():
+                tempo, beats = librosa.beat.beat_track(y=audio, sr=sr, units='time')
+                return {"tempo": tempo, "beats": beats}
+            result = cached_artifact(artifacts, "beats", audio, compute, sr=sr, units="time")
+            return result["tempo"], result["beats"]
+        
+        # 检测节拍点（dance与bgm并行，重复的音频直接读取缓存的节拍）
+        (ref_tempo, ref_beats), (mov_tempo, mov_beats) = parallel_map(detect_beats, [ref_audio, mov_audio],
+                                                                      align_workers)
         
         print(f"节拍检测:")
         print(f"  dance: {len(ref_beats)} 个节拍点, BPM ≈ {ref_tempo[0]:.1f}")
@@ -163,51 +212,88 @@ def find_beat_alignment(ref_audio: np.ndarray, mov_audio: np.ndarray, sr: int) -
         max_offset = min(len(ref_audio), len(mov_audio)) / sr * 0.4  # 最多搜索40%重叠
         
         best_score = 0
-        best_ref_start = 0
-        best_mov_start = 0
         
         print(f"搜索对齐位置 (最大偏移: {max_offset:.1f}秒)...")
         
-        for ref_offset in np.arange(0, max_offset, 0.1):
-            ref_start = int(ref_offset * sr)
-            ref_end = ref_start + int(window_size * sr)
-            
-            if ref_end > len(ref_audio):
-                continue
-                
-            for mov_offset in np.arange(0, max_offset, 0.1):
-                mov_start = int(mov_offset * sr)
-                mov_end = mov_start + int(window_size * sr)
-                
-                if mov_end > len(mov_audio):
-                    continue
-                
-                # 提取音频段
-                ref_seg = ref_audio[ref_start:ref_end]
-                mov_seg = mov_audio[mov_start:mov_end]
-                
-                # 计算相关性
-                try:
-                    corr = np.corrcoef(ref_seg.flatten(), mov_seg.flatten())[0, 1]
-                    if np.isnan(corr):
-                        corr = 0
-                except:
-                    corr = 0
-                
-                if corr > best_score:
-                    best_score = corr
-                    best_ref_start = ref_offset
-                    best_mov_start = mov_offset
+        # 候选起点与原嵌套循环一致：0.1秒网格，窗口越界的起点跳过
+        window_samples = int(window_size * sr)
+        ref_offsets = [t for t in np.arange(0, max_offset, 0.1) if int(t * sr) + window_samples <= len(ref_audio)]
+        mov_offsets = [t for t in np.arange(0, max_offset, 0.1) if int(t * sr) + window_samples <= len(mov_audio)]
+        ref_starts = [int(t * sr) for t in ref_offsets]
+        mov_starts = [int(t * sr) for t in mov_offsets]
+        
+        if align_mode == "beat_grid":
+            # 节拍网格剪枝：只评估两个窗口都从节拍点开始的候选，节拍帧误差在 ±beat_tolerance 内细化
+            from beatsync_align_engine import beat_pair_alignment
+            ref_start_samples, mov_start_samples, best_score, beat_candidates = beat_pair_alignment(
+                ref_audio, mov_audio, (np.asarray(ref_beats) * sr).astype(np.int64),
+                (np.asarray(mov_beats) * sr).astype(np.int64), ref_starts, mov_starts, window_samples,
+                int(beat_tolerance * sr), topk=coarse_topk, workers=align_workers, deadline=deadline
+            )
+            print(f"  节拍网格剪枝: 候选 {beat_candidates} / {len(ref_starts) * len(mov_starts)}, "
+                  f"细化邻域 ±{beat_tolerance:.2f}s")
+            if best_score <= 0:
+                print(f"  节拍候选不足，回退到全量搜索")
+                align_mode = "exhaustive"
+        
+        if align_mode == "anytime":
+            # 限时搜索：节拍对 → 粗扫网格 → 细化，截止时间到达时返回目前最好的结果
+            from beatsync_align_engine import anytime_grid_alignment
+            deadline_text = f"{align_deadline:.1f}s" if align_deadline is not None else "不限时"
+            print(f"  限时搜索: 候选 {len(ref_starts)} x {len(mov_starts)}, 时限 {deadline_text}")
+            ref_start_samples, mov_start_samples, best_score, stats = anytime_grid_alignment(
+                ref_audio, mov_audio, (np.asarray(ref_beats) * sr).astype(np.int64),
+                (np.asarray(mov_beats) * sr).astype(np.int64), ref_starts, mov_starts, window_samples, sr,
+                deadline=deadline, tolerance=int(beat_tolerance * sr), topk=coarse_topk,
+                refine_radius_sec=refine_radius, workers=align_workers
+            )
+            print(f"  已完成阶段: {' → '.join(stats['stages']) or '无'}"
+                  f"{'' if stats['completed'] else '（达到时限，使用目前最好的结果）'}")
+            if search_stats is not None:
+                search_stats.update(stats)
+        elif align_mode == "coarse_to_fine":
+            # 粗到细：降采样包络上粗扫整张网格，Top-K候选在原始采样率下细化
+            print(f"  粗到细搜索: 候选 {len(ref_starts)} x {len(mov_starts)}, Top-{coarse_topk}, 细化半径 {refine_radius:.2f}s")
+            from beatsync_align_engine import coarse_to_fine_grid
+            ref_start_samples, mov_start_samples, best_score = coarse_to_fine_grid(
+                ref_audio, mov_audio, ref_starts, mov_starts, window_samples, sr,
+                topk=coarse_topk, refine_radius_sec=refine_radius, workers=align_workers
+            )
+        elif align_mode == "exhaustive":
+            print(f"  批量计算相关性矩阵: {len(ref_starts)} x {len(mov_starts)}")
+            # 批量矩阵计算整张 (dance偏移 × bgm偏移) 相关性网格，替代逐对 np.corrcoef
+            from beatsync_align_engine import best_grid_alignment
+            grid_stats = {}
+            ref_idx, mov_idx, score = best_grid_alignment(ref_audio, mov_audio, ref_starts, mov_starts, window_samples,
+                                                          workers=align_workers, exit_threshold=exit_threshold,
+                                                          exit_margin=exit_margin, stats=grid_stats)
+            early_exit = grid_stats['skipped'] > 0
+            if exit_threshold is not None:
+                print(f"  候选评估: {grid_stats['evaluated']} 个, 跳过 {grid_stats['skipped']} 个"
+                      f"{'（提前结束）' if early_exit else ''}")
+            if search_stats is not None:
+                search_stats.update(early_exit=early_exit, **grid_stats)
+            ref_start_samples, mov_start_samples = 0, 0
+            if ref_idx >= 0:
+                best_score = score
+                ref_start_samples = ref_starts[ref_idx]
+                mov_start_samples = mov_starts[mov_idx]
+        best_ref_start = ref_start_samples / sr
+        best_mov_start = mov_start_samples / sr
         
         print(f"对齐结果:")
         print(f"  dance 节拍点: {best_ref_start:.2f}s")
         print(f"  bgm 节拍点: {best_mov_start:.2f}s")
         print(f"  置信度: {best_score:.4f}")
         
-        return int(best_ref_start * sr), int(best_mov_start * sr), best_score
+        if search_stats is not None:
+            search_stats['elapsed'] = time.time() - search_start
+        return int(ref_start_samples), int(mov_start_samples), best_score
         
     except Exception as e:
         print(f"节拍检测失败: {e}")
+        if search_stats is not None:
+            search_stats.update(completed=False, elapsed=time.time() - search_start)
         return 0, 0, 0.0
 
 def detect_badcase_type(ref_start: int, mov_start: int, sr: int) -> tuple:
@@ -232,44 +318,11 @@ def detect_badcase_type(ref_start: int, mov_start: int, sr: int) -> tuple:
         print("  不是badcase，T1 = T2")
         return "NORMAL", 0
 
-def detect_silent_segment_length(audio_path: str, sr: int = 22050) -> float:
-    """
-    检测音频前面连续无声段落的长度
-    返回需要裁剪的时长（秒）
-    """
-    try:
-        # 1. 加载音频
-        audio, _ = sf.read(audio_path)
-        
-        # 2. 计算音频能量（RMS）- 滑动窗口
-        window_size = int(0.1 * sr)  # 100ms窗口
-        hop_size = int(0.05 * sr)    # 50ms步长
-        
-        rms_values = []
-        for i in range(0, len(audio) - window_size, hop_size):
-            segment = audio[i:i + window_size]
-            rms = np.sqrt(np.mean(segment ** 2))
-            rms_values.append(rms)
-        
-        # 3. 找到第一个有声音的位置
-        silence_threshold = 0.01  # 静音阈值
-        
-        for i, rms in enumerate(rms_values):
-            if rms > silence_threshold:
-                # 找到第一个有声音的位置
-                silent_duration = (i * hop_size) / sr
-                return silent_duration
-        
-        # 如果整段都是静音，返回0
-        return 0.0
-        
-    except Exception as e:
-        print(f"检测无声段落失败: {e}")
-        return 0.0
-
 def detect_silent_segments_with_video(video_path: str, position: str = "trailing", sr: int = 22050, video_duration: float = None) -> float:
     """
     检测视频中有画面但无声段落的长度（复用beatsync_fine_cut_modular.py的成功逻辑）
+    只解码需要的部分：开头检测解码开头窗口，末尾检测解码末尾窗口（前80%平均RMS在视频较长时抽样估计），
+    不写检测用音频，检测耗时与视频长度无关
     
     参数:
         video_path: 视频文件路径
@@ -282,40 +335,16 @@ def detect_silent_segments_with_video(video_path: str, position: str = "trailing
     try:
         print(f"  检测{position}有画面但无声段落...")
         
-        # 提取音频
-        temp_audio = "temp_silent_detection.wav"
-        cmd_extract = [
-            'ffmpeg', '-y',
-            '-i', video_path,
-            '-vn', '-acodec', 'pcm_s16le', '-ar', str(sr), '-ac', '1',
-            temp_audio
-        ]
-        result = subprocess.run(cmd_extract, capture_output=True, text=True)
-        if result.returncode != 0:
-            print("  提取音频失败")
-            return 0.0
-        
         # 使用beatsync_fine_cut_modular.py中已验证的检测逻辑
         if position == "leading":
             # 检测开头的静音段落
-            silent_duration = detect_silent_segment_length(temp_audio, sr)
+            silent_duration = detect_leading_silence(video_path, sr, channels=1)
             print(f"  检测到开头静音段落: {silent_duration:.3f}s")
             return silent_duration
             
         else:  # trailing
             # 检测末尾的静音段落 - 使用宽松的静音检测策略
-            # 加载音频并计算RMS值
-            audio, _ = sf.read(temp_audio)
-            
-            # 计算音频能量（RMS）- 滑动窗口
-            window_size = int(0.1 * sr)  # 100ms窗口
-            hop_size = int(0.05 * sr)    # 50ms步长
-            
-            rms_values = []
-            for i in range(0, len(audio) - window_size, hop_size):
-                segment = audio[i:i + window_size]
-                rms = np.sqrt(np.mean(segment ** 2))
-                rms_values.append(rms)
+            hop_size = int(RMS_HOP_SEC * sr)  # 50ms步长
             
             # 获取视频总时长
             if video_duration is None:
@@ -327,71 +356,29 @@ def detect_silent_segments_with_video(video_path: str, position: str = "trailing
                 result = subprocess.run(cmd_duration, capture_output=True, text=True)
                 video_duration = float(result.stdout.strip())
             
-            # 步骤1：检测末尾N秒的静音比例
-            check_duration = 3.0  # 检查末尾3秒
-            check_frames = int(check_duration * sr / hop_size)
-            start_check_frame = max(0, len(rms_values) - check_frames)
-            
-            # 计算末尾N秒的静音比例
-            silence_threshold = 0.01
-            silent_frames = sum(1 for i in range(start_check_frame, len(rms_values)) if rms_values[i] < silence_threshold)
-            total_check_frames = len(rms_values) - start_check_frame
-            silence_ratio = silent_frames / total_check_frames if total_check_frames > 0 else 0
-            
-            print(f"  末尾{check_duration:.1f}秒静音比例: {silence_ratio:.1%}")
-            
-            # 步骤2：如果静音比例超过60%，使用"音频衰减检测"找到最后一个强音位置
-            if silence_ratio >= 0.6:
-                # 计算前80%音频的平均能量（排除末尾20%）
-                cutoff_frame = int(len(rms_values) * 0.8)
-                avg_rms = np.mean(rms_values[:cutoff_frame])
-                
-                # 设置阈值：如果音频能量低于平均值的30%，认为是衰减段落
-                fade_threshold = avg_rms * 0.3
-                
-                print(f"  前80%平均RMS: {avg_rms:.4f}, 衰减阈值(30%): {fade_threshold:.4f}")
-                
-                # 从后往前扫描，找到"连续衰减段落"的起点
-                # 如果从某个位置开始，后续80%以上的帧都低于阈值，就认为是衰减段落起点
-                last_strong_frame = -1
-                for start_idx in range(len(rms_values) - 1, -1, -1):
-                    # 检查从这个位置开始到结束的帧
-                    weak_frames = sum(1 for i in range(start_idx, len(rms_values)) if rms_values[i] < fade_threshold)
-                    total_frames = len(rms_values) - start_idx
-                    weak_ratio = weak_frames / total_frames if total_frames > 0 else 0
-                    
-                    # 如果70%以上是弱音，认为这是衰减段落的起点
-                    if weak_ratio >= 0.7:
-                        # 继续向前查找，找到最后一个强音位置
-                        for i in range(start_idx - 1, -1, -1):
-                            if rms_values[i] >= fade_threshold:
-                                last_strong_frame = i
-                                break
-                        break
-                
-                if last_strong_frame >= 0:
-                    last_strong_time = last_strong_frame * hop_size / sr
-                    trailing_silent_duration = video_duration - last_strong_time
-                    print(f"  检测到音频衰减: 最后强音位置第{last_strong_time:.2f}s")
-                    print(f"  建议裁剪末尾衰减段落: {trailing_silent_duration:.3f}s")
-                    return trailing_silent_duration
+            # 步骤1：末尾3秒的静音比例；步骤2：静音比例超过60%时，按前80%平均RMS的30%做衰减检测，
+            # 找到衰减段落起点之前最后一个强音位置；步骤3：否则找到最后一个有声音的位置
+            analysis = analyze_trailing_silence(video_path, video_duration, sr, channels=1)
+            print(f"  末尾{TAIL_CHECK_SEC:.1f}秒静音比例: {analysis['silence_ratio']:.1%}")
+            if analysis["avg_rms"] is not None:
+                print(f"  前80%平均RMS: {analysis['avg_rms']:.4f}, 衰减阈值(30%): {analysis['fade_threshold']:.4f}")
             
-            # 步骤3：如果静音比例不足60%，使用原来的逻辑（找到最后一个有声音的位置）
-            last_sound_frame = -1
-            for i in range(len(rms_values) - 1, -1, -1):
-                if rms_values[i] >= silence_threshold:
-                    last_sound_frame = i
-                    break
+            if analysis["last_strong_frame"] >= 0:
+                last_strong_time = analysis["last_strong_frame"] * hop_size / sr
+                trailing_silent_duration = video_duration - last_strong_time
+                print(f"  检测到音频衰减: 最后强音位置第{last_strong_time:.2f}s")
+                print(f"  建议裁剪末尾衰减段落: {trailing_silent_duration:.3f}s")
+                return trailing_silent_duration
             
-            if last_sound_frame >= 0:
-                last_sound_time = last_sound_frame * hop_size / sr
+            if analysis["last_sound_frame"] >= 0:
+                last_sound_time = analysis["last_sound_frame"] * hop_size / sr
                 trailing_silent_duration = video_duration - last_sound_time
                 print(f"  最后一个有声音的位置: 第{last_sound_time:.2f}s")
                 print(f"  检测到末尾静音段落: {trailing_silent_duration:.3f}s")
                 return trailing_silent_duration
             else:
                 print(f"  未找到有声音的位置，整个音频都是静音")
-                return len(audio) / sr
+                return analysis["audio_duration"]
         
     except Exception as e:
         print(f"检测{position}静音段落失败: {e}")
@@ -413,18 +400,25 @@ def detect_black_frames_with_audio_opencv(video_path: str, position: str = "trai
     返回:
         需要裁剪的时长（秒）
     """
+    import numpy as np
+    import cv2
     try:
         print(f"  检测{position}有声无画面段落...")
         
-        # 获取视频总时长
-        cmd_duration = [
-            'ffprobe', '-v', 'quiet',
-            '-show_entries', 'format=duration',
-            '-of', 'csv=p=0',
-            video_path
-        ]
-        result = subprocess.run(cmd_duration, capture_output=True, text=True)
-        total_duration = float(result.stdout.strip())
+        # 获取视频总时长（ingest阶段已探测过时直接使用）
+        from beatsync_utils import get_registered_probe
+        probe = get_registered_probe(video_path)
+        if probe is not None and probe.get('duration'):
+            total_duration = probe['duration']
+        else:
+            cmd_duration = [
+                'ffprobe', '-v', 'quiet',
+                '-show_entries', 'format=duration',
+                '-of', 'csv=p=0',
+                video_path
+            ]
+            result = subprocess.run(cmd_duration, capture_output=True, text=True)
+            total_duration = float(result.stdout.strip())
         
         # 获取视频帧率（增强错误处理）
         try:
@@ -653,15 +647,20 @@ def create_trimmed_video(dance_video: str, bgm_video: str, output_video: str,
                         badcase_type: str, gap_duration: float,
                         fast_video: bool = True,
                         hwaccel: Optional[str] = None,
-                        video_encode: str = "encode") -> bool:
-    """创建裁剪后的视频（不生成黑色画面）+ 末尾静音裁剪"""
+                        video_encode: str = "encode",
+                        workspace: Optional[TaskWorkspace] = None) -> bool:
+    """
+    创建裁剪后的视频（不生成黑色画面）+ 末尾静音裁剪
+    workspace: 任务临时工作区，None时创建临时的
+    """
     print(f"创建裁剪视频...")
     print(f"  Badcase类型: {badcase_type}")
     print(f"  裁剪时长: {gap_duration:.2f}s")
     
+    workspace, owned = own_workspace(workspace)
     try:
         # 第一步：创建基础裁剪视频
-        temp_video = "temp_trimmed_video.mp4"
+        temp_video = workspace.file("trimmed_video.mp4")
         
         if badcase_type == "T1_GT_T2":
             # T1 > T2: 裁剪dance视频的前gap_duration秒
@@ -858,6 +857,9 @@ def create_trimmed_video(dance_video: str, bgm_video: str, output_video: str,
     except Exception as e:
         print(f"创建裁剪视频失败: {e}")
         return False
+    finally:
+        if owned:
+            workspace.cleanup()
 
 def process_badcase_fix_trim(dance_video: str, bgm_video: str, output_video: str, sr: int = 44100,
                              fast_video: bool = True,
@@ -866,11 +868,32 @@ def process_badcase_fix_trim(dance_video: str, bgm_video: str, output_video: str
                              enable_cache: bool = True,
                              cache_dir: Optional[str] = ".beatsync_cache",
                              threads: Optional[int] = 4,
-                             lib_threads: Optional[int] = 1) -> bool:
-    """处理badcase修复（裁剪版本）"""
+                             lib_threads: Optional[int] = 1,
+                             align_mode: str = "exhaustive",
+                             refine_radius: float = 0.5,
+                             beat_tolerance: float = 0.1,
+                             fingerprint_db: Optional[str] = None,
+                             align_workers: Optional[int] = 1,
+                             align_deadline: Optional[float] = None,
+                             exit_threshold: Optional[float] = None,
+                             exit_margin: float = 0.2,
+                             ingest_manifest: Optional[dict] = None,
+                             workspace: Optional[TaskWorkspace] = None,
+                             report: Optional[dict] = None) -> bool:
+    """
+    处理badcase修复（裁剪版本）
+    enable_cache / cache_dir: 开启时音频与分析结果（节拍、静音检测的RMS包络）都先查缓存
+    workspace: 任务临时工作区（中间文件写在其中，并发任务互不覆盖），None时创建临时的
+    report: 传入dict时写入对齐结果（dance_alignment / bgm_alignment 秒、confidence）、badcase_type、
+            裁剪时长（trim_start）、各步骤耗时（timings）、输出路径（output_file）与失败原因（error）
+    """
+    import librosa
     import time
     from datetime import datetime
     total_start = time.time()
+    if report is None:
+        report = {}
+    timings = report.setdefault('timings', {})
     
     print("=" * 60)
     print(f"BeatSync Badcase修复（裁剪版本）开始处理...")
@@ -880,34 +903,35 @@ def process_badcase_fix_trim(dance_video: str, bgm_video: str, output_video: str
     print(f"[输出] output: {output_video}")
     print("=" * 60)
     
-    # 创建临时目录
-    temp_dir = tempfile.mkdtemp()
-    print(f"[步骤0] 创建临时目录: {temp_dir}")
+    # 任务临时工作区
+    workspace, owned = own_workspace(workspace)
+    artifacts = get_artifact_cache(cache_dir) if enable_cache and cache_dir else None
+    print(f"[步骤0] 临时工作区: {workspace.path}")
     
     try:
         # 提取音频
         print("[步骤1] 提取音频...")
         step_start = time.time()
-        dance_audio_path = os.path.join(temp_dir, "dance.wav")
-        bgm_audio_path = os.path.join(temp_dir, "bgm.wav")
         
         if lib_threads is not None:
             os.environ['OMP_NUM_THREADS'] = str(lib_threads)
             os.environ['MKL_NUM_THREADS'] = str(lib_threads)
             os.environ['NUMEXPR_NUM_THREADS'] = str(lib_threads)
-        if not extract_audio_from_video(dance_video, dance_audio_path, sr,
-                                        enable_cache=enable_cache, cache_dir=cache_dir):
+        # 解码音频（ffmpeg 直接输出float32到内存，不再写临时WAV再读回）
+        dance_audio = load_audio_from_video(dance_video, sr, enable_cache=enable_cache, cache_dir=cache_dir,
+                                            ingest_manifest=ingest_manifest)
+        if dance_audio is None:
             print("dance音频提取失败")
+            report['error'] = "dance音频提取失败"
             return False
             
-        if not extract_audio_from_video(bgm_video, bgm_audio_path, sr,
-                                        enable_cache=enable_cache, cache_dir=cache_dir):
+        bgm_audio = load_audio_from_video(bgm_video, sr, enable_cache=enable_cache, cache_dir=cache_dir,
+                                          ingest_manifest=ingest_manifest)
+        if bgm_audio is None:
             print("bgm音频提取失败")
+            report['error'] = "bgm音频提取失败"
             return False
-        
-        # 读取音频
-        dance_audio, _ = sf.read(dance_audio_path)
-        bgm_audio, _ = sf.read(bgm_audio_path)
+        timings['audio'] = time.time() - step_start
         
         print(f"音频长度: dance={len(dance_audio)/sr:.2f}s, bgm={len(bgm_audio)/sr:.2f}s")
         
@@ -922,31 +946,63 @@ def process_badcase_fix_trim(dance_video: str, bgm_video: str, output_video: str
         else:
             bgm_mono = bgm_audio
         
-        # 节拍检测对齐
-        ref_start, mov_start, confidence = find_beat_alignment(dance_mono, bgm_mono, sr)
+        # 指纹对齐（可选），识别失败时回退到节拍检测对齐
+        step_start = time.time()
+        fingerprint_result = None
+        if fingerprint_db:
+            from beatsync_fingerprint import fingerprint_alignment
+            fingerprint_result = fingerprint_alignment(dance_mono, bgm_mono, sr, db_path=fingerprint_db,
+                                                       song_name=os.path.basename(bgm_video))
+        if fingerprint_result is not None:
+            ref_start, mov_start, confidence = fingerprint_result
+            print("使用指纹对齐结果，跳过搜索")
+        else:
+            search_stats = {}
+            ref_start, mov_start, confidence = find_beat_alignment(dance_mono, bgm_mono, sr,
+                                                                   align_mode=align_mode,
+                                                                   refine_radius=refine_radius,
+                                                                   beat_tolerance=beat_tolerance,
+                                                                   align_workers=align_workers,
+                                                                   align_deadline=align_deadline,
+                                                                   search_stats=search_stats,
+                                                                   exit_threshold=exit_threshold,
+                                                                   exit_margin=exit_margin,
+                                                                   artifacts=artifacts)
+            if not search_stats.get('completed', True):
+                print(f"对齐搜索未完成（耗时 {search_stats['elapsed']:.1f}s），使用目前最好的结果")
+        
+        timings['align'] = time.time() - step_start
         
         # 检测badcase类型
         badcase_type, gap_duration = detect_badcase_type(ref_start, mov_start, sr)
+        report.update(dance_alignment=ref_start / sr, bgm_alignment=mov_start / sr,
+                      confidence=float(confidence), badcase_type=badcase_type, trim_start=float(gap_duration))
         
         if badcase_type != "NORMAL":
             print(f"[步骤6] 检测到badcase，使用裁剪方法修复...")
             step_start = time.time()
             success = create_trimmed_video(dance_video, bgm_video, output_video, badcase_type, gap_duration,
-                                           fast_video=fast_video, hwaccel=hwaccel, video_encode=video_encode)
+                                           fast_video=fast_video, hwaccel=hwaccel, video_encode=video_encode,
+                                           workspace=workspace)
             print(f"[步骤6] 完成，耗时: {time.time() - step_start:.1f}秒")
         else:
             print("[步骤6] 不是badcase，直接合成...")
             step_start = time.time()
             success = create_trimmed_video(dance_video, bgm_video, output_video, badcase_type, 0,
-                                           fast_video=fast_video, hwaccel=hwaccel, video_encode=video_encode)
+                                           fast_video=fast_video, hwaccel=hwaccel, video_encode=video_encode,
+                                           workspace=workspace)
             print(f"[步骤6] 完成，耗时: {time.time() - step_start:.1f}秒")
         
+        timings['render'] = time.time() - step_start
+        
         total_elapsed = time.time() - total_start
         print("=" * 60)
         if success:
+            report['output_file'] = output_video
             print(f"Badcase修复（裁剪版本）成功! 类型: {badcase_type}, 裁剪时间: {gap_duration:.2f}s")
         else:
             print("Badcase修复（裁剪版本）失败!")
+            report['error'] = "合成裁剪视频失败"
         print(f"[总完成] 时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"[总耗时] {total_elapsed:.1f}秒 ({total_elapsed/60:.1f}分钟)")
         print("=" * 60)
@@ -955,99 +1011,135 @@ def process_badcase_fix_trim(dance_video: str, bgm_video: str, output_video: str
         
     except Exception as e:
         print(f"处理失败: {e}")
+        report['error'] = f"处理失败: {e}"
         return False
     finally:
         # 清理临时文件
-        import shutil
-        shutil.rmtree(temp_dir)
-        print("临时文件已清理")
+        if owned:
+            workspace.cleanup()
+            print("临时文件已清理")
 
-def main():
-    parser = argparse.ArgumentParser(description="BeatSync Badcase修复程序（裁剪版本）")
-    parser.add_argument('--dance', type=str, required=True, help='Dance视频路径')
-    parser.add_argument('--bgm', type=str, required=True, help='BGM视频路径')
-    parser.add_argument('--output', type=str, required=True, help='输出视频路径')
-    parser.add_argument('--fast-video', action='store_true', help='启用快速路径（更快的编码/可选硬件加速）')
-    parser.add_argument('--hwaccel', type=str, default=None, choices=[None, 'videotoolbox', 'auto'], help='硬件加速选项')
-    parser.add_argument('--video-encode', type=str, default='x264_fast', choices=['copy', 'x264_fast', 'videotoolbox'], help='出片阶段的视频编码策略')
-    parser.add_argument('--enable-cache', action='store_true', help='启用音频提取缓存（基于输入签名）')
-    parser.add_argument('--cache-dir', type=str, default='.beatsync_cache', help='缓存目录')
-    parser.add_argument('--threads', type=int, default=4, help='ffmpeg 线程数（不指定则使用默认）')
-    parser.add_argument('--lib-threads', type=int, default=1, help='数值库线程（OMP/MKL/NUMEXPR）')
+def run_badcase_fix_trim(dance_video: str, bgm_video: str, output_video: str,
+                         ingest_manifest_path: Optional[str] = None,
+                         report: Optional[dict] = None,
+                         **options) -> bool:
+    """
+    完整流程（命令行与进程内调用共用）：输入验证、格式标准化后执行 process_badcase_fix_trim
     
-    args = parser.parse_args()
+    参数:
+        ingest_manifest_path: 并行处理器ingest阶段的清单路径
+        report: 传入dict时写入处理结果，见 process_badcase_fix_trim
+        options: process_badcase_fix_trim 的其余参数
+    """
+    if report is None:
+        report = {}
+    # numba 已在导入时指向内核缓存目录（用到时从缓存加载），这里只把缓存节省的时间记入阶段耗时
+    try:
+        from beatsync_warmup import report_kernel_cache
+        report_kernel_cache(report.setdefault('timings', {}))
+    except Exception as e:
+        print(f"读取numba内核缓存状态失败: {e}")
+    ingest_manifest = None
+    if ingest_manifest_path:
+        from beatsync_ingest import load_ingest_manifest
+        ingest_manifest = load_ingest_manifest(ingest_manifest_path)
     
     # 输入验证（增强异常处理）
     try:
         from beatsync_utils import validate_input_files
-        is_valid, error_msg = validate_input_files(args.dance, args.bgm, args.output)
+        is_valid, error_msg = validate_input_files(dance_video, bgm_video, output_video)
         if not is_valid:
             print("=" * 60)
             print("输入验证失败:")
             print(error_msg)
             print("=" * 60)
+            report['error'] = f"输入验证失败: {error_msg}"
             return False
     except ImportError:
         # 如果工具模块不可用，使用基础检查
-        if not os.path.exists(args.dance):
-            print(f"Dance视频文件不存在: {args.dance}")
+        if not os.path.exists(dance_video):
+            print(f"Dance视频文件不存在: {dance_video}")
+            report['error'] = f"Dance视频文件不存在: {dance_video}"
             return False
-        if not os.path.exists(args.bgm):
-            print(f"BGM视频文件不存在: {args.bgm}")
+        if not os.path.exists(bgm_video):
+            print(f"BGM视频文件不存在: {bgm_video}")
+            report['error'] = f"BGM视频文件不存在: {bgm_video}"
             return False
     except Exception as e:
         print(f"输入验证异常: {e}")
+        report['error'] = f"输入验证异常: {e}"
         return False
     
-    # 格式标准化（新增）
-    format_temp_dir = tempfile.mkdtemp(prefix="beatsync_format_")
-    normalized_files = []  # 记录需要清理的临时文件
+    # 任务临时工作区：格式转换结果与中间文件都写在其中，结束后整体删除
+    workspace = TaskWorkspace(estimate_scratch_bytes(dance_video, bgm_video))
     
     try:
-        # 对dance和bgm视频进行格式转换
-        dance_video, converted_dance = normalize_video_format(args.dance, temp_dir=format_temp_dir)
-        if converted_dance:
-            normalized_files.append(dance_video)
-        
-        bgm_video, converted_bgm = normalize_video_format(args.bgm, temp_dir=format_temp_dir)
-        if converted_bgm:
-            normalized_files.append(bgm_video)
+        # 格式标准化：对dance和bgm视频进行格式转换
+        dance_video, _ = normalize_video_format(dance_video, temp_dir=workspace.path)
+        bgm_video, _ = normalize_video_format(bgm_video, temp_dir=workspace.path)
         
-        # 规范化编码策略与默认加速（不改变对齐逻辑）
-        video_encode = 'copy'
-        if args.video_encode == 'x264_fast':
-            video_encode = 'encode'
-        elif args.video_encode == 'videotoolbox':
-            video_encode = 'videotoolbox'
-        hwaccel = None if args.hwaccel in (None, 'auto') else args.hwaccel
-        # 默认启用快速路径与缓存
-        if not args.fast_video:
-            args.fast_video = True
-        if not args.enable_cache:
-            args.enable_cache = True
-        success = process_badcase_fix_trim(dance_video, bgm_video, args.output,
-                                           fast_video=True if args.fast_video else True,
-                                           hwaccel=hwaccel,
-                                           video_encode=video_encode,
-                                           enable_cache=args.enable_cache,
-                                           cache_dir=args.cache_dir,
-                                           threads=args.threads,
-                                           lib_threads=args.lib_threads)
-        return success
+        return process_badcase_fix_trim(dance_video, bgm_video, output_video,
+                                        ingest_manifest=ingest_manifest,
+                                        workspace=workspace,
+                                        report=report,
+                                        **options)
         
     finally:
-        # 清理临时转换文件
-        for temp_file in normalized_files:
-            try:
-                if os.path.exists(temp_file):
-                    os.remove(temp_file)
-            except Exception as e:
-                print(f"清理临时文件失败: {e}")
-        try:
-            if os.path.exists(format_temp_dir) and not os.listdir(format_temp_dir):
-                os.rmdir(format_temp_dir)
-        except Exception:
-            pass
+        workspace.cleanup()
+
+def main():
+    parser = argparse.ArgumentParser(description="BeatSync Badcase修复程序（裁剪版本）")
+    parser.add_argument('--dance', type=str, required=True, help='Dance视频路径')
+    parser.add_argument('--bgm', type=str, required=True, help='BGM视频路径')
+    parser.add_argument('--output', type=str, required=True, help='输出视频路径')
+    parser.add_argument('--fast-video', action='store_true', help='启用快速路径（更快的编码/可选硬件加速）')
+    parser.add_argument('--hwaccel', type=str, default=None, choices=[None, 'videotoolbox', 'auto'], help='硬件加速选项')
+    parser.add_argument('--video-encode', type=str, default='x264_fast', choices=['copy', 'x264_fast', 'videotoolbox'], help='出片阶段的视频编码策略')
+    parser.add_argument('--enable-cache', action='store_true', help='启用音频提取缓存（基于输入签名）')
+    parser.add_argument('--cache-dir', type=str, default='.beatsync_cache', help='缓存目录')
+    parser.add_argument('--threads', type=int, default=4, help='ffmpeg 线程数（不指定则使用默认）')
+    parser.add_argument('--lib-threads', type=int, default=1, help='数值库线程（OMP/MKL/NUMEXPR）')
+    parser.add_argument('--align-mode', type=str, default='exhaustive', choices=['exhaustive', 'coarse_to_fine', 'beat_grid', 'anytime'], help='对齐搜索模式：全量网格搜索 / 粗到细多分辨率搜索 / 节拍网格剪枝 / 限时搜索')
+    parser.add_argument('--refine-radius', type=float, default=0.5, help='粗到细模式的细化半径（秒）')
+    parser.add_argument('--beat-tolerance', type=float, default=0.1, help='节拍网格模式的细化邻域（秒）')
+    parser.add_argument('--align-deadline', type=float, default=None, help='限时搜索模式的时限（秒），到达时返回目前最好的对齐结果')
+    parser.add_argument('--early-exit-threshold', type=float, default=None, help='提前结束的得分阈值：全量搜索中最高得分达到该值且领先次高分时停止（不指定则不提前结束）')
+    parser.add_argument('--early-exit-margin', type=float, default=0.2, help='提前结束要求的领先幅度（最高分 - 其他偏移的次高分）')
+    parser.add_argument('--fingerprint-db', type=str, default=None, help='bgm指纹库路径（SQLite）：识别成功时直接用指纹对齐，跳过搜索')
+    parser.add_argument('--align-workers', type=int, default=1, help='对齐打分的并行线程数（0为自动；受 BEATSYNC_CPU_BUDGET / 数值库线程数限制）')
+    parser.add_argument('--ingest-manifest', type=str, default=None, help='并行处理器ingest阶段的清单：复用其探测信息与已解码的音频，跳过重复提取')
+    
+    args = parser.parse_args()
+    
+    # 规范化编码策略与默认加速（不改变对齐逻辑）
+    video_encode = 'copy'
+    if args.video_encode == 'x264_fast':
+        video_encode = 'encode'
+    elif args.video_encode == 'videotoolbox':
+        video_encode = 'videotoolbox'
+    hwaccel = None if args.hwaccel in (None, 'auto') else args.hwaccel
+    # 默认启用快速路径与缓存
+    if not args.fast_video:
+        args.fast_video = True
+    if not args.enable_cache:
+        args.enable_cache = True
+    return run_badcase_fix_trim(args.dance, args.bgm, args.output,
+                                ingest_manifest_path=args.ingest_manifest,
+                                fast_video=True if args.fast_video else True,
+                                hwaccel=hwaccel,
+                                video_encode=video_encode,
+                                enable_cache=args.enable_cache,
+                                cache_dir=args.cache_dir,
+                                threads=args.threads,
+                                lib_threads=args.lib_threads,
+                                align_mode=args.align_mode,
+                                refine_radius=args.refine_radius,
+                                beat_tolerance=args.beat_tolerance,
+                                fingerprint_db=args.fingerprint_db,
+                                align_workers=args.align_workers,
+                                align_deadline=args.align_deadline,
+                                exit_threshold=args.early_exit_threshold,
+                                exit_margin=args.early_exit_margin)
 
 if __name__ == "__main__":
     success = main()
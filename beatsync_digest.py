@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+BeatSync 内容摘要
+缓存键按文件内容（完整文件的流式 SHA-256）生成：同一视频重新上传、换了文件名或路径也能命中缓存；
+每个文件在一个进程内只计算一次（按 路径+大小+修改时间+inode 记住结果），上传时可以边写边算
+"""
+
+import os
+import json
+import hashlib
+import threading
+
+CHUNK_SIZE = 1024 * 1024
+
+# (绝对路径, 大小, 修改时间ns, inode) -> 十六进制摘要；文件被改写后自动失效
+_digests = {}
+_digests_lock = threading.Lock()
+
+
+def new_digest():
+    """流式摘要对象（update(chunk) / hexdigest()），上传时边写边算"""
+    return hashlib.sha256()
+
+
+def _stat_key(path: str) -> tuple:
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_size, st.st_mtime_ns, st.st_ino)
+
+
+def remember_digest(path: str, digest: str):
+    """登记已算好的文件摘要（如上传时计算的、ingest清单中记录的）"""
+    key = _stat_key(path)
+    with _digests_lock:
+        _digests[key] = digest
+
+
+def file_digest(path: str) -> str:
+    """完整文件的 SHA-256（已登记或本进程算过时直接返回）"""
+    key = _stat_key(path)
+    with _digests_lock:
+        digest = _digests.get(key)
+    if digest is not None:
+        return digest
+    h = new_digest()
+    buffer = bytearray(CHUNK_SIZE)
+    view = memoryview(buffer)
+    with open(path, "rb") as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            h.update(view[:n])
+    digest = h.hexdigest()
+    with _digests_lock:
+        _digests[key] = digest
+    return digest
+
+
+def content_cache_key(path: str, code_ver: str, **params) -> str:
+    """
+    基于文件内容摘要与处理参数的缓存键（不含路径与修改时间）
+
+    参数:
+        code_ver: 缓存格式/算法版本，变更后旧缓存自然失效
+        params: 影响结果的参数（采样率、声道数、时长等）
+    """
+    key_obj = {"content": file_digest(path), "code_ver": code_ver, **params}
+    key_str = json.dumps(key_obj, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(key_str.encode("utf-8")).hexdigest()
+
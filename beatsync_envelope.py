@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+BeatSync 能量包络
+裁剪模块的静音/衰减检测共用的向量化实现：100ms窗口、50ms步长的RMS包络一次 NumPy 运算得到，
+末尾衰减段落的弱音比例用后缀和一次算出所有起点（O(n)，不再对每个起点重新计数）
+"""
+
+from typing import Optional
+
+# 静音检测的RMS滑动窗口与步长（秒）
+RMS_WINDOW_SEC = 0.1
+RMS_HOP_SEC = 0.05
+
+
+def frame_params(sr: int, window_sec: float = RMS_WINDOW_SEC, hop_sec: float = RMS_HOP_SEC) -> tuple:
+    """(窗口采样点数, 步长采样点数)"""
+    return int(window_sec * sr), int(hop_sec * sr)
+
+
+def framed_rms(audio, sr: int, window_sec: float = RMS_WINDOW_SEC, hop_sec: float = RMS_HOP_SEC):
+    """
+    分帧RMS包络：第k帧为 audio[k*hop : k*hop + window] 所有采样（多声道时含全部声道）的均方根，
+    帧起点取 range(0, len(audio) - window, hop)
+
+    参数:
+        audio: (samples,) 或 (samples, channels) 数组（按float64计算能量）
+
+    返回:
+        float64 数组（音频不足一个窗口时为空）
+    """
+    import numpy as np
+    window_size, hop_size = frame_params(sr, window_sec, hop_sec)
+    audio = np.asarray(audio)
+    starts = np.arange(0, len(audio) - window_size, hop_size)
+    if len(starts) == 0:
+        return np.zeros(0)
+    from numpy.lib.stride_tricks import sliding_window_view
+    channels = audio.shape[1] if audio.ndim > 1 else 1
+    # 行连续的多声道音频展平后，一个窗口的所有声道采样是一段连续区间：
+    # 在展平的能量数组上按步长取滑动窗口视图（不复制），逐窗口求和即得各帧能量
+    energy = np.square(np.ascontiguousarray(audio), dtype=np.float64).ravel()
+    frames = sliding_window_view(energy, window_size * channels)[::hop_size * channels][:len(starts)]
+    return np.sqrt(frames.sum(axis=1) / (window_size * channels))
+
+
+def first_frame_above(rms, threshold: float) -> int:
+    """第一个 RMS > threshold 的帧，没有时返回-1"""
+    import numpy as np
+    frames = np.flatnonzero(np.asarray(rms) > threshold)
+    return int(frames[0]) if len(frames) else -1
+
+
+def last_frame_at_least(rms, threshold: float, end: Optional[int] = None) -> int:
+    """end（不含）之前最后一个 RMS >= threshold 的帧，没有时返回-1"""
+    import numpy as np
+    frames = np.flatnonzero(np.asarray(rms)[:end] >= threshold)
+    return int(frames[-1]) if len(frames) else -1
+
+
+def below_ratio(rms, threshold: float, start: int) -> float:
+    """从 start 帧到末尾 RMS < threshold 的帧所占比例（没有帧时为0）"""
+    import numpy as np
+    tail = np.asarray(rms)[start:]
+    return int(np.count_nonzero(tail < threshold)) / len(tail) if len(tail) else 0
+
+
+def decay_start_frame(rms, fade_threshold: float, weak_ratio: float = 0.7) -> int:
+    """
+    末尾衰减段落的起点：从后往前第一个满足「从该帧到末尾弱音（< fade_threshold）比例 >= weak_ratio」的帧，
+    各起点的弱音帧数由后缀和一次得到；没有时返回-1
+    """
+    import numpy as np
+    weak = np.asarray(rms) < fade_threshold
+    n = len(weak)
+    if n == 0:
+        return -1
+    weak_counts = np.cumsum(weak[::-1])[::-1]  # weak_counts[s] = 第s帧到末尾的弱音帧数
+    ratios = weak_counts / np.arange(n, 0, -1)
+    frames = np.flatnonzero(ratios >= weak_ratio)
+    return int(frames[-1]) if len(frames) else -1
+
+
+def last_strong_before_decay(rms, fade_threshold: float, weak_ratio: float = 0.7) -> int:
+    """衰减段落起点之前最后一个强音帧（RMS >= fade_threshold），没有衰减段落或强音帧时返回-1"""
+    start = decay_start_frame(rms, fade_threshold, weak_ratio)
+    if start < 0:
+        return -1
+    return last_frame_at_least(rms, fade_threshold, end=start)
+
+
+# ==================== 开头/末尾窗口检测 ====================
+# 只解码检测需要的部分：开头检测解码开头窗口，末尾检测解码末尾窗口（窗口内找不到结果时加倍扩大），
+# 前80%平均RMS在区域较短时整段解码，较长时用均匀分布的若干小段估计：检测耗时与视频长度无关
+# 从中间开始解码时用 -ss 定位，并非逐采样精确：AAC等格式有编码器延迟（priming，常见为1024个采样，
+# 44.1kHz下约23ms），寻址时的预解码也因解码器而异，包络与整段解码相比帧序号可能相差约一帧（50ms），
+# RMS数值也略有不同；从开头解码（开头检测）不受影响
+
+# 开头/末尾窗口的初始长度（秒）
+HEAD_WINDOW_SEC = 20.0
+TAIL_WINDOW_SEC = 20.0
+# 前80%平均RMS：区域不超过该时长时整段解码（精确值），否则抽样估计
+STAT_EXACT_MAX_SEC = 60.0
+# 抽样的段数与每段时长（秒）
+STAT_SEGMENTS = 8
+STAT_SEGMENT_SEC = 2.0
+# 末尾静音比例的检查时长（秒）与静音阈值（取值与整段检测相同）
+TAIL_CHECK_SEC = 3.0
+SILENCE_THRESHOLD = 0.01
+
+
+def decode_rms(video_path: str, sr: int, channels: int = 2, start_frame: int = 0,
+               frames: Optional[int] = None) -> tuple:
+    """
+    解码从第 start_frame 帧起的音频并计算RMS包络，返回包络的第0帧对应整段的第 start_frame 帧
+    （start_frame > 0 时按 -ss 定位，与整段解码相比可能偏差约一帧，见本节说明）
+
+    参数:
+        frames: 只解码够计算这么多帧的音频，None表示解码到末尾
+
+    返回:
+        (RMS包络, 解码的采样点数)；起点超过音频末尾时包络为空
+    """
+    import numpy as np
+    from beatsync_audio_decoder import decode_audio
+    window_size, hop_size = frame_params(sr)
+    offset = start_frame * hop_size / sr
+    duration = (frames * hop_size + window_size) / sr if frames is not None else None
+    audio, error = decode_audio(video_path, sr=sr, channels=channels, duration=duration, offset=offset)
+    if audio is None:
+        if start_frame > 0 and error.startswith("没有解码到音频数据"):
+            return np.zeros(0), 0
+        raise RuntimeError(error)
+    rms = framed_rms(audio, sr)
+    return (rms[:frames] if frames is not None else rms), len(audio)
+
+
+def detect_leading_silence(video_path: str, sr: int = 22050, channels: int = 2,
+                           window_sec: float = HEAD_WINDOW_SEC,
+                           threshold: float = SILENCE_THRESHOLD) -> float:
+    """
+    开头连续无声段落的长度（秒）：只解码开头窗口，窗口内都是静音时加倍扩大；整段静音时返回0
+    结果与整段解码后 first_frame_above 相同
+    """
+    _, hop_size = frame_params(sr)
+    window_frames = max(1, int(window_sec * sr / hop_size))
+    while True:
+        rms, _ = decode_rms(video_path, sr, channels, 0, window_frames)
+        first = first_frame_above(rms, threshold)
+        if first >= 0:
+            return first * hop_size / sr
+        if len(rms) < window_frames:
+            return 0.0
+        window_frames *= 2
+
+
+def sampled_mean_rms(video_path: str, sr: int, channels: int, end_frame: int,
+                     exact_max_sec: float = STAT_EXACT_MAX_SEC, segments: int = STAT_SEGMENTS,
+                     segment_sec: float = STAT_SEGMENT_SEC) -> float:
+    """
+    前 end_frame 帧的平均RMS：区域不超过 exact_max_sec 时整段解码（精确），
+    否则解码均匀分布的 segments 段（每段 segment_sec 秒）估计；没有帧时为nan
+    """
+    import numpy as np
+    _, hop_size = frame_params(sr)
+    if end_frame <= 0:
+        return float("nan")
+    if end_frame * hop_size / sr <= exact_max_sec:
+        rms, _ = decode_rms(video_path, sr, channels, 0, end_frame)
+        return float(np.mean(rms))
+    segment_frames = max(1, int(segment_sec * sr / hop_size))
+    # 区域等分为 segments 份，每份取中间一段（不偏向开头的无声段落或末尾）
+    centers = (np.arange(segments) + 0.5) * end_frame / segments
+    starts = np.clip(centers - segment_frames / 2, 0, end_frame - segment_frames).astype(int)
+    values = [decode_rms(video_path, sr, channels, int(start), segment_frames)[0] for start in starts]
+    return float(np.mean(np.concatenate(values)))
+
+
+def analyze_trailing_silence(video_path: str, duration: float, sr: int = 22050, channels: int = 2,
+                             window_sec: float = TAIL_WINDOW_SEC, check_sec: float = TAIL_CHECK_SEC,
+                             threshold: float = SILENCE_THRESHOLD, silence_ratio_min: float = 0.6,
+                             fade_factor: float = 0.3, weak_ratio: float = 0.7) -> dict:
+    """
+    末尾静音/衰减分析（与整段检测的步骤相同）：只解码末尾窗口，结果落在窗口之外时加倍扩大窗口
+    （末尾窗口按 -ss 定位，帧序号与整段解码相比可能相差约一帧，即裁剪点误差约50ms）
+
+    1. 末尾 check_sec 秒中静音帧（< threshold）的比例
+    2. 比例 >= silence_ratio_min 时：衰减阈值 = 前80%帧平均RMS（sampled_mean_rms）* fade_factor，
+       找到衰减段落起点之前最后一个强音帧
+    3. 最后一个有声音（>= threshold）的帧
+
+    参数:
+        duration: 视频时长（秒，用于定位末尾窗口；不准确时窗口会自动扩大）
+
+    返回:
+        dict: total_frames、audio_duration（音频时长，秒）、silence_ratio、avg_rms / fade_threshold
+              （未做衰减检测时为None）、last_strong_frame、last_sound_frame（帧序号，找不到时为-1）
+    """
+    window_size, hop_size = frame_params(sr)
+    window_frames = max(1, int(window_sec * sr / hop_size))
+    check_frames = int(check_sec * sr / hop_size)
+    last_frame = max(0, (int(duration * sr) - window_size) // hop_size)
+    avg_rms = None
+    while True:
+        start_frame = max(0, last_frame - window_frames)
+        rms, samples = decode_rms(video_path, sr, channels, start_frame)
+        complete = start_frame == 0
+        total_frames = start_frame + len(rms)
+        result = {
+            "total_frames": total_frames,
+            "audio_duration": (start_frame * hop_size + samples) / sr,
+            "silence_ratio": 0,
+            "avg_rms": None,
+            "fade_threshold": None,
+            "last_strong_frame": -1,
+            "last_sound_frame": -1,
+        }
+        check_start = max(0, total_frames - check_frames)
+        if check_start < start_frame or len(rms) == 0:
+            if complete:
+                return result
+            window_frames *= 2
+            continue
+        result["silence_ratio"] = below_ratio(rms, threshold, check_start - start_frame)
+
+        if result["silence_ratio"] >= silence_ratio_min:
+            if avg_rms is None:
+                cutoff_frame = int(total_frames * 0.8)
+                if complete:
+                    import numpy as np
+                    avg_rms = float(np.mean(rms[:cutoff_frame])) if cutoff_frame > 0 else float("nan")
+                else:
+                    avg_rms = sampled_mean_rms(video_path, sr, channels, cutoff_frame)
+            fade_threshold = avg_rms * fade_factor
+            result.update(avg_rms=avg_rms, fade_threshold=fade_threshold)
+            decay_start = decay_start_frame(rms, fade_threshold, weak_ratio)
+            last_strong = last_frame_at_least(rms, fade_threshold, end=decay_start) if decay_start >= 0 else -1
+            if last_strong < 0 and not complete:
+                # 衰减段落起点或其之前的强音帧在窗口之外
+                window_frames *= 2
+                continue
+            if last_strong >= 0:
+                result["last_strong_frame"] = start_frame + last_strong
+                return result
+
+        last_sound = last_frame_at_least(rms, threshold)
+        if last_sound < 0 and not complete:
+            window_frames *= 2
+            continue
+        result["last_sound_frame"] = start_frame + last_sound if last_sound >= 0 else -1
+        return result
@@ -5,19 +5,24 @@ BeatSync 模块解耦精剪模式
 模块2: 裁剪模块（检测并剪掉前面的无声段落）
 """
 
+from __future__ import annotations
+
 import os
 import sys
-import librosa
-import numpy as np
-import soundfile as sf
 import subprocess
 import argparse
 import shutil
 import tempfile
-from typing import Tuple, Optional
-import hashlib
-import json
+from typing import Tuple, Optional, TYPE_CHECKING
 from datetime import datetime
+from beatsync_workspace import TaskWorkspace, own_workspace, estimate_scratch_bytes
+from beatsync_artifact_cache import ArtifactCache, cached_artifact, get_artifact_cache
+from beatsync_envelope import RMS_HOP_SEC, TAIL_CHECK_SEC, detect_leading_silence, analyze_trailing_silence
+
+# numpy / soundfile / librosa 在用到的函数内导入：只做输入验证、--help 或被编排进程导入时不加载
+if TYPE_CHECKING:
+    import numpy as np
+
 #
 # 启用行缓冲，确保日志实时写出（不影响功能/算法）
 try:
@@ -26,6 +31,13 @@ try:
 except Exception:
     pass
 
+# numba 内核缓存目录（librosa 的即时编译结果跨进程复用，需在numba被导入前设置）
+try:
+    from beatsync_warmup import configure_numba_cache
+    configure_numba_cache()
+except ImportError:
+    pass
+
 # ==================== 视频格式兼容性 ====================
 
 def normalize_video_format(video_path: str, output_path: str = None, 
@@ -80,120 +92,84 @@ def ensure_dir(path: str):
     if path and not os.path.exists(path):
         os.makedirs(path, exist_ok=True)
 
-def file_quick_signature(path: str, max_bytes: int = 4 * 1024 * 1024) -> dict:
+def build_cache_key(input_path: str, duration: float, sr: int, channels: int, code_ver: str = "modular_v2") -> str:
     """
-    生成文件签名：size + mtime + 前4MB sha1，避免全量hash带来的IO
+    基于输入文件内容（完整文件摘要）与关键参数构建缓存key：同一视频换了文件名/路径也能命中
     """
-    st = os.stat(path)
-    sig = {
-        "size": st.st_size,
-        "mtime": int(st.st_mtime),
-        "sha1_head": None
-    }
-    try:
-        h = hashlib.sha1()
-        with open(path, "rb") as f:
-            chunk = f.read(max_bytes)
-            h.update(chunk)
-        sig["sha1_head"] = h.hexdigest()
-    except Exception:
-        sig["sha1_head"] = None
-    return sig
+    from beatsync_digest import content_cache_key
+    return content_cache_key(input_path, code_ver, duration=duration, sr=sr, channels=channels)
 
-def build_cache_key(input_path: str, duration: float, sr: int, channels: int, code_ver: str = "modular_v1") -> str:
+def load_audio_optimized(video_path: str, duration: float = 30.0, enable_cache: bool = False,
+                         cache_dir: Optional[str] = None, sr: int = 22050,
+                         ingest_manifest: Optional[dict] = None) -> Optional[np.ndarray]:
     """
-    基于输入文件签名与关键参数构建缓存key
-    """
-    sig = file_quick_signature(input_path)
-    key_obj = {
-        "input": input_path,
-        "sig": sig,
-        "duration": duration,
-        "sr": sr,
-        "channels": channels,
-        "code_ver": code_ver,
-    }
-    key_str = json.dumps(key_obj, sort_keys=True, ensure_ascii=False)
-    return hashlib.sha1(key_str.encode("utf-8")).hexdigest()
+    优化的音频加载：ffmpeg 解码结果直接读入float32数组，不经过临时WAV文件
+    （提供ingest清单且包含该视频时，直接使用并行处理器已解码的音频；命中缓存时为缓存文件的只读内存映射）
 
-def extract_audio_optimized(video_path: str, audio_path: str, duration: float = 30.0,
-                            enable_cache: bool = False, cache_dir: Optional[str] = None) -> bool:
-    """优化的音频提取"""
+    返回: (samples, 2) 的float32双声道音频，失败时返回None
+    """
     try:
-        if enable_cache and cache_dir:
-            ensure_dir(cache_dir)
-            # 缓存管理：在提取前检查并清理缓存
-            try:
-                from beatsync_utils import manage_cache
-                manage_cache(cache_dir, max_files=100, max_size_mb=5000)
-            except ImportError:
-                pass  # 如果工具模块不可用，跳过缓存管理
-            
-            cache_key = build_cache_key(video_path, duration, 22050, 2)
-            cache_wav = os.path.join(cache_dir, f"{cache_key}.wav")
-            if os.path.exists(cache_wav):
-                # 命中缓存
-                shutil.copyfile(cache_wav, audio_path)
-                return True
-        cmd = [
-            'ffmpeg', '-y',
-            '-nostdin', '-hide_banner', '-v', 'error',
-            '-i', video_path,
-            '-t', str(duration),
-            '-vn', '-acodec', 'pcm_s16le', '-ar', '22050', '-ac', '2',
-            audio_path
-        ]
-        
-        # 增强异常处理
-        try:
-            from beatsync_utils import run_ffmpeg_command, validate_audio_file
-            success, error_msg = run_ffmpeg_command(cmd, f"提取音频 {os.path.basename(video_path)}")
-            if not success:
-                print(f"音频提取失败: {error_msg}")
-                return False
-            
-            # 验证提取的音频文件
-            is_valid, validation_error = validate_audio_file(audio_path)
-            if not is_valid:
-                print(f"音频验证失败: {validation_error}")
-                return False
-        except ImportError:
-            # 如果工具模块不可用，使用基础方法
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-            if result.returncode != 0:
-                print(f"音频提取失败: {result.stderr[:200]}")
-                return False
+        from beatsync_ingest import ingested_audio
+        audio = ingested_audio(ingest_manifest, video_path, sr, duration)
+        if audio is not None:
+            return audio
         
-        ok = True
-        if ok and enable_cache and cache_dir:
-            try:
-                cache_key = build_cache_key(video_path, duration, 22050, 2)
-                cache_wav = os.path.join(cache_dir, f"{cache_key}.wav")
-                if not os.path.exists(cache_wav):
-                    shutil.copyfile(audio_path, cache_wav)
-            except Exception:
-                pass
-        return ok
-    except:
-        return False
+        cache_index = None
+        if enable_cache and cache_dir:
+            # 缓存索引：按键查找，超出上限时在后台按LRU淘汰（不再每次遍历缓存目录）
+            from beatsync_audio_cache import get_cache_index
+            cache_index = get_cache_index(cache_dir)
+            cache_key = build_cache_key(video_path, duration, sr, 2)
+            audio = cache_index.load_array(cache_key)
+            if audio is not None:
+                # 命中缓存：直接返回缓存文件的只读内存映射
+                return audio
+        
+        from beatsync_audio_decoder import decode_audio
+        audio, error_msg = decode_audio(video_path, sr=sr, channels=2, duration=duration)
+        if audio is None:
+            print(f"音频提取失败: {error_msg}")
+            return None
+        
+        if cache_index is not None:
+            cache_index.store_array(cache_key, audio)
+        return audio
+    except Exception as e:
+        print(f"音频提取失败: {e}")
+        return None
 
-def extract_music_features(audio: np.ndarray, sr: int):
-    """提取音乐特征"""
-    try:
-        # MFCC特征
-        mfcc = librosa.feature.mfcc(y=audio, sr=sr, n_mfcc=13)
-        
-        # 音乐特征
-        chroma = librosa.feature.chroma_stft(y=audio, sr=sr)
-        spectral_contrast = librosa.feature.spectral_contrast(y=audio, sr=sr)
-        spectral_rolloff = librosa.feature.spectral_rolloff(y=audio, sr=sr)
-        
-        return mfcc, chroma, spectral_contrast, spectral_rolloff
-    except:
+def extract_music_features(audio: np.ndarray, sr: int, artifacts: Optional[ArtifactCache] = None):
+    """提取音乐特征；artifacts: 分析结果缓存（None时直接计算）"""
+    import librosa
+    def compute():
+        try:
+            return {
+                # MFCC特征
+                "mfcc": librosa.feature.mfcc(y=audio, sr=sr, n_mfcc=13),
+                # 音乐特征
+                "chroma": librosa.feature.chroma_stft(y=audio, sr=sr),
+                "spectral_contrast": librosa.feature.spectral_contrast(y=audio, sr=sr),
+                "spectral_rolloff": librosa.feature.spectral_rolloff(y=audio, sr=sr),
+            }
+        except:
+            return None
+    features = cached_artifact(artifacts, "music_features", audio, compute, sr=sr, n_mfcc=13)
+    if features is None:
         return None, None, None, None
+    return features["mfcc"], features["chroma"], features["spectral_contrast"], features["spectral_rolloff"]
+
+def detect_beats(audio: np.ndarray, sr: int, artifacts: Optional[ArtifactCache] = None):
+    """节拍检测（librosa.beat.beat_track，节拍为帧序号）；artifacts: 分析结果缓存（None时直接计算）"""
+    import librosa
+    def compute():
+        tempo, beats = librosa.beat.beat_track(y=audio, sr=sr)
+        return {"tempo": tempo, "beats": beats}
+    result = cached_artifact(artifacts, "beats", audio, compute, sr=sr, units="frames")
+    return result["tempo"], result["beats"]
 
 def calculate_feature_similarity(feat1: np.ndarray, feat2: np.ndarray) -> float:
     """计算特征相似度"""
+    import numpy as np
     try:
         corr_matrix = np.corrcoef(feat1.flatten(), feat2.flatten())
         return abs(corr_matrix[0, 1])
@@ -203,6 +179,7 @@ def calculate_feature_similarity(feat1: np.ndarray, feat2: np.ndarray) -> float:
 def calculate_original_correlation(ref_audio: np.ndarray, mov_audio: np.ndarray, 
                                    ref_start: int, mov_start: int, sr: int) -> float:
     """计算原始音频相关性"""
+    import numpy as np
     window_samples = int(2.0 * sr)  # 2秒窗口
     
     ref_start_idx = ref_start
@@ -277,33 +254,303 @@ def calculate_music_feature_correlation(ref_audio: np.ndarray, mov_audio: np.nda
     except Exception as e:
         return 0.0
 
+# librosa特征的默认帧移（采样点）
+FEATURE_HOP_LENGTH = 512
+# onset包络帧移（采样点）：22.05kHz下约86帧/秒
+ONSET_HOP_LENGTH = 256
+# onset包络模板长度（秒）：包络的时间分辨率低，用比2秒窗口更长的模板保证区分度
+ONSET_WINDOW_SEC = 6.0
+
+def calculate_music_feature_curve(ref_audio: np.ndarray, mov_audio: np.ndarray,
+                                  mov_start: int, sr: int, ref_features: Optional[tuple] = None,
+                                  artifacts: Optional[ArtifactCache] = None) -> np.ndarray:
+    """
+    批量计算音乐特征相关性：dance整段只提取一次MFCC/Chroma/Spectral Contrast/Rolloff，
+    在特征矩阵上滑动与2秒窗口对齐的帧块，一次得到所有dance帧起点的得分
+    
+    参数:
+        ref_audio: dance音频（整段分析片段）
+        mov_audio: bgm音频
+        mov_start: bgm窗口起点（采样点），模板特征与逐点计算一样取自该2秒片段
+        sr: 采样率
+        ref_features: 已提取的dance整段特征（为None时现场提取）
+        artifacts: 分析结果缓存，只用于dance整段特征（bgm的2秒片段每次不同，缓存命中不了，不写入缓存）
+    
+    返回:
+        得分曲线，第j项对应dance起点约为 j * FEATURE_HOP_LENGTH 采样点（权重与逐点计算相同）
+    """
+    import numpy as np
+    from beatsync_align_engine import sliding_feature_correlation
+    window_samples = int(2.0 * sr)  # 2秒窗口
+    if mov_start < 0 or mov_start + window_samples > len(mov_audio) or len(ref_audio) < window_samples:
+        return np.zeros(0)
+    
+    if ref_features is None:
+        ref_features = extract_music_features(ref_audio, sr, artifacts)
+    mov_features = extract_music_features(mov_audio[mov_start:mov_start + window_samples], sr)
+    if any(f is None for f in ref_features) or any(f is None for f in mov_features):
+        return np.zeros(0)
+    
+    curve = None
+    # 调整后的权重（MFCC, Chroma, Spectral Contrast, Spectral Rolloff）
+    for ref_feat, mov_feat, weight in zip(ref_features, mov_features, (0.4, 0.3, 0.2, 0.1)):
+        similarity = np.abs(sliding_feature_correlation(ref_feat, mov_feat)) * weight
+        curve = similarity if curve is None else curve + similarity
+    return curve
+
+def music_feature_scores(curve: np.ndarray, ref_starts, ref_len: int, sr: int,
+                         hop_length: int = FEATURE_HOP_LENGTH) -> np.ndarray:
+    """按dance起点（采样点）采样帧级得分曲线（音乐特征/onset包络），窗口越界的起点得分为0"""
+    import numpy as np
+    window_samples = int(2.0 * sr)
+    scores = np.zeros(len(ref_starts))
+    for i, ref_start in enumerate(ref_starts):
+        frame = int(round(ref_start / hop_length))
+        if ref_start + window_samples <= ref_len and frame < len(curve):
+            scores[i] = curve[frame]
+    return scores
+
+# 批量音乐特征得分与逐窗口提取特征的得分在边界填充、分贝裁剪、调音估计上略有差异，无法逐位一致：
+# 融合决策前，可能成为最佳对齐点的少数候选（最多 MUSIC_RESCORE_TOP_K 个）改用逐窗口得分，
+# 选出的对齐点按逐点计算的得分与逐点穷举的最优得分相差不超过 MUSIC_SCORE_MARGIN
+# 批量得分与逐窗口得分的误差上界：合成节拍音频（18组，噪声0~3倍）实测最大误差约0.053（单段曲线与网格），
+# 见 scripts/test/test_align_engine.py 的 test_music_score_margin
+MUSIC_SCORE_MARGIN = 0.06
+# 每个阶段最多重新打分的候选数（逐窗口提取特征较慢，开销固定，不随网格大小增长）
+MUSIC_RESCORE_TOP_K = 8
+# 每批重新打分的候选数
+MUSIC_RESCORE_BATCH = 4
+
+def rescore_music_candidates(ref_audio: np.ndarray, mov_audio: np.ndarray, pairs, original_scores,
+                             music_scores, sr: int, align_strategy: str = "fusion",
+                             min_score: float = 0.0, margin: float = MUSIC_SCORE_MARGIN, batch: int = MUSIC_RESCORE_BATCH,
+                             top_k: int = MUSIC_RESCORE_TOP_K, workers: Optional[int] = 1) -> np.ndarray:
+    """
+    融合决策前按逐窗口提取特征（calculate_music_feature_correlation）重新计算可能胜出的候选的音乐特征得分
+    
+    只有音乐特征得分加上 margin 后能让融合决策改用音乐特征的候选，融合得分才可能与原始得分不同；
+    这些候选按可能的最高融合得分（批量得分 + margin）从高到低分批重新打分，直到剩余候选的最高可能得分
+    不超过目前的最高融合得分（剩余候选即使用逐窗口得分也不会胜出），或已重新打分 top_k 个候选；
+    其余候选保留批量得分（融合决策仍用原始得分，与逐点计算一致）
+    
+    参数:
+        pairs: [(dance起点, bgm起点)]（采样点），与两个得分序列一一对应
+        min_score: 已有的最佳得分（如第一阶段的结果），最高可能得分不超过它的候选不重新打分
+        top_k: 最多重新打分的候选数
+    
+    返回:
+        新的音乐特征得分数组
+    """
+    import numpy as np
+    from beatsync_align_engine import parallel_map
+    original_scores = np.asarray(original_scores, dtype=np.float64)
+    scores = np.array(music_scores, dtype=np.float64)
+    if len(scores) == 0:
+        return scores
+    optimistic = scores + margin
+    can_switch = ((original_scores >= FUSION_MIN_ORIGINAL) & (optimistic > original_scores * FUSION_RATIO)
+                  & (optimistic - original_scores > FUSION_GAP))
+    candidates = np.flatnonzero(can_switch)
+    order = candidates[np.argsort(-optimistic[candidates], kind="stable")]
+    # 融合得分不低于原始得分：原始得分本身是精确的
+    best_final = max(min_score, float(original_scores.max()))
+    done = 0
+    limit = min(len(order), top_k)
+    while done < limit and optimistic[order[done]] > best_final:
+        chunk = list(order[done:min(done + batch, limit)])
+        scores[chunk] = parallel_map(lambda i: calculate_music_feature_correlation(
+            ref_audio, mov_audio, pairs[i][0], pairs[i][1], sr), chunk, workers)
+        for i in chunk:
+            final_score = find_best_alignment_score(ref_audio, mov_audio, pairs[i][0], pairs[i][1], sr,
+                                                    original_score=float(original_scores[i]),
+                                                    music_score=float(scores[i]),
+                                                    align_strategy=align_strategy)[0]
+            best_final = max(best_final, final_score)
+        done += len(chunk)
+    return scores
+
+def calculate_music_feature_grid(ref_audio: np.ndarray, mov_audio: np.ndarray, ref_starts, mov_starts,
+                                 sr: int, ref_features: Optional[tuple] = None,
+                                 workers: Optional[int] = 1,
+                                 artifacts: Optional[ArtifactCache] = None) -> np.ndarray:
+    """
+    批量计算 (dance起点 × bgm起点) 的音乐特征得分
+
+    dance与bgm各只提取一次整段特征，每个bgm起点的模板直接从bgm特征矩阵中按帧切片
+    （与单独提取2秒片段相比只有边界帧的填充不同），再在dance特征上滑动；
+    各bgm起点的列互相独立，workers > 1 时按列分给线程池；artifacts: 分析结果缓存（None时直接计算）
+
+    返回:
+        (len(ref_starts), len(mov_starts)) 得分矩阵，窗口越界的位置得分为0
+    """
+    import numpy as np
+    from beatsync_align_engine import sliding_feature_correlation, parallel_map
+    window_samples = int(2.0 * sr)
+    template_frames = 1 + window_samples // FEATURE_HOP_LENGTH
+    grid = np.zeros((len(ref_starts), len(mov_starts)))
+    if len(ref_audio) < window_samples or len(mov_audio) < window_samples:
+        return grid
+
+    if ref_features is None:
+        ref_features = extract_music_features(ref_audio, sr, artifacts)
+    mov_features = extract_music_features(mov_audio, sr, artifacts)
+    if any(f is None for f in ref_features) or any(f is None for f in mov_features):
+        return grid
+
+    def fill_column(j: int):
+        mov_start = mov_starts[j]
+        frame = int(round(mov_start / FEATURE_HOP_LENGTH))
+        if mov_start + window_samples > len(mov_audio) or frame + template_frames > mov_features[0].shape[1]:
+            return
+        curve = None
+        for ref_feat, mov_feat, weight in zip(ref_features, mov_features, (0.4, 0.3, 0.2, 0.1)):
+            similarity = np.abs(sliding_feature_correlation(ref_feat, mov_feat[:, frame:frame + template_frames])) * weight
+            curve = similarity if curve is None else curve + similarity
+        grid[:, j] = music_feature_scores(curve, ref_starts, len(ref_audio), sr)
+
+    parallel_map(fill_column, range(len(mov_starts)), workers)
+    return grid
+
+def calculate_onset_envelope(audio: np.ndarray, sr: int, artifacts: Optional[ArtifactCache] = None) -> np.ndarray:
+    """onset强度包络（帧移 ONSET_HOP_LENGTH，22.05kHz下约86帧/秒）；artifacts: 分析结果缓存（None时直接计算）"""
+    import librosa
+    def compute():
+        return {"envelope": librosa.onset.onset_strength(y=audio, sr=sr, hop_length=ONSET_HOP_LENGTH)}
+    return cached_artifact(artifacts, "onset_envelope", audio, compute, sr=sr,
+                           hop_length=ONSET_HOP_LENGTH)["envelope"]
+
+def calculate_onset_curve(ref_audio: np.ndarray, mov_audio: np.ndarray, mov_start: int, sr: int,
+                          ref_env: Optional[np.ndarray] = None,
+                          mov_env: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    onset包络相关性：bgm从mov_start起的包络模板在dance包络上滑动，一次得到所有dance帧起点的得分
+    
+    参数:
+        ref_env / mov_env: 已计算的onset包络（为None时现场计算）
+    
+    返回:
+        得分曲线，第j项对应dance起点约为 j * ONSET_HOP_LENGTH 采样点
+    """
+    import numpy as np
+    from beatsync_align_engine import normalized_xcorr_curve
+    if ref_env is None:
+        ref_env = calculate_onset_envelope(ref_audio, sr)
+    if mov_env is None:
+        mov_env = calculate_onset_envelope(mov_audio, sr)
+    frame = int(round(mov_start / ONSET_HOP_LENGTH))
+    length = min(int(ONSET_WINDOW_SEC * sr / ONSET_HOP_LENGTH), len(mov_env) - frame, len(ref_env))
+    if frame < 0 or length < 2:
+        return np.zeros(0)
+    return normalized_xcorr_curve(ref_env, mov_env[frame:frame + length])
+
+def calculate_onset_correlation(ref_audio: np.ndarray, mov_audio: np.ndarray,
+                                ref_start: int, mov_start: int, sr: int) -> float:
+    """使用onset包络进行相关性计算（单个偏移）"""
+    curve = calculate_onset_curve(ref_audio, mov_audio, mov_start, sr)
+    return float(music_feature_scores(curve, [ref_start], len(ref_audio), sr, hop_length=ONSET_HOP_LENGTH)[0])
+
+# 融合决策：原始得分不低于 FUSION_MIN_ORIGINAL，且候选策略得分超过原始得分的 FUSION_RATIO 倍、
+# 高出 FUSION_GAP 以上时，才改用候选策略的得分
+FUSION_MIN_ORIGINAL = 0.05
+FUSION_RATIO = 1.5
+FUSION_GAP = 0.1
+
 def find_best_alignment_score(ref_audio: np.ndarray, mov_audio: np.ndarray, 
-                              ref_start: int, mov_start: int, sr: int) -> Tuple[float, float, float, str]:
-    """计算并融合多种策略的对齐得分"""
-    original_score = calculate_original_correlation(ref_audio, mov_audio, ref_start, mov_start, sr)
-    music_score = calculate_music_feature_correlation(ref_audio, mov_audio, ref_start, mov_start, sr)
+                              ref_start: int, mov_start: int, sr: int,
+                              original_score: Optional[float] = None,
+                              music_score: Optional[float] = None,
+                              onset_score: Optional[float] = None,
+                              align_strategy: str = "fusion") -> Tuple[float, float, float, str]:
+    """
+    计算并融合多种策略的对齐得分
+    
+    参数:
+        original_score: 预先批量计算好的原始相关性得分（为None时逐点计算）
+        music_score: 预先批量计算好的音乐特征得分（为None时逐点计算）
+        onset_score: 预先批量计算好的onset包络得分（为None时逐点计算）
+        align_strategy: "fusion" 原始相关性 + 音乐特征；"onset" 原始相关性 + onset包络
+    
+    返回:
+        (最终得分, 原始得分, 候选策略得分, 选择的策略)，候选策略为音乐特征或onset包络
+    """
+    if original_score is None:
+        original_score = calculate_original_correlation(ref_audio, mov_audio, ref_start, mov_start, sr)
+    if align_strategy == "onset":
+        if onset_score is None:
+            onset_score = calculate_onset_correlation(ref_audio, mov_audio, ref_start, mov_start, sr)
+        alternative_score, alternative = onset_score, "onset"
+    else:
+        if music_score is None:
+            music_score = calculate_music_feature_correlation(ref_audio, mov_audio, ref_start, mov_start, sr)
+        alternative_score, alternative = music_score, "music_features"
     
     # 多策略融合决策 - 更保守的策略选择
-    if original_score < 0.05:
+    if original_score < FUSION_MIN_ORIGINAL:
         final_score = original_score
         strategy = "original"
-    elif music_score > original_score * 1.5 and (music_score - original_score) > 0.1:
-        final_score = music_score
-        strategy = "music_features"
+    elif alternative_score > original_score * FUSION_RATIO and (alternative_score - original_score) > FUSION_GAP:
+        final_score = alternative_score
+        strategy = alternative
     else:
         final_score = original_score
         strategy = "original"
     
-    return final_score, original_score, music_score, strategy
+    return final_score, original_score, alternative_score, strategy
 
-def find_beat_alignment_multi_strategy(ref_audio: np.ndarray, mov_audio: np.ndarray, sr: int) -> Tuple[int, int, float]:
-    """多策略融合的节拍对齐算法"""
+def find_beat_alignment_multi_strategy(ref_audio: np.ndarray, mov_audio: np.ndarray, sr: int,
+                                       align_mode: str = "exhaustive",
+                                       refine_radius: float = 0.5,
+                                       coarse_topk: int = 5,
+                                       beat_tolerance: float = 0.1,
+                                       search_bgm_offset: bool = False,
+                                       align_strategy: str = "fusion",
+                                       align_workers: Optional[int] = 1,
+                                       align_deadline: Optional[float] = None,
+                                       search_stats: Optional[dict] = None,
+                                       exit_threshold: Optional[float] = None,
+                                       exit_margin: float = 0.2,
+                                       artifacts: Optional[ArtifactCache] = None) -> Tuple[int, int, float]:
+    """
+    多策略融合的节拍对齐算法
+    
+    参数:
+        align_mode: "exhaustive" 按0.2秒步长全量搜索；"coarse_to_fine" 降采样包络粗扫 + Top-K全采样率细化；
+                    "beat_grid" 只搜索能让bgm节拍落在dance节拍上的起点；
+                    "anytime" 按 节拍一致起点 → 粗扫 → 细化 的优先级搜索，到达 align_deadline 时返回目前最好的结果
+        refine_radius: 粗到细模式的细化半径（秒）
+        coarse_topk: 粗到细模式保留的候选数
+        beat_tolerance: 节拍网格模式的细化邻域（秒）
+        search_bgm_offset: 是否启用第二阶段（bgm起点不为0的网格搜索）
+        align_strategy: "fusion" 原始相关性 + 音乐特征；"onset" onset包络（约86帧/秒）找Top-K偏移，
+                        只在小邻域内用原始音频细化（自带候选生成，不使用 align_mode）
+        align_workers: 对齐打分的并行线程数（0为按CPU预算自动选择），结果与串行一致
+        align_deadline: 时限（秒，从调用开始计时）。anytime模式在时限内按优先级评估候选；
+                        任何模式下到达时限后都跳过音乐特征打分与第二阶段
+        search_stats: 传入dict时写入搜索统计：completed（是否完成搜索）、stages、elapsed、
+                      early_exit、evaluated / skipped（评估与跳过的候选数）
+        exit_threshold / exit_margin: 提前结束：第一阶段最高原始得分不低于阈值、且领先其他偏移的次高分
+                                      至少 exit_margin 时，跳过音乐特征打分与第二阶段（None表示不提前结束）
+        artifacts: 分析结果缓存：节拍、onset包络与特征矩阵先按音频内容查缓存（None时直接计算）
+    """
+    import numpy as np
+    import librosa
+    import time
     print("使用多策略融合节拍对齐算法...")
+    search_start = time.time()
+    from beatsync_align_engine import (
+        parallel_map, resolve_align_workers, deadline_after, deadline_expired, confident_best
+    )
+    deadline = deadline_after(align_deadline)
+    stats = {'completed': True, 'stages': [align_mode]}
+    align_workers = resolve_align_workers(align_workers)
+    if align_workers > 1:
+        print(f"并行对齐打分: {align_workers} 线程")
     
-    # 快速节拍检测
+    # 快速节拍检测（dance与bgm并行）
     print("快速节拍检测...")
-    ref_tempo, ref_beats = librosa.beat.beat_track(y=ref_audio, sr=sr)
-    mov_tempo, mov_beats = librosa.beat.beat_track(y=mov_audio, sr=sr)
+    (ref_tempo, ref_beats), (mov_tempo, mov_beats) = parallel_map(
+        lambda audio: detect_beats(audio, sr, artifacts), [ref_audio, mov_audio], align_workers
+    )
     
     print(f"节拍检测:")
     print(f"  dance: {len(ref_beats)} 个节拍点, BPM ≈ {ref_tempo[0]:.1f}")
@@ -323,14 +570,117 @@ def find_beat_alignment_multi_strategy(ref_audio: np.ndarray, mov_audio: np.ndar
     print(f"  第一阶段：搜索bgm=0s的情况...")
     mov_start_samples = 0
     
-    for ref_offset in np.arange(0, max_offset * sr, step_size * sr):
-        ref_start_samples = int(ref_offset)
-        
-        if ref_start_samples >= len(ref_audio):
-            break
-            
+    # 原始相关性：FFT互相关 + 累积和归一化，一次得到所有dance起点（采样点分辨率）的得分曲线
+    from beatsync_align_engine import (
+        normalized_xcorr_curve, offset_scores, coarse_to_fine_offsets, beat_consistent_ranges, refine_offset,
+        top_k_peaks
+    )
+    window_samples = int(2.0 * sr)
+    mov_template = mov_audio[mov_start_samples:mov_start_samples + window_samples]
+    
+    beat_ranges = []
+    if align_mode == "beat_grid" and align_strategy != "onset" and len(mov_template) == window_samples:
+        # 节拍网格剪枝：dance起点 = bgm起点 + (dance节拍 - bgm节拍)，节拍帧误差在 ±beat_tolerance 内细化
+        beat_ranges = beat_consistent_ranges(librosa.frames_to_samples(ref_beats),
+                                             librosa.frames_to_samples(mov_beats),
+                                             mov_start_samples, 0, int(max_offset * sr) - 1,
+                                             int(beat_tolerance * sr))
+        covered = sum(hi - lo + 1 for lo, hi in beat_ranges) / max(1, int(max_offset * sr))
+        print(f"  节拍网格剪枝: 候选 {len(beat_ranges)} 个范围（覆盖 {covered:.0%} 的起点）, "
+              f"细化邻域 ±{beat_tolerance:.2f}s")
+        if len(beat_ranges) == 0:
+            print(f"  节拍候选不足，回退到全量搜索")
+    
+    if align_strategy == "onset":
+        # onset包络：低帧率包络上找Top-K偏移，再在 ±2帧 内用原始音频细化（采样点分辨率）
+        ref_env = calculate_onset_envelope(ref_audio, sr, artifacts)
+        mov_env = calculate_onset_envelope(mov_audio, sr, artifacts)
+        onset_curve = calculate_onset_curve(ref_audio, mov_audio, mov_start_samples, sr,
+                                            ref_env=ref_env, mov_env=mov_env)
+        peaks = top_k_peaks(onset_curve[:int(max_offset * sr / ONSET_HOP_LENGTH)], coarse_topk,
+                            max(1, int(step_size * sr / ONSET_HOP_LENGTH)))
+        print(f"  onset包络搜索: {len(onset_curve)} 帧, Top-{coarse_topk}, 细化邻域 ±{2 * ONSET_HOP_LENGTH} 采样点")
+        radius = 2 * ONSET_HOP_LENGTH
+        candidates = parallel_map(lambda p: refine_offset(ref_audio, mov_template, int(p) * ONSET_HOP_LENGTH - radius,
+                                                          int(p) * ONSET_HOP_LENGTH + radius),
+                                  peaks, align_workers) if len(mov_template) == window_samples else []
+        ref_grid = [start for start, _ in candidates]
+        original_scores = [score for _, score in candidates]
+    elif align_mode == "anytime" and len(mov_template) == window_samples:
+        # 限时搜索：节拍一致起点 → 包络粗扫 → Top-K细化，截止时间到达时停止
+        from beatsync_align_engine import anytime_offsets
+        deadline_text = f"{align_deadline:.1f}s" if align_deadline is not None else "不限时"
+        print(f"  限时搜索: Top-{coarse_topk}, 细化半径 {refine_radius:.2f}s, 时限 {deadline_text}")
+        candidates, stats = anytime_offsets(ref_audio, mov_template, librosa.frames_to_samples(ref_beats),
+                                            librosa.frames_to_samples(mov_beats), mov_start_samples,
+                                            int(max_offset * sr), sr, deadline=deadline,
+                                            tolerance=int(beat_tolerance * sr), topk=coarse_topk,
+                                            refine_radius_sec=refine_radius, workers=align_workers,
+                                            exit_threshold=exit_threshold, exit_margin=exit_margin)
+        ref_grid = [start for start, _ in candidates]
+        original_scores = [score for _, score in candidates]
+    elif len(beat_ranges) > 0:
+        candidates = parallel_map(lambda r: refine_offset(ref_audio, mov_template, r[0], r[1]),
+                                  beat_ranges, align_workers)
+        ref_grid = [start for start, _ in candidates]
+        original_scores = [score for _, score in candidates]
+    elif align_mode == "coarse_to_fine" and len(mov_template) == window_samples:
+        # 粗到细：降采样包络粗扫，Top-K候选在原始采样率下细化（采样点分辨率）
+        print(f"  粗到细搜索: Top-{coarse_topk}, 细化半径 {refine_radius:.2f}s")
+        candidates = coarse_to_fine_offsets(ref_audio, mov_template, int(max_offset * sr), sr,
+                                            topk=coarse_topk, refine_radius_sec=refine_radius,
+                                            workers=align_workers)
+        ref_grid = [start for start, _ in candidates]
+        original_scores = [score for _, score in candidates]
+    else:
+        original_curve = normalized_xcorr_curve(ref_audio, mov_template) \
+            if len(mov_template) == window_samples else np.zeros(0)
+        ref_grid = [int(ref_offset) for ref_offset in np.arange(0, max_offset * sr, step_size * sr)]
+        ref_grid = [ref_start_samples for ref_start_samples in ref_grid if ref_start_samples < len(ref_audio)]
+        # 越界窗口与逐点计算一致，得分为0
+        original_scores = offset_scores(original_curve, ref_grid)
+    
+    # 提前结束：原始相关性已足够确定（屏幕录制等干净的bgm），不再做音乐特征打分与第二阶段
+    evaluated, skipped = stats.get('evaluated', len(ref_grid)), stats.get('skipped', 0)
+    early_exit = stats.get('early_exit', False) or (
+        exit_threshold is not None and confident_best([r - mov_start_samples for r in ref_grid], original_scores,
+                                                      exit_threshold, exit_margin, window_samples // 8))
+    if early_exit:
+        print(f"  提前结束: 最高原始得分 {max(original_scores):.4f} ≥ {exit_threshold:.2f}，"
+              f"领先次高分 ≥ {exit_margin:.2f}")
+    
+    if align_strategy == "onset":
+        # onset包络得分取细化后起点所在的帧（不再提取音乐特征）
+        alternative_label = "onset包络得分"
+        alternative_scores = music_feature_scores(onset_curve, ref_grid, len(ref_audio), sr,
+                                                  hop_length=ONSET_HOP_LENGTH)
+    elif early_exit:
+        # 只用原始相关性（融合规则在替代得分为0时选择原始得分）
+        alternative_label = "音乐特征得分"
+        alternative_scores = np.zeros(len(ref_grid))
+    elif deadline_expired(deadline):
+        # 到达时限：只用原始相关性
+        print(f"  已到达时限，跳过音乐特征打分")
+        alternative_label = "音乐特征得分"
+        alternative_scores = np.zeros(len(ref_grid))
+        stats['completed'] = False
+    else:
+        # 音乐特征：整段提取一次特征矩阵，滑动帧块批量计算所有偏移的得分
+        alternative_label = "音乐特征得分"
+        ref_features = extract_music_features(ref_audio, sr, artifacts)
+        music_curve = calculate_music_feature_curve(ref_audio, mov_audio, mov_start_samples, sr,
+                                                    ref_features=ref_features, artifacts=artifacts)
+        alternative_scores = music_feature_scores(music_curve, ref_grid, len(ref_audio), sr)
+        alternative_scores = rescore_music_candidates(ref_audio, mov_audio,
+                                                      [(r, mov_start_samples) for r in ref_grid],
+                                                      original_scores, alternative_scores, sr,
+                                                      workers=align_workers)
+    
+    for ref_start_samples, original_score, alternative_score in zip(ref_grid, original_scores, alternative_scores):
         final_score, original_score, music_score, strategy = find_best_alignment_score(
-            ref_audio, mov_audio, ref_start_samples, mov_start_samples, sr
+            ref_audio, mov_audio, ref_start_samples, mov_start_samples, sr,
+            original_score=float(original_score), music_score=float(alternative_score),
+            onset_score=float(alternative_score), align_strategy=align_strategy
         )
         
         if final_score > best_score:
@@ -339,13 +689,72 @@ def find_beat_alignment_multi_strategy(ref_audio: np.ndarray, mov_audio: np.ndar
             best_mov_start = mov_start_samples
             best_strategy = strategy
             print(f"    找到更好的对齐点: dance={ref_start_samples/sr:.2f}s, bgm={mov_start_samples/sr:.2f}s")
-            print(f"      原始得分: {original_score:.4f}, 音乐特征得分: {music_score:.4f}")
+            print(f"      原始得分: {original_score:.4f}, {alternative_label}: {music_score:.4f}")
             print(f"      最终得分: {final_score:.4f}, 选择策略: {strategy}")
     
-    # 第二阶段：已禁用（第二步修复）
-    print(f"  第二阶段：已禁用（第二步修复）")
+    if search_bgm_offset:
+        ref_grid2 = [int(o) for o in np.arange(0, max_offset * sr, step_size * sr)]
+        ref_grid2 = [r for r in ref_grid2 if r + window_samples <= len(ref_audio)]
+        mov_grid2 = [int(o) for o in np.arange(step_size * sr, max_offset * sr, step_size * sr)]  # 跳过bgm=0
+        mov_grid2 = [m for m in mov_grid2 if m + window_samples <= len(mov_audio)]
     
-    print("搜索完成")
+    if search_bgm_offset and (early_exit or deadline_expired(deadline)):
+        print(f"  第二阶段：{'提前结束' if early_exit else '已到达时限'}，跳过")
+        skipped += len(ref_grid2) * len(mov_grid2)
+        stats['completed'] = early_exit
+    elif search_bgm_offset:
+        # 第二阶段：bgm起点也参与搜索（bgm片头有前导段的情况），
+        # 原始相关性与音乐特征都按整张 (dance偏移 × bgm偏移) 网格批量计算
+        from beatsync_align_engine import pearson_grid
+        evaluated += len(ref_grid2) * len(mov_grid2)
+        print(f"  第二阶段：搜索bgm偏移（批量网格 {len(ref_grid2)} x {len(mov_grid2)}）...")
+        original_grid = pearson_grid(ref_audio, mov_audio, ref_grid2, mov_grid2, window_samples,
+                                     workers=align_workers)
+        if align_strategy == "onset":
+            columns = parallel_map(
+                lambda m: music_feature_scores(calculate_onset_curve(ref_audio, mov_audio, m, sr,
+                                                                     ref_env=ref_env, mov_env=mov_env),
+                                               ref_grid2, len(ref_audio), sr, hop_length=ONSET_HOP_LENGTH),
+                mov_grid2, align_workers
+            )
+            alternative_grid = np.zeros((len(ref_grid2), len(mov_grid2)))
+            for mi, column in enumerate(columns):
+                alternative_grid[:, mi] = column
+        else:
+            alternative_grid = calculate_music_feature_grid(ref_audio, mov_audio, ref_grid2, mov_grid2, sr,
+                                                      ref_features=ref_features, workers=align_workers,
+                                                      artifacts=artifacts)
+            pairs = [(r, m) for r in ref_grid2 for m in mov_grid2]
+            alternative_grid = rescore_music_candidates(ref_audio, mov_audio, pairs, original_grid.ravel(),
+                                                        alternative_grid.ravel(), sr, min_score=best_score,
+                                                        workers=align_workers).reshape(alternative_grid.shape)
+        for mi, mov_start_samples in enumerate(mov_grid2):
+            for ri, ref_start_samples in enumerate(ref_grid2):
+                final_score, original_score, music_score, strategy = find_best_alignment_score(
+                    ref_audio, mov_audio, ref_start_samples, mov_start_samples, sr,
+                    original_score=float(original_grid[ri, mi]), music_score=float(alternative_grid[ri, mi]),
+                    onset_score=float(alternative_grid[ri, mi]), align_strategy=align_strategy
+                )
+                if final_score > best_score:
+                    best_score = final_score
+                    best_ref_start = ref_start_samples
+                    best_mov_start = mov_start_samples
+                    best_strategy = strategy
+                    print(f"    找到更好的对齐点: dance={ref_start_samples/sr:.2f}s, bgm={mov_start_samples/sr:.2f}s")
+                    print(f"      原始得分: {original_score:.4f}, {alternative_label}: {music_score:.4f}")
+                    print(f"      最终得分: {final_score:.4f}, 选择策略: {strategy}")
+    else:
+        # 第二阶段：默认关闭（--search-bgm-offset 开启）
+        print(f"  第二阶段：已禁用（第二步修复）")
+    
+    if stats['completed']:
+        print(f"搜索完成（评估 {evaluated} 个候选，跳过 {skipped} 个）")
+    else:
+        print(f"搜索未完成（达到时限 {align_deadline}s，已完成阶段: {' → '.join(stats['stages']) or '无'}），"
+              f"使用目前最好的结果")
+    if search_stats is not None:
+        search_stats.update(completed=stats['completed'], stages=stats['stages'], early_exit=early_exit,
+                            evaluated=evaluated, skipped=skipped, elapsed=time.time() - search_start)
     return best_ref_start, best_mov_start, best_score
 
 def create_aligned_video(dance_video: str, bgm_video: str, output_video: str, 
@@ -354,25 +763,32 @@ def create_aligned_video(dance_video: str, bgm_video: str, output_video: str,
                         hwaccel: Optional[str] = None,
                         video_encode: str = "copy",
                         enable_cache: bool = False,
-                        cache_dir: Optional[str] = None) -> bool:
-    """创建对齐视频（模块1的输出）"""
+                        cache_dir: Optional[str] = None,
+                        ingest_manifest: Optional[dict] = None,
+                        workspace: Optional[TaskWorkspace] = None) -> bool:
+    """创建对齐视频（模块1的输出）；workspace: 任务临时工作区，None时创建临时的"""
+    import numpy as np
+    import soundfile as sf
+    workspace, owned = own_workspace(workspace)
+    combined_audio_path = workspace.file("combined_audio.wav")
     try:
         print("创建对齐视频...")
         
-        # 计算时间偏移
-        time_offset = ref_start / sr
-        print(f"时间偏移: {time_offset:.3f}s (bgm需要延迟{time_offset:.3f}s)")
+        # 计算时间偏移：bgm的mov_start处对齐到dance的ref_start处
+        time_offset = (ref_start - mov_start) / sr
+        if time_offset >= 0:
+            print(f"时间偏移: {time_offset:.3f}s (bgm需要延迟{time_offset:.3f}s)")
+        else:
+            print(f"时间偏移: {time_offset:.3f}s (bgm需要剪掉开头{-time_offset:.3f}s)")
         
         # 创建静音音频
-        silence_duration = time_offset
-        silence_samples = int(silence_duration * sr)
+        silence_samples = max(0, ref_start - mov_start)
         # 读取BGM以确定声道数，保证拼接维度一致
-        bgm_audio_path = "temp_bgm_audio.wav"
-        if not extract_audio_optimized(bgm_video, bgm_audio_path, 60.0,
-                                       enable_cache=enable_cache, cache_dir=cache_dir):
+        bgm_audio = load_audio_optimized(bgm_video, 60.0, enable_cache=enable_cache, cache_dir=cache_dir,
+                                         ingest_manifest=ingest_manifest)  # (samples, channels)
+        if bgm_audio is None:
             print("提取BGM音频失败")
             return False
-        bgm_audio, _ = sf.read(bgm_audio_path, dtype="float32", always_2d=True)  # (samples, channels)
         num_channels = bgm_audio.shape[1] if bgm_audio.ndim == 2 else 1
         # 生成与BGM相同声道数的静音
         if num_channels > 1:
@@ -382,11 +798,11 @@ def create_aligned_video(dance_video: str, bgm_video: str, output_video: str,
         
         # 加载BGM音频（已在上面读取为float32、2D保证）
         
-        # 拼接静音 + BGM
+        # 拼接静音 + BGM（bgm起点晚于dance起点时剪掉bgm开头）
+        bgm_audio = bgm_audio[max(0, mov_start - ref_start):]
         combined_audio = np.concatenate([silence_audio, bgm_audio], axis=0)
         
         # 保存组合音频
-        combined_audio_path = "temp_combined_audio.wav"
         sf.write(combined_audio_path, combined_audio, sr)
         
         # 创建最终视频
@@ -417,41 +833,28 @@ def create_aligned_video(dance_video: str, bgm_video: str, output_video: str,
             success, error_msg = run_ffmpeg_command(cmd, f"创建对齐视频 {os.path.basename(output_video)}")
             if not success:
                 print(f"创建对齐视频失败: {error_msg}")
-                # 清理临时文件
-                for temp_file in [bgm_audio_path, combined_audio_path]:
-                    if os.path.exists(temp_file):
-                        try:
-                            os.remove(temp_file)
-                        except:
-                            pass
                 return False
         except ImportError:
             # 如果工具模块不可用，使用基础方法
             result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
             if result.returncode != 0:
                 print(f"创建对齐视频失败: {result.stderr[:200]}")
-                # 清理临时文件
-                for temp_file in [bgm_audio_path, combined_audio_path]:
-                    if os.path.exists(temp_file):
-                        try:
-                            os.remove(temp_file)
-                        except:
-                            pass
                 return False
         
-        # 清理临时文件
-        for temp_file in [bgm_audio_path, combined_audio_path]:
-            if os.path.exists(temp_file):
-                try:
-                    os.remove(temp_file)
-                except:
-                    pass
-        
         return True
         
     except Exception as e:
         print(f"创建对齐视频失败: {e}")
         return False
+    finally:
+        # 清理临时文件（组合音频写完视频即不再需要，尽早释放工作区空间）
+        if os.path.exists(combined_audio_path):
+            try:
+                os.remove(combined_audio_path)
+            except OSError:
+                pass
+        if owned:
+            workspace.cleanup()
 
 def alignment_module(dance_video: str, bgm_video: str, result_video: str,
                      fast_video: bool = False,
@@ -459,38 +862,55 @@ def alignment_module(dance_video: str, bgm_video: str, result_video: str,
                      video_encode: str = "copy",
                      enable_cache: bool = False,
                      cache_dir: Optional[str] = None,
-                     ffmpeg_threads: Optional[int] = None) -> tuple:
+                     ffmpeg_threads: Optional[int] = None,
+                     align_mode: str = "exhaustive",
+                     refine_radius: float = 0.5,
+                     beat_tolerance: float = 0.1,
+                     search_bgm_offset: bool = False,
+                     align_strategy: str = "fusion",
+                     fingerprint_db: Optional[str] = None,
+                     align_workers: Optional[int] = 1,
+                     align_deadline: Optional[float] = None,
+                     exit_threshold: Optional[float] = None,
+                     exit_margin: float = 0.2,
+                     ingest_manifest: Optional[dict] = None,
+                     workspace: Optional[TaskWorkspace] = None,
+                     report: Optional[dict] = None) -> tuple:
     """
     对齐模块：输出对齐后的视频
+    enable_cache / cache_dir: 开启时音频与分析结果（节拍、onset包络、特征矩阵）都先查缓存
+    workspace: 任务临时工作区（组合音频写在其中），None时创建临时的
+    report: 传入dict时写入对齐结果（dance_alignment / bgm_alignment 秒、confidence）与各步骤耗时（timings）
     返回: (success: bool, dance_alignment: float) - 成功标志和dance视频的对齐点（秒）
     """
+    import numpy as np
+    import librosa
     try:
         import time
         step_start = time.time()
+        timings = report.setdefault('timings', {}) if report is not None else {}
         print("=== 模块1: 对齐模块 ===")
         
-        # 提取音频
-        print("[步骤1.1] 提取音频片段（前30秒）...")
+        # 解码音频（ffmpeg 直接输出float32到内存，不再写临时WAV再读回）
+        print("[步骤1.1] 解码音频片段（前30秒）...")
         step_time = time.time()
-        if not extract_audio_optimized(dance_video, "temp_dance_audio.wav", 30.0,
-                                       enable_cache=enable_cache, cache_dir=cache_dir):
+        sr = 22050
+        dance_audio = load_audio_optimized(dance_video, 30.0, enable_cache=enable_cache,
+                                           cache_dir=cache_dir, sr=sr, ingest_manifest=ingest_manifest)
+        if dance_audio is None:
             print("提取dance音频失败")
             return False, 0.0
         print(f"[步骤1.1] 完成，耗时: {time.time() - step_time:.1f}秒")
             
         step_time = time.time()
-        if not extract_audio_optimized(bgm_video, "temp_bgm_audio.wav", 30.0,
-                                       enable_cache=enable_cache, cache_dir=cache_dir):
+        bgm_audio = load_audio_optimized(bgm_video, 30.0, enable_cache=enable_cache,
+                                         cache_dir=cache_dir, sr=sr, ingest_manifest=ingest_manifest)
+        if bgm_audio is None:
             print("提取bgm音频失败")
             return False, 0.0
         print(f"[步骤1.2] 完成，耗时: {time.time() - step_time:.1f}秒")
+        timings['audio'] = time.time() - step_start
         
-        # 加载音频（以float32降低峰值内存），并在分析阶段转换为单声道
-        print("[步骤1.3] 加载音频...")
-        step_time = time.time()
-        dance_audio, sr = sf.read("temp_dance_audio.wav", dtype="float32", always_2d=False)
-        bgm_audio, _ = sf.read("temp_bgm_audio.wav", dtype="float32", always_2d=False)
-        print(f"[步骤1.3] 完成，耗时: {time.time() - step_time:.1f}秒")
         print(f"音频长度: dance={len(dance_audio)/sr:.2f}s, bgm={len(bgm_audio)/sr:.2f}s")
         
         # 仅用于对齐分析的单声道转换（输出仍保持双声道，不影响功能与精度）
@@ -509,16 +929,42 @@ def alignment_module(dance_video: str, bgm_video: str, result_video: str,
         # 执行多策略融合对齐算法（使用单声道分析以控制内存）
         print("[步骤1.5] 执行多策略融合对齐算法...")
         step_time = time.time()
-        ref_start, mov_start, confidence = find_beat_alignment_multi_strategy(dance_mono, bgm_mono, sr)
+        fingerprint_result = None
+        if fingerprint_db:
+            from beatsync_fingerprint import fingerprint_alignment
+            fingerprint_result = fingerprint_alignment(dance_mono, bgm_mono, sr, db_path=fingerprint_db,
+                                                       song_name=os.path.basename(bgm_video))
+        if fingerprint_result is not None:
+            ref_start, mov_start, confidence = fingerprint_result
+            print("  使用指纹对齐结果，跳过搜索")
+        else:
+            artifacts = get_artifact_cache(cache_dir) if enable_cache and cache_dir else None
+            ref_start, mov_start, confidence = find_beat_alignment_multi_strategy(dance_mono, bgm_mono, sr,
+                                                                                  align_mode=align_mode,
+                                                                                  refine_radius=refine_radius,
+                                                                                  beat_tolerance=beat_tolerance,
+                                                                                  search_bgm_offset=search_bgm_offset,
+                                                                                  align_strategy=align_strategy,
+                                                                                  align_workers=align_workers,
+                                                                                  align_deadline=align_deadline,
+                                                                                  exit_threshold=exit_threshold,
+                                                                                  exit_margin=exit_margin,
+                                                                                  artifacts=artifacts)
         print(f"[步骤1.5] 完成，耗时: {time.time() - step_time:.1f}秒")
+        timings['align'] = time.time() - step_time
         
-        dance_alignment = ref_start / sr  # 保存dance对齐点（秒）
+        # dance对齐点：bgm开头在dance中的位置（秒）。第二阶段可能选中同一偏移下更靠后的窗口，
+        # 因此按相对偏移计算；bgm开头被剪掉时为0
+        dance_alignment = max(0, ref_start - mov_start) / sr
         
         print(f"[模块1] 总耗时: {time.time() - step_start:.1f}秒")
         print(f"对齐结果:")
         print(f"  dance 开始: {dance_alignment:.2f}s")
         print(f"  bgm 开始: {mov_start/sr:.2f}s")
         print(f"  最终得分: {confidence:.4f}")
+        if report is not None:
+            report.update(dance_alignment=dance_alignment, bgm_alignment=mov_start / sr,
+                          confidence=float(confidence))
         
         # 释放仅用于分析的大数组，避免后续步骤峰值累积
         del dance_mono, bgm_mono
@@ -528,10 +974,12 @@ def alignment_module(dance_video: str, bgm_video: str, result_video: str,
         step_time = time.time()
         if not create_aligned_video(dance_video, bgm_video, result_video, ref_start, mov_start, sr,
                                     fast_video=fast_video, hwaccel=hwaccel, video_encode=video_encode,
-                                    enable_cache=enable_cache, cache_dir=cache_dir):
+                                    enable_cache=enable_cache, cache_dir=cache_dir,
+                                    ingest_manifest=ingest_manifest, workspace=workspace):
             print("创建对齐视频失败")
             return False, 0.0
         print(f"[步骤1.6] 完成，耗时: {time.time() - step_time:.1f}秒")
+        timings['aligned_video'] = time.time() - step_time
         
         print("模块1完成: 对齐视频已生成")
         return True, dance_alignment
@@ -539,146 +987,66 @@ def alignment_module(dance_video: str, bgm_video: str, result_video: str,
     except Exception as e:
         print(f"对齐模块失败: {e}")
         return False, 0.0
-    finally:
-        # 清理临时文件
-        for temp_file in ["temp_dance_audio.wav", "temp_bgm_audio.wav"]:
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
 
 # ==================== 模块2: 裁剪模块 ====================
 
-def detect_silent_segment_length(audio_path: str, sr: int = 22050) -> float:
+def detect_leading_silence_from_video(video_path: str, sr: int = 22050) -> float:
     """
-    检测音频前面连续无声段落的长度
-    返回需要裁剪的时长（秒）
+    检测视频音频前面连续无声段落的长度：只解码开头窗口（窗口内都是静音时才扩大），不写检测用音频
+    返回需要裁剪的时长（秒），与整段解码后找第一个有声音的帧结果相同
     """
     try:
-        # 1. 加载音频
-        audio, _ = sf.read(audio_path)
-        
-        # 2. 计算音频能量（RMS）- 滑动窗口
-        window_size = int(0.1 * sr)  # 100ms窗口
-        hop_size = int(0.05 * sr)    # 50ms步长
-        
-        rms_values = []
-        for i in range(0, len(audio) - window_size, hop_size):
-            segment = audio[i:i + window_size]
-            rms = np.sqrt(np.mean(segment ** 2))
-            rms_values.append(rms)
-        
-        # 3. 找到第一个有声音的位置
-        silence_threshold = 0.01  # 静音阈值
-        
-        for i, rms in enumerate(rms_values):
-            if rms > silence_threshold:
-                # 找到第一个有声音的位置
-                silent_duration = (i * hop_size) / sr
-                return silent_duration
-        
-        # 如果整段都是静音，返回0
-        return 0.0
-        
+        return detect_leading_silence(video_path, sr, channels=2)
     except Exception as e:
         print(f"检测无声段落失败: {e}")
         return 0.0
 
-def detect_trailing_silent_with_decay(audio_path: str, video_duration: float, sr: int = 22050) -> float:
+def detect_trailing_silence_from_video(video_path: str, video_duration: float, sr: int = 22050) -> float:
     """
-    检测末尾静音段落，使用音频衰减检测（从V2版本复用）
-    
+    检测末尾静音段落（音频衰减检测，步骤见 beatsync_envelope.analyze_trailing_silence）：
+    只解码末尾窗口，前80%平均RMS在视频较长时用抽样的小段估计，检测耗时与视频长度无关
+
     参数:
-        audio_path: 音频文件路径
-        video_duration: 视频总时长
+        video_path: 视频路径
+        video_duration: 视频总时长（同时用于定位末尾窗口）
         sr: 音频采样率
-    
+
     返回:
         需要裁剪的时长（秒）
     """
     try:
-        # 加载音频并计算RMS值
-        audio, _ = sf.read(audio_path)
-        
-        # 计算音频能量（RMS）- 滑动窗口
-        window_size = int(0.1 * sr)  # 100ms窗口
-        hop_size = int(0.05 * sr)    # 50ms步长
-        
-        rms_values = []
-        for i in range(0, len(audio) - window_size, hop_size):
-            segment = audio[i:i + window_size]
-            rms = np.sqrt(np.mean(segment ** 2))
-            rms_values.append(rms)
-        
-        # 步骤1：检测末尾N秒的静音比例
-        check_duration = 3.0  # 检查末尾3秒
-        check_frames = int(check_duration * sr / hop_size)
-        start_check_frame = max(0, len(rms_values) - check_frames)
-        
-        # 计算末尾N秒的静音比例
-        silence_threshold = 0.01
-        silent_frames = sum(1 for i in range(start_check_frame, len(rms_values)) if rms_values[i] < silence_threshold)
-        total_check_frames = len(rms_values) - start_check_frame
-        silence_ratio = silent_frames / total_check_frames if total_check_frames > 0 else 0
-        
-        print(f"  末尾{check_duration:.1f}秒静音比例: {silence_ratio:.1%}")
-        
-        # 步骤2：如果静音比例超过60%，使用"音频衰减检测"找到最后一个强音位置
-        if silence_ratio >= 0.6:
-            # 计算前80%音频的平均能量（排除末尾20%）
-            cutoff_frame = int(len(rms_values) * 0.8)
-            avg_rms = np.mean(rms_values[:cutoff_frame])
-            
-            # 设置阈值：如果音频能量低于平均值的30%，认为是衰减段落
-            fade_threshold = avg_rms * 0.3
-            
-            print(f"  前80%平均RMS: {avg_rms:.4f}, 衰减阈值(30%): {fade_threshold:.4f}")
-            
-            # 从后往前扫描，找到"连续衰减段落"的起点
-            last_strong_frame = -1
-            for start_idx in range(len(rms_values) - 1, -1, -1):
-                # 检查从这个位置开始到结束的帧
-                weak_frames = sum(1 for i in range(start_idx, len(rms_values)) if rms_values[i] < fade_threshold)
-                total_frames = len(rms_values) - start_idx
-                weak_ratio = weak_frames / total_frames if total_frames > 0 else 0
-                
-                # 如果70%以上是弱音，认为这是衰减段落的起点
-                if weak_ratio >= 0.7:
-                    # 继续向前查找，找到最后一个强音位置
-                    for i in range(start_idx - 1, -1, -1):
-                        if rms_values[i] >= fade_threshold:
-                            last_strong_frame = i
-                            break
-                    break
-            
-            if last_strong_frame >= 0:
-                last_strong_time = last_strong_frame * hop_size / sr
-                trailing_silent_duration = video_duration - last_strong_time
-                print(f"  检测到音频衰减: 最后强音位置第{last_strong_time:.2f}s")
-                print(f"  建议裁剪末尾衰减段落: {trailing_silent_duration:.3f}s")
-                return trailing_silent_duration
-        
-        # 步骤3：如果静音比例不足60%，使用原来的逻辑（找到最后一个有声音的位置）
-        last_sound_frame = -1
-        for i in range(len(rms_values) - 1, -1, -1):
-            if rms_values[i] >= silence_threshold:
-                last_sound_frame = i
-                break
-        
-        if last_sound_frame >= 0:
-            last_sound_time = last_sound_frame * hop_size / sr
+        hop_size = int(RMS_HOP_SEC * sr)  # 50ms步长
+        analysis = analyze_trailing_silence(video_path, video_duration, sr, channels=2)
+        print(f"  末尾{TAIL_CHECK_SEC:.1f}秒静音比例: {analysis['silence_ratio']:.1%}")
+        if analysis["avg_rms"] is not None:
+            print(f"  前80%平均RMS: {analysis['avg_rms']:.4f}, 衰减阈值(30%): {analysis['fade_threshold']:.4f}")
+
+        if analysis["last_strong_frame"] >= 0:
+            last_strong_time = analysis["last_strong_frame"] * hop_size / sr
+            trailing_silent_duration = video_duration - last_strong_time
+            print(f"  检测到音频衰减: 最后强音位置第{last_strong_time:.2f}s")
+            print(f"  建议裁剪末尾衰减段落: {trailing_silent_duration:.3f}s")
+            return trailing_silent_duration
+
+        if analysis["last_sound_frame"] >= 0:
+            last_sound_time = analysis["last_sound_frame"] * hop_size / sr
             trailing_silent_duration = video_duration - last_sound_time
             print(f"  最后一个有声音的位置: 第{last_sound_time:.2f}s")
             print(f"  检测到末尾静音段落: {trailing_silent_duration:.3f}s")
             return trailing_silent_duration
-        else:
-            print(f"  未找到有声音的位置，整个音频都是静音")
-            return video_duration
-            
+        print(f"  未找到有声音的位置，整个音频都是静音")
+        return video_duration
+
     except Exception as e:
         print(f"检测末尾静音段落失败: {e}")
         return 0.0
 
 def get_video_duration(video_path: str) -> float:
     """获取视频时长"""
+    from beatsync_utils import get_registered_probe
+    probe = get_registered_probe(video_path)
+    if probe is not None and probe.get('duration'):
+        return probe['duration']
     cmd = [
         'ffprobe', '-v', 'quiet',
         '-show_entries', 'format=duration',
@@ -692,7 +1060,8 @@ def trim_silent_segments_module(input_video: str, output_video: str, dance_video
                                 fast_video: bool = False,
                                 hwaccel: Optional[str] = None,
                                 video_encode: str = "encode",
-                                ffmpeg_threads: Optional[int] = None) -> bool:
+                                ffmpeg_threads: Optional[int] = None,
+                                report: Optional[dict] = None) -> bool:
     """
     裁剪模块：剪掉视频前面的连续无声段落，以及后面超出dance有效内容的部分
     
@@ -701,41 +1070,17 @@ def trim_silent_segments_module(input_video: str, output_video: str, dance_video
         output_video: 最终输出视频
         dance_video: 原始dance视频路径（用于计算有效时长）
         dance_alignment: dance视频的对齐点（秒）
+        report: 传入dict时写入裁剪点（trim_start / trim_duration 秒）与耗时（timings['trim']）
     """
     try:
         import time
         step_start = time.time()
         print("=== 模块2: 裁剪模块 ===")
         
-        # 1. 提取音频
-        temp_audio = "temp_audio_for_detection.wav"
-        step_time = time.time()
-        cmd_extract = [
-            'ffmpeg', '-y',
-            '-nostdin', '-hide_banner', '-v', 'error',
-            '-i', input_video,
-            '-vn', '-acodec', 'pcm_s16le', '-ar', '22050', '-ac', '2',
-            temp_audio
-        ]
-        # 增强异常处理
-        try:
-            from beatsync_utils import run_ffmpeg_command
-            success, error_msg = run_ffmpeg_command(cmd_extract, f"提取音频用于检测 {os.path.basename(input_video)}")
-            if not success:
-                print(f"提取音频失败: {error_msg}")
-                return False
-        except ImportError:
-            # 如果工具模块不可用，使用基础方法
-            result = subprocess.run(cmd_extract, capture_output=True, text=True, timeout=300)
-            if result.returncode != 0:
-                print(f"提取音频失败: {result.stderr[:200]}")
-                return False
-        print(f"[步骤2.1] 完成，耗时: {time.time() - step_time:.1f}秒")
-        
-        # 2. 检测前面的无声段落长度（用于验证）
+        # 1-2. 检测前面的无声段落长度（用于验证）：直接从对齐视频解码开头窗口，不再整段提取检测用音频
         print("[步骤2.2] 检测前面的无声段落...")
         step_time = time.time()
-        silent_duration = detect_silent_segment_length(temp_audio)
+        silent_duration = detect_leading_silence_from_video(input_video)
         print(f"[步骤2.2] 完成，耗时: {time.time() - step_time:.1f}秒")
         print(f"检测到前面无声段落长度: {silent_duration:.3f}s")
         
@@ -753,7 +1098,7 @@ def trim_silent_segments_module(input_video: str, output_video: str, dance_video
         print("[步骤2.4] 检测末尾静音段落...")
         step_time = time.time()
         input_video_duration = get_video_duration(input_video)
-        trailing_silent_duration = detect_trailing_silent_with_decay(temp_audio, input_video_duration)
+        trailing_silent_duration = detect_trailing_silence_from_video(input_video, input_video_duration)
         print(f"[步骤2.4] 完成，耗时: {time.time() - step_time:.1f}秒")
         
         # 5. 计算最终的有效时长
@@ -863,10 +1208,9 @@ def trim_silent_segments_module(input_video: str, output_video: str, dance_video
         print(f"[步骤2.5] 完成，耗时: {time.time() - step_time:.1f}秒")
         
         print(f"[模块2] 总耗时: {time.time() - step_start:.1f}秒")
-        
-        # 5. 清理临时文件
-        if os.path.exists(temp_audio):
-            os.remove(temp_audio)
+        if report is not None:
+            report.update(trim_start=trim_start, trim_duration=final_duration)
+            report.setdefault('timings', {})['trim'] = time.time() - step_start
         
         print("模块2完成: 精剪视频已生成")
         return True
@@ -884,26 +1228,56 @@ def fine_cut_modular_mode(dance_video: str, bgm_video: str, output_video: str,
                           enable_cache: bool = False,
                           cache_dir: Optional[str] = None,
                           ffmpeg_threads: Optional[int] = None,
-                          lib_threads: Optional[int] = None) -> bool:
-    """模块解耦精剪模式主函数"""
+                          lib_threads: Optional[int] = None,
+                          align_mode: str = "exhaustive",
+                          refine_radius: float = 0.5,
+                          beat_tolerance: float = 0.1,
+                          search_bgm_offset: bool = False,
+                          align_strategy: str = "fusion",
+                          fingerprint_db: Optional[str] = None,
+                          align_workers: Optional[int] = 1,
+                          align_deadline: Optional[float] = None,
+                          exit_threshold: Optional[float] = None,
+                          exit_margin: float = 0.2,
+                          ingest_manifest: Optional[dict] = None,
+                          workspace: Optional[TaskWorkspace] = None,
+                          report: Optional[dict] = None) -> bool:
+    """
+    模块解耦精剪模式主函数
+    workspace: 任务临时工作区（中间文件写在其中，并发任务互不覆盖），None时创建临时的
+    report: 传入dict时写入对齐结果、裁剪点、各步骤耗时、输出路径（output_file）与失败原因（error）
+    """
+    if report is None:
+        report = {}
+    workspace, owned = own_workspace(workspace)
     try:
         print("BeatSync 模块解耦精剪模式开始处理...")
         print(f"  dance: {dance_video}")
         print(f"  bgm: {bgm_video}")
         print(f"  输出: {output_video}")
         
-        # 生成模块1的输出文件名
+        # 模块1的输出（中间文件）
         base_name = os.path.splitext(os.path.basename(output_video))[0]
-        output_dir = os.path.dirname(output_video) if os.path.dirname(output_video) else "."
-        result_video = os.path.join(output_dir, f"{base_name}_module1_aligned.mp4")
+        result_video = workspace.file(f"{base_name}_module1_aligned.mp4")
         
         # 模块1: 对齐模块
         success, dance_alignment = alignment_module(dance_video, bgm_video, result_video,
                                                     fast_video=fast_video, hwaccel=hwaccel, video_encode=video_encode,
                                                     enable_cache=enable_cache, cache_dir=cache_dir,
-                                                    ffmpeg_threads=ffmpeg_threads)
+                                                    ffmpeg_threads=ffmpeg_threads,
+                                                    align_mode=align_mode, refine_radius=refine_radius,
+                                                    beat_tolerance=beat_tolerance,
+                                                    search_bgm_offset=search_bgm_offset,
+                                                    align_strategy=align_strategy,
+                                                    fingerprint_db=fingerprint_db,
+                                                    align_workers=align_workers,
+                                                    align_deadline=align_deadline,
+                                                    exit_threshold=exit_threshold, exit_margin=exit_margin,
+                                                    ingest_manifest=ingest_manifest, workspace=workspace,
+                                                    report=report)
         if not success:
             print("对齐模块失败")
+            report['error'] = "对齐模块失败"
             return False
         
         print(f"模块1输出已保存: {result_video}")
@@ -912,8 +1286,9 @@ def fine_cut_modular_mode(dance_video: str, bgm_video: str, output_video: str,
         if not trim_silent_segments_module(result_video, output_video, dance_video, dance_alignment,
                                            fast_video=fast_video, hwaccel=hwaccel,
                                            video_encode=("encode" if video_encode == "copy" else video_encode),
-                                           ffmpeg_threads=ffmpeg_threads):
+                                           ffmpeg_threads=ffmpeg_threads, report=report):
             print("裁剪模块失败")
+            report['error'] = "裁剪模块失败"
             return False
         
         # 删除中间文件
@@ -926,109 +1301,157 @@ def fine_cut_modular_mode(dance_video: str, bgm_video: str, output_video: str,
         
         print("模块解耦精剪模式处理成功!")
         print(f"最终输出: {output_video}")
+        report['output_file'] = output_video
         return True
         
     except Exception as e:
         print(f"模块解耦精剪模式处理失败: {e}")
+        report['error'] = f"模块解耦精剪模式处理失败: {e}"
         return False
+    finally:
+        if owned:
+            workspace.cleanup()
 
-def main():
-    parser = argparse.ArgumentParser(description="BeatSync 模块解耦精剪模式")
-    parser.add_argument('--dance', type=str, required=True, help='Dance视频路径')
-    parser.add_argument('--bgm', type=str, required=True, help='BGM视频路径')
-    parser.add_argument('--output', type=str, required=True, help='输出视频路径')
-    parser.add_argument('--fast-video', action='store_true', help='启用快速视频路径（更快的编码/可选硬件加速），不改变对齐逻辑')
-    parser.add_argument('--hwaccel', type=str, default=None, choices=[None, 'videotoolbox', 'auto'], help='硬件加速选项（如 macOS 的 videotoolbox）')
-    parser.add_argument('--video-encode', type=str, default='x264_fast', choices=['copy', 'x264_fast', 'videotoolbox'], help='出片阶段的视频编码策略')
-    parser.add_argument('--enable-cache', action='store_true', help='启用音频提取缓存（基于输入签名）')
-    parser.add_argument('--cache-dir', type=str, default='.beatsync_cache', help='缓存目录')
-    parser.add_argument('--threads', type=int, default=None, help='ffmpeg 线程数（不指定则使用默认）')
-    parser.add_argument('--lib-threads', type=int, default=None, help='数值库线程（OMP/MKL/NUMEXPR），不指定则不干预')
+def run_fine_cut_modular(dance_video: str, bgm_video: str, output_video: str,
+                         lib_threads: Optional[int] = 1,
+                         ingest_manifest_path: Optional[str] = None,
+                         report: Optional[dict] = None,
+                         **options) -> bool:
+    """
+    完整流程（命令行与进程内调用共用）：输入验证、格式标准化后执行 fine_cut_modular_mode
     
-    args = parser.parse_args()
+    参数:
+        lib_threads: 数值库线程（OMP/MKL/NUMEXPR），None表示不干预
+        ingest_manifest_path: 并行处理器ingest阶段的清单路径
+        report: 传入dict时写入处理结果，见 fine_cut_modular_mode
+        options: fine_cut_modular_mode 的其余参数
+    """
+    if report is None:
+        report = {}
+    # numba 已在导入时指向内核缓存目录（用到时从缓存加载），这里只把缓存节省的时间记入阶段耗时
+    try:
+        from beatsync_warmup import report_kernel_cache
+        report_kernel_cache(report.setdefault('timings', {}))
+    except Exception as e:
+        print(f"读取numba内核缓存状态失败: {e}")
+    ingest_manifest = None
+    if ingest_manifest_path:
+        from beatsync_ingest import load_ingest_manifest
+        ingest_manifest = load_ingest_manifest(ingest_manifest_path)
     
     # 输入验证（增强异常处理）
     try:
         from beatsync_utils import validate_input_files
-        is_valid, error_msg = validate_input_files(args.dance, args.bgm, args.output)
+        is_valid, error_msg = validate_input_files(dance_video, bgm_video, output_video)
         if not is_valid:
             print("=" * 60)
             print("输入验证失败:")
             print(error_msg)
             print("=" * 60)
+            report['error'] = f"输入验证失败: {error_msg}"
             return False
     except ImportError:
         # 如果工具模块不可用，使用基础检查
-        if not os.path.exists(args.dance):
-            print(f"Dance视频文件不存在: {args.dance}")
+        if not os.path.exists(dance_video):
+            print(f"Dance视频文件不存在: {dance_video}")
+            report['error'] = f"Dance视频文件不存在: {dance_video}"
             return False
-        if not os.path.exists(args.bgm):
-            print(f"BGM视频文件不存在: {args.bgm}")
+        if not os.path.exists(bgm_video):
+            print(f"BGM视频文件不存在: {bgm_video}")
+            report['error'] = f"BGM视频文件不存在: {bgm_video}"
             return False
     except Exception as e:
         print(f"输入验证异常: {e}")
+        report['error'] = f"输入验证异常: {e}"
         return False
     
-    # 格式标准化（新增）
-    temp_dir = tempfile.mkdtemp(prefix="beatsync_format_")
-    normalized_files = []  # 记录需要清理的临时文件
+    # 任务临时工作区：格式转换结果与各模块的中间文件都写在其中，结束后整体删除
+    workspace = TaskWorkspace(estimate_scratch_bytes(dance_video, bgm_video))
+    print(f"临时工作区: {workspace.path}")
     
     try:
-        # 对dance和bgm视频进行格式转换
-        dance_video, converted_dance = normalize_video_format(args.dance, temp_dir=temp_dir)
-        if converted_dance:
-            normalized_files.append(dance_video)
+        # 格式标准化：对dance和bgm视频进行格式转换
+        dance_video, _ = normalize_video_format(dance_video, temp_dir=workspace.path)
+        bgm_video, _ = normalize_video_format(bgm_video, temp_dir=workspace.path)
         
-        bgm_video, converted_bgm = normalize_video_format(args.bgm, temp_dir=temp_dir)
-        if converted_bgm:
-            normalized_files.append(bgm_video)
-        
-        # 默认策略（用户未显式指定时）：启用快速路径、启用缓存、设置线程
-        if not args.fast_video:
-            args.fast_video = True
-        if not args.enable_cache:
-            args.enable_cache = True
-        if args.threads is None:
-            # 默认使用CPU核心数（如果检测不到则使用2）
-            args.threads = os.cpu_count() or 2
-        if args.lib_threads is None:
-            args.lib_threads = 1
-
-        # 规范化编码策略
-        video_encode = 'copy'
-        if args.video_encode == 'x264_fast':
-            video_encode = 'encode'
-        elif args.video_encode == 'videotoolbox':
-            video_encode = 'videotoolbox'
-        hwaccel = None if args.hwaccel in (None, 'auto') else args.hwaccel
         # 线程环境（可选）：不影响数值结果，仅影响并行
-        if args.lib_threads is not None:
-            os.environ['OMP_NUM_THREADS'] = str(args.lib_threads)
-            os.environ['MKL_NUM_THREADS'] = str(args.lib_threads)
-            os.environ['NUMEXPR_NUM_THREADS'] = str(args.lib_threads)
-        success = fine_cut_modular_mode(dance_video, bgm_video, args.output,
-                                        fast_video=args.fast_video,
-                                        hwaccel=hwaccel,
-                                        video_encode=video_encode,
-                                        enable_cache=args.enable_cache,
-                                        cache_dir=args.cache_dir,
-                                        ffmpeg_threads=args.threads,
-                                        lib_threads=args.lib_threads)
-        return success
+        if lib_threads is not None:
+            os.environ['OMP_NUM_THREADS'] = str(lib_threads)
+            os.environ['MKL_NUM_THREADS'] = str(lib_threads)
+            os.environ['NUMEXPR_NUM_THREADS'] = str(lib_threads)
+        return fine_cut_modular_mode(dance_video, bgm_video, output_video,
+                                     lib_threads=lib_threads,
+                                     ingest_manifest=ingest_manifest,
+                                     workspace=workspace,
+                                     report=report,
+                                     **options)
         
     finally:
-        # 清理临时转换文件
-        for temp_file in normalized_files:
-            try:
-                if os.path.exists(temp_file):
-                    os.remove(temp_file)
-            except Exception as e:
-                print(f"清理临时文件失败: {e}")
-        try:
-            if os.path.exists(temp_dir) and not os.listdir(temp_dir):
-                os.rmdir(temp_dir)
-        except Exception:
-            pass
+        workspace.cleanup()
+
+def main():
+    parser = argparse.ArgumentParser(description="BeatSync 模块解耦精剪模式")
+    parser.add_argument('--dance', type=str, required=True, help='Dance视频路径')
+    parser.add_argument('--bgm', type=str, required=True, help='BGM视频路径')
+    parser.add_argument('--output', type=str, required=True, help='输出视频路径')
+    parser.add_argument('--fast-video', action='store_true', help='启用快速视频路径（更快的编码/可选硬件加速），不改变对齐逻辑')
+    parser.add_argument('--hwaccel', type=str, default=None, choices=[None, 'videotoolbox', 'auto'], help='硬件加速选项（如 macOS 的 videotoolbox）')
+    parser.add_argument('--video-encode', type=str, default='x264_fast', choices=['copy', 'x264_fast', 'videotoolbox'], help='出片阶段的视频编码策略')
+    parser.add_argument('--enable-cache', action='store_true', help='启用音频提取缓存（基于输入签名）')
+    parser.add_argument('--cache-dir', type=str, default='.beatsync_cache', help='缓存目录')
+    parser.add_argument('--threads', type=int, default=None, help='ffmpeg 线程数（不指定则使用默认）')
+    parser.add_argument('--lib-threads', type=int, default=None, help='数值库线程（OMP/MKL/NUMEXPR），不指定则不干预')
+    parser.add_argument('--align-mode', type=str, default='exhaustive', choices=['exhaustive', 'coarse_to_fine', 'beat_grid', 'anytime'], help='对齐搜索模式：全量搜索 / 粗到细多分辨率搜索 / 节拍网格剪枝 / 限时搜索')
+    parser.add_argument('--refine-radius', type=float, default=0.5, help='粗到细模式的细化半径（秒）')
+    parser.add_argument('--beat-tolerance', type=float, default=0.1, help='节拍网格模式的细化邻域（秒）')
+    parser.add_argument('--search-bgm-offset', action='store_true', help='启用第二阶段：同时搜索bgm起点（bgm片头有前导段时使用）')
+    parser.add_argument('--align-strategy', type=str, default='fusion', choices=['fusion', 'onset'], help='对齐得分策略：原始相关性+音乐特征融合 / onset包络（低开销）')
+    parser.add_argument('--align-deadline', type=float, default=None, help='对齐搜索时限（秒），到达时返回目前最好的对齐结果（限时搜索模式按优先级评估候选）')
+    parser.add_argument('--early-exit-threshold', type=float, default=None, help='提前结束的得分阈值：最高原始得分达到该值且领先次高分时停止搜索（不指定则不提前结束）')
+    parser.add_argument('--early-exit-margin', type=float, default=0.2, help='提前结束要求的领先幅度（最高分 - 其他偏移的次高分）')
+    parser.add_argument('--fingerprint-db', type=str, default=None, help='bgm指纹库路径（SQLite）：识别成功时直接用指纹对齐，跳过搜索')
+    parser.add_argument('--align-workers', type=int, default=1, help='对齐打分的并行线程数（0为自动；受 BEATSYNC_CPU_BUDGET / 数值库线程数限制）')
+    parser.add_argument('--ingest-manifest', type=str, default=None, help='并行处理器ingest阶段的清单：复用其探测信息与已解码的音频，跳过重复提取')
+    
+    args = parser.parse_args()
+    
+    # 默认策略（用户未显式指定时）：启用快速路径、启用缓存、设置线程
+    if not args.fast_video:
+        args.fast_video = True
+    if not args.enable_cache:
+        args.enable_cache = True
+    if args.threads is None:
+        # 默认使用CPU核心数（如果检测不到则使用2）
+        args.threads = os.cpu_count() or 2
+    if args.lib_threads is None:
+        args.lib_threads = 1
+
+    # 规范化编码策略
+    video_encode = 'copy'
+    if args.video_encode == 'x264_fast':
+        video_encode = 'encode'
+    elif args.video_encode == 'videotoolbox':
+        video_encode = 'videotoolbox'
+    hwaccel = None if args.hwaccel in (None, 'auto') else args.hwaccel
+    return run_fine_cut_modular(args.dance, args.bgm, args.output,
+                                lib_threads=args.lib_threads,
+                                ingest_manifest_path=args.ingest_manifest,
+                                fast_video=args.fast_video,
+                                hwaccel=hwaccel,
+                                video_encode=video_encode,
+                                enable_cache=args.enable_cache,
+                                cache_dir=args.cache_dir,
+                                ffmpeg_threads=args.threads,
+                                align_mode=args.align_mode,
+                                refine_radius=args.refine_radius,
+                                beat_tolerance=args.beat_tolerance,
+                                search_bgm_offset=args.search_bgm_offset,
+                                align_strategy=args.align_strategy,
+                                fingerprint_db=args.fingerprint_db,
+                                align_workers=args.align_workers,
+                                align_deadline=args.align_deadline,
+                                exit_threshold=args.early_exit_threshold,
+                                exit_margin=args.early_exit_margin)
 
 if __name__ == "__main__":
     success = main()
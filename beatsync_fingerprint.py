@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+BeatSync 音频指纹索引
+频谱峰值组成的landmark哈希（锚点峰 + 目标峰 + 时间差）存入本地SQLite：
+- 识别上传的BGM是否为已分析过的歌曲
+- 通过哈希投票的偏移直方图对齐dance与bgm，替代相关性搜索
+"""
+
+import os
+import sqlite3
+import numpy as np
+from datetime import datetime
+from typing import Optional, Tuple
+
+# 指纹帧移（秒）：22.05kHz下为512采样点；44.1kHz下为1024采样点，两种采样率的频率分辨率一致
+FP_HOP_SEC = 512 / 22050
+# 只使用 ~5.5kHz 以下的频率bin（频率分辨率约10.8Hz）
+FP_MAX_BIN = 512
+# 峰值邻域（频率bin, 帧）与密度上限（每秒峰值数）
+FP_PEAK_NEIGHBORHOOD = (15, 11)
+FP_PEAKS_PER_SEC = 30
+# 配对区域：目标峰在锚点之后 1~63 帧、频率差不超过 ±FP_MAX_DF 个bin，每个锚点最多配对 FP_FANOUT 个
+FP_MAX_DT = 63
+FP_MAX_DF = 127
+FP_FANOUT = 6
+# 采信投票结果的最少票数，以及最高票与次高票（偏移相差超过1帧）的最小比值
+FP_MIN_VOTES = 10
+FP_MIN_VOTE_RATIO = 3.0
+# 出现次数过多的哈希区分度低，投票时跳过
+FP_MAX_HASH_MATCHES = 50
+
+
+def fingerprint_hop(sr: int) -> int:
+    """指纹帧移（采样点）"""
+    return max(1, int(round(FP_HOP_SEC * sr)))
+
+
+def compute_spectral_peaks(audio: np.ndarray, sr: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    提取频谱峰值（星座图）
+
+    返回:
+        (帧下标数组, 频率bin数组)，按帧排序
+    """
+    import librosa
+    from scipy.ndimage import maximum_filter
+
+    hop = fingerprint_hop(sr)
+    n_fft = 1 << int(4 * hop - 1).bit_length()
+    spec = np.abs(librosa.stft(np.asarray(audio, dtype=np.float32), n_fft=n_fft, hop_length=hop))[:FP_MAX_BIN]
+    if spec.size == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    log_spec = np.log(spec + 1e-6)
+
+    local_max = (maximum_filter(log_spec, size=FP_PEAK_NEIGHBORHOOD, mode='constant', cval=-np.inf) == log_spec)
+    peaks = local_max & (log_spec > np.median(log_spec) + 1.0)
+    freqs, frames = np.nonzero(peaks)
+    # 限制峰值密度：只保留幅度最大的若干个
+    max_peaks = max(1, int(FP_PEAKS_PER_SEC * spec.shape[1] * hop / sr))
+    if len(frames) > max_peaks:
+        keep = np.argsort(-log_spec[freqs, frames], kind='stable')[:max_peaks]
+        freqs, frames = freqs[keep], frames[keep]
+    order = np.lexsort((freqs, frames))
+    return frames[order].astype(np.int64), freqs[order].astype(np.int64)
+
+
+def compute_landmarks(audio: np.ndarray, sr: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    计算landmark哈希：每个锚点峰与其后配对区域内最近的 FP_FANOUT 个峰组成 (f1, f2, dt)
+
+    返回:
+        (哈希数组, 锚点帧下标数组)
+    """
+    frames, freqs = compute_spectral_peaks(audio, sr)
+    hashes, times = [], []
+    for i in range(len(frames)):
+        paired = 0
+        for j in range(i + 1, len(frames)):
+            dt = frames[j] - frames[i]
+            if dt > FP_MAX_DT:
+                break
+            if dt < 1 or abs(freqs[j] - freqs[i]) > FP_MAX_DF:
+                continue
+            hashes.append((int(freqs[i]) * FP_MAX_BIN + int(freqs[j])) * (FP_MAX_DT + 1) + int(dt))
+            times.append(int(frames[i]))
+            paired += 1
+            if paired >= FP_FANOUT:
+                break
+    return np.asarray(hashes, dtype=np.int64), np.asarray(times, dtype=np.int64)
+
+
+def vote_offset(hashes_a: np.ndarray, times_a: np.ndarray,
+                hashes_b: np.ndarray, times_b: np.ndarray) -> Tuple[int, int, int]:
+    """
+    哈希投票：统计所有匹配哈希的时间差 (times_a - times_b) 直方图
+
+    返回:
+        (最高票偏移（帧）, 最高票数, 次高票数（与最高票偏移相差超过1帧）)，没有匹配时返回 (0, 0, 0)
+    """
+    if len(hashes_a) == 0 or len(hashes_b) == 0:
+        return 0, 0, 0
+    order = np.argsort(hashes_a, kind='stable')
+    sorted_hashes, sorted_times = hashes_a[order], times_a[order]
+    lo = np.searchsorted(sorted_hashes, hashes_b, side='left')
+    counts = np.searchsorted(sorted_hashes, hashes_b, side='right') - lo
+    counts[counts > FP_MAX_HASH_MATCHES] = 0
+    if counts.sum() == 0:
+        return 0, 0, 0
+
+    idx_b = np.repeat(np.arange(len(hashes_b)), counts)
+    within = np.arange(len(idx_b)) - np.repeat(np.cumsum(counts) - counts, counts)
+    offsets = sorted_times[lo[idx_b] + within] - times_b[idx_b]
+    base = offsets.min()
+    histogram = np.bincount(offsets - base)
+    best = int(np.argmax(histogram))
+    votes = int(histogram[best])
+    rest = histogram.copy()
+    rest[max(0, best - 1):best + 2] = 0
+    return best + int(base), votes, int(rest.max()) if len(rest) else 0
+
+
+def vote_is_confident(votes: int, runner_up: int) -> bool:
+    """投票结果是否可信"""
+    return votes >= FP_MIN_VOTES and votes >= FP_MIN_VOTE_RATIO * max(runner_up, 1)
+
+
+# ==================== SQLite 指纹库 ====================
+
+def init_fingerprint_db(db_path: str):
+    """初始化指纹库（建表），目录不存在时创建"""
+    db_dir = os.path.dirname(os.path.abspath(db_path))
+    os.makedirs(db_dir, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS songs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                frames INTEGER NOT NULL,
+                hash_count INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                hash INTEGER NOT NULL,
+                song_id INTEGER NOT NULL,
+                frame INTEGER NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_fingerprints_hash ON fingerprints(hash)")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def add_song(db_path: str, name: str, hashes: np.ndarray, times: np.ndarray, frames: int) -> int:
+    """把一首歌的landmark哈希写入指纹库，返回歌曲id"""
+    init_fingerprint_db(db_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.execute(
+            "INSERT INTO songs (name, frames, hash_count, created_at) VALUES (?, ?, ?, ?)",
+            (name, int(frames), len(hashes), datetime.now().isoformat())
+        )
+        song_id = cursor.lastrowid
+        conn.executemany(
+            "INSERT INTO fingerprints (hash, song_id, frame) VALUES (?, ?, ?)",
+            ((int(h), song_id, int(t)) for h, t in zip(hashes, times))
+        )
+        conn.commit()
+        return song_id
+    finally:
+        conn.close()
+
+
+def query_fingerprints(db_path: str, hashes: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    查询指纹库中与给定哈希相同的条目
+
+    返回:
+        (哈希数组, 歌曲id数组, 帧下标数组)
+    """
+    if not os.path.exists(db_path) or len(hashes) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    unique = np.unique(hashes).tolist()
+    rows = []
+    conn = sqlite3.connect(db_path)
+    try:
+        # SQLite 单条语句的参数个数有上限，分批查询
+        for i in range(0, len(unique), 900):
+            batch = unique[i:i + 900]
+            rows.extend(conn.execute(
+                f"SELECT hash, song_id, frame FROM fingerprints WHERE hash IN ({','.join('?' * len(batch))})",
+                batch
+            ).fetchall())
+    except sqlite3.OperationalError:
+        rows = []  # 指纹库尚未初始化
+    finally:
+        conn.close()
+    if not rows:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    data = np.asarray(rows, dtype=np.int64)
+    return data[:, 0], data[:, 1], data[:, 2]
+
+
+def identify_song(db_path: str, hashes: np.ndarray, times: np.ndarray) -> Optional[dict]:
+    """
+    识别音频片段对应的已入库歌曲
+
+    返回:
+        {'song_id', 'name', 'offset'(片段起点在歌曲中的帧下标), 'votes', 'runner_up'}，未识别时返回None
+    """
+    db_hashes, db_songs, db_frames = query_fingerprints(db_path, hashes)
+    best = None
+    for song_id in np.unique(db_songs):
+        mask = db_songs == song_id
+        offset, votes, runner_up = vote_offset(db_hashes[mask], db_frames[mask], hashes, times)
+        if vote_is_confident(votes, runner_up) and (best is None or votes > best['votes']):
+            best = {'song_id': int(song_id), 'offset': offset, 'votes': votes, 'runner_up': runner_up}
+    if best is None:
+        return None
+    conn = sqlite3.connect(db_path)
+    try:
+        row = conn.execute("SELECT name FROM songs WHERE id = ?", (best['song_id'],)).fetchone()
+    finally:
+        conn.close()
+    best['name'] = row[0] if row else ""
+    return best
+
+
+def load_song_fingerprints(db_path: str, song_id: int) -> Tuple[np.ndarray, np.ndarray]:
+    """读取一首歌的全部landmark哈希，返回 (哈希数组, 帧下标数组)"""
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("SELECT hash, frame FROM fingerprints WHERE song_id = ?", (song_id,)).fetchall()
+    finally:
+        conn.close()
+    if not rows:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    data = np.asarray(rows, dtype=np.int64)
+    return data[:, 0], data[:, 1]
+
+
+# ==================== 指纹对齐 ====================
+
+def fingerprint_alignment(ref_audio: np.ndarray, mov_audio: np.ndarray, sr: int,
+                          db_path: Optional[str] = None,
+                          song_name: str = "") -> Optional[Tuple[int, int, float]]:
+    """
+    指纹对齐：哈希投票得到dance与bgm的相对偏移，再在 ±2帧 内用原始音频细化到采样点
+
+    有指纹库时先识别bgm：已入库则用库中歌曲的指纹定位dance（dance片段可以超出bgm片段覆盖的范围）；
+    未入库则直接对dance与bgm的指纹投票，并把bgm写入指纹库供后续任务使用。
+
+    参数:
+        ref_audio: dance音频（单声道）
+        mov_audio: bgm音频（单声道）
+        db_path: 指纹库路径（为None时只做dance与bgm之间的投票）
+        song_name: bgm入库时使用的名称
+
+    返回:
+        (dance起点, bgm起点, 相关系数)（采样点），投票结果不可信时返回None
+    """
+    from beatsync_align_engine import refine_offset
+
+    hop = fingerprint_hop(sr)
+    ref_hashes, ref_times = compute_landmarks(ref_audio, sr)
+    mov_hashes, mov_times = compute_landmarks(mov_audio, sr)
+    print(f"指纹: dance {len(ref_hashes)} 个哈希, bgm {len(mov_hashes)} 个哈希")
+
+    lag_frames = None
+    if db_path:
+        song = identify_song(db_path, mov_hashes, mov_times)
+        if song is not None:
+            print(f"  指纹库识别bgm: {song['name']} (id={song['song_id']}, 票数 {song['votes']})")
+            song_hashes, song_times = load_song_fingerprints(db_path, song['song_id'])
+            dance_offset, votes, runner_up = vote_offset(song_hashes, song_times, ref_hashes, ref_times)
+            if vote_is_confident(votes, runner_up):
+                # 歌曲帧 = dance帧 + dance_offset = bgm帧 + bgm_offset
+                lag_frames = song['offset'] - dance_offset
+                print(f"  dance在歌曲中的偏移: {dance_offset * hop / sr:.2f}s (票数 {votes}, 次高 {runner_up})")
+        else:
+            song_id = add_song(db_path, song_name or "bgm", mov_hashes, mov_times, len(mov_audio) // hop + 1)
+            print(f"  bgm未入库，已加入指纹库 (id={song_id})")
+
+    if lag_frames is None:
+        lag_frames, votes, runner_up = vote_offset(ref_hashes, ref_times, mov_hashes, mov_times)
+        print(f"  dance-bgm哈希投票: 偏移 {lag_frames * hop / sr:.2f}s (票数 {votes}, 次高 {runner_up})")
+        if not vote_is_confident(votes, runner_up):
+            print("  指纹投票结果不可信")
+            return None
+
+    # 原始音频细化：bgm窗口取在重叠部分内（两侧各留出细化邻域），细化范围不会被信号边界截断
+    lag = int(lag_frames) * hop
+    window = int(2.0 * sr)
+    radius = 2 * hop
+    mov_start = max(0, -lag) + radius
+    if mov_start + window > len(mov_audio) or mov_start + lag + radius + window > len(ref_audio):
+        return None
+    ref_start, score = refine_offset(ref_audio, mov_audio[mov_start:mov_start + window],
+                                     mov_start + lag - radius, mov_start + lag + radius)
+    # 与搜索结果的表示一致：dance起点/bgm起点中有一个为0
+    lag = ref_start - mov_start
+    print(f"  细化后: 偏移 {lag / sr:+.3f}s, 相关系数 {score:.4f}")
+    return max(0, lag), max(0, -lag), float(score)
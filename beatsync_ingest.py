@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+BeatSync 输入预处理（ingest）模块
+并行处理器对每个输入只探测一次、只解码一次音频（44.1kHz 双声道float32，保存为 .npy），
+写出清单文件；modular版本与V2版本通过 --ingest-manifest 读取清单，以mmap方式共享音频，跳过各自的提取。
+提供缓存目录时，解码结果按输入内容摘要缓存：同一视频再次提交（重新上传、不同用户）时不再解码
+"""
+
+import os
+import json
+import numpy as np
+from math import gcd
+from typing import Optional, Tuple
+
+# 规范音频格式：V2直接使用，modular由此降采样到22.05kHz
+INGEST_SR = 44100
+INGEST_CHANNELS = 2
+MANIFEST_NAME = "manifest.json"
+# 缓存的ingest音频的格式版本
+INGEST_CACHE_VER = "ingest_v1"
+
+
+def ingest_inputs(inputs: dict, ingest_dir: str, sr: int = INGEST_SR,
+                  cache_dir: Optional[str] = None) -> Tuple[Optional[str], str]:
+    """
+    探测、格式标准化并解码输入文件
+
+    参数:
+        inputs: {角色: 视频路径}，如 {"dance": ..., "bgm": ...}
+        ingest_dir: 存放 .npy 音频、标准化视频与清单的目录
+        sr: 规范采样率
+        cache_dir: 音频缓存目录（按输入内容摘要缓存解码结果），None表示不缓存
+
+    返回:
+        (清单路径, 错误信息)，失败时清单路径为None
+    """
+    from beatsync_utils import probe_media, register_media_probe
+    from beatsync_audio_decoder import decode_audio
+    from beatsync_fine_cut_modular import normalize_video_format
+    from beatsync_digest import file_digest, content_cache_key
+
+    cache_index = None
+    if cache_dir:
+        from beatsync_audio_cache import get_cache_index
+        cache_index = get_cache_index(cache_dir)
+
+    os.makedirs(ingest_dir, exist_ok=True)
+    manifest = {"sr": sr, "channels": INGEST_CHANNELS, "inputs": {}}
+    for role, source in inputs.items():
+        probe = probe_media(source)
+        if probe is None:
+            return None, f"{role}视频格式无效或无法读取: {source}"
+        if not probe['has_video']:
+            return None, f"{role}视频没有视频轨道: {source}"
+        if not probe['has_audio']:
+            return None, f"{role}视频没有音频轨道: {source}"
+
+        # 非MP4只在这里转换一次，两个流程都使用转换后的文件
+        video, _ = normalize_video_format(source, temp_dir=ingest_dir)
+        digest = file_digest(source)
+        audio_path = os.path.join(ingest_dir, f"{role}.npy")
+        cache_key = content_cache_key(source, INGEST_CACHE_VER, sr=sr, channels=INGEST_CHANNELS)
+        if cache_index is not None and cache_index.link_file(cache_key, audio_path):
+            frames = len(np.load(audio_path, mmap_mode="r"))
+            print(f"  {role}音频命中缓存（内容摘要 {digest[:12]}）")
+        else:
+            audio, error_msg = decode_audio(video, sr=sr, channels=INGEST_CHANNELS)
+            if audio is None:
+                return None, f"{role}音频解码失败: {error_msg}"
+            np.save(audio_path, audio)
+            frames = len(audio)
+            if cache_index is not None:
+                cache_index.store_file(cache_key, audio_path)
+
+        register_media_probe(video, probe)
+        manifest["inputs"][role] = {
+            "source": os.path.abspath(source),
+            "video": os.path.abspath(video),
+            "audio": os.path.abspath(audio_path),
+            "frames": int(frames),
+            "digest": digest,
+            "probe": probe,
+        }
+
+    manifest_path = os.path.join(ingest_dir, MANIFEST_NAME)
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest_path, ""
+
+
+def load_ingest_manifest(manifest_path: str) -> Optional[dict]:
+    """
+    读取清单，并登记其中的探测信息（之后的验证/时长/帧率查询不再调用ffprobe）
+    与输入内容摘要（之后生成缓存键不再读取整个文件）；失败时返回None
+    """
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"读取ingest清单失败，各流程自行提取音频: {e}")
+        return None
+    from beatsync_utils import register_media_probe
+    from beatsync_digest import remember_digest
+    for entry in manifest.get("inputs", {}).values():
+        register_media_probe(entry["video"], entry["probe"])
+        register_media_probe(entry["source"], entry["probe"])
+        if entry.get("digest"):
+            try:
+                remember_digest(entry["source"], entry["digest"])
+            except OSError:
+                pass
+    return manifest
+
+
+def find_ingest_entry(manifest: Optional[dict], video_path: str) -> Optional[dict]:
+    """按视频路径（标准化后的文件或原始文件）查找清单条目"""
+    if not manifest:
+        return None
+    path = os.path.abspath(video_path)
+    for entry in manifest.get("inputs", {}).values():
+        if path in (entry["video"], entry["source"]):
+            return entry
+    return None
+
+
+def ingested_audio(manifest: Optional[dict], video_path: str, sr: int,
+                   duration: Optional[float] = None) -> Optional[np.ndarray]:
+    """
+    从清单读取已解码的音频
+
+    参数:
+        manifest: load_ingest_manifest 的结果
+        video_path: 视频路径
+        sr: 需要的采样率；与规范采样率相同时返回mmap视图（不复制），否则重采样
+        duration: 只取前 duration 秒
+
+    返回:
+        (samples, 2) 的float32音频，清单中没有该视频时返回None
+    """
+    entry = find_ingest_entry(manifest, video_path)
+    if entry is None:
+        return None
+    try:
+        audio = np.load(entry["audio"], mmap_mode="r")
+    except (OSError, ValueError) as e:
+        print(f"读取ingest音频失败，改为重新提取: {e}")
+        return None
+    source_sr = manifest["sr"]
+    if duration is not None:
+        audio = audio[:int(np.ceil(duration * source_sr))]
+    if sr == source_sr:
+        return audio
+    from scipy.signal import resample_poly
+    g = gcd(int(sr), int(source_sr))
+    resampled = resample_poly(audio, sr // g, source_sr // g, axis=0).astype(np.float32)
+    if duration is not None:
+        resampled = resampled[:int(duration * sr)]
+    return resampled
@@ -6,18 +6,15 @@ BeatSync 并行处理器
 
 import os
 import sys
-import subprocess
 import argparse
 import tempfile
 import shutil
 import threading
-import numpy as np
-import soundfile as sf
-import librosa
-import re
+import time
 from datetime import datetime
-from typing import Tuple
+from typing import Optional, Tuple
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
 
 # 启用行缓冲，确保日志实时写出（不影响功能/算法）
 try:
@@ -29,299 +26,114 @@ except Exception:
 # 获取CPU核心数（用于优化线程数）
 CPU_COUNT = os.cpu_count() or 2
 
-def extract_audio_from_video(video_path: str, output_path: str, sr: int = 44100) -> bool:
-    """从视频中提取音频为 WAV 格式"""
+def load_audio_from_video(video_path: str, sr: int = 44100):
+    """解码视频音轨为单声道float32数组（ffmpeg 直接输出到内存，不写临时WAV），失败时返回None"""
     try:
-        cmd = [
-            'ffmpeg', '-y',
-            '-i', video_path,
-            '-vn', '-acodec', 'pcm_s16le', '-ar', str(sr), '-ac', '1',
-            output_path
-        ]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        return result.returncode == 0
+        from beatsync_audio_decoder import decode_audio
+        audio, _ = decode_audio(video_path, sr=sr, channels=1)
+        return audio
     except:
-        return False
+        return None
+
+# 单个版本的处理时限（秒），适应Render免费层的性能限制
+PIPELINE_TIMEOUT = 1200
+# 工作进程内的时限未能中断任务时，父进程再等待的时间（秒）
+TIMEOUT_GRACE = 60
+# 两个版本共用的缓存目录（与项目根目录绑定，不受调用方工作目录影响）
+PROJECT_ROOT = str(Path(__file__).parent.absolute())
+CACHE_DIR = os.path.join(PROJECT_ROOT, ".beatsync_cache")
 
-def extract_alignment_info(output_text, program_name):
-    """从程序输出中提取对齐信息"""
-    info = {
-        'program': program_name,
-        'dance_alignment': 'UNKNOWN',
-        'bgm_alignment': 'UNKNOWN',
-        'confidence': 'UNKNOWN',
-        'success': False
+def pipeline_options() -> dict:
+    """两个版本共用的处理参数：快速出片、缓存、CPU平分给两个版本"""
+    half = max(1, CPU_COUNT // 2)  # 使用一半CPU核心数，避免并行处理时的资源竞争
+    return {
+        "fast_video": True,
+        "video_encode": "encode",  # x264_fast
+        "enable_cache": True,
+        "cache_dir": CACHE_DIR,
+        "lib_threads": 1,
+        "align_workers": half,  # 对齐打分线程，与另一路任务平分CPU
     }
-    
-    # 提取对齐点信息 - 更全面的正则表达式
-    dance_patterns = [
-        r'dance.*?(\d+\.?\d*)s',
-        r'dance 开始.*?(\d+\.?\d*)s',
-        r'dance 节拍点.*?(\d+\.?\d*)s',
-        r'dance.*?(\d+\.?\d*)秒'
-    ]
-    
-    bgm_patterns = [
-        r'bgm.*?(\d+\.?\d*)s',
-        r'bgm 开始.*?(\d+\.?\d*)s', 
-        r'bgm 节拍点.*?(\d+\.?\d*)s',
-        r'bgm.*?(\d+\.?\d*)秒'
-    ]
-    
-    confidence_patterns = [
-        r'置信度.*?(\d+\.?\d*)',
-        r'confidence.*?(\d+\.?\d*)',
-        r'最终得分.*?(\d+\.?\d*)'
-    ]
-    
-    # 尝试匹配dance对齐点
-    for pattern in dance_patterns:
-        match = re.search(pattern, output_text, re.IGNORECASE)
-        if match:
-            info['dance_alignment'] = f"{match.group(1)}s"
-            break
-    
-    # 尝试匹配bgm对齐点
-    for pattern in bgm_patterns:
-        match = re.search(pattern, output_text, re.IGNORECASE)
-        if match:
-            info['bgm_alignment'] = f"{match.group(1)}s"
-            break
-    
-    # 尝试匹配置信度
-    for pattern in confidence_patterns:
-        match = re.search(pattern, output_text, re.IGNORECASE)
-        if match:
-            info['confidence'] = match.group(1)
+
+def run_in_pool(executor, func, dance_video: str, bgm_video: str, output_video: str,
+                program: str, **options) -> dict:
+    """
+    在进程池中运行一个版本，返回对比报告使用的结果dict
+
+    处理时限在工作进程内从任务开始执行时计时（见 beatsync_worker_pool.run_with_time_limit），
+    在共享进程池中排队的时间不计入；工作进程内的时限不起作用时（如卡在不响应信号的本地调用中），
+    开始执行超过 PIPELINE_TIMEOUT + TIMEOUT_GRACE 秒后放弃等待，结果带 stuck 标记（工作进程仍被占用）
+    """
+    from beatsync_worker_pool import run_with_time_limit, PipelineTimeout
+
+    start_time = datetime.now()
+    print(f"  [时间] 开始时间: {start_time.strftime('%H:%M:%S')}")
+    future = executor.submit(run_with_time_limit, func, PIPELINE_TIMEOUT,
+                             os.path.abspath(dance_video), os.path.abspath(bgm_video),
+                             os.path.abspath(output_video), **options)
+    started = None
+    while True:
+        try:
+            result = future.result(timeout=1.0)
             break
+        except FutureTimeoutError:
+            if started is None and future.running():
+                started = time.monotonic()
+            if started is not None and time.monotonic() - started > PIPELINE_TIMEOUT + TIMEOUT_GRACE:
+                elapsed = time.monotonic() - started
+                print(f"  [错误] {program}处理超时且未响应中断（已运行{elapsed:.1f}秒）")
+                return {'program': program, 'success': False, 'timed_out': True, 'stuck': True,
+                        'error': f'超时（已运行{elapsed:.1f}秒，限制{PIPELINE_TIMEOUT}秒）'}
+        except PipelineTimeout:
+            elapsed = time.monotonic() - started if started is not None else PIPELINE_TIMEOUT
+            print(f"  [错误] {program}处理超时（已运行{elapsed:.1f}秒）")
+            return {'program': program, 'success': False, 'timed_out': True,
+                    'error': f'超时（已运行{elapsed:.1f}秒，限制{PIPELINE_TIMEOUT}秒）'}
+        except Exception as e:
+            # 工作进程异常退出（如内存不足被杀）
+            return {'program': program, 'success': False, 'error': f"{type(e).__name__}: {e}"}
     
-    # 检查是否成功 - 扩展成功标志列表
-    success_indicators = [
-        '处理成功', 
-        'success', 
-        '完成', 
-        '模块解耦精剪模式处理成功',
-        'Badcase修复（裁剪版本）成功',  # V2版本成功标志
-        'Badcase修复.*成功',  # V2版本成功标志（正则）
-        '精剪视频已生成',
-        '最终输出:',
-        '最终裁剪视频创建成功'
-    ]
-    info['success'] = any(indicator in output_text for indicator in success_indicators)
-    
-    return info
+    print(f"  [时间] 完成时间: {datetime.now().strftime('%H:%M:%S')}, 耗时: {result.elapsed:.1f}秒")
+    if result.timings:
+        print("  [耗时] " + ", ".join(f"{name}={sec:.1f}s" for name, sec in result.timings.items()))
+    if not result.success:
+        print(f"  [错误] {result.error}")
+    return result.to_info()
 
-def process_with_modular(dance_video: str, bgm_video: str, output_video: str) -> dict:
-    """使用modular版本处理"""
-    start_time = None
-    try:
-        print("  使用modular版本处理...")
-        start_time = datetime.now()
-        print(f"  [时间] 开始时间: {start_time.strftime('%H:%M:%S')}")
-        # 获取项目根目录（脚本所在目录的父目录）
-        script_dir = Path(__file__).parent.absolute()
-        project_root = script_dir
-        
-        modular_script = project_root / "beatsync_fine_cut_modular.py"
-        if not modular_script.exists():
-            # 如果找不到，尝试当前工作目录
-            modular_script = Path("beatsync_fine_cut_modular.py")
-        
-        cmd = [
-            "python3", str(modular_script),
-            "--dance", dance_video,
-            "--bgm", bgm_video,
-            "--output", output_video,
-            "--fast-video",
-            "--video-encode", "x264_fast",
-            "--enable-cache",
-            "--cache-dir", ".beatsync_cache",
-            "--threads", str(max(1, CPU_COUNT // 2)),  # 使用一半CPU核心数，避免并行处理时的资源竞争
-            "--lib-threads", "1"
-        ]
-        
-        print(f"  [命令] 执行命令: {' '.join(cmd[:3])} ... (参数已省略)")
-        print(f"  [状态] 开始执行subprocess...")
-        
-        # 设置工作目录为项目根目录
-        # 增加超时时间到1200秒（20分钟），适应Render免费层的性能限制
-        start_time = datetime.now()
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=1200, cwd=str(project_root))
-        end_time = datetime.now()
-        elapsed = (end_time - start_time).total_seconds()
-        print(f"  [时间] 完成时间: {end_time.strftime('%H:%M:%S')}, 耗时: {elapsed:.1f}秒")
-        print(f"  [结果] 返回码: {result.returncode}")
-        if result.stdout:
-            print(f"  [输出] stdout长度: {len(result.stdout)}字符")
-        if result.stderr:
-            print(f"  [错误] stderr长度: {len(result.stderr)}字符")
-            # 如果失败，打印stderr内容（前500字符）
-            if result.returncode != 0:
-                print(f"  [错误详情] stderr内容:")
-                stderr_lines = result.stderr.strip().split('\n')
-                for i, line in enumerate(stderr_lines[:10]):  # 只显示前10行
-                    print(f"    {line}")
-                if len(stderr_lines) > 10:
-                    print(f"    ... (还有 {len(stderr_lines) - 10} 行)")
-        info = extract_alignment_info(result.stdout, "modular版本")
-        info['return_code'] = result.returncode
-        info['stderr'] = result.stderr
-        
-        # 检查输出文件（modular版本必须输出最终文件，不接受中间文件）
-        output_is_intermediate = '_module1_aligned' in output_video
-        
-        # 如果失败，提取错误信息
-        if result.returncode != 0:
-            # 优先从stderr提取错误信息
-            if result.stderr:
-                # 提取关键错误信息（前500字符）
-                error_lines = result.stderr.strip().split('\n')
-                # 查找包含"Error"、"error"、"失败"、"Exception"的行
-                error_msg = None
-                for line in error_lines:
-                    if any(keyword in line.lower() for keyword in ['error', '失败', 'exception', 'traceback']):
-                        error_msg = line.strip()
-                        break
-                if not error_msg and error_lines:
-                    # 如果没有找到关键词，使用最后一行
-                    error_msg = error_lines[-1].strip()
-                if error_msg:
-                    info['error'] = error_msg[:200]  # 限制长度
-                else:
-                    info['error'] = f"返回码: {result.returncode}, stderr: {result.stderr[:200]}"
-            else:
-                info['error'] = f"返回码: {result.returncode}，无错误输出"
-        
-        # 增强成功判断：如果返回码为0且输出文件存在，则认为成功
-        # 注意：modular版本必须输出最终文件，不接受中间文件
-        if result.returncode == 0 and os.path.exists(output_video) and os.path.getsize(output_video) > 0:
-            # 检查是否是中间文件（modular版本可能生成中间文件）
-            if output_is_intermediate:
-                # 这是中间文件，不是最终输出，应该认为失败
-                info['success'] = False
-                if not info.get('error'):
-                    info['error'] = '只生成了中间文件，未生成最终输出文件（模块2失败）'
-                print(f"  ⚠️  警告: 检测到中间文件，但未找到最终输出文件")
-                print(f"  ⚠️  中间文件: {output_video}")
-                print(f"  ⚠️  这表示模块2（裁剪模块）失败")
-            else:
-                info['success'] = True
-        elif result.returncode != 0:
-            # 如果返回码不是0，检查是否有中间文件
-            intermediate_file = output_video.replace('.mp4', '_module1_aligned.mp4')
-            if os.path.exists(intermediate_file) and os.path.getsize(intermediate_file) > 0:
-                if not info.get('error'):
-                    info['error'] = f'模块2失败，只生成了中间文件（返回码: {result.returncode}）'
-                print(f"  ⚠️  警告: 返回码{result.returncode}，但检测到中间文件")
-                print(f"  ⚠️  中间文件: {intermediate_file}")
-                print(f"  ⚠️  这表示模块2（裁剪模块）失败")
-            # 即使extract_alignment_info认为成功，如果返回码不是0，也应该认为失败
-            if info.get('success') and result.returncode != 0:
-                info['success'] = False
-                if not info.get('error'):
-                    info['error'] = f'返回码: {result.returncode}，处理失败'
-        
-        return info
-        
-    except subprocess.TimeoutExpired as e:
-        elapsed = (datetime.now() - start_time).total_seconds() if start_time else 0
-        print(f"  [错误] modular版本处理超时（已运行{elapsed:.1f}秒）")
-        return {'program': 'modular版本', 'success': False, 'error': f'超时（已运行{elapsed:.1f}秒，限制1200秒）'}
-    except Exception as e:
-        return {'program': 'modular版本', 'success': False, 'error': str(e)}
+def process_with_modular(executor, dance_video: str, bgm_video: str, output_video: str,
+                         ingest_manifest: Optional[str] = None) -> dict:
+    """使用modular版本处理（在进程池中调用流程API）"""
+    from beatsync_pipeline_api import run_modular_pipeline, MODULAR_PROGRAM
+    print("  使用modular版本处理...")
+    options = pipeline_options()
+    options["ffmpeg_threads"] = max(1, CPU_COUNT // 2)
+    return run_in_pool(executor, run_modular_pipeline, dance_video, bgm_video, output_video,
+                       MODULAR_PROGRAM, ingest_manifest_path=ingest_manifest, **options)
 
-def process_with_v2(dance_video: str, bgm_video: str, output_video: str) -> dict:
-    """使用V2版本处理"""
-    start_time = None
-    try:
-        print("  使用V2版本处理...")
-        start_time = datetime.now()
-        print(f"  [时间] 开始时间: {start_time.strftime('%H:%M:%S')}")
-        # 获取项目根目录（脚本所在目录的父目录）
-        script_dir = Path(__file__).parent.absolute()
-        project_root = script_dir
-        
-        v2_script = project_root / "beatsync_badcase_fix_trim_v2.py"
-        if not v2_script.exists():
-            # 如果找不到，尝试当前工作目录
-            v2_script = Path("beatsync_badcase_fix_trim_v2.py")
-        
-        cmd = [
-            "python3", str(v2_script),
-            "--dance", dance_video,
-            "--bgm", bgm_video,
-            "--output", output_video,
-            "--fast-video",
-            "--video-encode", "x264_fast",
-            "--enable-cache",
-            "--cache-dir", ".beatsync_cache",
-            "--threads", str(max(1, CPU_COUNT // 2)),  # 使用一半CPU核心数，避免并行处理时的资源竞争
-            "--lib-threads", "1"
-        ]
-        
-        print(f"  [命令] 执行命令: {' '.join(cmd[:3])} ... (参数已省略)")
-        print(f"  [状态] 开始执行subprocess...")
-        
-        # 设置工作目录为项目根目录
-        # 增加超时时间到1200秒（20分钟），适应Render免费层的性能限制
-        start_time = datetime.now()
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=1200, cwd=str(project_root))
-        end_time = datetime.now()
-        elapsed = (end_time - start_time).total_seconds()
-        print(f"  [时间] 完成时间: {end_time.strftime('%H:%M:%S')}, 耗时: {elapsed:.1f}秒")
-        print(f"  [结果] 返回码: {result.returncode}")
-        if result.stdout:
-            print(f"  [输出] stdout长度: {len(result.stdout)}字符")
-        if result.stderr:
-            print(f"  [错误] stderr长度: {len(result.stderr)}字符")
-            # 如果失败，打印stderr内容（前500字符）
-            if result.returncode != 0:
-                print(f"  [错误详情] stderr内容:")
-                stderr_lines = result.stderr.strip().split('\n')
-                for i, line in enumerate(stderr_lines[:10]):  # 只显示前10行
-                    print(f"    {line}")
-                if len(stderr_lines) > 10:
-                    print(f"    ... (还有 {len(stderr_lines) - 10} 行)")
-        info = extract_alignment_info(result.stdout, "V2版本")
-        info['return_code'] = result.returncode
-        info['stderr'] = result.stderr
-        
-        # 如果失败，提取错误信息
-        if result.returncode != 0:
-            # 优先从stderr提取错误信息
-            if result.stderr:
-                # 提取关键错误信息（前500字符）
-                error_lines = result.stderr.strip().split('\n')
-                # 查找包含"Error"、"error"、"失败"、"Exception"的行
-                error_msg = None
-                for line in error_lines:
-                    if any(keyword in line.lower() for keyword in ['error', '失败', 'exception', 'traceback']):
-                        error_msg = line.strip()
-                        break
-                if not error_msg and error_lines:
-                    # 如果没有找到关键词，使用最后一行
-                    error_msg = error_lines[-1].strip()
-                if error_msg:
-                    info['error'] = error_msg[:200]  # 限制长度
-                else:
-                    info['error'] = f"返回码: {result.returncode}, stderr: {result.stderr[:200]}"
-            else:
-                info['error'] = f"返回码: {result.returncode}，无错误输出"
-        
-        # 增强成功判断：如果返回码为0且输出文件存在，则认为成功
-        if result.returncode == 0 and os.path.exists(output_video) and os.path.getsize(output_video) > 0:
-            info['success'] = True
-        
-        return info
-        
-    except subprocess.TimeoutExpired as e:
-        elapsed = (datetime.now() - start_time).total_seconds() if 'start_time' in locals() else 0
-        print(f"  [错误] V2版本处理超时（已运行{elapsed:.1f}秒）")
-        return {'program': 'V2版本', 'success': False, 'error': f'超时（已运行{elapsed:.1f}秒，限制1200秒）'}
-    except Exception as e:
-        return {'program': 'V2版本', 'success': False, 'error': str(e)}
+def process_with_v2(executor, dance_video: str, bgm_video: str, output_video: str,
+                    ingest_manifest: Optional[str] = None) -> dict:
+    """使用V2版本处理（在进程池中调用流程API）"""
+    from beatsync_pipeline_api import run_v2_pipeline, V2_PROGRAM
+    print("  使用V2版本处理...")
+    options = pipeline_options()
+    options["threads"] = max(1, CPU_COUNT // 2)
+    return run_in_pool(executor, run_v2_pipeline, dance_video, bgm_video, output_video,
+                       V2_PROGRAM, ingest_manifest_path=ingest_manifest, **options)
+
+def terminate_pool(executor):
+    """
+    强制结束进程池的工作进程（任务超时且未响应中断时使用，否则关闭进程池会一直等待该任务）
+    只用于本模块自己创建的进程池：共享的常驻进程池中还有其他任务在运行，不能结束
+    """
+    for process in list(getattr(executor, "_processes", {}).values()):
+        try:
+            process.terminate()
+        except Exception:
+            pass
+    executor.shutdown(wait=False, cancel_futures=True)
 
-def process_beat_sync_parallel(dance_video: str, bgm_video: str, output_dir: str, sample_name: str, parallel: bool = False) -> bool:
+def process_beat_sync_parallel(dance_video: str, bgm_video: str, output_dir: str, sample_name: str, parallel: bool = False,
+                               executor: Optional[ProcessPoolExecutor] = None) -> bool:
     """
     处理主函数（支持串行和并行模式）
     
@@ -333,6 +145,7 @@ def process_beat_sync_parallel(dance_video: str, bgm_video: str, output_dir: str
         parallel: 是否使用并行模式（默认False，使用串行模式）
                   - False: 串行模式（适合资源受限环境，如Render免费层）
                   - True: 并行模式（适合资源充足环境，需要升级服务器后使用）
+        executor: 运行两个版本的进程池（None则本次调用内新建，结束时关闭）
     """
     mode_name = "并行处理器" if parallel else "串行处理器"
     print("=" * 60)
@@ -361,74 +174,121 @@ def process_beat_sync_parallel(dance_video: str, bgm_video: str, output_dir: str
     print(f"输出目录: {output_dir}")
     print("-" * 40)
     
-    # 处理（串行或并行）
-    mode_text = "并行处理" if parallel else "串行处理"
-    print(f"\n步骤1: {mode_text}...")
-    
-    # 使用线程真正并行处理两个版本
-    # 使用线程安全的字典存储结果
-    modular_result = {}
-    v2_result = {}
-    result_lock = threading.Lock()
-    
-    def modular_thread():
-        """Modular版本处理线程"""
+    # ingest：每个输入只探测一次、解码一次，两个版本共享（失败时各自提取）
+    print(f"\n步骤0: 预处理输入（探测 + 解码音频）...")
+    ingest_dir = tempfile.mkdtemp(prefix="beatsync_ingest_")
+    # 中断或超时等异常时同样终止自建的进程池、删除ingest临时目录
+    own_executor = False
+    modular_result, v2_result = {}, {}
+    try:
+        ingest_manifest = None
+        dance_input, bgm_input = dance_video, bgm_video  # 传给两个版本的输入（非MP4时为ingest转换后的文件）
         try:
-            result = process_with_modular(dance_video, bgm_video, modular_output)
-            result['output_file'] = modular_output
-            with result_lock:
-                modular_result.update(result)
-            print(f"  ✅ modular版本处理完成: {'成功' if result.get('success') else '失败'}")
+            from beatsync_ingest import ingest_inputs, load_ingest_manifest
+            ingest_manifest, ingest_error = ingest_inputs({"dance": dance_video, "bgm": bgm_video}, ingest_dir,
+                                                           cache_dir=CACHE_DIR)
+            if ingest_manifest:
+                inputs = load_ingest_manifest(ingest_manifest)["inputs"]
+                dance_input, bgm_input = inputs["dance"]["video"], inputs["bgm"]["video"]
+                print(f"  ✅ 预处理完成: {ingest_manifest}")
+            else:
+                print(f"  ⚠️  预处理失败，两个版本各自提取音频: {ingest_error}")
         except Exception as e:
-            error_info = {
-                'program': 'modular版本',
-                'success': False,
-                'error': str(e)
-            }
-            with result_lock:
-                modular_result.update(error_info)
-            print(f"  ❌ modular版本处理异常: {str(e)}")
+            ingest_manifest = None
+            print(f"  ⚠️  预处理异常，两个版本各自提取音频: {e}")
     
-    def v2_thread():
-        """V2版本处理线程"""
-        try:
-            result = process_with_v2(dance_video, bgm_video, v2_output)
-            result['output_file'] = v2_output
-            with result_lock:
-                v2_result.update(result)
-            print(f"  ✅ V2版本处理完成: {'成功' if result.get('success') else '失败'}")
-        except Exception as e:
-            error_info = {
-                'program': 'V2版本',
-                'success': False,
-                'error': str(e)
-            }
-            with result_lock:
-                v2_result.update(error_info)
-            print(f"  ❌ V2版本处理异常: {str(e)}")
+        # 处理（串行或并行）
+        mode_text = "并行处理" if parallel else "串行处理"
+        print(f"\n步骤1: {mode_text}...")
+    
+        # 使用线程真正并行处理两个版本
+        # 使用线程安全的字典存储结果（modular_result / v2_result 在 try 之前创建，finally 中要用到）
+        result_lock = threading.Lock()
     
-    # 根据parallel参数选择串行或并行模式
-    if parallel:
-        # 并行处理模式（适合资源充足环境）
-        print("  启动modular版本和V2版本并行处理...")
-        t1 = threading.Thread(target=modular_thread, daemon=False)
-        t2 = threading.Thread(target=v2_thread, daemon=False)
+        def modular_thread():
+            """Modular版本处理线程"""
+            try:
+                result = process_with_modular(executor, dance_input, bgm_input, modular_output, ingest_manifest)
+                result['output_file'] = modular_output
+                with result_lock:
+                    modular_result.update(result)
+                print(f"  ✅ modular版本处理完成: {'成功' if result.get('success') else '失败'}")
+            except Exception as e:
+                error_info = {
+                    'program': 'modular版本',
+                    'success': False,
+                    'error': str(e)
+                }
+                with result_lock:
+                    modular_result.update(error_info)
+                print(f"  ❌ modular版本处理异常: {str(e)}")
+    
+        def v2_thread():
+            """V2版本处理线程"""
+            try:
+                result = process_with_v2(executor, dance_input, bgm_input, v2_output, ingest_manifest)
+                result['output_file'] = v2_output
+                with result_lock:
+                    v2_result.update(result)
+                print(f"  ✅ V2版本处理完成: {'成功' if result.get('success') else '失败'}")
+            except Exception as e:
+                error_info = {
+                    'program': 'V2版本',
+                    'success': False,
+                    'error': str(e)
+                }
+                with result_lock:
+                    v2_result.update(error_info)
+                print(f"  ❌ V2版本处理异常: {str(e)}")
+    
+        # 两个版本在工作进程中以函数调用方式运行（不再每次启动python3子进程、重复导入librosa等库）
+        if executor is None:
+            executor = ProcessPoolExecutor(max_workers=2 if parallel else 1)
+            own_executor = True
+    
+        # 根据parallel参数选择串行或并行模式
+        if parallel:
+            # 并行处理模式（适合资源充足环境）
+            print("  启动modular版本和V2版本并行处理...")
+            t1 = threading.Thread(target=modular_thread, daemon=False)
+            t2 = threading.Thread(target=v2_thread, daemon=False)
         
-        t1.start()
-        t2.start()
+            t1.start()
+            t2.start()
         
-        # 等待两个线程完成（即使一个失败，另一个也会继续）
-        t1.join()
-        t2.join()
-    else:
-        # 串行处理模式（适合资源受限环境，如Render免费层）
-        # 测试结果：串行处理总耗时更长，不推荐使用
-        # 串行处理：先运行V2版本，再运行modular版本
-        print("  启动V2版本处理（串行模式，避免资源竞争）...")
-        v2_thread()
+            # 等待两个线程完成（即使一个失败，另一个也会继续）
+            t1.join()
+            t2.join()
+        else:
+            # 串行处理模式（适合资源受限环境，如Render免费层）
+            # 测试结果：串行处理总耗时更长，不推荐使用
+            # 串行处理：先运行V2版本，再运行modular版本
+            print("  启动V2版本处理（串行模式，避免资源竞争）...")
+            v2_thread()
+            if v2_result.get('stuck'):
+                # 超时的任务未响应中断，仍占用工作进程：modular版本改用新的专用进程池
+                if own_executor:
+                    terminate_pool(executor)
+                else:
+                    print("  [警告] 共享进程池中的V2任务未响应中断，modular版本改用专用进程池")
+                executor = ProcessPoolExecutor(max_workers=1)
+                own_executor = True
         
-        print("  启动modular版本处理（串行模式）...")
-        modular_thread()
+            print("  启动modular版本处理（串行模式）...")
+            modular_thread()
+    except BaseException:
+        # 异常退出：自建的进程池直接终止，不等待仍在运行的任务
+        if own_executor:
+            terminate_pool(executor)
+            own_executor = False
+        raise
+    finally:
+        if own_executor:
+            if modular_result.get('stuck') or (parallel and v2_result.get('stuck')):
+                terminate_pool(executor)
+            else:
+                executor.shutdown(wait=True)
+        shutil.rmtree(ingest_dir, ignore_errors=True)
     
     # 获取结果（线程安全）
     with result_lock:
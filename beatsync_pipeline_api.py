@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+BeatSync 流程API
+以函数调用方式运行modular版本与V2版本（替代逐个启动 python3 子进程并从输出中正则提取结果），
+返回结构化的处理结果；并行处理器在进程池中调用
+"""
+
+import os
+import time
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Optional
+
+MODULAR_PROGRAM = "modular版本"
+V2_PROGRAM = "V2版本"
+
+
+@dataclass
+class PipelineResult:
+    """单个版本的处理结果（时间单位：秒）"""
+    program: str
+    success: bool = False
+    output_file: Optional[str] = None
+    dance_alignment: Optional[float] = None   # bgm对齐到的dance位置
+    bgm_alignment: Optional[float] = None     # bgm对齐点
+    confidence: Optional[float] = None        # 对齐得分
+    trim_start: Optional[float] = None        # modular：裁剪起点；V2：裁剪掉的时长
+    trim_duration: Optional[float] = None     # modular：裁剪后的时长
+    badcase_type: Optional[str] = None        # V2：T1_GT_T2 / T2_GT_T1 / NORMAL
+    timings: Dict[str, float] = field(default_factory=dict)
+    elapsed: float = 0.0
+    error: Optional[str] = None
+
+    def to_info(self) -> dict:
+        """转为对比报告使用的dict：对齐点/置信度格式化为字符串，未知时为 'UNKNOWN'"""
+        info = asdict(self)
+        for key, fmt in [('dance_alignment', '{:.3f}s'), ('bgm_alignment', '{:.3f}s'), ('confidence', '{:.4f}')]:
+            info[key] = 'UNKNOWN' if info[key] is None else fmt.format(info[key])
+        return info
+
+
+def _run_pipeline(program: str, runner, dance_video: str, bgm_video: str, output_video: str,
+                  **options) -> PipelineResult:
+    # 流程的中间文件写在各自的任务临时工作区（beatsync_workspace），不依赖当前目录
+    report = {}
+    start = time.time()
+    try:
+        ok = runner(dance_video, bgm_video, output_video, report=report, **options)
+    except Exception as e:
+        ok = False
+        report.setdefault('error', f"{type(e).__name__}: {e}")
+    result = PipelineResult(
+        program=program,
+        dance_alignment=report.get('dance_alignment'),
+        bgm_alignment=report.get('bgm_alignment'),
+        confidence=report.get('confidence'),
+        trim_start=report.get('trim_start'),
+        trim_duration=report.get('trim_duration'),
+        badcase_type=report.get('badcase_type'),
+        timings=report.get('timings', {}),
+        elapsed=time.time() - start,
+        error=report.get('error'),
+    )
+    # 成功需要流程返回成功且输出文件非空
+    if ok and os.path.exists(output_video) and os.path.getsize(output_video) > 0:
+        result.success = True
+        result.output_file = output_video
+    elif ok:
+        result.error = f"输出文件不存在或为空: {output_video}"
+    elif not result.error:
+        result.error = "处理失败"
+    return result
+
+
+def run_modular_pipeline(dance_video: str, bgm_video: str, output_video: str, **options) -> PipelineResult:
+    """
+    运行modular版本（输入验证 + 对齐模块 + 裁剪模块）
+
+    参数:
+        options: beatsync_fine_cut_modular.run_fine_cut_modular 的参数
+    """
+    from beatsync_fine_cut_modular import run_fine_cut_modular
+    return _run_pipeline(MODULAR_PROGRAM, run_fine_cut_modular, dance_video, bgm_video, output_video, **options)
+
+
+def run_v2_pipeline(dance_video: str, bgm_video: str, output_video: str, **options) -> PipelineResult:
+    """
+    运行V2版本（输入验证 + badcase检测与裁剪合成）
+
+    参数:
+        options: beatsync_badcase_fix_trim_v2.run_badcase_fix_trim 的参数
+    """
+    from beatsync_badcase_fix_trim_v2 import run_badcase_fix_trim
+    return _run_pipeline(V2_PROGRAM, run_badcase_fix_trim, dance_video, bgm_video, output_video, **options)
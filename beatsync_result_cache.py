@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+BeatSync 处理结果缓存
+同一对 (dance, bgm) 视频按内容摘要 + 处理流程版本缓存两个版本的最终输出：重复提交时直接把缓存的输出
+硬链接到新任务目录，不再运行两条完整流程；相同组合正在处理时，新提交关联到正在运行的任务
+"""
+
+import os
+import json
+import hashlib
+import threading
+from typing import Dict, Optional, Tuple
+
+# 处理流程版本：对齐/裁剪/编码的输出发生变化时递增，旧结果自然失效
+PIPELINE_VERSION = "pipeline_v1"
+# 缓存的输出版本（两个版本都成功时才缓存，命中时两个都要存在）
+RESULT_OUTPUTS = ("modular", "v2")
+
+
+def result_cache_key(dance_path: str, bgm_path: str, version: str = PIPELINE_VERSION) -> str:
+    """(dance, bgm) 组合的结果缓存键：两个文件的内容摘要 + 处理流程版本（与文件名、上传ID无关）"""
+    from beatsync_digest import file_digest
+    key_obj = {"dance": file_digest(dance_path), "bgm": file_digest(bgm_path), "pipeline": version}
+    key_str = json.dumps(key_obj, sort_keys=True)
+    return "result_" + hashlib.sha1(key_str.encode("utf-8")).hexdigest()
+
+
+def output_name(task_id: str, version: str) -> str:
+    """任务目录中各版本输出的文件名（与预览/下载接口一致）"""
+    return f"{task_id}_{version}.mp4"
+
+
+class ResultCache:
+    """
+    结果缓存（输出视频放在缓存目录的 results 子目录中，有自己的索引与上限，不会挤掉音频/分析结果缓存）
+
+    参数:
+        cache_dir: 缓存目录
+    """
+
+    def __init__(self, cache_dir: str):
+        from beatsync_audio_cache import get_cache_index
+        self.index = get_cache_index(cache_dir, kind="results")
+
+    def store_outputs(self, key: str, outputs: Dict[str, str]) -> bool:
+        """
+        缓存一次处理的输出（硬链接进缓存目录，任务目录被清理后缓存仍然有效）
+
+        参数:
+            outputs: {版本: 输出文件路径}，缺少任一版本时不缓存
+
+        返回:
+            是否已缓存
+        """
+        if any(not outputs.get(version) or not os.path.exists(outputs[version]) for version in RESULT_OUTPUTS):
+            return False
+        for version in RESULT_OUTPUTS:
+            if self.index.store_file(f"{key}_{version}", outputs[version], ext=".mp4") is None:
+                return False
+        return True
+
+    def link_outputs(self, key: str, output_dir: str, task_id: str) -> Optional[Dict[str, str]]:
+        """
+        命中时把各版本输出硬链接（不在同一文件系统时复制）到新任务目录
+
+        返回:
+            {版本: 任务目录中的输出路径}；未命中或部分版本已被淘汰时返回None（不留下部分输出）
+        """
+        linked = {}
+        for version in RESULT_OUTPUTS:
+            dest = os.path.join(output_dir, output_name(task_id, version))
+            if not self.index.link_file(f"{key}_{version}", dest):
+                for path in linked.values():
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                return None
+            linked[version] = dest
+        return linked
+
+
+class InflightTasks:
+    """正在处理的 (dance, bgm) 组合：结果缓存键 -> (任务ID, 输入文件)，相同组合的新提交关联到已有任务"""
+
+    def __init__(self):
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def claim(self, key: str, task_id: str, inputs: Tuple = ()) -> Optional[Tuple[str, Tuple]]:
+        """
+        登记任务开始处理该组合
+
+        返回:
+            None 表示登记成功（由本任务处理）；该组合已在处理时返回已有的 (任务ID, 输入文件)
+        """
+        with self._lock:
+            existing = self._tasks.get(key)
+            if existing is not None:
+                return existing
+            self._tasks[key] = (task_id, tuple(inputs))
+            return None
+
+    def release(self, key: str, task_id: str):
+        """任务结束（成功或失败）后注销；只注销本任务的登记"""
+        with self._lock:
+            existing = self._tasks.get(key)
+            if existing is not None and existing[0] == task_id:
+                del self._tasks[key]
+
+    def get(self, key: str) -> Optional[str]:
+        """正在处理该组合的任务ID"""
+        with self._lock:
+            existing = self._tasks.get(key)
+            return existing[0] if existing is not None else None
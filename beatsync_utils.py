@@ -8,6 +8,7 @@ import os
 import subprocess
 import traceback
 import gc
+import json
 from typing import Tuple, Optional
 
 try:
@@ -16,6 +17,59 @@ try:
 except ImportError:
     PSUTIL_AVAILABLE = False
 
+# 已探测的媒体信息（绝对路径 -> probe_media 的结果），由ingest阶段登记，避免重复ffprobe
+_MEDIA_PROBES = {}
+
+def probe_media(video_path: str, timeout: int = 10) -> Optional[dict]:
+    """
+    一次ffprobe（JSON输出）获取时长、帧率与音视频流信息
+    
+    参数:
+        video_path: 媒体文件路径
+        timeout: 超时时间（秒）
+    
+    返回:
+        {duration, fps, has_video, has_audio, video_codec, audio_codec}，失败时返回None
+        （fps为 r_frame_rate 原始字符串，用 parse_fps_safely 解析）
+    """
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-print_format', 'json',
+        '-show_format', '-show_streams',
+        video_path
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+        if result.returncode != 0:
+            return None
+        info = json.loads(result.stdout or "{}")
+    except (subprocess.TimeoutExpired, FileNotFoundError, ValueError):
+        return None
+    
+    streams = info.get('streams', [])
+    video = next((st for st in streams if st.get('codec_type') == 'video'), None)
+    audio = next((st for st in streams if st.get('codec_type') == 'audio'), None)
+    try:
+        duration = float(info.get('format', {}).get('duration'))
+    except (TypeError, ValueError):
+        duration = None
+    return {
+        'duration': duration,
+        'fps': video.get('r_frame_rate') if video else None,
+        'has_video': video is not None,
+        'has_audio': audio is not None,
+        'video_codec': video.get('codec_name') if video else None,
+        'audio_codec': audio.get('codec_name') if audio else None,
+    }
+
+def register_media_probe(video_path: str, probe: dict):
+    """登记已探测的媒体信息，之后的验证、时长与帧率查询直接使用"""
+    _MEDIA_PROBES[os.path.abspath(video_path)] = probe
+
+def get_registered_probe(video_path: str) -> Optional[dict]:
+    """返回已登记的媒体信息，未登记时返回None"""
+    return _MEDIA_PROBES.get(os.path.abspath(video_path))
+
 def validate_input_files(dance_video: str, bgm_video: str, output_video: str) -> Tuple[bool, str]:
     """
     验证输入文件的有效性
@@ -39,6 +93,15 @@ def validate_input_files(dance_video: str, bgm_video: str, output_video: str) ->
     # 2. 检查文件格式（使用ffprobe）
     for video_path, name in [(dance_video, "dance"), (bgm_video, "bgm")]:
         if os.path.exists(video_path):
+            # ingest阶段已探测过：直接使用登记的信息
+            probe = get_registered_probe(video_path)
+            if probe is not None:
+                if not probe.get('has_video'):
+                    errors.append(f"{name}视频格式无效或无法读取: {video_path}")
+                elif not probe.get('has_audio'):
+                    errors.append(f"{name}视频没有音频轨道: {video_path}")
+                continue
+            
             # 检查视频流
             cmd = [
                 'ffprobe', '-v', 'error',
@@ -195,6 +258,10 @@ def get_video_fps(video_path: str, default: float = 25.0) -> float:
     返回:
         帧率（浮点数）
     """
+    probe = get_registered_probe(video_path)
+    if probe is not None and probe.get('fps'):
+        return parse_fps_safely(probe['fps'], default)
+    
     try:
         cmd = [
             'ffprobe', '-v', 'error',  # 改为 error 级别，避免警告干扰
@@ -317,7 +384,9 @@ def get_memory_usage_mb() -> Optional[float]:
 
 def manage_cache(cache_dir: str, max_files: int = 100, max_size_mb: int = 5000) -> Tuple[int, float]:
     """
-    管理缓存目录，清理旧文件以保持缓存大小在限制内
+    管理缓存目录，按最后访问时间淘汰旧文件以保持缓存大小在限制内
+    （读取缓存索引中维护的文件数与总大小，不遍历目录，见 beatsync_audio_cache；
+    只管理音频缓存，分析结果与处理结果缓存有各自的上限）
     
     参数:
         cache_dir: 缓存目录路径
@@ -331,72 +400,15 @@ def manage_cache(cache_dir: str, max_files: int = 100, max_size_mb: int = 5000)
         return 0, 0.0
     
     try:
-        # 获取所有缓存文件及其信息
-        cache_files = []
-        for filename in os.listdir(cache_dir):
-            if filename.endswith('.wav'):
-                filepath = os.path.join(cache_dir, filename)
-                try:
-                    stat = os.stat(filepath)
-                    cache_files.append({
-                        'path': filepath,
-                        'size': stat.st_size,
-                        'mtime': stat.st_mtime
-                    })
-                except:
-                    continue
-        
-        if len(cache_files) == 0:
-            return 0, 0.0
-        
-        # 按修改时间排序（最旧的在前）
-        cache_files.sort(key=lambda x: x['mtime'])
-        
-        # 计算总大小
-        total_size_mb = sum(f['size'] for f in cache_files) / (1024 * 1024)
-        
-        deleted_count = 0
-        freed_mb = 0.0
-        
-        # 如果文件数超过限制，删除最旧的文件
-        if len(cache_files) > max_files:
-            to_delete = len(cache_files) - max_files
-            for i in range(to_delete):
-                try:
-                    file_size_mb = cache_files[i]['size'] / (1024 * 1024)
-                    os.remove(cache_files[i]['path'])
-                    deleted_count += 1
-                    freed_mb += file_size_mb
-                except Exception as e:
-                    print(f"  警告: 删除缓存文件失败 {cache_files[i]['path']}: {e}")
-        
-        # 如果总大小超过限制，继续删除最旧的文件
-        if total_size_mb > max_size_mb:
-            current_size_mb = total_size_mb - freed_mb
-            for cache_file in cache_files[deleted_count:]:
-                if current_size_mb <= max_size_mb:
-                    break
-                try:
-                    file_size_mb = cache_file['size'] / (1024 * 1024)
-                    os.remove(cache_file['path'])
-                    deleted_count += 1
-                    freed_mb += file_size_mb
-                    current_size_mb -= file_size_mb
-                except Exception as e:
-                    print(f"  警告: 删除缓存文件失败 {cache_file['path']}: {e}")
-        
-        if deleted_count > 0:
-            print(f"  缓存清理: 删除了 {deleted_count} 个文件，释放了 {freed_mb:.2f}MB")
-        
-        return deleted_count, freed_mb
-        
+        from beatsync_audio_cache import get_cache_index
+        return get_cache_index(cache_dir, max_files=max_files, max_size_mb=max_size_mb).evict()
     except Exception as e:
         print(f"  警告: 缓存管理失败: {e}")
         return 0, 0.0
 
 def get_cache_info(cache_dir: str) -> dict:
     """
-    获取缓存目录信息
+    获取缓存目录信息（读取缓存索引中的累计值）
     
     参数:
         cache_dir: 缓存目录路径
@@ -412,26 +424,12 @@ def get_cache_info(cache_dir: str) -> dict:
         }
     
     try:
-        cache_files = []
-        for filename in os.listdir(cache_dir):
-            if filename.endswith('.wav'):
-                filepath = os.path.join(cache_dir, filename)
-                try:
-                    stat = os.stat(filepath)
-                    cache_files.append({
-                        'path': filepath,
-                        'size': stat.st_size,
-                        'mtime': stat.st_mtime
-                    })
-                except:
-                    continue
-        
-        total_size_mb = sum(f['size'] for f in cache_files) / (1024 * 1024)
-        
+        from beatsync_audio_cache import get_cache_index
+        file_count, total_bytes = get_cache_index(cache_dir).totals()
         return {
             'exists': True,
-            'file_count': len(cache_files),
-            'total_size_mb': total_size_mb
+            'file_count': file_count,
+            'total_size_mb': total_bytes / (1024 * 1024)
         }
     except Exception as e:
         return {
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+BeatSync numba 内核预热
+librosa 的节拍检测等内核由 numba 即时编译（cache=True），这里把编译结果统一缓存到受管理的目录
+（默认 .beatsync_cache/numba，可用 BEATSYNC_NUMBA_CACHE_DIR 或 NUMBA_CACHE_DIR 指定）。
+预热（在合成信号上调用全部内核）只在本入口与常驻工作进程初始化时运行；命令行流程只把 numba 指向缓存目录，
+用到内核时从缓存加载，并在阶段耗时中报告预编译记录的冷编译耗时（即缓存节省的时间）
+
+用法（部署/构建镜像时预先编译）:
+    python beatsync_warmup.py [--cache-dir DIR] [--force]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+from typing import Optional
+
+CACHE_DIR_ENV = "BEATSYNC_NUMBA_CACHE_DIR"
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".beatsync_cache", "numba")
+# 记录冷编译耗时（用于计算节省的时间），随 librosa / numba 版本失效
+RECORD_NAME = "beatsync_warmup.json"
+
+def configure_numba_cache(cache_dir: Optional[str] = None) -> Optional[str]:
+    """
+    设置 numba 缓存目录（应在 numba 被导入前调用；已设置 NUMBA_CACHE_DIR 时不覆盖）
+
+    返回:
+        生效的缓存目录，目录不可写时返回None（保持numba默认行为）
+    """
+    if os.environ.get("NUMBA_CACHE_DIR") and cache_dir is None:
+        return os.environ["NUMBA_CACHE_DIR"]
+    cache_dir = cache_dir or os.environ.get(CACHE_DIR_ENV) or DEFAULT_CACHE_DIR
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+    except OSError:
+        return None
+    if not os.access(cache_dir, os.W_OK):
+        return None
+    os.environ["NUMBA_CACHE_DIR"] = cache_dir
+    if "numba" in sys.modules:
+        # numba 已被导入：重新读取配置使缓存目录生效
+        from numba.core import config
+        config.reload_config()
+    return cache_dir
+
+
+def warm_up_kernels() -> float:
+    """在合成信号上调用流程用到的 librosa 函数（两个版本的采样率与数据类型），返回耗时（秒）"""
+    import numpy as np
+    import librosa
+
+    start = time.time()
+    for sr, dtype in ((22050, np.float32), (44100, np.float32), (22050, np.float64)):
+        y = librosa.clicks(times=np.arange(0.0, 4.0, 0.5), sr=sr, length=4 * sr).astype(dtype)
+        librosa.to_mono(np.stack([y, y]))
+        librosa.beat.beat_track(y=y, sr=sr)
+        librosa.onset.onset_strength(y=y, sr=sr)
+        librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
+        librosa.feature.chroma_stft(y=y, sr=sr)
+        librosa.feature.spectral_contrast(y=y, sr=sr)
+        librosa.feature.spectral_rolloff(y=y, sr=sr)
+    return time.time() - start
+
+
+def _versions() -> dict:
+    import numba
+    import librosa
+    return {"numba": numba.__version__, "librosa": librosa.__version__}
+
+
+def read_cold_seconds(cache_dir: Optional[str]) -> Optional[float]:
+    """读取记录的冷编译耗时，没有记录或版本不一致时返回None"""
+    if not cache_dir:
+        return None
+    try:
+        with open(os.path.join(cache_dir, RECORD_NAME), "r", encoding="utf-8") as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if record.get("versions") != _versions():
+        return None
+    return record.get("cold_seconds")
+
+
+def write_cold_seconds(cache_dir: Optional[str], seconds: float):
+    if not cache_dir:
+        return
+    try:
+        with open(os.path.join(cache_dir, RECORD_NAME), "w", encoding="utf-8") as f:
+            json.dump({"cold_seconds": seconds, "versions": _versions()}, f)
+    except OSError:
+        pass
+
+
+def has_compiled_kernels(cache_dir: Optional[str]) -> bool:
+    """缓存目录中是否已有编译好的内核（numba 的 .nbi 索引文件）"""
+    if not cache_dir or not os.path.isdir(cache_dir):
+        return False
+    for _, _, files in os.walk(cache_dir):
+        if any(name.endswith(".nbi") for name in files):
+            return True
+    return False
+
+
+def report_kernel_cache(timings: Optional[dict] = None, cache_dir: Optional[str] = None) -> Optional[float]:
+    """
+    流程启动时报告内核缓存状态（不运行预热：内核在流程用到时从缓存加载）
+
+    参数:
+        timings: 传入dict时写入 kernels_saved（缓存已有内核时为预编译记录的冷编译耗时，否则为0）
+        cache_dir: 内核缓存目录，None时使用当前生效的 NUMBA_CACHE_DIR
+
+    返回:
+        缓存节省的时间（秒），没有预编译记录时返回None
+    """
+    cache_dir = cache_dir or os.environ.get("NUMBA_CACHE_DIR")
+    cold = read_cold_seconds(cache_dir) if has_compiled_kernels(cache_dir) else None
+    if timings is not None:
+        timings['kernels_saved'] = cold or 0.0
+    if cold is not None:
+        print(f"[预热] numba内核从缓存加载（预编译记录的冷编译耗时约 {cold:.1f}秒）")
+    else:
+        print("[预热] numba内核缓存未预编译（可运行 python beatsync_warmup.py），首次使用时编译")
+    return cold
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BeatSync numba 内核预编译")
+    parser.add_argument('--cache-dir', type=str, default=None, help=f'内核缓存目录（默认 {CACHE_DIR_ENV} 或 .beatsync_cache/numba）')
+    parser.add_argument('--force', action='store_true', help='清空缓存后重新编译（同时重新测量冷编译耗时）')
+    args = parser.parse_args()
+
+    cache_dir = configure_numba_cache(args.cache_dir)
+    if cache_dir is None:
+        print("缓存目录不可写，无法预编译")
+        return False
+    if args.force:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        configure_numba_cache(cache_dir)
+
+    # 只有缓存为空时本次才是冷编译，耗时可以作为冷编译记录；已有内核时只是加载，不覆盖记录
+    cold_run = not has_compiled_kernels(cache_dir)
+    elapsed = warm_up_kernels()
+    if cold_run:
+        write_cold_seconds(cache_dir, elapsed)
+        print(f"内核已编译并缓存到 {cache_dir}，耗时: {elapsed:.1f}秒")
+    else:
+        cold = read_cold_seconds(cache_dir)
+        cold_text = f"{cold:.1f}秒" if cold is not None else "未记录（使用 --force 重新测量）"
+        print(f"内核缓存已存在（{cache_dir}），加载耗时: {elapsed:.1f}秒，冷编译耗时: {cold_text}")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+BeatSync 常驻工作进程池
+forkserver 预先导入 NumPy / librosa / soundfile / cv2 与两个版本的流程模块，
+工作进程启动时从 numba 缓存加载流程用到的内核（见 beatsync_warmup），之后接收任务；
+工作进程处理一定数量的任务后自动替换，控制内存增长；
+任务的处理时限在工作进程内从开始执行时计时（排队时间不计入），超时只中断该任务，不结束工作进程
+"""
+
+import os
+import sys
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+# 进程池大小（默认2：并行模式下两个版本同时运行）
+POOL_SIZE_ENV = "BEATSYNC_WORKER_POOL_SIZE"
+# 每个工作进程处理多少个任务后替换（0表示不替换）
+MAX_TASKS_ENV = "BEATSYNC_WORKER_MAX_TASKS"
+DEFAULT_POOL_SIZE = 2
+DEFAULT_MAX_TASKS = 20
+
+# forkserver 中预先导入的模块：工作进程由其fork出来，不再重复导入
+PRELOAD_MODULES = [
+    "numpy", "soundfile", "librosa", "cv2",
+    "beatsync_pipeline_api", "beatsync_fine_cut_modular", "beatsync_badcase_fix_trim_v2",
+]
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def configured_pool_size() -> int:
+    """共享进程池的工作进程数（BEATSYNC_WORKER_POOL_SIZE，默认2）"""
+    return max(1, _env_int(POOL_SIZE_ENV, DEFAULT_POOL_SIZE))
+
+
+class PipelineTimeout(BaseException):
+    """任务超过处理时限（继承BaseException：流程内部的 except Exception 不会把它当作普通错误处理）"""
+
+
+def _raise_timeout(signum, frame):
+    raise PipelineTimeout()
+
+
+def run_with_time_limit(func, time_limit: Optional[float], *args, **kwargs):
+    """
+    在工作进程中运行 func，超过 time_limit 秒时在其中抛出 PipelineTimeout
+
+    时限从任务开始执行时计时，排队等待空闲工作进程的时间不计入；超时只中断当前任务
+    （流程的 finally 清理工作区，subprocess 结束正在运行的 ffmpeg），工作进程继续处理其他任务。
+    只抛出一次：清理过程不会再被打断（不会留下 /dev/shm 中的临时文件）；若被流程中的裸 except 吞掉，
+    任务继续运行，由调用方的兜底时限处理（见 beatsync_parallel_processor 的 stuck / terminate_pool）。
+    不支持 SIGALRM 的平台或不在主线程时直接运行，由调用方的兜底时限处理。
+
+    参数:
+        func: 要运行的函数
+        time_limit: 处理时限（秒），None表示不限制
+    返回:
+        func 的返回值
+    """
+    import signal
+
+    if (time_limit is None or not hasattr(signal, "setitimer")
+            or threading.current_thread() is not threading.main_thread()):
+        return func(*args, **kwargs)
+
+    previous = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, time_limit)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def warm_up_worker():
+    """工作进程初始化：导入依赖并在合成信号上运行流程用到的librosa函数，加载（或编译）numba内核"""
+    try:
+        # forkserver 预导入失败时在这里导入（如 spawn 启动方式）
+        import soundfile
+        import cv2
+        import beatsync_pipeline_api
+        from beatsync_warmup import configure_numba_cache, warm_up_kernels
+
+        configure_numba_cache()
+        warm_up_kernels()
+    except Exception as e:
+        # 预热失败不影响处理（首个任务时再编译）
+        print(f"WARNING: 工作进程预热失败: {e}")
+
+
+def _ready(hold: float = 0.0) -> int:
+    # hold：占住工作进程一段时间，使下一次提交启动新的进程而不是复用空闲进程
+    if hold > 0:
+        time.sleep(hold)
+    return os.getpid()
+
+
+def create_worker_pool(size: Optional[int] = None, max_tasks_per_worker: Optional[int] = None,
+                       warm_up: bool = True) -> ProcessPoolExecutor:
+    """
+    创建工作进程池（forkserver启动，工作进程带预热）
+
+    参数:
+        size: 工作进程数，None时读取 BEATSYNC_WORKER_POOL_SIZE（默认2）
+        max_tasks_per_worker: 每个工作进程处理的任务数上限，None时读取 BEATSYNC_WORKER_MAX_TASKS（默认20），
+                              0表示不替换（需要 Python 3.11+，更低版本忽略）
+        warm_up: 工作进程启动时是否预热 numba 内核
+    """
+    size = max(1, size) if size is not None else configured_pool_size()
+    max_tasks = max_tasks_per_worker if max_tasks_per_worker is not None else _env_int(MAX_TASKS_ENV, DEFAULT_MAX_TASKS)
+
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    if context.get_start_method() == "forkserver":
+        project_root = os.path.dirname(os.path.abspath(__file__))
+        if project_root not in sys.path:
+            sys.path.insert(0, project_root)
+        context.set_forkserver_preload(PRELOAD_MODULES)
+
+    kwargs = {"max_workers": size, "mp_context": context, "initializer": warm_up_worker if warm_up else None}
+    if max_tasks > 0 and sys.version_info >= (3, 11):
+        kwargs["max_tasks_per_child"] = max_tasks
+    return ProcessPoolExecutor(**kwargs)
+
+
+def warm_up_pool(executor: ProcessPoolExecutor, size: Optional[int] = None) -> list:
+    """提前启动全部工作进程（每次提交会启动一个新进程，直到达到进程池大小），返回工作进程PID"""
+    size = size if size is not None else executor._max_workers
+    futures = [executor.submit(_ready, 0.5) for _ in range(size)]
+    return [f.result() for f in futures]
+
+
+def get_worker_pool() -> ProcessPoolExecutor:
+    """返回共享的工作进程池；尚未创建或已失效（工作进程被终止、已关闭）时重新创建"""
+    global _pool
+    with _pool_lock:
+        if _pool is None or getattr(_pool, "_broken", False) or getattr(_pool, "_shutdown_thread", False):
+            _pool = create_worker_pool()
+        return _pool
+
+
+def shutdown_worker_pool():
+    """关闭共享的工作进程池"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
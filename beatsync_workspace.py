@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+BeatSync 任务临时工作区
+每个任务在独立的唯一目录中写临时文件（组合音频、检测用音频、中间视频等），
+多个任务可以在同一台机器上并发运行而不互相覆盖；空间足够时优先使用内存文件系统 /dev/shm
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+from typing import Optional, Tuple
+
+# 指定临时工作区的根目录（设置后不再自动选择）
+SCRATCH_DIR_ENV = "BEATSYNC_SCRATCH_DIR"
+SHM_DIR = "/dev/shm"
+# /dev/shm 占用的是内存：除任务所需空间外再保留一部分，避免占满内存
+SHM_RESERVE_BYTES = 256 * 1024 * 1024
+# 未指定所需空间时的预估值
+DEFAULT_REQUIRED_BYTES = 512 * 1024 * 1024
+
+# 本进程内各根目录上已被工作区预留的空间（并发任务尚未写入的部分也计入）
+_reserved = {}
+_reserved_lock = threading.Lock()
+
+
+def estimate_scratch_bytes(*input_files: str, factor: float = 2.0,
+                           extra: int = 64 * 1024 * 1024) -> int:
+    """按输入文件大小估算任务所需的临时空间（中间视频约为输入大小，另加音频等小文件）"""
+    total = 0
+    for path in input_files:
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    return int(total * factor) + extra
+
+
+def _free_bytes(root: str) -> int:
+    try:
+        return shutil.disk_usage(root).free
+    except OSError:
+        return 0
+
+
+def choose_scratch_root(required_bytes: int = DEFAULT_REQUIRED_BYTES) -> Tuple[str, bool]:
+    """
+    选择临时工作区的根目录（调用方需持有 _reserved_lock）
+
+    返回:
+        (根目录, 是否为内存文件系统)；/dev/shm 不存在、不可写或剩余空间不足时使用系统临时目录
+    """
+    override = os.environ.get(SCRATCH_DIR_ENV)
+    if override:
+        return override, os.path.abspath(override).startswith(SHM_DIR + os.sep)
+    if os.path.isdir(SHM_DIR) and os.access(SHM_DIR, os.W_OK):
+        available = _free_bytes(SHM_DIR) - _reserved.get(SHM_DIR, 0) - SHM_RESERVE_BYTES
+        if available >= required_bytes:
+            return SHM_DIR, True
+    return tempfile.gettempdir(), False
+
+
+class TaskWorkspace:
+    """
+    任务级临时工作区：创建唯一目录并预留空间，cleanup() 删除目录并释放预留
+    可作为上下文管理器使用
+    """
+
+    def __init__(self, required_bytes: int = DEFAULT_REQUIRED_BYTES, prefix: str = "beatsync_task_"):
+        with _reserved_lock:
+            self.root, self.on_tmpfs = choose_scratch_root(required_bytes)
+            os.makedirs(self.root, exist_ok=True)
+            self.path = tempfile.mkdtemp(prefix=prefix, dir=self.root)
+            self.reserved_bytes = required_bytes
+            _reserved[self.root] = _reserved.get(self.root, 0) + required_bytes
+
+    def file(self, name: str) -> str:
+        """工作区内的文件路径"""
+        return os.path.join(self.path, name)
+
+    def used_bytes(self) -> int:
+        """工作区当前占用的空间"""
+        total = 0
+        for dirpath, _, filenames in os.walk(self.path):
+            for name in filenames:
+                try:
+                    total += os.path.getsize(os.path.join(dirpath, name))
+                except OSError:
+                    pass
+        return total
+
+    def free_bytes(self) -> int:
+        """工作区所在文件系统的剩余空间（减去本进程其他工作区的预留）"""
+        with _reserved_lock:
+            others = _reserved.get(self.root, 0) - self.reserved_bytes
+        return max(0, _free_bytes(self.root) - others)
+
+    def cleanup(self):
+        """删除工作区并释放预留（可重复调用）"""
+        if self.path is None:
+            return
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.path = None
+        with _reserved_lock:
+            remaining = _reserved.get(self.root, 0) - self.reserved_bytes
+            if remaining > 0:
+                _reserved[self.root] = remaining
+            else:
+                _reserved.pop(self.root, None)
+
+    def __enter__(self) -> "TaskWorkspace":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
+
+    def __repr__(self) -> str:
+        return f"TaskWorkspace({self.path!r}, tmpfs={self.on_tmpfs})"
+
+
+def own_workspace(workspace: Optional[TaskWorkspace]) -> Tuple[TaskWorkspace, bool]:
+    """未传入工作区时创建一个临时的，返回 (工作区, 是否需要由调用方清理)"""
+    if workspace is not None:
+        return workspace, False
+    return TaskWorkspace(), True
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+限时（anytime）对齐搜索测试：不限时时的准确性、到达时限时返回目前最好的结果与完成标记
+使用合成的节奏型音频，无需测试数据
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from beatsync_align_engine import deadline_after, deadline_expired, run_until_deadline
+from test_align_beat_grid import make_rhythmic_pair, run_quiet
+
+
+def test_run_until_deadline():
+    """截止时间到达后不再开始新的任务，已完成的结果按顺序返回"""
+    assert run_until_deadline(lambda x: x * 2, [1, 2, 3], None) == [2, 4, 6]
+    assert run_until_deadline(lambda x: x * 2, [1, 2, 3], deadline_after(0.0)) == []
+    assert not deadline_expired(None)
+
+    deadline = deadline_after(0.05)
+    results = run_until_deadline(lambda x: time.sleep(0.03) or x, list(range(10)), deadline)
+    assert results == list(range(len(results))) and 1 <= len(results) < 10
+
+
+def test_v2_anytime():
+    """V2：不限时时完成全部阶段且结果不差于全量搜索；时限为0时立即返回未完成标记"""
+    from beatsync_badcase_fix_trim_v2 import find_beat_alignment
+
+    sr = 22050
+    for seed, (dance_pad, bgm_pad) in enumerate([(3.4, 0.0), (0.0, 2.35)]):
+        dance, bgm = make_rhythmic_pair(sr, 24.0, dance_pad, bgm_pad, seed=seed)
+        true_lag = dance_pad - bgm_pad
+        stats = {}
+        ref_start, mov_start, score = run_quiet(find_beat_alignment, dance, bgm, sr, align_mode="anytime",
+                                                search_stats=stats)[0]
+        assert stats['completed'] and stats['stages'] == ['beat', 'coarse', 'refine'], stats
+        assert stats['evaluated'] > 0 and stats['skipped'] == 0 and not stats['early_exit'], stats
+        assert abs((ref_start - mov_start) / sr - true_lag) <= 0.005, f"{(ref_start - mov_start) / sr:.3f}s != {true_lag}s"
+
+    stats = {}
+    _, _, score = run_quiet(find_beat_alignment, dance, bgm, sr, align_mode="anytime",
+                            align_deadline=0.0, search_stats=stats)[0]
+    assert not stats['completed'] and stats['stages'] == [] and score == 0.0
+    assert stats['evaluated'] == 0 and not stats['early_exit']
+
+
+def test_beat_pair_deadline():
+    """节拍对搜索：到达时限时不再打分或细化；未细化的候选取节拍点上的得分"""
+    from beatsync_align_engine import beat_pair_alignment
+
+    sr = 22050
+    dance, bgm = make_rhythmic_pair(sr, 24.0, 3.4, 0.0, seed=0)
+    ref_beats = np.arange(int(0.25 * sr), len(dance) - sr, int(0.5 * sr))
+    mov_beats = np.arange(int(0.25 * sr), len(bgm) - sr, int(0.5 * sr))
+    starts = list(range(0, int(8 * sr), int(0.1 * sr)))
+    window = 2 * sr
+    assert beat_pair_alignment(dance, bgm, ref_beats, mov_beats, starts, starts, window, 2205,
+                               deadline=deadline_after(0.0)) == (0, 0, 0.0, 0)
+    full = beat_pair_alignment(dance, bgm, ref_beats, mov_beats, starts, starts, window, 2205)
+    assert full[3] > 0 and full[2] > 0
+
+
+def test_modular_anytime():
+    """modular：不限时时找到正确的dance起点；到达时限时跳过音乐特征与第二阶段并标记未完成"""
+    from beatsync_fine_cut_modular import find_beat_alignment_multi_strategy
+
+    sr = 22050
+    dance, bgm = make_rhythmic_pair(sr, 24.0, 1.23, 0.0, seed=1)
+    stats = {}
+    (ref_start, mov_start, _), _ = run_quiet(find_beat_alignment_multi_strategy, dance, bgm, sr,
+                                             align_mode="anytime", search_stats=stats)
+    assert stats['completed'] and stats['stages'] == ['beat', 'coarse', 'refine'], stats
+    assert mov_start == 0 and abs(ref_start / sr - 1.23) <= 0.02, f"{ref_start / sr:.3f}s != 1.23s"
+
+    stats = {}
+    _, output = run_quiet(find_beat_alignment_multi_strategy, dance, bgm, sr, align_mode="anytime",
+                          align_deadline=0.0, search_bgm_offset=True, search_stats=stats)
+    assert not stats['completed'] and stats['stages'] == []
+    assert "跳过音乐特征打分" in output and "第二阶段：已到达时限" in output
+
+
+def main():
+    tests = [test_run_until_deadline, test_v2_anytime, test_beat_pair_deadline, test_modular_anytime]
+    failed = 0
+    for test in tests:
+        print(f"运行 {test.__name__} ...")
+        try:
+            test()
+            print(f"  ✅ 通过")
+        except AssertionError as e:
+            failed += 1
+            print(f"  ❌ 失败: {e}")
+    print(f"\n结果: {len(tests) - failed}/{len(tests)} 通过")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
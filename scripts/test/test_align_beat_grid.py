@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+节拍网格剪枝模式测试：候选数量与对齐准确性
+使用合成的节奏型音频（固定BPM的音符），无需测试数据
+"""
+
+import io
+import sys
+import contextlib
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from beatsync_align_engine import beat_consistent_ranges, beat_pair_starts
+
+
+def make_rhythmic_pair(sr: int, duration: float, dance_pad: float, bgm_pad: float,
+                       seed: int = 0, bpm: float = 120.0):
+    """合成一对节奏型音频：每拍一个随机音高的音符，部分反拍加较弱的装饰音"""
+    rng = np.random.default_rng(seed)
+    n = int(duration * sr)
+    beat = 60.0 / bpm
+    music = 0.05 * rng.standard_normal(n)
+    for onset_time in np.arange(0.0, duration, beat / 2):
+        on_beat = int(round(onset_time / beat * 2)) % 2 == 0
+        if not on_beat and rng.random() < 0.6:
+            continue
+        onset = int(onset_time * sr)
+        t = np.arange(min(int(beat * sr), n - onset)) / sr
+        note = np.exp(-t * 8.0) * np.sin(2 * np.pi * rng.uniform(110.0, 880.0) * t)
+        music[onset:onset + len(t)] += note if on_beat else 0.4 * note
+    dance = np.concatenate([0.05 * rng.standard_normal(int(dance_pad * sr)), music])[:n]
+    bgm = np.concatenate([0.05 * rng.standard_normal(int(bgm_pad * sr)), music])[:n]
+    dance = dance + 0.2 * rng.standard_normal(n)
+    return dance.astype(np.float32), bgm.astype(np.float32)
+
+
+def run_quiet(func, *args, **kwargs):
+    """运行函数并返回 (结果, 输出文本)"""
+    buf = io.StringIO()
+    with contextlib.redirect_stdout(buf):
+        result = func(*args, **kwargs)
+    return result, buf.getvalue()
+
+
+def test_beat_candidates():
+    """节拍对候选限定在起点范围内；固定bgm起点时的候选按容差合并"""
+    ref_starts, mov_starts = beat_pair_starts([0, 100, 200, 900], [50, 150, 800], 0, 500, 0, 500)
+    assert sorted(zip(ref_starts.tolist(), mov_starts.tolist())) == \
+        [(0, 50), (0, 150), (100, 50), (100, 150), (200, 50), (200, 150)]
+
+    # 起点 = bgm起点 + (dance节拍 - bgm节拍)，超出 [lo, hi] 的丢弃，重叠的范围合并
+    ranges = beat_consistent_ranges([300, 1000, 1002], [50, 150, 400], 0, 0, 2000, tolerance=5)
+    assert ranges == [(145, 155), (245, 255), (595, 607), (845, 857), (945, 957)]
+    assert beat_consistent_ranges([300], [50], 100, 0, 352, tolerance=5) == [(345, 352)]
+
+
+def test_v2_beat_grid():
+    """V2：候选数量减少一个数量级，且对齐结果不差于全量网格搜索"""
+    from beatsync_badcase_fix_trim_v2 import find_beat_alignment
+
+    sr = 22050
+    for seed, (dance_pad, bgm_pad) in enumerate([(3.4, 0.0), (1.23, 0.0), (0.0, 2.35), (4.1, 1.6)]):
+        dance, bgm = make_rhythmic_pair(sr, 24.0, dance_pad, bgm_pad, seed=seed)
+        true_lag = dance_pad - bgm_pad
+        exhaustive, _ = run_quiet(find_beat_alignment, dance, bgm, sr, align_mode="exhaustive")
+        (ref_start, mov_start, score), output = run_quiet(find_beat_alignment, dance, bgm, sr,
+                                                          align_mode="beat_grid")
+        line = next(l for l in output.splitlines() if "节拍网格剪枝" in l)
+        print(line.strip())
+        evaluated, total = [int(x) for x in line.split("候选")[1].split(",")[0].split("/")]
+        assert evaluated * 10 <= total, f"候选 {evaluated} / {total}"
+
+        exhaustive_err = abs((exhaustive[0] - exhaustive[1]) / sr - true_lag)
+        err = abs((ref_start - mov_start) / sr - true_lag)
+        assert err <= max(exhaustive_err, 0.005), f"节拍网格误差 {err:.3f}s > 全量 {exhaustive_err:.3f}s"
+
+
+def test_modular_beat_grid():
+    """modular：节拍网格模式（bgm=0）找到正确的dance起点"""
+    from beatsync_fine_cut_modular import find_beat_alignment_multi_strategy
+
+    sr = 22050
+    for seed, dance_pad in enumerate([3.4, 1.23, 4.1]):
+        dance, bgm = make_rhythmic_pair(sr, 24.0, dance_pad, 0.0, seed=seed)
+        (ref_start, mov_start, score), _ = run_quiet(find_beat_alignment_multi_strategy, dance, bgm, sr,
+                                                     align_mode="beat_grid")
+        assert mov_start == 0
+        assert abs(ref_start / sr - dance_pad) <= 0.02, f"{ref_start / sr:.3f}s != {dance_pad}s"
+
+
+def main():
+    tests = [test_beat_candidates, test_v2_beat_grid, test_modular_beat_grid]
+    failed = 0
+    for test in tests:
+        print(f"运行 {test.__name__} ...")
+        try:
+            test()
+            print(f"  ✅ 通过")
+        except AssertionError as e:
+            failed += 1
+            print(f"  ❌ 失败: {e}")
+    print(f"\n结果: {len(tests) - failed}/{len(tests)} 通过")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
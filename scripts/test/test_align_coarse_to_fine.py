@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+粗到细对齐模式与全量搜索的准确性对比
+
+默认使用合成音频（dance/bgm各自带不同长度的前导段）；
+也可以指定真实样本目录（每个子目录包含 dance.mp4 与 bgm.mp4）：
+    python3 scripts/test/test_align_coarse_to_fine.py --cases-dir test_data/input_allcases
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+# 允许的对齐误差（秒）：超过该误差视为粗到细模式与全量搜索结果不一致
+LAG_TOLERANCE = 0.05
+
+
+def make_padded_pair(sr: int, duration: float, dance_pad: float, bgm_pad: float, seed: int = 0):
+    """合成一对音频：同一段音乐分别加上不同长度的前导噪声"""
+    rng = np.random.default_rng(seed)
+    n = int(duration * sr)
+    # 非周期的"音乐"：随机间隔的音符起音 + 随机音高，避免周期信号带来的多解
+    music = 0.05 * rng.standard_normal(n)
+    onset = 0
+    while onset < n:
+        length = int(rng.uniform(0.15, 0.6) * sr)
+        t = np.arange(min(length, n - onset)) / sr
+        music[onset:onset + len(t)] += np.exp(-t * 6.0) * np.sin(2 * np.pi * rng.uniform(110.0, 880.0) * t)
+        onset += length
+    dance = np.concatenate([0.05 * rng.standard_normal(int(dance_pad * sr)), music])[:n]
+    bgm = np.concatenate([0.05 * rng.standard_normal(int(bgm_pad * sr)), music])[:n]
+    dance = dance + 0.2 * rng.standard_normal(n)
+    return dance.astype(np.float32), bgm.astype(np.float32)
+
+
+def compare_v2(dance: np.ndarray, bgm: np.ndarray, sr: int, label: str, true_lag: float = None) -> dict:
+    """对比V2 find_beat_alignment 两种模式的结果（dance起点 - bgm起点 的相对偏移）"""
+    from beatsync_badcase_fix_trim_v2 import find_beat_alignment
+
+    results = {}
+    for mode in ("exhaustive", "coarse_to_fine"):
+        start = time.time()
+        ref_start, mov_start, score = find_beat_alignment(dance, bgm, sr, align_mode=mode)
+        results[mode] = {
+            'lag': (ref_start - mov_start) / sr,
+            'score': score,
+            'elapsed': time.time() - start,
+        }
+    report(f"V2 {label}", results, true_lag)
+    return results
+
+
+def compare_modular(dance: np.ndarray, bgm: np.ndarray, sr: int, label: str, true_lag: float = None) -> dict:
+    """对比modular find_beat_alignment_multi_strategy 两种模式的结果"""
+    from beatsync_fine_cut_modular import find_beat_alignment_multi_strategy
+
+    results = {}
+    for mode in ("exhaustive", "coarse_to_fine"):
+        start = time.time()
+        ref_start, mov_start, score = find_beat_alignment_multi_strategy(dance, bgm, sr, align_mode=mode)
+        results[mode] = {
+            'lag': (ref_start - mov_start) / sr,
+            'score': score,
+            'elapsed': time.time() - start,
+        }
+    report(f"modular {label}", results, true_lag)
+    return results
+
+
+def report(label: str, results: dict, true_lag: float = None):
+    exhaustive, c2f = results['exhaustive'], results['coarse_to_fine']
+    print(f"\n[{label}]")
+    for mode, r in results.items():
+        err = f", 误差 {abs(r['lag'] - true_lag) * 1000:.1f}ms" if true_lag is not None else ""
+        print(f"  {mode:15s} 偏移 {r['lag']:+.3f}s, 得分 {r['score']:.4f}, 耗时 {r['elapsed']:.2f}s{err}")
+    print(f"  偏移差异: {abs(exhaustive['lag'] - c2f['lag']) * 1000:.1f}ms, "
+          f"加速比: {exhaustive['elapsed'] / max(c2f['elapsed'], 1e-6):.1f}x")
+
+
+def synthetic_cases():
+    # (dance前导, bgm前导)
+    return [(3.4, 0.0), (1.23, 0.0), (0.0, 2.35), (4.1, 1.6)]
+
+
+def test_v2_coarse_to_fine_accuracy():
+    """V2：粗到细模式的对齐误差不超过全量搜索（网格0.1秒）的误差"""
+    sr = 22050
+    for seed, (dance_pad, bgm_pad) in enumerate(synthetic_cases()):
+        dance, bgm = make_padded_pair(sr, 24.0, dance_pad, bgm_pad, seed=seed)
+        true_lag = dance_pad - bgm_pad
+        results = compare_v2(dance, bgm, sr, f"dance+{dance_pad}s/bgm+{bgm_pad}s", true_lag)
+        exhaustive_err = abs(results['exhaustive']['lag'] - true_lag)
+        c2f_err = abs(results['coarse_to_fine']['lag'] - true_lag)
+        assert c2f_err <= max(exhaustive_err, 0.005), f"粗到细误差 {c2f_err:.3f}s > 全量 {exhaustive_err:.3f}s"
+        assert abs(results['exhaustive']['lag'] - results['coarse_to_fine']['lag']) <= LAG_TOLERANCE
+
+
+def test_modular_coarse_to_fine_accuracy():
+    """modular：粗到细模式（bgm=0）的dance起点与全量搜索一致"""
+    sr = 22050
+    for seed, (dance_pad, _) in enumerate(synthetic_cases()):
+        if dance_pad == 0.0:
+            continue
+        dance, bgm = make_padded_pair(sr, 24.0, dance_pad, 0.0, seed=seed)
+        results = compare_modular(dance, bgm, sr, f"dance+{dance_pad}s", dance_pad)
+        exhaustive_err = abs(results['exhaustive']['lag'] - dance_pad)
+        c2f_err = abs(results['coarse_to_fine']['lag'] - dance_pad)
+        assert c2f_err <= max(exhaustive_err, 0.005), f"粗到细误差 {c2f_err:.3f}s > 全量 {exhaustive_err:.3f}s"
+
+
+def load_case_audio(video_path: str, sr: int, duration: float = None) -> np.ndarray:
+    """用ffmpeg提取单声道音频"""
+    import soundfile as sf
+    import subprocess
+
+    with tempfile.TemporaryDirectory() as tmp:
+        wav = os.path.join(tmp, "audio.wav")
+        cmd = ['ffmpeg', '-y', '-nostdin', '-v', 'error', '-i', video_path]
+        if duration:
+            cmd += ['-t', str(duration)]
+        cmd += ['-vn', '-acodec', 'pcm_s16le', '-ar', str(sr), '-ac', '1', wav]
+        subprocess.run(cmd, check=True, capture_output=True)
+        audio, _ = sf.read(wav, dtype='float32')
+    return audio
+
+
+def run_real_cases(pairs: list) -> int:
+    """对真实样本对比两种模式，返回偏移差异超出容差的样本数"""
+    mismatches = 0
+    for label, dance_path, bgm_path in pairs:
+        dance = load_case_audio(dance_path, 44100)
+        bgm = load_case_audio(bgm_path, 44100)
+        v2 = compare_v2(dance, bgm, 44100, label)
+        modular = compare_modular(load_case_audio(dance_path, 22050, 30.0),
+                                  load_case_audio(bgm_path, 22050, 30.0), 22050, label)
+        for name, results in (("V2", v2), ("modular", modular)):
+            if abs(results['exhaustive']['lag'] - results['coarse_to_fine']['lag']) > LAG_TOLERANCE:
+                mismatches += 1
+                print(f"  ⚠️  {name} {label}: 粗到细结果与全量搜索不一致")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="粗到细对齐模式准确性对比")
+    parser.add_argument('--cases-dir', type=str, default=None, help='样本目录（子目录包含 dance.mp4 / bgm.mp4）')
+    parser.add_argument('--dance', type=str, default=None, help='单个dance视频')
+    parser.add_argument('--bgm', type=str, default=None, help='单个bgm视频')
+    args = parser.parse_args()
+
+    pairs = []
+    if args.dance and args.bgm:
+        pairs.append((Path(args.dance).stem, args.dance, args.bgm))
+    if args.cases_dir:
+        for case_dir in sorted(Path(args.cases_dir).iterdir()):
+            dance, bgm = case_dir / "dance.mp4", case_dir / "bgm.mp4"
+            if dance.exists() and bgm.exists():
+                pairs.append((case_dir.name, str(dance), str(bgm)))
+
+    if pairs:
+        mismatches = run_real_cases(pairs)
+        print(f"\n结果: {len(pairs) * 2 - mismatches}/{len(pairs) * 2} 一致（容差 {LAG_TOLERANCE * 1000:.0f}ms）")
+        return 0 if mismatches == 0 else 1
+
+    failed = 0
+    for test in (test_v2_coarse_to_fine_accuracy, test_modular_coarse_to_fine_accuracy):
+        try:
+            test()
+            print(f"✅ {test.__name__} 通过")
+        except AssertionError as e:
+            failed += 1
+            print(f"❌ {test.__name__} 失败: {e}")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+提前结束策略测试：干净的bgm（屏幕录制）在少量候选后结束且结果不变；
+得分不够确定时不提前结束
+使用合成音频，无需测试数据
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from beatsync_align_engine import confident_best
+from test_align_coarse_to_fine import make_padded_pair
+from test_align_beat_grid import run_quiet
+
+
+def make_clean_pair(sr: int, duration: float, dance_pad: float, seed: int = 0):
+    """dance = 静音前导 + bgm（几乎无噪声，相当于屏幕录制的音频）"""
+    _, bgm = make_padded_pair(sr, duration, 0.0, 0.0, seed=seed)
+    rng = np.random.default_rng(seed + 50)
+    dance = np.concatenate([np.zeros(int(dance_pad * sr), dtype=np.float32), bgm])[:len(bgm)]
+    return (dance + 0.01 * rng.standard_normal(len(bgm))).astype(np.float32), bgm
+
+
+def test_confident_best():
+    """最高分达到阈值，且领先其他偏移（相差超过 separation）的次高分至少 margin"""
+    assert confident_best([100, 105, 900], [0.95, 0.94, 0.5], 0.9, 0.2, 10)
+    assert not confident_best([100, 900], [0.95, 0.8], 0.9, 0.2, 10)
+    assert not confident_best([100], [0.85], 0.9, 0.2, 10)
+    assert not confident_best([], [], 0.9, 0.2, 10)
+
+
+def test_v2_early_exit():
+    """V2全量搜索：干净的bgm提前结束，偏移与完整搜索一致；带噪声时不提前结束"""
+    from beatsync_badcase_fix_trim_v2 import find_beat_alignment
+
+    sr = 22050
+    dance, bgm = make_clean_pair(sr, 40.0, 3.4, seed=3)
+    stats = {}
+    ref_start, mov_start, score = run_quiet(find_beat_alignment, dance, bgm, sr, exit_threshold=0.9,
+                                            search_stats=stats)[0]
+    print(f"  干净bgm: 评估 {stats['evaluated']}, 跳过 {stats['skipped']}")
+    assert stats['early_exit'] and stats['skipped'] > stats['evaluated']
+    assert ref_start - mov_start == int(3.4 * sr) and score > 0.99
+
+    dance, bgm = make_padded_pair(sr, 24.0, 3.4, 0.0, seed=0)
+    stats = {}
+    expected = run_quiet(find_beat_alignment, dance, bgm, sr)[0]
+    assert run_quiet(find_beat_alignment, dance, bgm, sr, exit_threshold=0.95, search_stats=stats)[0] == expected
+    assert not stats['early_exit'] and stats['skipped'] == 0
+
+
+def test_modular_early_exit():
+    """modular：干净的bgm在限时搜索的第一阶段后结束，跳过音乐特征与第二阶段"""
+    from beatsync_fine_cut_modular import find_beat_alignment_multi_strategy
+
+    sr = 22050
+    dance, bgm = make_clean_pair(sr, 30.0, 2.2, seed=4)
+    for mode in ("exhaustive", "anytime"):
+        stats = {}
+        (ref_start, mov_start, score), output = run_quiet(
+            find_beat_alignment_multi_strategy, dance, bgm, sr, align_mode=mode, search_bgm_offset=True,
+            exit_threshold=0.9, search_stats=stats
+        )
+        print(f"  {mode}: 评估 {stats['evaluated']}, 跳过 {stats['skipped']}")
+        assert stats['early_exit'] and stats['completed'] and stats['skipped'] > 0
+        assert "第二阶段：提前结束" in output
+        assert mov_start == 0 and abs(ref_start - int(2.2 * sr)) <= 2 and score > 0.99
+
+
+def main():
+    tests = [test_confident_best, test_v2_early_exit, test_modular_early_exit]
+    failed = 0
+    for test in tests:
+        print(f"运行 {test.__name__} ...")
+        try:
+            test()
+            print(f"  ✅ 通过")
+        except AssertionError as e:
+            failed += 1
+            print(f"  ❌ 失败: {e}")
+    print(f"\n结果: {len(tests) - failed}/{len(tests)} 通过")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+对齐计算引擎测试：批量/向量化实现与原有逐点实现的结果一致性
+使用合成音频，无需测试数据
+"""
+
+import os
+import sys
+import time
+import contextlib
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from beatsync_align_engine import (
+    normalized_xcorr_curve, best_grid_alignment, pearson_grid, sliding_feature_correlation,
+    resolve_align_workers, CPU_BUDGET_ENV
+)
+
+
+def make_test_pair(sr: int = 22050, duration: float = 30.0, delay: float = 3.4, seed: int = 0):
+    """生成一对合成音频：dance = 噪声前导 + 延迟后的bgm + 噪声"""
+    rng = np.random.default_rng(seed)
+    n = int(duration * sr)
+    t = np.arange(n) / sr
+    # 带节拍包络的音乐信号
+    envelope = 0.3 + 0.7 * (np.sin(2 * np.pi * 2.0 * t) > 0.6)
+    bgm = (envelope * np.sin(2 * np.pi * 220.0 * t) + 0.3 * rng.standard_normal(n)).astype(np.float32)
+    shift = int(delay * sr)
+    dance = np.concatenate([0.05 * rng.standard_normal(shift), bgm[:n - shift]]).astype(np.float32)
+    dance += (0.1 * rng.standard_normal(n)).astype(np.float32)
+    return dance, bgm, shift
+
+
+def test_xcorr_curve_matches_pointwise():
+    """FFT得分曲线与 calculate_original_correlation 逐点结果一致"""
+    from beatsync_fine_cut_modular import calculate_original_correlation
+
+    sr = 22050
+    dance, bgm, _ = make_test_pair(sr=sr)
+    window = int(2.0 * sr)
+
+    start = time.time()
+    curve = normalized_xcorr_curve(dance, bgm[:window])
+    elapsed = time.time() - start
+    print(f"  FFT得分曲线: {len(curve)} 个起点, 耗时 {elapsed * 1000:.1f}ms")
+
+    # 越界起点在两种实现中均为0
+    for ref_start in list(range(0, len(dance), 4410)) + [len(curve) - 1, len(curve)]:
+        expected = calculate_original_correlation(dance, bgm, ref_start, 0, sr)
+        actual = curve[ref_start] if ref_start < len(curve) else 0.0
+        assert abs(expected - actual) < 1e-6, f"起点{ref_start}: {expected} != {actual}"
+
+
+def test_xcorr_curve_silent_windows():
+    """静音窗口得分为0，与逐点实现的分母为0处理一致"""
+    sr = 22050
+    dance, bgm, _ = make_test_pair(sr=sr)
+    dance[:sr * 3] = 0.0
+    curve = normalized_xcorr_curve(dance, bgm[:int(2.0 * sr)])
+    assert np.all(curve[:sr] == 0.0)
+    assert np.all(normalized_xcorr_curve(dance, np.zeros(int(2.0 * sr))) == 0.0)
+
+
+def test_multi_strategy_finds_delay():
+    """多策略搜索在合成数据上找到正确的dance起点"""
+    from beatsync_fine_cut_modular import find_beat_alignment_multi_strategy
+
+    sr = 22050
+    dance, bgm, shift = make_test_pair(sr=sr, duration=20.0, delay=3.4)
+    ref_start, mov_start, score = find_beat_alignment_multi_strategy(dance, bgm, sr)
+    assert mov_start == 0
+    assert abs(ref_start - shift) <= int(0.2 * sr), f"{ref_start / sr:.2f}s != {shift / sr:.2f}s"
+    assert score > 0.5
+
+
+def test_multi_strategy_bgm_offset():
+    """bgm片头有前导段时，第二阶段（bgm偏移搜索）找到正确的相对偏移"""
+    from beatsync_fine_cut_modular import find_beat_alignment_multi_strategy
+
+    sr = 22050
+    dance, bgm, shift = make_test_pair(sr=sr, duration=24.0, delay=1.0, seed=5)
+    pad = int(2.6 * sr)
+    bgm = np.concatenate([(0.05 * np.random.default_rng(6).standard_normal(pad)).astype(np.float32), bgm])
+    expected_lag = shift - pad
+
+    start = time.time()
+    ref_start, mov_start, score = find_beat_alignment_multi_strategy(dance, bgm, sr, search_bgm_offset=True)
+    print(f"  启用第二阶段: 耗时 {time.time() - start:.2f}s")
+    assert abs((ref_start - mov_start) - expected_lag) <= int(0.2 * sr), \
+        f"{(ref_start - mov_start) / sr:.2f}s != {expected_lag / sr:.2f}s"
+    assert score > 0.5
+
+    # 默认不搜索bgm偏移
+    _, mov_start, _ = find_beat_alignment_multi_strategy(dance, bgm, sr)
+    assert mov_start == 0
+
+
+def test_onset_strategy_finds_delay():
+    """onset包络策略在合成数据上找到正确的dance起点（原始音频细化到采样点）"""
+    from beatsync_fine_cut_modular import find_beat_alignment_multi_strategy
+
+    sr = 22050
+    dance, bgm, shift = make_test_pair(sr=sr, duration=30.0, delay=3.37, seed=7)
+    start = time.time()
+    ref_start, mov_start, score = find_beat_alignment_multi_strategy(dance, bgm, sr, align_strategy="onset")
+    print(f"  onset策略: 耗时 {time.time() - start:.2f}s")
+    assert mov_start == 0
+    assert abs(ref_start - shift) <= 2, f"{ref_start} != {shift}"
+    assert score > 0.5
+
+
+def test_onset_strategy_fusion():
+    """find_best_alignment_score：onset策略返回自身得分，并按与音乐特征相同的规则参与融合"""
+    from beatsync_fine_cut_modular import find_best_alignment_score
+
+    dummy = np.zeros(10, dtype=np.float32)
+    assert find_best_alignment_score(dummy, dummy, 0, 0, 22050, original_score=0.2, onset_score=0.6,
+                                     align_strategy="onset") == (0.6, 0.2, 0.6, "onset")
+    assert find_best_alignment_score(dummy, dummy, 0, 0, 22050, original_score=0.5, onset_score=0.6,
+                                     align_strategy="onset") == (0.5, 0.5, 0.6, "original")
+    assert find_best_alignment_score(dummy, dummy, 0, 0, 22050, original_score=0.01, onset_score=0.9,
+                                     align_strategy="onset")[3] == "original"
+
+
+def nested_loop_alignment(ref_audio, mov_audio, sr, max_offset, window_size=2.0):
+    """原V2 find_beat_alignment 的嵌套 np.corrcoef 循环（参考实现）"""
+    best_score, best_ref, best_mov = 0, 0, 0
+    for ref_offset in np.arange(0, max_offset, 0.1):
+        ref_start = int(ref_offset * sr)
+        ref_end = ref_start + int(window_size * sr)
+        if ref_end > len(ref_audio):
+            continue
+        for mov_offset in np.arange(0, max_offset, 0.1):
+            mov_start = int(mov_offset * sr)
+            mov_end = mov_start + int(window_size * sr)
+            if mov_end > len(mov_audio):
+                continue
+            with np.errstate(invalid='ignore', divide='ignore'):
+                corr = np.corrcoef(ref_audio[ref_start:ref_end], mov_audio[mov_start:mov_end])[0, 1]
+            if np.isnan(corr):
+                corr = 0
+            if corr > best_score:
+                best_score, best_ref, best_mov = corr, ref_start, mov_start
+    return best_ref, best_mov, best_score
+
+
+def test_grid_matches_nested_loop():
+    """批量二维网格与嵌套 np.corrcoef 循环的argmax一致"""
+    sr = 4000
+    for seed, delay in [(1, 1.3), (2, 0.0), (3, 2.7)]:
+        dance, bgm, _ = make_test_pair(sr=sr, duration=12.0, delay=delay, seed=seed)
+        max_offset = min(len(dance), len(bgm)) / sr * 0.4
+        window = int(2.0 * sr)
+        ref_starts = [int(t * sr) for t in np.arange(0, max_offset, 0.1) if int(t * sr) + window <= len(dance)]
+        mov_starts = [int(t * sr) for t in np.arange(0, max_offset, 0.1) if int(t * sr) + window <= len(bgm)]
+
+        start = time.time()
+        expected = nested_loop_alignment(dance, bgm, sr, max_offset)
+        loop_elapsed = time.time() - start
+        start = time.time()
+        ri, mi, score = best_grid_alignment(dance, bgm, ref_starts, mov_starts, window)
+        grid_elapsed = time.time() - start
+        print(f"  delay={delay}s: 嵌套循环 {loop_elapsed:.2f}s, 批量网格 {grid_elapsed * 1000:.1f}ms")
+
+        assert (ref_starts[ri], mov_starts[mi]) == expected[:2], f"{(ref_starts[ri], mov_starts[mi])} != {expected[:2]}"
+        assert abs(score - expected[2]) < 1e-9
+
+        grid = pearson_grid(dance, bgm, ref_starts, mov_starts, window)
+        for i in range(0, len(ref_starts), 7):
+            for j in range(0, len(mov_starts), 5):
+                rs, ms = ref_starts[i], mov_starts[j]
+                corr = np.corrcoef(dance[rs:rs + window], bgm[ms:ms + window])[0, 1]
+                assert abs(grid[i, j] - corr) < 1e-4
+
+
+def test_grid_all_silent():
+    """全静音输入没有正得分，返回 (-1, -1, 0.0)，对应原实现的 (0, 0, 0)"""
+    silent = np.zeros(4000 * 6, dtype=np.float32)
+    assert best_grid_alignment(silent, silent, [0, 400], [0, 400], 8000) == (-1, -1, 0.0)
+
+
+@contextlib.contextmanager
+def cpu_budget(budget: int, lib_threads: int = 1):
+    """临时设置CPU预算与数值库线程数（测试机核数较少时也走多线程路径）"""
+    saved = {k: os.environ.get(k) for k in (CPU_BUDGET_ENV, "OMP_NUM_THREADS")}
+    os.environ[CPU_BUDGET_ENV] = str(budget)
+    os.environ["OMP_NUM_THREADS"] = str(lib_threads)
+    try:
+        yield
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def test_resolve_align_workers():
+    """并行线程数不超过 CPU预算 // 数值库线程数"""
+    with cpu_budget(16, lib_threads=4):
+        assert resolve_align_workers(None) == 1
+        assert resolve_align_workers(1) == 1
+        assert resolve_align_workers(8) == 4
+        assert resolve_align_workers(0) == 4
+    with cpu_budget(16, lib_threads=32):
+        assert resolve_align_workers(0) == 1
+
+
+def test_parallel_grid_deterministic():
+    """多线程批量网格与串行结果逐位一致"""
+    sr = 22050
+    dance, bgm, _ = make_test_pair(sr=sr, duration=30.0, delay=2.3, seed=8)
+    window = int(2.0 * sr)
+    ref_starts = list(range(0, int(12 * sr), int(0.1 * sr)))
+    mov_starts = list(range(0, int(12 * sr), int(0.1 * sr)))
+
+    with cpu_budget(4):
+        start = time.time()
+        serial = pearson_grid(dance, bgm, ref_starts, mov_starts, window)
+        serial_elapsed = time.time() - start
+        start = time.time()
+        parallel = pearson_grid(dance, bgm, ref_starts, mov_starts, window, workers=4)
+        parallel_elapsed = time.time() - start
+        print(f"  网格 {len(ref_starts)} x {len(mov_starts)}: 串行 {serial_elapsed:.2f}s, 4线程 {parallel_elapsed:.2f}s")
+        assert np.array_equal(serial, parallel)
+        assert best_grid_alignment(dance, bgm, ref_starts, mov_starts, window) == \
+            best_grid_alignment(dance, bgm, ref_starts, mov_starts, window, workers=4)
+
+
+def test_multi_strategy_parallel():
+    """modular多策略搜索（含第二阶段）多线程与串行结果一致"""
+    from beatsync_fine_cut_modular import find_beat_alignment_multi_strategy
+
+    sr = 22050
+    dance, bgm, _ = make_test_pair(sr=sr, duration=20.0, delay=1.0, seed=9)
+    with cpu_budget(4):
+        for strategy in ("fusion", "onset"):
+            serial = find_beat_alignment_multi_strategy(dance, bgm, sr, search_bgm_offset=True,
+                                                        align_strategy=strategy)
+            parallel = find_beat_alignment_multi_strategy(dance, bgm, sr, search_bgm_offset=True,
+                                                          align_strategy=strategy, align_workers=4)
+            assert serial == parallel, f"{strategy}: {serial} != {parallel}"
+
+
+def test_v2_parallel():
+    """V2各对齐模式多线程与串行结果一致"""
+    from beatsync_badcase_fix_trim_v2 import find_beat_alignment
+
+    sr = 22050
+    dance, bgm, _ = make_test_pair(sr=sr, duration=20.0, delay=1.7, seed=10)
+    with cpu_budget(4):
+        for mode in ("exhaustive", "coarse_to_fine", "beat_grid"):
+            serial = find_beat_alignment(dance, bgm, sr, align_mode=mode)
+            parallel = find_beat_alignment(dance, bgm, sr, align_mode=mode, align_workers=4)
+            assert serial == parallel, f"{mode}: {serial} != {parallel}"
+
+
+def test_sliding_feature_correlation_matches_corrcoef():
+    """特征矩阵滑动相关与展平后逐窗口 np.corrcoef 一致"""
+    rng = np.random.default_rng(4)
+    features = rng.standard_normal((13, 300))
+    template = features[:, 120:207] + 0.5 * rng.standard_normal((13, 87))
+    curve = sliding_feature_correlation(features, template)
+    assert len(curve) == 300 - 87 + 1
+    for j in range(0, len(curve), 9):
+        expected = np.corrcoef(features[:, j:j + 87].flatten(), template.flatten())[0, 1]
+        assert abs(curve[j] - expected) < 1e-9
+    assert int(np.argmax(curve)) == 120
+
+
+def test_music_feature_curve_matches_pointwise():
+    """批量音乐特征得分与逐窗口提取特征的结果接近，且最佳偏移一致"""
+    from beatsync_fine_cut_modular import (
+        calculate_music_feature_curve, music_feature_scores, calculate_music_feature_correlation
+    )
+
+    sr = 22050
+    dance, bgm, shift = make_test_pair(sr=sr, duration=16.0, delay=3.4)
+    ref_starts = list(range(0, int(6.4 * sr), int(0.2 * sr)))
+
+    start = time.time()
+    curve = calculate_music_feature_curve(dance, bgm, 0, sr)
+    batched = music_feature_scores(curve, ref_starts, len(dance), sr)
+    batched_elapsed = time.time() - start
+    start = time.time()
+    pointwise = np.array([calculate_music_feature_correlation(dance, bgm, rs, 0, sr) for rs in ref_starts])
+    pointwise_elapsed = time.time() - start
+    print(f"  批量 {batched_elapsed:.2f}s, 逐窗口 {pointwise_elapsed:.2f}s")
+
+    # 帧对齐近似（边界填充不同）带来的误差较小
+    assert np.abs(batched - pointwise).max() < 0.1
+    assert int(np.argmax(batched)) == int(np.argmax(pointwise))
+
+
+def test_music_fusion_matches_pointwise():
+    """融合决策前重新打分后，这些样本上选出的对齐点与得分与逐点计算（逐窗口提取特征）完全一致，包括选择音乐特征策略的情况"""
+    import io
+    from beatsync_fine_cut_modular import find_beat_alignment_multi_strategy, find_best_alignment_score
+
+    sr = 22050
+    for seed, noise in [(0, 0.0), (1, 2.0), (2, 4.0)]:
+        dance, bgm, _ = make_test_pair(sr=sr, duration=16.0, delay=3.4, seed=seed)
+        dance = dance + (noise * np.random.default_rng(seed + 10).standard_normal(len(dance))).astype(np.float32)
+        with contextlib.redirect_stdout(io.StringIO()):
+            ref_start, mov_start, score = find_beat_alignment_multi_strategy(dance, bgm, sr)
+
+        max_offset = min(len(dance), len(bgm)) / sr * 0.4
+        best_score, best_ref_start, best_strategy = 0.0, 0, "original"
+        for ref_offset in np.arange(0, max_offset * sr, 0.2 * sr):
+            final_score, _, _, strategy = find_best_alignment_score(dance, bgm, int(ref_offset), 0, sr)
+            if final_score > best_score:
+                best_score, best_ref_start, best_strategy = final_score, int(ref_offset), strategy
+        assert (ref_start, mov_start) == (best_ref_start, 0), (seed, ref_start, best_ref_start)
+        assert abs(score - best_score) < 1e-6, (seed, score, best_score)
+        if noise >= 2.0:
+            assert best_strategy == "music_features"
+
+
+def test_music_score_margin():
+    """批量音乐特征得分（单段曲线与整段网格）与逐窗口提取特征的得分之差在 MUSIC_SCORE_MARGIN 以内"""
+    from beatsync_fine_cut_modular import (calculate_music_feature_curve, calculate_music_feature_grid,
+                                           calculate_music_feature_correlation, music_feature_scores,
+                                           MUSIC_SCORE_MARGIN)
+
+    sr = 22050
+    worst = 0.0
+    for seed, noise in [(0, 0.0), (1, 1.0), (2, 3.0)]:
+        dance, bgm, _ = make_test_pair(sr=sr, duration=10.0, delay=2.0, seed=seed)
+        dance = dance + (noise * np.random.default_rng(seed + 10).standard_normal(len(dance))).astype(np.float32)
+        refs = [int(o) for o in np.arange(0, 4 * sr, 0.2 * sr)]
+        movs = [int(o) for o in np.arange(0.2 * sr, 4 * sr, 0.8 * sr)]
+        curve = music_feature_scores(calculate_music_feature_curve(dance, bgm, 0, sr), refs, len(dance), sr)
+        grid = calculate_music_feature_grid(dance, bgm, refs[::4], movs, sr)
+        for i, r in enumerate(refs):
+            worst = max(worst, abs(curve[i] - calculate_music_feature_correlation(dance, bgm, r, 0, sr)))
+        for i, r in enumerate(refs[::4]):
+            for j, m in enumerate(movs):
+                worst = max(worst, abs(grid[i, j] - calculate_music_feature_correlation(dance, bgm, r, m, sr)))
+    print(f"  批量与逐窗口音乐特征得分最大误差: {worst:.4f}（上界 {MUSIC_SCORE_MARGIN}）")
+    assert worst < MUSIC_SCORE_MARGIN, worst
+
+
+def test_music_fusion_bgm_offset_matches_exhaustive():
+    """
+    开启第二阶段时与逐点穷举（两个阶段都逐窗口提取特征）比较：选出的对齐点按逐点计算的融合得分
+    不低于穷举最优得分减 MUSIC_SCORE_MARGIN；每个阶段重新打分的候选数不超过 MUSIC_RESCORE_TOP_K
+    """
+    import io
+    from unittest import mock
+    import beatsync_fine_cut_modular as modular
+
+    sr = 22050
+    for seed, noise in [(3, 0.0), (4, 3.0), (1, 2.0)]:
+        dance, bgm, _ = make_test_pair(sr=sr, duration=8.0, delay=1.4, seed=seed)
+        dance = dance + (noise * np.random.default_rng(seed + 10).standard_normal(len(dance))).astype(np.float32)
+        pointwise = modular.calculate_music_feature_correlation
+        with mock.patch.object(modular, "calculate_music_feature_correlation", wraps=pointwise) as rescored, \
+                contextlib.redirect_stdout(io.StringIO()):
+            result = modular.find_beat_alignment_multi_strategy(dance, bgm, sr, search_bgm_offset=True)
+        assert rescored.call_count <= 2 * modular.MUSIC_RESCORE_TOP_K, rescored.call_count
+
+        max_offset = min(len(dance), len(bgm)) / sr * 0.4
+        window = int(2.0 * sr)
+        best = (0, 0, 0.0)
+        pairs = [(int(r), 0) for r in np.arange(0, max_offset * sr, 0.2 * sr)]
+        movs = [int(m) for m in np.arange(0.2 * sr, max_offset * sr, 0.2 * sr) if int(m) + window <= len(bgm)]
+        refs = [int(r) for r in np.arange(0, max_offset * sr, 0.2 * sr) if int(r) + window <= len(dance)]
+        pairs += [(r, m) for m in movs for r in refs]
+        for r, m in pairs:
+            final_score = modular.find_best_alignment_score(dance, bgm, r, m, sr)[0]
+            if final_score > best[2]:
+                best = (r, m, final_score)
+        chosen = modular.find_best_alignment_score(dance, bgm, result[0], result[1], sr)[0]
+        assert chosen >= best[2] - modular.MUSIC_SCORE_MARGIN, (seed, result, chosen, best)
+
+
+def main():
+    tests = [
+        test_xcorr_curve_matches_pointwise,
+        test_xcorr_curve_silent_windows,
+        test_multi_strategy_finds_delay,
+        test_multi_strategy_bgm_offset,
+        test_onset_strategy_finds_delay,
+        test_onset_strategy_fusion,
+        test_grid_matches_nested_loop,
+        test_grid_all_silent,
+        test_resolve_align_workers,
+        test_parallel_grid_deterministic,
+        test_multi_strategy_parallel,
+        test_v2_parallel,
+        test_sliding_feature_correlation_matches_corrcoef,
+        test_music_feature_curve_matches_pointwise,
+        test_music_fusion_matches_pointwise,
+        test_music_score_margin,
+        test_music_fusion_bgm_offset_matches_exhaustive,
+    ]
+    failed = 0
+    for test in tests:
+        print(f"运行 {test.__name__} ...")
+        try:
+            test()
+            print(f"  ✅ 通过")
+        except AssertionError as e:
+            failed += 1
+            print(f"  ❌ 失败: {e}")
+    print(f"\n结果: {len(tests) - failed}/{len(tests)} 通过")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
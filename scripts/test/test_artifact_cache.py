@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+分析结果缓存测试：缓存键（类型/内容/参数）、命中后不再计算、.npz 登记到分析结果自己的索引、只缓存整段特征、
+节拍/onset包络/音乐特征命中缓存时不调用 librosa，且对齐结果不变
+"""
+
+import io
+import os
+import sys
+import tempfile
+import contextlib
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from beatsync_artifact_cache import ArtifactCache, array_digest, cached_artifact
+
+
+def click_track(seconds: float, sr: int, bpm: float = 120.0, seed: int = 0) -> np.ndarray:
+    """带噪声的节拍点击音频"""
+    rng = np.random.default_rng(seed)
+    audio = 0.01 * rng.standard_normal(int(seconds * sr)).astype(np.float32)
+    click = np.hanning(256).astype(np.float32)
+    for start in np.arange(0.25, seconds - 0.1, 60.0 / bpm):
+        i = int(start * sr)
+        audio[i:i + 256] += click
+    return audio
+
+
+def fail(*args, **kwargs):
+    raise AssertionError("命中缓存时不应重新计算")
+
+
+def test_keys():
+    """类型、内容、参数任一不同时缓存键不同；未知类型报错"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ArtifactCache(tmp)
+        key = cache.key("beats", "abc", sr=22050)
+        assert key == cache.key("beats", "abc", sr=22050)
+        assert len({key, cache.key("beats", "abd", sr=22050), cache.key("beats", "abc", sr=44100),
+                    cache.key("onset_envelope", "abc", sr=22050)}) == 4
+        try:
+            cache.key("unknown", "abc")
+            assert False, "应当抛出 ValueError"
+        except ValueError:
+            pass
+
+    audio = np.arange(100, dtype=np.float32)
+    assert array_digest(audio) == array_digest(audio.copy())
+    assert array_digest(audio) != array_digest(audio.astype(np.float64))
+    assert array_digest(audio) != array_digest(audio.reshape(50, 2))
+
+
+def test_get_or_compute():
+    """未命中时计算并写入 artifacts 子目录的 .npz（登记到分析结果索引），之后直接读取；计算失败（None）不缓存"""
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"envelope": np.linspace(0, 1, 10)}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ArtifactCache(tmp)
+        first = cache.get("onset_envelope", "abc", compute, hop_length=256)
+        second = cache.get("onset_envelope", "abc", compute, hop_length=256)
+        assert len(calls) == 1 and (cache.hits, cache.misses) == (1, 1)
+        assert np.array_equal(first["envelope"], second["envelope"])
+        assert len([name for name in os.listdir(os.path.join(tmp, "artifacts")) if name.endswith(".npz")]) == 1
+        assert cache.index.totals()[0] == 1 and not any(name.endswith(".npz") for name in os.listdir(tmp))
+
+        assert cache.get("beats", "abc", lambda: None) is None
+        assert cache.load("beats", "abc") is None and cache.index.totals()[0] == 1
+
+        # 未开启缓存时直接计算
+        assert cached_artifact(None, "onset_envelope", "abc", compute)["envelope"].shape == (10,)
+        assert len(calls) == 2
+
+
+def test_window_features_not_cached():
+    """逐窗口的bgm片段特征不写入缓存，只缓存dance整段特征"""
+    from beatsync_fine_cut_modular import calculate_music_feature_curve
+
+    sr = 22050
+    dance = click_track(6.0, sr, seed=2)
+    bgm = click_track(6.0, sr, seed=3)
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ArtifactCache(tmp)
+        for mov_start in range(0, 4 * sr, sr):
+            calculate_music_feature_curve(dance, bgm, mov_start, sr, artifacts=cache)
+        assert cache.index.totals()[0] == 1 and (cache.hits, cache.misses) == (3, 1)
+
+
+def test_modular_alignment_artifacts():
+    """modular：节拍、onset包络、音乐特征命中缓存后不调用librosa，对齐结果与未缓存一致"""
+    import librosa
+    from beatsync_fine_cut_modular import find_beat_alignment_multi_strategy
+
+    sr = 22050
+    dance = click_track(12.0, sr, seed=1)
+    bgm = np.ascontiguousarray(dance[int(1.5 * sr):])
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ArtifactCache(tmp)
+        results = {}
+        for strategy in ["fusion", "onset"]:
+            with contextlib.redirect_stdout(io.StringIO()):
+                expected = find_beat_alignment_multi_strategy(dance, bgm, sr, align_strategy=strategy)
+                assert find_beat_alignment_multi_strategy(dance, bgm, sr, align_strategy=strategy,
+                                                          artifacts=cache) == expected
+            results[strategy] = expected
+
+        with mock.patch.object(librosa.beat, "beat_track", fail), \
+                mock.patch.object(librosa.onset, "onset_strength", fail), \
+                mock.patch.object(librosa.feature, "mfcc", fail):
+            for strategy, expected in results.items():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    assert find_beat_alignment_multi_strategy(dance, bgm, sr, align_strategy=strategy,
+                                                              artifacts=cache) == expected
+
+
+def test_v2_beats_artifacts():
+    """V2：节拍检测命中缓存后不调用librosa，对齐结果与未缓存一致"""
+    import librosa
+    from beatsync_badcase_fix_trim_v2 import find_beat_alignment
+
+    sr = 22050
+    dance = click_track(10.0, sr, seed=2)
+    bgm = np.ascontiguousarray(dance[int(1.0 * sr):])
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ArtifactCache(tmp)
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = find_beat_alignment(dance, bgm, sr, align_mode="beat_grid")
+            assert find_beat_alignment(dance, bgm, sr, align_mode="beat_grid", artifacts=cache) == expected
+        with mock.patch.object(librosa.beat, "beat_track", fail), contextlib.redirect_stdout(io.StringIO()):
+            assert find_beat_alignment(dance, bgm, sr, align_mode="beat_grid", artifacts=cache) == expected
+        assert cache.hits == 2
+
+
+def main():
+    tests = [
+        test_keys,
+        test_get_or_compute,
+        test_window_features_not_cached,
+        test_modular_alignment_artifacts,
+        test_v2_beats_artifacts,
+    ]
+    failed = 0
+    for test in tests:
+        print(f"运行 {test.__name__} ...")
+        try:
+            test()
+            print(f"  ✅ 通过")
+        except AssertionError as e:
+            failed += 1
+            print(f"  ❌ 失败: {e}")
+    print(f"\n结果: {len(tests) - failed}/{len(tests)} 通过")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+音频缓存索引测试：按键查找、累计文件数与大小、LRU淘汰（同步/后台）、已有文件导入、
+数组缓存（原子写入、内存映射读取）、各类缓存分开索引与淘汰、manage_cache / get_cache_info 读取索引、modular加载命中缓存
+"""
+
+import io
+import os
+import sys
+import time
+import tempfile
+import contextlib
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from beatsync_audio_cache import AudioCacheIndex, get_cache_index
+from beatsync_utils import manage_cache, get_cache_info
+from test_audio_decoder import fake_ffmpeg, save_audio
+
+
+def write_entry(index: AudioCacheIndex, key: str, size: int) -> str:
+    path = index.path_for(key)
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    index.record(key, path, evict=False)
+    return path
+
+
+def test_lookup_and_totals():
+    """登记后可按键查找；文件数与总大小随登记、覆盖、删除增量更新"""
+    with tempfile.TemporaryDirectory() as tmp:
+        index = AudioCacheIndex(tmp)
+        assert index.lookup("a") is None and index.totals() == (0, 0)
+        path_a = write_entry(index, "a", 100)
+        write_entry(index, "b", 50)
+        assert index.lookup("a") == path_a and index.totals() == (2, 150)
+        write_entry(index, "a", 30)
+        assert index.totals() == (2, 80)
+        os.remove(path_a)
+        assert index.lookup("a") is None and index.totals() == (1, 50)
+
+
+def test_lru_eviction():
+    """超出文件数/大小上限时淘汰最久未访问的文件"""
+    with tempfile.TemporaryDirectory() as tmp:
+        index = AudioCacheIndex(tmp, max_files=2, max_size_mb=1)
+        paths = {key: write_entry(index, key, 100) for key in ["a", "b", "c"]}
+        time.sleep(0.01)
+        index.lookup("a")  # a 最近访问过，b 最旧
+        assert index.evict() == (1, 100 / (1024 * 1024))
+        assert not os.path.exists(paths["b"]) and index.lookup("b") is None
+        assert index.lookup("a") and index.lookup("c") and index.totals() == (2, 200)
+
+        index.max_files = 10
+        write_entry(index, "big", 1024 * 1024)
+        deleted, _ = index.evict()
+        assert deleted >= 1 and index.totals()[1] <= 1024 * 1024
+
+
+def test_background_eviction():
+    """登记时超出上限在后台淘汰"""
+    with tempfile.TemporaryDirectory() as tmp:
+        index = AudioCacheIndex(tmp, max_files=1)
+        write_entry(index, "old", 10)
+        path = index.path_for("new")
+        with open(path, "wb") as f:
+            f.write(b"\0" * 10)
+        with contextlib.redirect_stdout(io.StringIO()):
+            index.record("new", path)
+            index.wait_for_eviction(timeout=10)
+        assert index.totals() == (1, 10) and index.lookup("new") == path
+
+
+def test_array_cache():
+    """数组写入后以只读内存映射读取，内容一致；不残留临时文件；替换旧格式文件"""
+    with tempfile.TemporaryDirectory() as tmp:
+        index = AudioCacheIndex(tmp)
+        old_wav = write_entry(index, "k", 10)
+        audio = np.random.default_rng(0).standard_normal((500, 2)).astype(np.float32)
+        assert index.load_array("k") is None  # 旧格式不可直接映射
+        path = index.store_array("k", audio)
+        assert path.endswith(".npy") and not os.path.exists(old_wav)
+        assert sorted(os.listdir(tmp)) == ["cache_index.sqlite3", "k.npy"]
+        assert index.totals() == (1, os.path.getsize(path))
+        cached = index.load_array("k")
+        assert isinstance(cached, np.memmap) and not cached.flags.writeable
+        assert cached.dtype == np.float32 and np.array_equal(cached, audio)
+
+
+def test_kinds_evicted_separately():
+    """每类缓存在自己的子目录中单独计数与淘汰：一类写满不会淘汰其他类"""
+    with tempfile.TemporaryDirectory() as tmp:
+        audio_index = get_cache_index(tmp)
+        results_index = get_cache_index(tmp, kind="results", max_files=1)
+        assert results_index.cache_dir == os.path.join(os.path.abspath(tmp), "results")
+        assert get_cache_index(tmp, kind="artifacts").max_files == 1000
+        audio_path = write_entry(audio_index, "audio", 10)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for key in ["r1", "r2", "r3"]:
+                write_entry(results_index, key, 10)
+                time.sleep(0.01)
+            results_index.evict()
+        assert results_index.totals() == (1, 10) and results_index.lookup("r3")
+        assert audio_index.totals() == (1, 10) and audio_index.lookup("audio") == audio_path
+        try:
+            get_cache_index(tmp, kind="unknown")
+            assert False, "应当抛出 ValueError"
+        except ValueError:
+            pass
+
+
+def test_import_existing_and_utils():
+    """首次建立索引时导入已有缓存文件；manage_cache / get_cache_info 使用索引"""
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ["x.wav", "y.wav", "notes.txt"]:
+            with open(os.path.join(tmp, name), "wb") as f:
+                f.write(b"\0" * 1024)
+        info = get_cache_info(tmp)
+        assert info['exists'] and info['file_count'] == 2
+        assert abs(info['total_size_mb'] - 2 / 1024) < 1e-9
+        assert get_cache_index(tmp).lookup("x") == os.path.join(tmp, "x.wav")
+        with contextlib.redirect_stdout(io.StringIO()):
+            deleted, _ = manage_cache(tmp, max_files=1)
+        assert deleted == 1 and get_cache_info(tmp)['file_count'] == 1
+    assert not get_cache_info(os.path.join(tmp, "missing"))['exists']
+
+
+def test_modular_cache_hit():
+    """modular加载启用缓存时第二次直接读取缓存（不再调用ffmpeg）"""
+    from beatsync_fine_cut_modular import load_audio_optimized
+
+    audio = np.random.default_rng(0).uniform(-0.5, 0.5, (2000, 2)).astype(np.float32)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        with fake_ffmpeg() as tmp, contextlib.redirect_stdout(io.StringIO()):
+            path = save_audio(tmp, audio)
+            first = load_audio_optimized(path, 30.0, enable_cache=True, cache_dir=cache_dir, sr=100)
+            assert first is not None and get_cache_info(cache_dir)['file_count'] == 1
+            old_path = os.environ["PATH"]
+            os.environ["PATH"] = ""
+            try:
+                second = load_audio_optimized(path, 30.0, enable_cache=True, cache_dir=cache_dir, sr=100)
+            finally:
+                os.environ["PATH"] = old_path
+        assert isinstance(second, np.memmap) and np.array_equal(first, second)
+
+
+def main():
+    tests = [
+        test_lookup_and_totals,
+        test_lru_eviction,
+        test_background_eviction,
+        test_array_cache,
+        test_kinds_evicted_separately,
+        test_import_existing_and_utils,
+        test_modular_cache_hit,
+    ]
+    failed = 0
+    for test in tests:
+        print(f"运行 {test.__name__} ...")
+        try:
+            test()
+            print(f"  ✅ 通过")
+        except AssertionError as e:
+            failed += 1
+            print(f"  ❌ 失败: {e}")
+    print(f"\n结果: {len(tests) - failed}/{len(tests)} 通过")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
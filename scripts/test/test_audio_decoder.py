@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+音频解码测试：ffmpeg 管道输出读入预分配缓冲区、分块迭代、错误处理、modular加载与缓存
+使用一个把 .npy 文件按 f32le 写到标准输出的替身 ffmpeg，无需测试数据与真实ffmpeg
+"""
+
+import io
+import os
+import sys
+import stat
+import tempfile
+import contextlib
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from beatsync_audio_decoder import decode_audio, iter_audio_chunks, ffmpeg_decode_command
+from beatsync_utils import get_cache_info
+
+FAKE_FFMPEG = """#!{python}
+import sys
+import numpy as np
+args = sys.argv[1:]
+path = args[args.index('-i') + 1]
+channels = int(args[args.index('-ac') + 1])
+try:
+    data = np.load(path)
+except Exception as e:
+    sys.stderr.write(f"{{path}}: {{e}}\\n")
+    sys.exit(1)
+source_sr = None
+if hasattr(data, 'files'):  # 带原始采样率的输入（.npz: audio, sr）
+    data, source_sr = data['audio'], int(data['sr'])
+audio = data.astype('<f4')
+if audio.ndim == 1:
+    audio = np.repeat(audio[:, None], channels, axis=1)
+rate = int(args[args.index('-ar') + 1])
+if source_sr is not None and source_sr != rate:
+    # 线性插值重采样：与ingest的resample_poly不同，类似真实ffmpeg另用一种重采样器
+    t = np.arange(int(len(audio) * rate / source_sr)) * (source_sr / rate)
+    audio = np.stack([np.interp(t, np.arange(len(audio)), audio[:, c]) for c in range(audio.shape[1])], axis=1).astype('<f4')
+if '-ss' in args:
+    audio = audio[int(round(float(args[args.index('-ss') + 1]) * rate)):]
+if '-t' in args:
+    audio = audio[:int(float(args[args.index('-t') + 1]) * rate)]
+sys.stdout.buffer.write(np.ascontiguousarray(audio).tobytes())
+"""
+
+
+@contextlib.contextmanager
+def fake_ffmpeg():
+    """临时把替身 ffmpeg 放到 PATH 最前面"""
+    with tempfile.TemporaryDirectory() as tmp:
+        script = os.path.join(tmp, "ffmpeg")
+        with open(script, "w") as f:
+            f.write(FAKE_FFMPEG.format(python=sys.executable))
+        os.chmod(script, os.stat(script).st_mode | stat.S_IEXEC)
+        old_path = os.environ.get("PATH", "")
+        os.environ["PATH"] = tmp + os.pathsep + old_path
+        try:
+            yield tmp
+        finally:
+            os.environ["PATH"] = old_path
+
+
+def save_audio(directory: str, audio: np.ndarray) -> str:
+    path = os.path.join(directory, "input.npy")
+    np.save(path, audio)
+    return path
+
+
+def test_decode_command():
+    """解码命令输出 f32le 到标准输出，时长/偏移参数可选"""
+    cmd = ffmpeg_decode_command("a.mp4", 22050, 2, duration=30.0)
+    assert cmd[-1] == "pipe:1" and "f32le" in cmd and cmd[cmd.index('-t') + 1] == "30.0"
+    assert '-ss' not in cmd and '-y' not in cmd
+    assert ffmpeg_decode_command("a.mp4", 44100, 1, offset=5.0)[5:7] == ['-ss', '5.0']
+
+
+def test_decode_audio():
+    """单声道/双声道解码与原始采样一致；时长未知时缓冲区扩容；预估时长过长时截断"""
+    rng = np.random.default_rng(0)
+    stereo = rng.standard_normal((5000, 2)).astype(np.float32)
+    with fake_ffmpeg() as tmp:
+        path = save_audio(tmp, stereo)
+        audio, error = decode_audio(path, sr=100, channels=2)  # 初始容量 60s*100 = 6000 帧
+        assert error == "" and audio.dtype == np.float32 and audio.shape == (5000, 2)
+        assert np.array_equal(audio, stereo)
+
+        audio, _ = decode_audio(path, sr=10, channels=2)  # 初始容量 600 帧，需要多次扩容
+        assert np.array_equal(audio, stereo)
+
+        audio, _ = decode_audio(path, sr=100, channels=2, duration=20.0)  # 只取前 2000 帧
+        assert np.array_equal(audio, stereo[:2000])
+
+        mono = stereo[:, 0].copy()
+        path = save_audio(tmp, mono)
+        audio, _ = decode_audio(path, sr=1000, channels=1, duration=100.0)  # 预估远大于实际长度
+        assert audio.shape == (5000,) and np.array_equal(audio, mono)
+        assert audio.base is None or audio.base.nbytes == audio.nbytes
+
+
+def test_decode_errors():
+    """ffmpeg 失败与无音频数据时返回None和错误信息"""
+    with fake_ffmpeg() as tmp:
+        audio, error = decode_audio(os.path.join(tmp, "missing.npy"), sr=100)
+        assert audio is None and "返回码 1" in error and "missing.npy" in error
+
+        path = save_audio(tmp, np.zeros(0, dtype=np.float32))
+        audio, error = decode_audio(path, sr=100)
+        assert audio is None and "没有解码到音频数据" in error
+
+        try:
+            list(iter_audio_chunks(os.path.join(tmp, "missing.npy"), sr=100))
+            assert False, "应当抛出 RuntimeError"
+        except RuntimeError as e:
+            assert "missing.npy" in str(e)
+
+
+def test_iter_audio_chunks():
+    """分块迭代拼接后与整段解码一致，除最后一块外每块长度固定"""
+    rng = np.random.default_rng(1)
+    stereo = rng.standard_normal((2550, 2)).astype(np.float32)
+    with fake_ffmpeg() as tmp:
+        path = save_audio(tmp, stereo)
+        chunks = list(iter_audio_chunks(path, sr=100, channels=2, chunk_sec=5.0))
+        assert [len(c) for c in chunks] == [500] * 5 + [50]
+        assert np.array_equal(np.concatenate(chunks), stereo)
+
+
+def test_modular_load_cache():
+    """modular：解码为双声道float32，开启缓存时第二次直接读缓存"""
+    from beatsync_fine_cut_modular import load_audio_optimized
+
+    rng = np.random.default_rng(2)
+    mono = (0.5 * rng.standard_normal(22050 * 2)).clip(-1, 1).astype(np.float32)
+    with fake_ffmpeg() as tmp:
+        path = save_audio(tmp, mono)
+        cache_dir = os.path.join(tmp, "cache")
+        with contextlib.redirect_stdout(io.StringIO()):
+            audio = load_audio_optimized(path, 1.0, enable_cache=True, cache_dir=cache_dir)
+        assert audio.shape == (22050, 2) and np.array_equal(audio[:, 0], mono[:22050])
+        assert len([name for name in os.listdir(cache_dir) if name.endswith(".npy")]) == 1
+        assert get_cache_info(cache_dir)['file_count'] == 1
+
+        os.environ["PATH"] = os.environ["PATH"].split(os.pathsep, 1)[1]  # 移除ffmpeg：只能命中缓存
+        with contextlib.redirect_stdout(io.StringIO()):
+            cached = load_audio_optimized(path, 1.0, enable_cache=True, cache_dir=cache_dir)
+        assert cached.shape == (22050, 2) and np.allclose(cached, audio, atol=1.0 / 32768)
+
+
+def main():
+    tests = [
+        test_decode_command,
+        test_decode_audio,
+        test_decode_errors,
+        test_iter_audio_chunks,
+        test_modular_load_cache,
+    ]
+    failed = 0
+    for test in tests:
+        print(f"运行 {test.__name__} ...")
+        try:
+            test()
+            print(f"  ✅ 通过")
+        except AssertionError as e:
+            failed += 1
+            print(f"  ❌ 失败: {e}")
+    print(f"\n结果: {len(tests) - failed}/{len(tests)} 通过")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
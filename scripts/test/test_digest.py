@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+内容摘要测试：完整文件流式摘要、每个文件只计算一次、文件改写后重新计算、缓存键与路径无关
+"""
+
+import os
+import sys
+import hashlib
+import tempfile
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+import beatsync_digest
+from beatsync_digest import new_digest, file_digest, remember_digest, content_cache_key
+
+
+def write(path: str, data: bytes) -> str:
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def test_full_file_digest():
+    """摘要覆盖整个文件（不只是开头），与一次性计算的 SHA-256 一致"""
+    data = os.urandom(3 * beatsync_digest.CHUNK_SIZE + 123)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write(os.path.join(tmp, "a.mp4"), data)
+        assert file_digest(path) == hashlib.sha256(data).hexdigest()
+        other = write(os.path.join(tmp, "b.mp4"), data[:-1] + bytes([data[-1] ^ 1]))
+        assert file_digest(other) != file_digest(path)
+
+
+def test_digest_remembered():
+    """登记过的摘要直接返回（不读取文件）；文件改写后重新计算"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write(os.path.join(tmp, "upload.mp4"), b"video bytes")
+        streaming = new_digest()
+        for chunk in (b"video ", b"bytes"):
+            streaming.update(chunk)
+        remember_digest(path, "remembered")
+        assert file_digest(path) == "remembered"
+        write(path, b"changed video bytes")
+        os.utime(path, ns=(1, 1))
+        assert file_digest(path) == hashlib.sha256(b"changed video bytes").hexdigest()
+        assert streaming.hexdigest() == hashlib.sha256(b"video bytes").hexdigest()
+
+
+def test_content_cache_key():
+    """相同内容、不同文件名得到相同的缓存键；参数或内容不同时键不同"""
+    from beatsync_fine_cut_modular import build_cache_key as modular_key
+    from beatsync_badcase_fix_trim_v2 import build_cache_key as v2_key
+
+    with tempfile.TemporaryDirectory() as tmp:
+        first = write(os.path.join(tmp, "1111_dance.mp4"), b"same content")
+        second = write(os.path.join(tmp, "2222_dance.mp4"), b"same content")
+        third = write(os.path.join(tmp, "3333_dance.mp4"), b"other content")
+        assert content_cache_key(first, "v1", sr=1) == content_cache_key(second, "v1", sr=1)
+        assert content_cache_key(first, "v1", sr=1) != content_cache_key(first, "v1", sr=2)
+        assert content_cache_key(first, "v1", sr=1) != content_cache_key(first, "v2", sr=1)
+        assert content_cache_key(first, "v1", sr=1) != content_cache_key(third, "v1", sr=1)
+        assert modular_key(first, 30.0, 22050, 2) == modular_key(second, 30.0, 22050, 2)
+        assert v2_key(first, 44100, 2) == v2_key(second, 44100, 2) != v2_key(third, 44100, 2)
+
+
+def main():
+    tests = [test_full_file_digest, test_digest_remembered, test_content_cache_key]
+    failed = 0
+    for test in tests:
+        print(f"运行 {test.__name__} ...")
+        try:
+            test()
+            print(f"  ✅ 通过")
+        except AssertionError as e:
+            failed += 1
+            print(f"  ❌ 失败: {e}")
+    print(f"\n结果: {len(tests) - failed}/{len(tests)} 通过")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+能量包络测试：向量化RMS包络与逐帧循环一致（单/双声道、不足一个窗口）、后缀和衰减检测与逐起点计数一致、
+modular / V2 只解码开头/末尾窗口的静音检测与整段逐帧循环的参考实现一致、解码量与视频长度无关
+（替身ffmpeg的 -ss 按采样精确截取；真实AAC/MP4寻址可能偏差约一帧，见 beatsync_envelope 的说明）
+"""
+
+import io
+import os
+import sys
+import contextlib
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from beatsync_envelope import framed_rms, below_ratio, first_frame_above, last_frame_at_least, \
+    decay_start_frame, last_strong_before_decay, detect_leading_silence, analyze_trailing_silence
+from test_audio_decoder import fake_ffmpeg
+
+
+def loop_rms(audio, sr):
+    """原实现：逐帧计算RMS"""
+    window_size, hop_size = int(0.1 * sr), int(0.05 * sr)
+    rms_values = []
+    for i in range(0, len(audio) - window_size, hop_size):
+        segment = audio[i:i + window_size]
+        rms_values.append(np.sqrt(np.mean(segment ** 2)))
+    return rms_values
+
+
+def loop_last_strong(rms_values, fade_threshold):
+    """原实现：对每个起点重新计数弱音帧"""
+    last_strong_frame = -1
+    for start_idx in range(len(rms_values) - 1, -1, -1):
+        weak_frames = sum(1 for i in range(start_idx, len(rms_values)) if rms_values[i] < fade_threshold)
+        total_frames = len(rms_values) - start_idx
+        weak_ratio = weak_frames / total_frames if total_frames > 0 else 0
+        if weak_ratio >= 0.7:
+            for i in range(start_idx - 1, -1, -1):
+                if rms_values[i] >= fade_threshold:
+                    last_strong_frame = i
+                    break
+            break
+    return last_strong_frame
+
+
+def loop_trailing(rms_values, video_duration, sr):
+    """原实现：末尾静音/衰减检测"""
+    hop_size = int(0.05 * sr)
+    check_frames = int(3.0 * sr / hop_size)
+    start_check_frame = max(0, len(rms_values) - check_frames)
+    silent_frames = sum(1 for i in range(start_check_frame, len(rms_values)) if rms_values[i] < 0.01)
+    total_check_frames = len(rms_values) - start_check_frame
+    silence_ratio = silent_frames / total_check_frames if total_check_frames > 0 else 0
+    if silence_ratio >= 0.6:
+        fade_threshold = np.mean(rms_values[:int(len(rms_values) * 0.8)]) * 0.3
+        last_strong_frame = loop_last_strong(rms_values, fade_threshold)
+        if last_strong_frame >= 0:
+            return video_duration - last_strong_frame * hop_size / sr
+    for i in range(len(rms_values) - 1, -1, -1):
+        if rms_values[i] >= 0.01:
+            return video_duration - i * hop_size / sr
+    return None
+
+
+def synthetic_tracks(sr):
+    """开头静音 + 节奏段 + 不同结尾（渐弱、突然结束、静音尾巴、整段静音）"""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(8 * sr)) / sr
+    body = (0.4 * np.sin(2 * np.pi * 220 * t) * (1 + np.sin(2 * np.pi * 2 * t)) / 2).astype(np.float64)
+    fade = body[:int(3 * sr)] * np.linspace(1, 0, int(3 * sr)) ** 3
+    lead = np.zeros(int(0.7 * sr))
+    return {
+        "fade_out": np.concatenate([lead, body, fade, 0.001 * rng.standard_normal(int(2 * sr))]),
+        "hard_stop": np.concatenate([lead, body]),
+        "silent_tail": np.concatenate([lead, body, np.zeros(int(4 * sr))]),
+        "all_silent": np.zeros(int(5 * sr)),
+    }
+
+
+def test_framed_rms_matches_loop():
+    """单声道/双声道、多种长度下与逐帧循环逐位一致；不足一个窗口时为空"""
+    rng = np.random.default_rng(1)
+    sr = 22050
+    for length in [0, 100, 2205, 2206, 2205 + 1102, 22050 * 3 + 17]:
+        for audio in [rng.standard_normal(length), rng.standard_normal((length, 2)),
+                      rng.standard_normal(length).astype(np.float32)]:
+            expected = loop_rms(audio.astype(np.float64), sr)  # float32 输入按float64计算
+            actual = framed_rms(audio, sr)
+            assert actual.shape == (len(expected),) and actual.dtype == np.float64
+            assert np.array_equal(actual, expected)  # 逐窗口求和的顺序与 np.mean 相同，结果逐位一致
+    # 长静音尾巴：窗口直接求和，静音帧为精确的0（累积和相减会留下误差）
+    audio = np.concatenate([rng.standard_normal(sr * 60), np.zeros(sr * 5)])
+    assert np.all(framed_rms(audio, sr)[-90:] == 0)
+
+
+def test_decay_matches_loop():
+    """后缀和衰减起点、最后强音帧、比例与首末帧查找与原循环一致"""
+    rng = np.random.default_rng(2)
+    for trial in range(200):
+        n = int(rng.integers(0, 60))
+        rms = list(rng.random(n) * rng.choice([0.05, 1.0]))
+        if n and trial % 3 == 0:
+            rms[-n // 3:] = [v * 0.05 for v in rms[-n // 3:]]
+        for fade in [0.01, 0.1, 0.3, 0.5]:
+            assert last_strong_before_decay(rms, fade) == loop_last_strong(rms, fade)
+            start = int(rng.integers(0, n + 1))
+            tail = rms[start:]
+            expected_ratio = sum(1 for v in tail if v < fade) / len(tail) if tail else 0
+            assert below_ratio(rms, fade, start) == expected_ratio
+            above = [i for i, v in enumerate(rms) if v > fade]
+            assert first_frame_above(rms, fade) == (above[0] if above else -1)
+            at_least = [i for i, v in enumerate(rms) if v >= fade]
+            assert last_frame_at_least(rms, fade) == (at_least[-1] if at_least else -1)
+    assert decay_start_frame([], 0.1) == -1 and last_strong_before_decay([0.0, 0.0], 0.1) == -1
+
+
+def expected_from_full(audio, sr, duration):
+    """参考实现：整段音频逐帧循环计算的检测结果 (开头静音时长, 末尾裁剪时长)"""
+    rms_values = loop_rms(np.asarray(audio, dtype=np.float64), sr)
+    first = next((i for i, v in enumerate(rms_values) if v > 0.01), None)
+    leading = first * int(0.05 * sr) / sr if first is not None else 0.0
+    trailing = loop_trailing(rms_values, duration, sr)
+    return leading, (duration if trailing is None else trailing)
+
+
+def test_windowed_detection_matches_full():
+    """只解码开头/末尾窗口（窗口不够时扩大）的检测结果与整段逐帧循环的参考实现相同；时长不准确时也一致"""
+    import beatsync_fine_cut_modular as modular
+    import beatsync_badcase_fix_trim_v2 as v2
+
+    sr = 22050
+    with fake_ffmpeg() as tmp:
+        for name, track in synthetic_tracks(sr).items():
+            audio = track.astype(np.float32)
+            duration = len(audio) / sr
+            stereo_path = os.path.join(tmp, f"{name}_stereo.npy")
+            mono_path = os.path.join(tmp, f"{name}_mono.npy")
+            np.save(stereo_path, np.stack([audio, audio], axis=1))
+            np.save(mono_path, audio)
+            expected_leading, expected_trailing = expected_from_full(np.stack([audio, audio], axis=1), sr, duration)
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                assert modular.detect_leading_silence_from_video(stereo_path) == expected_leading, name
+                assert modular.detect_trailing_silence_from_video(stereo_path, duration) == expected_trailing, name
+                assert v2.detect_silent_segments_with_video(mono_path, "leading") == expected_leading, name
+                v2_trailing = v2.detect_silent_segments_with_video(mono_path, "trailing", video_duration=duration)
+            assert v2_trailing == expected_trailing, name
+            if name == "fade_out":
+                assert 0.5 < expected_leading < 1.0 and expected_trailing > 2.0
+
+            # 小窗口（需要多次扩大）、时长偏长/偏短时，帧位置与整段解码相同
+            assert detect_leading_silence(stereo_path, sr, window_sec=0.2) == expected_leading, name
+            full = analyze_trailing_silence(stereo_path, duration, sr, window_sec=60.0)
+            for window_sec, hint in [(0.5, duration), (1.0, duration + 3.0), (2.0, duration - 4.0)]:
+                analysis = analyze_trailing_silence(stereo_path, hint, sr, window_sec=window_sec)
+                assert analysis == full, (name, window_sec, hint)
+
+
+def test_windowed_decode_bounded():
+    """长视频只解码开头/末尾窗口与抽样小段，解码量与视频长度无关；抽样的平均RMS得到相同的裁剪位置"""
+    import beatsync_audio_decoder
+
+    sr = 2000
+    rng = np.random.default_rng(3)
+    decode = beatsync_audio_decoder.decode_audio
+    for minutes in [10, 30]:
+        t = np.arange(int(minutes * 60 * sr)) / sr
+        body = 0.3 * np.sin(2 * np.pi * 110 * t) * (1 + 0.5 * np.sin(2 * np.pi * 0.5 * t))
+        fade = body[:int(4 * sr)] * np.linspace(1, 0, int(4 * sr)) ** 3
+        audio = np.concatenate([np.zeros(int(1.5 * sr)), body, fade,
+                                0.001 * rng.standard_normal(int(3 * sr))]).astype(np.float32)
+        duration = len(audio) / sr
+        decoded = []
+
+        def counting_decode(*args, **kwargs):
+            result = decode(*args, **kwargs)
+            if result[0] is not None:
+                decoded.append(len(result[0]) / sr)
+            return result
+
+        with fake_ffmpeg() as tmp:
+            path = os.path.join(tmp, "long.npy")
+            np.save(path, audio)
+            with mock.patch.object(beatsync_audio_decoder, "decode_audio", counting_decode):
+                leading = detect_leading_silence(path, sr, channels=1)
+                analysis = analyze_trailing_silence(path, duration, sr, channels=1)
+        assert sum(decoded) < 60.0, sum(decoded)
+
+        rms = framed_rms(audio, sr)
+        exact_fade = np.mean(rms[:int(len(rms) * 0.8)]) * 0.3
+        assert leading == first_frame_above(rms, 0.01) * int(0.05 * sr) / sr
+        assert abs(analysis["fade_threshold"] - exact_fade) < 0.05 * exact_fade
+        assert analysis["last_strong_frame"] == last_strong_before_decay(rms, exact_fade)
+
+
+def main():
+    tests = [
+        test_framed_rms_matches_loop,
+        test_decay_matches_loop,
+        test_windowed_detection_matches_full,
+        test_windowed_decode_bounded,
+    ]
+    failed = 0
+    for test in tests:
+        print(f"运行 {test.__name__} ...")
+        try:
+            test()
+            print(f"  ✅ 通过")
+        except AssertionError as e:
+            failed += 1
+            print(f"  ❌ 失败: {e}")
+    print(f"\n结果: {len(tests) - failed}/{len(tests)} 通过")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+指纹对齐测试：哈希投票偏移、指纹库入库与识别、不匹配时回退
+使用合成音频，无需测试数据
+"""
+
+import io
+import os
+import sys
+import tempfile
+import contextlib
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from beatsync_fingerprint import (
+    compute_landmarks, vote_offset, vote_is_confident, fingerprint_hop,
+    fingerprint_alignment, init_fingerprint_db, identify_song
+)
+
+
+def make_music(sr: int, duration: float, seed: int) -> np.ndarray:
+    """随机间隔、随机音高的音符序列"""
+    rng = np.random.default_rng(seed)
+    n = int(duration * sr)
+    music = 0.05 * rng.standard_normal(n)
+    onset = 0
+    while onset < n:
+        length = int(rng.uniform(0.15, 0.6) * sr)
+        t = np.arange(min(length, n - onset)) / sr
+        music[onset:onset + len(t)] += np.exp(-t * 6.0) * np.sin(2 * np.pi * rng.uniform(110.0, 880.0) * t)
+        onset += length
+    return music
+
+
+def make_pair(sr: int, duration: float, dance_pad: float, bgm_pad: float, seed: int = 0):
+    """同一段音乐分别加上不同长度的前导噪声，dance再叠加噪声"""
+    rng = np.random.default_rng(seed + 100)
+    music = make_music(sr, duration, seed)
+    n = len(music)
+    dance = np.concatenate([0.05 * rng.standard_normal(int(dance_pad * sr)), music])[:n]
+    bgm = np.concatenate([0.05 * rng.standard_normal(int(bgm_pad * sr)), music])[:n]
+    dance = dance + 0.2 * rng.standard_normal(n)
+    return dance.astype(np.float32), bgm.astype(np.float32)
+
+
+def run_quiet(func, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def test_vote_offset():
+    """哈希投票得到的帧偏移与真实偏移一致"""
+    sr = 22050
+    hop = fingerprint_hop(sr)
+    dance, bgm = make_pair(sr, 20.0, 3.4, 0.0, seed=1)
+    ha, ta = compute_landmarks(dance, sr)
+    hb, tb = compute_landmarks(bgm, sr)
+    offset, votes, runner_up = vote_offset(ha, ta, hb, tb)
+    assert vote_is_confident(votes, runner_up), f"票数 {votes}, 次高 {runner_up}"
+    assert abs(offset * hop / sr - 3.4) <= hop / sr, f"{offset * hop / sr:.3f}s != 3.4s"
+
+
+def test_fingerprint_alignment_direct():
+    """无指纹库：dance与bgm直接投票并细化到采样点"""
+    sr = 22050
+    for seed, (dance_pad, bgm_pad) in enumerate([(3.4, 0.0), (0.0, 2.35), (4.1, 1.6)]):
+        dance, bgm = make_pair(sr, 24.0, dance_pad, bgm_pad, seed=seed)
+        result = run_quiet(fingerprint_alignment, dance, bgm, sr)
+        assert result is not None
+        ref_start, mov_start, score = result
+        expected = int(dance_pad * sr) - int(bgm_pad * sr)
+        assert min(ref_start, mov_start) == 0
+        assert abs((ref_start - mov_start) - expected) <= 2, f"{ref_start - mov_start} != {expected}"
+        assert score > 0.5
+
+
+def test_fingerprint_db_identify():
+    """bgm首次出现时入库；再次出现（另一段剪辑）时被识别，并用库中指纹定位dance"""
+    sr = 22050
+    music = make_music(sr, 40.0, seed=3)
+    rng = np.random.default_rng(4)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "fingerprints.db")
+        init_fingerprint_db(db_path)
+
+        # 第一次：完整bgm入库
+        full_bgm = music.astype(np.float32)
+        dance = np.concatenate([0.05 * rng.standard_normal(int(2.0 * sr)), music[:int(30 * sr)]])
+        dance = (dance + 0.2 * rng.standard_normal(len(dance))).astype(np.float32)
+        result = run_quiet(fingerprint_alignment, dance, full_bgm, sr, db_path=db_path, song_name="song.mp4")
+        assert result is not None and abs(result[0] - int(2.0 * sr)) <= 2
+
+        # 第二次：bgm是同一首歌的另一段（从8秒开始），dance从歌曲5秒处开始
+        bgm_clip = music[int(8.0 * sr):int(30.0 * sr)].astype(np.float32)
+        dance = music[int(5.0 * sr):int(30.0 * sr)]
+        dance = (dance + 0.2 * rng.standard_normal(len(dance))).astype(np.float32)
+        song = run_quiet(identify_song, db_path, *compute_landmarks(bgm_clip, sr))
+        assert song is not None and song['name'] == "song.mp4"
+        result = run_quiet(fingerprint_alignment, dance, bgm_clip, sr, db_path=db_path, song_name="clip.mp4")
+        assert result is not None
+        ref_start, mov_start, _ = result
+        # bgm开头在dance中的位置：8 - 5 = 3秒
+        assert mov_start == 0 and abs(ref_start - int(3.0 * sr)) <= 2, f"{ref_start} != {int(3.0 * sr)}"
+
+
+def test_fingerprint_no_match():
+    """不同歌曲：投票不可信，返回None（调用方回退到搜索）"""
+    sr = 22050
+    dance = make_music(sr, 20.0, seed=10).astype(np.float32)
+    bgm = make_music(sr, 20.0, seed=11).astype(np.float32)
+    assert run_quiet(fingerprint_alignment, dance, bgm, sr) is None
+
+
+def main():
+    tests = [
+        test_vote_offset,
+        test_fingerprint_alignment_direct,
+        test_fingerprint_db_identify,
+        test_fingerprint_no_match,
+    ]
+    failed = 0
+    for test in tests:
+        print(f"运行 {test.__name__} ...")
+        try:
+            test()
+            print(f"  ✅ 通过")
+        except AssertionError as e:
+            failed += 1
+            print(f"  ❌ 失败: {e}")
+    print(f"\n结果: {len(tests) - failed}/{len(tests)} 通过")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+导入耗时测试（python -X importtime）：流程脚本与并行编排进程在导入、--help 时
+不加载 numpy / librosa / soundfile / cv2，编排进程的导入耗时在毫秒级
+"""
+
+import sys
+import subprocess
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+HEAVY_MODULES = ["numpy", "librosa", "soundfile", "cv2", "numba", "scipy"]
+# 编排进程导入耗时上限（微秒）；本机约 25ms，留出较大余量避免CI抖动
+ORCHESTRATOR_BUDGET_US = 300_000
+
+
+def import_report(args) -> dict:
+    """用 -X importtime 运行Python，返回 {模块名: 累计导入耗时(微秒)}"""
+    result = subprocess.run([sys.executable, "-X", "importtime"] + args, cwd=str(project_root),
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, f"{args} 运行失败: {result.stderr[-500:]}"
+    report = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            report[name.strip()] = int(cumulative)
+    return report
+
+
+def heavy_in(report: dict) -> list:
+    return [name for name in HEAVY_MODULES if name in report]
+
+
+def test_modules_import_light():
+    """导入流程模块与流程API不加载重型依赖"""
+    for module in ["beatsync_fine_cut_modular", "beatsync_badcase_fix_trim_v2",
+                   "beatsync_parallel_processor", "beatsync_pipeline_api"]:
+        report = import_report(["-c", f"import {module}"])
+        assert module in report, f"{module} 未导入"
+        assert not heavy_in(report), f"{module} 导入了 {heavy_in(report)}"
+
+
+def test_help_is_light():
+    """--help 不加载重型依赖"""
+    for script in ["beatsync_fine_cut_modular.py", "beatsync_badcase_fix_trim_v2.py",
+                   "beatsync_parallel_processor.py"]:
+        report = import_report([script, "--help"])
+        assert not heavy_in(report), f"{script} --help 导入了 {heavy_in(report)}"
+
+
+def test_orchestrator_import_time():
+    """并行编排进程的导入耗时在预算内"""
+    report = import_report(["-c", "import beatsync_parallel_processor"])
+    elapsed = report["beatsync_parallel_processor"]
+    assert elapsed < ORCHESTRATOR_BUDGET_US, f"导入耗时 {elapsed / 1000:.1f}ms"
+
+
+def main():
+    tests = [test_modules_import_light, test_help_is_light, test_orchestrator_import_time]
+    failed = 0
+    for test in tests:
+        print(f"运行 {test.__name__} ...")
+        try:
+            test()
+            print(f"  ✅ 通过")
+        except AssertionError as e:
+            failed += 1
+            print(f"  ❌ 失败: {e}")
+    print(f"\n结果: {len(tests) - failed}/{len(tests)} 通过")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
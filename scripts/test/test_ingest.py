@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+ingest阶段测试：一次探测、一次解码，清单登记探测信息与内容摘要，两个流程共享mmap音频，
+同一内容再次提交时命中缓存
+使用替身 ffmpeg / ffprobe，无需测试数据与真实ffmpeg
+"""
+
+import io
+import os
+import sys
+import stat
+import tempfile
+import contextlib
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from beatsync_ingest import ingest_inputs, load_ingest_manifest, ingested_audio, INGEST_SR
+from test_audio_decoder import fake_ffmpeg
+
+FAKE_FFPROBE = """#!{python}
+import sys, json, os
+path = sys.argv[-1]
+if not os.path.exists(path):
+    sys.exit(1)
+streams = [{{"codec_type": "video", "codec_name": "h264", "r_frame_rate": "30000/1001"}}]
+if "noaudio" not in path:
+    streams.append({{"codec_type": "audio", "codec_name": "aac"}})
+print(json.dumps({{"streams": streams, "format": {{"duration": "12.5"}}}}))
+"""
+
+
+# 有无ingest清单时modular音频的允许差值（峰值约0.8的音频），以及不比较的首尾采样数
+RESAMPLE_TOLERANCE = 1e-3
+RESAMPLE_EDGE = 32
+
+
+@contextlib.contextmanager
+def fake_tools():
+    """替身 ffmpeg + ffprobe"""
+    with fake_ffmpeg() as tmp:
+        script = os.path.join(tmp, "ffprobe")
+        with open(script, "w") as f:
+            f.write(FAKE_FFPROBE.format(python=sys.executable))
+        os.chmod(script, os.stat(script).st_mode | stat.S_IEXEC)
+        yield tmp
+
+
+def save_video(directory: str, name: str, audio: np.ndarray) -> str:
+    """替身 ffmpeg 读取的"视频"：以 .npy 内容保存、扩展名为 .mp4"""
+    path = os.path.join(directory, name)
+    with open(path, "wb") as f:
+        np.save(f, audio)
+    return path
+
+
+def run_quiet(func, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def test_ingest_manifest():
+    """清单包含两个输入的探测信息与音频；规范采样率下为mmap视图，其他采样率按时长重采样"""
+    rng = np.random.default_rng(0)
+    dance = rng.standard_normal((INGEST_SR * 2, 2)).astype(np.float32)
+    bgm = rng.standard_normal((INGEST_SR * 3, 2)).astype(np.float32)
+    with fake_tools() as tmp:
+        dance_path = save_video(tmp, "dance.mp4", dance)
+        bgm_path = save_video(tmp, "bgm.mp4", bgm)
+        manifest_path, error = run_quiet(ingest_inputs, {"dance": dance_path, "bgm": bgm_path},
+                                         os.path.join(tmp, "ingest"))
+        assert manifest_path and error == "", error
+        manifest = load_ingest_manifest(manifest_path)
+        entry = manifest["inputs"]["bgm"]
+        assert entry["frames"] == len(bgm) and entry["probe"]["duration"] == 12.5
+
+        audio = ingested_audio(manifest, bgm_path, INGEST_SR)
+        assert isinstance(audio, np.memmap) and np.array_equal(audio, bgm)
+        assert np.array_equal(ingested_audio(manifest, dance_path, INGEST_SR, duration=1.0), dance[:INGEST_SR])
+
+        half = ingested_audio(manifest, dance_path, 22050, duration=1.0)
+        assert half.dtype == np.float32 and half.shape == (22050, 2)
+        assert ingested_audio(manifest, os.path.join(tmp, "other.mp4"), INGEST_SR) is None
+
+
+def test_registered_probes():
+    """加载清单后，输入验证与帧率查询使用登记的探测信息，不再调用ffprobe"""
+    from beatsync_utils import validate_input_files, get_video_fps
+
+    audio = np.zeros((INGEST_SR, 2), dtype=np.float32)
+    with fake_tools() as tmp:
+        dance_path = save_video(tmp, "dance2.mp4", audio)
+        bgm_path = save_video(tmp, "bgm2.mp4", audio + 0.1)
+        manifest_path, _ = run_quiet(ingest_inputs, {"dance": dance_path, "bgm": bgm_path},
+                                     os.path.join(tmp, "ingest"))
+        os.environ["PATH"] = os.environ["PATH"].split(os.pathsep, 1)[1]  # 移除替身工具
+        load_ingest_manifest(manifest_path)
+        ok, error = validate_input_files(dance_path, bgm_path, os.path.join(tmp, "out", "result.mp4"))
+        assert ok, error
+        assert abs(run_quiet(get_video_fps, dance_path) - 29.97) < 0.01
+
+
+def test_ingest_rejects_missing_audio():
+    """没有音频轨道的输入在ingest阶段即报错"""
+    with fake_tools() as tmp:
+        dance_path = save_video(tmp, "dance_noaudio.mp4", np.zeros((100, 2), dtype=np.float32))
+        bgm_path = save_video(tmp, "bgm3.mp4", np.zeros((100, 2), dtype=np.float32))
+        manifest_path, error = run_quiet(ingest_inputs, {"dance": dance_path, "bgm": bgm_path},
+                                         os.path.join(tmp, "ingest"))
+        assert manifest_path is None and "没有音频轨道" in error
+
+
+def test_pipelines_use_ingest():
+    """modular与V2的音频加载在有清单时直接读取ingest音频（无需ffmpeg）"""
+    from beatsync_fine_cut_modular import load_audio_optimized
+    from beatsync_badcase_fix_trim_v2 import load_audio_from_video
+
+    rng = np.random.default_rng(1)
+    dance = rng.standard_normal((INGEST_SR * 2, 2)).astype(np.float32)
+    with fake_tools() as tmp:
+        dance_path = save_video(tmp, "dance4.mp4", dance)
+        bgm_path = save_video(tmp, "bgm4.mp4", dance[::-1].copy())
+        manifest_path, _ = run_quiet(ingest_inputs, {"dance": dance_path, "bgm": bgm_path},
+                                     os.path.join(tmp, "ingest"))
+        os.environ["PATH"] = os.environ["PATH"].split(os.pathsep, 1)[1]
+        manifest = load_ingest_manifest(manifest_path)
+        v2_audio = run_quiet(load_audio_from_video, dance_path, 44100, ingest_manifest=manifest)
+        assert isinstance(v2_audio, np.memmap) and np.array_equal(v2_audio, dance)
+        modular_audio = run_quiet(load_audio_optimized, bgm_path, 1.0, ingest_manifest=manifest)
+        assert modular_audio.shape == (22050, 2)
+
+
+def test_modular_audio_with_and_without_ingest():
+    """
+    modular在没有清单时仍由ffmpeg直接解码到22.05kHz（与原来相同），有清单时由ingest音频重采样：
+    两种重采样器不同，采样不逐位一致；除去首尾各 RESAMPLE_EDGE 个采样（滤波器边缘），
+    最大差值小于 RESAMPLE_TOLERANCE（约为峰值的 -60dB）
+    """
+    from beatsync_fine_cut_modular import load_audio_optimized
+
+    t = np.arange(INGEST_SR * 2) / INGEST_SR
+    rng = np.random.default_rng(5)
+    tones = [a * np.sin(2 * np.pi * f * t + p) for a, f, p in
+             zip(rng.uniform(0.05, 0.2, 8), rng.uniform(80, 3000, 8), rng.uniform(0, 2 * np.pi, 8))]
+    mono = np.sum(tones, axis=0)
+    bgm = np.stack([mono, 0.8 * mono], axis=1).astype(np.float32)
+    with fake_tools() as tmp:
+        dance_path = save_video(tmp, "dance5.mp4", bgm[::-1].copy())
+        # 带原始采样率的输入：替身ffmpeg按 -ar 线性插值重采样（另一种重采样器）
+        bgm_path = os.path.join(tmp, "bgm5.mp4")
+        with open(bgm_path, "wb") as f:
+            np.savez(f, audio=bgm, sr=INGEST_SR)
+        manifest_path, _ = run_quiet(ingest_inputs, {"dance": dance_path, "bgm": bgm_path},
+                                     os.path.join(tmp, "ingest"))
+        without_ingest = run_quiet(load_audio_optimized, bgm_path, 1.0)
+        with_ingest = run_quiet(load_audio_optimized, bgm_path, 1.0,
+                                ingest_manifest=load_ingest_manifest(manifest_path))
+    assert without_ingest.shape == with_ingest.shape == (22050, 2)
+    diff = np.abs(without_ingest - with_ingest)[RESAMPLE_EDGE:-RESAMPLE_EDGE].max()
+    print(f"   有无清单的最大采样差值: {diff:.5f}")
+    assert diff < RESAMPLE_TOLERANCE, diff
+
+
+def test_ingest_cache_by_content():
+    """同一视频以不同文件名再次提交时命中缓存（不再解码），清单记录内容摘要"""
+    import beatsync_audio_decoder
+    from beatsync_digest import file_digest
+
+    rng = np.random.default_rng(2)
+    dance = rng.standard_normal((INGEST_SR, 2)).astype(np.float32)
+    with fake_tools() as tmp:
+        cache_dir = os.path.join(tmp, "cache")
+        first = {"dance": save_video(tmp, "upload1_dance.mp4", dance),
+                 "bgm": save_video(tmp, "upload1_bgm.mp4", dance[::-1].copy())}
+        manifest_path, error = run_quiet(ingest_inputs, first, os.path.join(tmp, "ingest1"), cache_dir=cache_dir)
+        assert manifest_path, error
+
+        second = {"dance": save_video(tmp, "upload2_dance.mp4", dance),
+                  "bgm": save_video(tmp, "upload2_bgm.mp4", dance[::-1].copy())}
+        decode_audio = beatsync_audio_decoder.decode_audio
+        beatsync_audio_decoder.decode_audio = lambda *args, **kwargs: (None, "不应再次解码")
+        try:
+            manifest_path, error = run_quiet(ingest_inputs, second, os.path.join(tmp, "ingest2"),
+                                             cache_dir=cache_dir)
+        finally:
+            beatsync_audio_decoder.decode_audio = decode_audio
+        assert manifest_path, error
+        manifest = load_ingest_manifest(manifest_path)
+        entry = manifest["inputs"]["dance"]
+        assert entry["digest"] == file_digest(second["dance"]) and entry["frames"] == len(dance)
+        assert np.array_equal(ingested_audio(manifest, second["dance"], INGEST_SR), dance)
+
+
+def main():
+    tests = [
+        test_ingest_manifest,
+        test_registered_probes,
+        test_ingest_rejects_missing_audio,
+        test_pipelines_use_ingest,
+        test_modular_audio_with_and_without_ingest,
+        test_ingest_cache_by_content,
+    ]
+    failed = 0
+    for test in tests:
+        print(f"运行 {test.__name__} ...")
+        try:
+            test()
+            print(f"  ✅ 通过")
+        except AssertionError as e:
+            failed += 1
+            print(f"  ❌ 失败: {e}")
+    print(f"\n结果: {len(tests) - failed}/{len(tests)} 通过")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+流程API测试：结构化结果、失败原因透传、在进程池中调用两个版本
+不需要测试数据（使用不存在的输入验证失败路径）
+"""
+
+import io
+import os
+import sys
+import tempfile
+import contextlib
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from beatsync_pipeline_api import PipelineResult, run_modular_pipeline, run_v2_pipeline
+
+
+def run_quiet(func, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def test_result_to_info():
+    """报告dict中对齐点与置信度为格式化字符串，未知时为 UNKNOWN"""
+    result = PipelineResult(program="V2版本", success=True, dance_alignment=1.5, bgm_alignment=0.0,
+                            confidence=0.87654, timings={'align': 2.0})
+    info = result.to_info()
+    assert info['dance_alignment'] == "1.500s" and info['bgm_alignment'] == "0.000s"
+    assert info['confidence'] == "0.8765" and info['timings'] == {'align': 2.0}
+    assert PipelineResult(program="modular版本").to_info()['confidence'] == 'UNKNOWN'
+
+
+def test_failure_reported():
+    """输入不存在时两个版本都返回失败及具体原因，而不是抛出异常"""
+    with tempfile.TemporaryDirectory() as tmp:
+        dance = os.path.join(tmp, "missing_dance.mp4")
+        bgm = os.path.join(tmp, "missing_bgm.mp4")
+        for runner in (run_modular_pipeline, run_v2_pipeline):
+            result = run_quiet(runner, dance, bgm, os.path.join(tmp, "out.mp4"))
+            assert isinstance(result, PipelineResult) and not result.success
+            assert result.output_file is None and "missing_dance.mp4" in result.error, result.error
+
+
+def test_process_pool():
+    """并行处理器的进程池调用：结果dict可跨进程返回"""
+    from beatsync_parallel_processor import process_with_modular, process_with_v2
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dance = os.path.join(tmp, "missing_dance.mp4")
+        bgm = os.path.join(tmp, "missing_bgm.mp4")
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            modular = run_quiet(process_with_modular, executor, dance, bgm, os.path.join(tmp, "m.mp4"))
+            v2 = run_quiet(process_with_v2, executor, dance, bgm, os.path.join(tmp, "v.mp4"))
+        assert modular['program'] == "modular版本" and not modular['success']
+        assert v2['program'] == "V2版本" and not v2['success'] and "输入验证失败" in v2['error']
+
+
+def test_ingest_dir_removed_on_interrupt():
+    """处理中途被中断（KeyboardInterrupt 等 BaseException）时，ingest临时目录同样被删除"""
+    from unittest import mock
+    import beatsync_parallel_processor as processor
+
+    created = []
+    real_mkdtemp = tempfile.mkdtemp
+
+    def recording_mkdtemp(*args, **kwargs):
+        path = real_mkdtemp(*args, **kwargs)
+        created.append(path)
+        return path
+
+    def interrupted(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dance = os.path.join(tmp, "dance.mp4")
+        bgm = os.path.join(tmp, "bgm.mp4")
+        for path in (dance, bgm):
+            with open(path, "wb") as f:
+                f.write(b"not a video")
+        with mock.patch.object(tempfile, "mkdtemp", recording_mkdtemp), \
+                mock.patch.object(processor, "process_with_v2", interrupted):
+            try:
+                run_quiet(processor.process_beat_sync_parallel, dance, bgm, os.path.join(tmp, "out"), "sample")
+            except KeyboardInterrupt:
+                pass
+            else:
+                raise AssertionError("中断没有向上抛出")
+    ingest_dirs = [path for path in created if "beatsync_ingest_" in os.path.basename(path)]
+    assert len(ingest_dirs) == 1 and not os.path.exists(ingest_dirs[0]), ingest_dirs
+
+
+def main():
+    tests = [test_result_to_info, test_failure_reported, test_process_pool, test_ingest_dir_removed_on_interrupt]
+    failed = 0
+    for test in tests:
+        print(f"运行 {test.__name__} ...")
+        try:
+            test()
+            print(f"  ✅ 通过")
+        except AssertionError as e:
+            failed += 1
+            print(f"  ❌ 失败: {e}")
+    print(f"\n结果: {len(tests) - failed}/{len(tests)} 通过")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
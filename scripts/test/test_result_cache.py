@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+处理结果缓存测试：缓存键按文件内容（与文件名无关）、两个版本都成功才缓存、命中时硬链接到新任务目录、
+输出视频单独索引（不计入音频缓存）、部分输出被淘汰时不命中、相同组合并发提交只有一个任务处理
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from beatsync_result_cache import ResultCache, InflightTasks, result_cache_key, output_name
+from beatsync_utils import get_cache_info
+
+
+def write_file(path: str, data: bytes) -> str:
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def test_result_key():
+    """同内容不同文件名的组合键相同；dance/bgm互换、内容或流程版本不同时键不同"""
+    with tempfile.TemporaryDirectory() as tmp:
+        dance = write_file(os.path.join(tmp, "a_dance.mp4"), b"dance")
+        bgm = write_file(os.path.join(tmp, "a_bgm.mp4"), b"bgm")
+        dance2 = write_file(os.path.join(tmp, "b_dance.mp4"), b"dance")
+        other = write_file(os.path.join(tmp, "c_bgm.mp4"), b"other")
+        key = result_cache_key(dance, bgm)
+        assert key == result_cache_key(dance2, bgm)
+        assert len({key, result_cache_key(bgm, dance), result_cache_key(dance, other),
+                    result_cache_key(dance, bgm, version="pipeline_test")}) == 4
+
+
+def test_store_and_link():
+    """两个版本都成功时缓存；命中时硬链接到新任务目录，原任务目录删除后仍可命中"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResultCache(os.path.join(tmp, "cache"))
+        task_dir = os.path.join(tmp, "task1")
+        os.makedirs(task_dir)
+        outputs = {version: write_file(os.path.join(task_dir, output_name("task1", version)), version.encode())
+                   for version in ["modular", "v2"]}
+
+        assert not cache.store_outputs("result_k", {"modular": outputs["modular"]})
+        assert cache.link_outputs("result_k", task_dir, "x") is None
+        assert cache.store_outputs("result_k", outputs)
+        shutil.rmtree(task_dir)
+
+        new_dir = os.path.join(tmp, "task2")
+        os.makedirs(new_dir)
+        linked = cache.link_outputs("result_k", new_dir, "task2")
+        assert linked == {version: os.path.join(new_dir, output_name("task2", version))
+                          for version in ["modular", "v2"]}
+        for version, path in linked.items():
+            with open(path, "rb") as f:
+                assert f.read() == version.encode()
+        cached = cache.index.lookup("result_k_v2")
+        assert os.stat(cached).st_ino == os.stat(linked["v2"]).st_ino
+        assert os.path.dirname(cached) == os.path.join(tmp, "cache", "results")
+        assert cache.index.totals()[0] == 2 and get_cache_info(os.path.join(tmp, "cache"))['file_count'] == 0
+
+
+def test_partial_eviction():
+    """任一版本已被淘汰时不命中，也不在任务目录留下部分输出"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResultCache(os.path.join(tmp, "cache"))
+        outputs = {version: write_file(os.path.join(tmp, f"{version}.mp4"), version.encode())
+                   for version in ["modular", "v2"]}
+        assert cache.store_outputs("result_k", outputs)
+        os.remove(cache.index.lookup("result_k_v2"))
+
+        task_dir = os.path.join(tmp, "task")
+        os.makedirs(task_dir)
+        assert cache.link_outputs("result_k", task_dir, "task") is None
+        assert os.listdir(task_dir) == []
+
+
+def test_inflight_claims():
+    """相同组合并发登记时只有一个任务成功，其余得到该任务；注销后可重新登记，只注销自己的登记"""
+    inflight = InflightTasks()
+    results = {}
+    barrier = threading.Barrier(8)
+
+    def submit(i):
+        barrier.wait()
+        results[i] = inflight.claim("result_k", f"task{i}", (f"dance{i}", f"bgm{i}"))
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    owners = [i for i, existing in results.items() if existing is None]
+    assert len(owners) == 1
+    owner = f"task{owners[0]}"
+    assert all(existing == (owner, (f"dance{owners[0]}", f"bgm{owners[0]}"))
+               for existing in results.values() if existing is not None)
+    assert inflight.get("result_k") == owner
+
+    inflight.release("result_k", "task_other")
+    assert inflight.get("result_k") == owner
+    inflight.release("result_k", owner)
+    assert inflight.get("result_k") is None
+    assert inflight.claim("result_k", "task_new") is None
+
+
+def main():
+    tests = [
+        test_result_key,
+        test_store_and_link,
+        test_partial_eviction,
+        test_inflight_claims,
+    ]
+    failed = 0
+    for test in tests:
+        print(f"运行 {test.__name__} ...")
+        try:
+            test()
+            print(f"  ✅ 通过")
+        except AssertionError as e:
+            failed += 1
+            print(f"  ❌ 失败: {e}")
+    print(f"\n结果: {len(tests) - failed}/{len(tests)} 通过")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+numba 内核预热测试：缓存目录配置、冷编译耗时记录、阶段耗时报告（只读缓存状态，不运行预热）
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+import beatsync_warmup
+from beatsync_warmup import configure_numba_cache, read_cold_seconds, write_cold_seconds, report_kernel_cache
+
+
+def test_configure_cache_dir():
+    """显式指定的目录被创建并设置为 NUMBA_CACHE_DIR"""
+    saved = os.environ.get("NUMBA_CACHE_DIR")
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            cache_dir = os.path.join(tmp, "numba")
+            assert configure_numba_cache(cache_dir) == cache_dir
+            assert os.path.isdir(cache_dir) and os.environ["NUMBA_CACHE_DIR"] == cache_dir
+            # 未显式指定时不覆盖已设置的目录
+            assert configure_numba_cache() == cache_dir
+    finally:
+        if saved is None:
+            os.environ.pop("NUMBA_CACHE_DIR", None)
+        else:
+            os.environ["NUMBA_CACHE_DIR"] = saved
+        configure_numba_cache(saved)
+
+
+def test_cold_seconds_record():
+    """冷编译耗时按 numba/librosa 版本记录，版本变化后失效"""
+    with tempfile.TemporaryDirectory() as tmp:
+        assert read_cold_seconds(tmp) is None
+        write_cold_seconds(tmp, 12.5)
+        assert read_cold_seconds(tmp) == 12.5
+        record = os.path.join(tmp, beatsync_warmup.RECORD_NAME)
+        with open(record, "w", encoding="utf-8") as f:
+            f.write('{"cold_seconds": 12.5, "versions": {"numba": "0.0"}}')
+        assert read_cold_seconds(tmp) is None
+    assert read_cold_seconds(None) is None
+
+
+def test_report_kernel_cache():
+    """缓存中有编译好的内核且有冷编译记录时报告节省的时间；缓存为空时为0（记录不可信）"""
+    with tempfile.TemporaryDirectory() as tmp:
+        write_cold_seconds(tmp, 12.5)
+        timings = {}
+        assert report_kernel_cache(timings, cache_dir=tmp) is None and timings == {'kernels_saved': 0.0}
+        kernel_dir = os.path.join(tmp, "librosa_0")
+        os.makedirs(kernel_dir)
+        open(os.path.join(kernel_dir, "beat.py.nbi"), "wb").close()
+        assert report_kernel_cache(timings, cache_dir=tmp) == 12.5 and timings['kernels_saved'] == 12.5
+        assert sorted(os.listdir(tmp)) == [beatsync_warmup.RECORD_NAME, "librosa_0"]
+
+
+def main():
+    tests = [test_configure_cache_dir, test_cold_seconds_record, test_report_kernel_cache]
+    failed = 0
+    for test in tests:
+        print(f"运行 {test.__name__} ...")
+        try:
+            test()
+            print(f"  ✅ 通过")
+        except AssertionError as e:
+            failed += 1
+            print(f"  ❌ 失败: {e}")
+    print(f"\n结果: {len(tests) - failed}/{len(tests)} 通过")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
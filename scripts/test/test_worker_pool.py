@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+常驻工作进程池测试：预启动工作进程、按任务数替换工作进程、失效后重建、预热函数、任务处理时限
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+import beatsync_worker_pool
+from beatsync_worker_pool import (create_worker_pool, warm_up_pool, get_worker_pool, warm_up_worker,
+                                  run_with_time_limit, PipelineTimeout)
+
+
+def test_warm_up_pool_starts_workers():
+    """提前启动全部工作进程，任务在已启动的进程中执行"""
+    pool = create_worker_pool(size=2, max_tasks_per_worker=0, warm_up=False)
+    try:
+        pids = set(warm_up_pool(pool))
+        assert len(pids) == 2 and os.getpid() not in pids
+        assert pool.submit(os.getpid).result() in pids
+    finally:
+        pool.shutdown()
+
+
+def test_worker_recycled():
+    """每个工作进程处理 max_tasks_per_worker 个任务后被替换"""
+    pool = create_worker_pool(size=1, max_tasks_per_worker=2, warm_up=False)
+    try:
+        pids = [pool.submit(os.getpid).result() for _ in range(4)]
+        assert pids[0] == pids[1] and pids[2] == pids[3] and pids[0] != pids[2], pids
+    finally:
+        pool.shutdown()
+
+
+def test_shared_pool_recreated():
+    """共享进程池关闭（如超时后被结束）后，下次获取时重建"""
+    os.environ[beatsync_worker_pool.POOL_SIZE_ENV] = "1"
+    try:
+        pool = get_worker_pool()
+        assert get_worker_pool() is pool
+        pool.shutdown(wait=True)
+        new_pool = get_worker_pool()
+        assert new_pool is not pool and new_pool._max_workers == 1
+    finally:
+        beatsync_worker_pool.shutdown_worker_pool()
+        del os.environ[beatsync_worker_pool.POOL_SIZE_ENV]
+
+
+def test_time_limit_interrupts_task_only():
+    """超时在工作进程内中断任务，工作进程保留并继续处理之后的任务"""
+    pool = create_worker_pool(size=1, max_tasks_per_worker=0, warm_up=False)
+    try:
+        pid = pool.submit(os.getpid).result()
+        start = time.monotonic()
+        try:
+            pool.submit(run_with_time_limit, time.sleep, 0.3, 10).result()
+            assert False, "应当抛出 PipelineTimeout"
+        except PipelineTimeout:
+            pass
+        assert time.monotonic() - start < 5
+        assert pool.submit(run_with_time_limit, os.getpid, 5).result() == pid
+    finally:
+        pool.shutdown()
+
+
+def test_time_limit_excludes_queue_time():
+    """时限从任务开始执行时计时：在进程池中排队的时间不计入"""
+    pool = create_worker_pool(size=1, max_tasks_per_worker=0, warm_up=False)
+    try:
+        futures = [pool.submit(run_with_time_limit, time.sleep, 1.0, 0.6) for _ in range(3)]
+        for future in futures:
+            future.result()  # 后两个任务排队超过1秒，但执行只用0.6秒
+    finally:
+        pool.shutdown()
+
+
+def test_time_limit_fires_once():
+    """超时只抛出一次：任务的 finally 清理耗时超过1秒也不会再被打断"""
+    cleaned = []
+
+    def slow_cleanup():
+        try:
+            time.sleep(10)
+        finally:
+            time.sleep(1.5)
+            cleaned.append(True)
+
+    try:
+        run_with_time_limit(slow_cleanup, 0.2)
+        assert False, "应当抛出 PipelineTimeout"
+    except PipelineTimeout:
+        pass
+    assert cleaned == [True]
+
+
+def test_warm_up_worker():
+    """预热函数可以在当前进程直接运行（节拍检测不报错）"""
+    warm_up_worker()
+
+
+def main():
+    tests = [
+        test_warm_up_pool_starts_workers,
+        test_worker_recycled,
+        test_shared_pool_recreated,
+        test_time_limit_interrupts_task_only,
+        test_time_limit_excludes_queue_time,
+        test_time_limit_fires_once,
+        test_warm_up_worker,
+    ]
+    failed = 0
+    for test in tests:
+        print(f"运行 {test.__name__} ...")
+        try:
+            test()
+            print(f"  ✅ 通过")
+        except AssertionError as e:
+            failed += 1
+            print(f"  ❌ 失败: {e}")
+    print(f"\n结果: {len(tests) - failed}/{len(tests)} 通过")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+任务临时工作区测试：唯一目录、/dev/shm 优先与回退、空间预留、并发任务的中间文件互不覆盖
+并发测试使用替身 ffmpeg：解码时输出 .npy 音频，合成时记录输入参数并写出输出文件
+"""
+
+import io
+import os
+import sys
+import json
+import stat
+import tempfile
+import threading
+import contextlib
+from pathlib import Path
+
+import numpy as np
+
+# 添加项目根目录到路径
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+import beatsync_workspace
+from beatsync_workspace import TaskWorkspace, own_workspace, estimate_scratch_bytes
+
+FAKE_FFMPEG = """#!{python}
+import os
+import sys
+import json
+import numpy as np
+args = sys.argv[1:]
+if args[-1] == 'pipe:1':
+    audio = np.load(args[args.index('-i') + 1]).astype('<f4')
+    channels = int(args[args.index('-ac') + 1])
+    audio = np.repeat(audio[:, None], channels, axis=1)
+    sys.stdout.buffer.write(np.ascontiguousarray(audio).tobytes())
+    sys.exit(0)
+inputs = [args[i + 1] for i, a in enumerate(args) if a == '-i']
+with open(args[-1] + '.json', 'w') as f:
+    json.dump({{'inputs': inputs, 'exists': [os.path.exists(p) for p in inputs]}}, f)
+with open(args[-1], 'wb') as f:
+    f.write(b'video')
+"""
+
+
+@contextlib.contextmanager
+def fake_ffmpeg():
+    """临时把替身 ffmpeg 放到 PATH 最前面"""
+    with tempfile.TemporaryDirectory() as tmp:
+        script = os.path.join(tmp, "ffmpeg")
+        with open(script, "w") as f:
+            f.write(FAKE_FFMPEG.format(python=sys.executable))
+        os.chmod(script, os.stat(script).st_mode | stat.S_IEXEC)
+        old_path = os.environ.get("PATH", "")
+        os.environ["PATH"] = tmp + os.pathsep + old_path
+        try:
+            yield tmp
+        finally:
+            os.environ["PATH"] = old_path
+
+
+def test_unique_and_cleanup():
+    """每个工作区是独立的唯一目录，cleanup 删除目录并释放预留（可重复调用）"""
+    before = dict(beatsync_workspace._reserved)
+    first, second = TaskWorkspace(1024), TaskWorkspace(1024)
+    try:
+        assert first.path != second.path and os.path.isdir(first.path) and os.path.isdir(second.path)
+        assert first.file("a.wav").startswith(first.path + os.sep)
+        with open(first.file("a.wav"), "wb") as f:
+            f.write(b"\0" * 1000)
+        assert first.used_bytes() == 1000 and second.used_bytes() == 0
+        assert beatsync_workspace._reserved[first.root] >= 2048
+    finally:
+        path = first.path
+        first.cleanup()
+        first.cleanup()
+        second.cleanup()
+    assert not os.path.exists(path) and beatsync_workspace._reserved == before
+    with TaskWorkspace(1024) as workspace:
+        path = workspace.path
+    assert not os.path.exists(path)
+
+
+def test_prefers_shm_and_falls_back():
+    """空间足够时使用 /dev/shm，所需空间超过剩余空间时回退到系统临时目录"""
+    with TaskWorkspace(1024) as workspace:
+        if os.path.isdir(beatsync_workspace.SHM_DIR) and os.access(beatsync_workspace.SHM_DIR, os.W_OK) \
+                and workspace.free_bytes() > beatsync_workspace.SHM_RESERVE_BYTES + 1024:
+            assert workspace.on_tmpfs and workspace.root == beatsync_workspace.SHM_DIR
+    with TaskWorkspace(1 << 60) as workspace:
+        assert not workspace.on_tmpfs and workspace.root == tempfile.gettempdir()
+
+
+def test_scratch_dir_override():
+    """BEATSYNC_SCRATCH_DIR 指定根目录"""
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ[beatsync_workspace.SCRATCH_DIR_ENV] = tmp
+        try:
+            with TaskWorkspace() as workspace:
+                assert os.path.dirname(workspace.path) == tmp
+        finally:
+            del os.environ[beatsync_workspace.SCRATCH_DIR_ENV]
+
+
+def test_own_workspace_and_estimate():
+    """传入的工作区由调用方清理，未传入时创建临时的；所需空间按输入大小估算"""
+    with TaskWorkspace(1024) as workspace:
+        assert own_workspace(workspace) == (workspace, False)
+    created, owned = own_workspace(None)
+    assert owned and os.path.isdir(created.path)
+    created.cleanup()
+    with tempfile.NamedTemporaryFile() as f:
+        f.write(b"\0" * 1000)
+        f.flush()
+        assert estimate_scratch_bytes(f.name, "missing.mp4", factor=2.0, extra=10) == 2010
+
+
+def test_concurrent_aligned_videos():
+    """并发创建对齐视频：组合音频写在各自的工作区，不写当前目录，结束后删除"""
+    from beatsync_fine_cut_modular import create_aligned_video
+
+    sr = 100
+    with fake_ffmpeg() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        bgm = os.path.join(tmp, "bgm.npy")
+        np.save(bgm, np.linspace(-0.5, 0.5, 3 * sr, dtype=np.float32))
+        cwd_before = set(os.listdir("."))
+        workspaces = [TaskWorkspace(1024) for _ in range(4)]
+        outputs = [os.path.join(tmp, f"out_{i}.mp4") for i in range(4)]
+        results = [None] * 4
+
+        def run(i):
+            results[i] = create_aligned_video("dance.mp4", bgm, outputs[i], ref_start=i * 10, mov_start=0, sr=sr,
+                                              workspace=workspaces[i])
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        try:
+            assert results == [True] * 4, results
+            combined = []
+            for workspace, output in zip(workspaces, outputs):
+                with open(output + ".json") as f:
+                    record = json.load(f)
+                audio_path = record["inputs"][1]
+                assert record["exists"] == [False, True]
+                assert os.path.dirname(audio_path) == workspace.path and not os.path.exists(audio_path)
+                combined.append(audio_path)
+            assert len(set(combined)) == 4
+            assert set(os.listdir(".")) == cwd_before
+        finally:
+            for workspace in workspaces:
+                workspace.cleanup()
+
+
+def main():
+    tests = [
+        test_unique_and_cleanup,
+        test_prefers_shm_and_falls_back,
+        test_scratch_dir_override,
+        test_own_workspace_and_estimate,
+        test_concurrent_aligned_videos,
+    ]
+    failed = 0
+    for test in tests:
+        print(f"运行 {test.__name__} ...")
+        try:
+            test()
+            print(f"  ✅ 通过")
+        except AssertionError as e:
+            failed += 1
+            print(f"  ❌ 失败: {e}")
+    print(f"\n结果: {len(tests) - failed}/{len(tests)} 通过")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
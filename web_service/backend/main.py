@@ -11,6 +11,7 @@ import tempfile
 import shutil
 import threading
 import json
+import contextlib
 from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Optional, Dict
@@ -83,6 +84,9 @@ UPLOAD_DIR = project_root / "outputs" / "web_uploads"
 OUTPUT_DIR = project_root / "outputs" / "web_outputs"
 CLEANUP_AGE_HOURS = 24  # 24小时后清理临时文件
 WEB_OUTPUTS_RETENTION_DAYS = 3  # Web输出保留3天
+# 处理结果缓存：放在处理器缓存目录的 results 子目录中，有自己的索引与上限；BEATSYNC_RESULT_CACHE=0 关闭
+RESULT_CACHE_DIR = project_root / ".beatsync_cache"
+RESULT_CACHE_ENABLED = os.getenv("BEATSYNC_RESULT_CACHE", "1") != "0"
 
 # 确保目录存在
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
@@ -93,6 +97,28 @@ TASK_STATUS_FILE = project_root / "outputs" / "task_status.json"
 task_status: Dict[str, dict] = {}
 task_lock = threading.RLock()  # 使用可重入锁，避免死锁
 
+# 正在处理的 (dance, bgm) 组合（按内容），相同组合的重复提交关联到已有任务
+from beatsync_result_cache import ResultCache, InflightTasks, result_cache_key
+inflight_tasks = InflightTasks()
+
+def use_parallel_mode() -> bool:
+    """两个版本是否并行处理：CPU核心数>=2时启用（串行处理总耗时更长）"""
+    return (os.cpu_count() or 2) >= 2
+
+
+def task_slot_count(pool_size: int, parallel: bool) -> int:
+    """
+    同时处理的任务数：并行模式下每个任务同时占用两个工作进程，串行模式下占用一个，
+    不超过共享进程池的容量（默认2个工作进程、并行模式时为1个任务，需要更多并发时调大
+    BEATSYNC_WORKER_POOL_SIZE）；超出的任务在这里排队（不进入进程池排队，避免挤占正在运行的任务）
+    """
+    workers_per_task = 2 if parallel else 1
+    return max(1, pool_size // workers_per_task)
+
+
+from beatsync_worker_pool import configured_pool_size
+task_slots = threading.BoundedSemaphore(task_slot_count(configured_pool_size(), use_parallel_mode()))
+
 # 订阅系统认证（可选认证，允许无认证请求）
 security = HTTPBearer(auto_error=False)
 
@@ -263,6 +289,7 @@ async def upload_video(
         file_id: 文件ID（用于后续处理）
         filename: 文件名
         size: 文件大小（字节）
+        sha256: 文件内容摘要（处理时按内容命中缓存，同一视频重新上传不再重复解码）
     """
     import sys
     print(f"INFO: 收到上传请求 - file_type: {file_type}, filename: {file.filename if file else 'None'}", file=sys.stderr, flush=True)
@@ -294,8 +321,10 @@ async def upload_video(
     import sys
     print(f"INFO: 开始保存文件 - file_id: {file_id}, path: {file_path}", file=sys.stderr, flush=True)
     
-    # 保存文件
+    # 保存文件（边写边计算内容摘要，处理时不再重新读取整个文件）
     try:
+        from beatsync_digest import new_digest, remember_digest
+        digest = new_digest()
         file_size = 0
         with open(file_path, "wb") as f:
             while True:
@@ -303,16 +332,20 @@ async def upload_video(
                 if not chunk:
                     break
                 f.write(chunk)
+                digest.update(chunk)
                 file_size += len(chunk)
+        content_digest = digest.hexdigest()
+        remember_digest(str(file_path), content_digest)
         
         import sys
-        print(f"INFO: 文件保存成功 - file_id: {file_id}, size: {file_size} bytes", file=sys.stderr, flush=True)
+        print(f"INFO: 文件保存成功 - file_id: {file_id}, size: {file_size} bytes, sha256: {content_digest[:12]}", file=sys.stderr, flush=True)
         
         result = {
             "file_id": file_id,
             "file_type": file_type,
             "filename": file.filename,
             "size": file_size,
+            "sha256": content_digest,
             "message": "文件上传成功"
         }
         print(f"INFO: 返回上传响应: {result}", file=sys.stderr, flush=True)
@@ -382,14 +415,14 @@ def process_video_background(task_id: str, dance_path: Path, bgm_path: Path, out
                 if perf_logger:
                     perf_logger.log_step("启动并行处理线程")
                 
-                # 检测CPU核心数，决定是否启用并行模式
+                # 检测CPU核心数，决定是否启用并行模式（与 task_slots 的名额计算相同）
                 import os
                 cpu_count = os.cpu_count() or 2
                 # 测试结果：串行处理反而更慢（总耗时更长）
                 # 并行处理：本地52秒，线上132秒（总耗时）
                 # 串行处理：本地100秒，线上180秒（总耗时）
                 # 结论：保持并行处理模式，总耗时更短
-                use_parallel = cpu_count >= 2  # 如果CPU核心数>=2，启用并行模式
+                use_parallel = use_parallel_mode()  # 如果CPU核心数>=2，启用并行模式
                 
                 if perf_logger:
                     perf_logger.log_step(f"CPU核心数: {cpu_count}, 并行模式: {use_parallel}")
@@ -399,7 +432,8 @@ def process_video_background(task_id: str, dance_path: Path, bgm_path: Path, out
                     str(bgm_path),
                     str(output_dir),
                     task_id,
-                    parallel=use_parallel  # 根据CPU核心数自动启用并行模式
+                    parallel=use_parallel,  # 根据CPU核心数自动启用并行模式
+                    executor=get_shared_worker_pool()  # 常驻的预热工作进程池（不可用时为None，本次新建）
                 )
                 processing_success[0] = success
                 if perf_logger:
@@ -422,29 +456,21 @@ def process_video_background(task_id: str, dance_path: Path, bgm_path: Path, out
         modular_output = output_dir / f"{task_id}_modular.mp4"
         v2_output = output_dir / f"{task_id}_v2.mp4"
         
-        # 也检查中间文件（modular版本可能生成中间文件）
-        modular_intermediate = output_dir / f"{task_id}_modular_module1_aligned.mp4"
-        
         check_interval = 10  # 10秒检查一次
         last_check_time = time.time()
         
         while not processing_done.is_set():
             current_time = time.time()
             if current_time - last_check_time >= check_interval:
-                # 检查输出文件（modular版本只检查最终文件，不接受中间文件）
+                # 检查输出文件（中间文件在任务工作区中，处理结束后清理，这里只看最终文件）
                 modular_final_exists = modular_output.exists() and modular_output.stat().st_size > 0
-                modular_intermediate_exists = modular_intermediate.exists() and modular_intermediate.stat().st_size > 0
                 v2_exists = v2_output.exists() and v2_output.stat().st_size > 0
                 
-                # 如果只有中间文件，记录警告
-                if modular_intermediate_exists and not modular_final_exists:
-                    print(f"WARNING: Modular版本只生成了中间文件，模块2可能失败")
-                
                 # 更新状态
                 with task_lock:
                     status = task_status.get(task_id, {})
                     
-                    # 更新modular状态（使用modular_final_exists，因为这里只检查最终文件）
+                    # 更新modular状态
                     if modular_final_exists and status.get("modular_status") != "success":
                         status["modular_status"] = "success"
                         status["modular_output"] = str(modular_output)
@@ -481,25 +507,19 @@ def process_video_background(task_id: str, dance_path: Path, bgm_path: Path, out
         if perf_logger:
             perf_logger.log_step("等待处理线程完成")
         
-        # 最终检查输出文件（包括中间文件）
+        # 最终检查输出文件
         modular_final_exists = modular_output.exists() and modular_output.stat().st_size > 0
-        modular_intermediate_exists = modular_intermediate.exists() and modular_intermediate.stat().st_size > 0
-        modular_exists = modular_final_exists or modular_intermediate_exists
         v2_exists = v2_output.exists() and v2_output.stat().st_size > 0
         
         if perf_logger:
             if modular_final_exists:
-                perf_logger.log_file_operation("检查输出文件（最终）", str(modular_output),
+                perf_logger.log_file_operation("检查输出文件", str(modular_output),
                                              modular_output.stat().st_size)
-            elif modular_intermediate_exists:
-                perf_logger.log_file_operation("检查输出文件（中间）", str(modular_intermediate),
-                                             modular_intermediate.stat().st_size)
             if v2_exists:
                 perf_logger.log_file_operation("检查输出文件", str(v2_output),
                                              v2_output.stat().st_size)
         
         # 更新最终状态
-        # 注意：modular版本必须输出最终文件，不接受中间文件
         # 优先检查文件是否存在，即使处理过程中有异常，只要文件生成了就认为成功
         try:
             if modular_final_exists or v2_exists:
@@ -513,14 +533,7 @@ def process_video_background(task_id: str, dance_path: Path, bgm_path: Path, out
                     result["modular_output"] = str(modular_output)
                     result["modular_status"] = "success"
                 else:
-                    # 如果只有中间文件，认为失败
-                    if modular_intermediate_exists:
-                        print(f"ERROR: Modular版本只生成了中间文件，未生成最终输出文件")
-                        print(f"ERROR: 中间文件: {modular_intermediate}")
-                        print(f"ERROR: 这表示模块2（裁剪模块）失败")
                     result["modular_status"] = "failed"
-                    if modular_intermediate_exists:
-                        result["modular_error"] = "模块2失败，只生成了中间文件，未生成最终输出"
                 
                 if v2_exists:
                     result["v2_output"] = str(v2_output)
@@ -715,6 +728,57 @@ def process_video_background(task_id: str, dance_path: Path, bgm_path: Path, out
             save_task_status()  # 保存到文件
 
 
+def get_result_cache() -> Optional[ResultCache]:
+    """返回处理结果缓存，未开启或不可用时返回None"""
+    if not RESULT_CACHE_ENABLED:
+        return None
+    try:
+        return ResultCache(str(RESULT_CACHE_DIR))
+    except Exception as e:
+        print(f"WARNING: 结果缓存不可用: {e}")
+        return None
+
+
+@contextlib.contextmanager
+def task_slot(task_id: str):
+    """占用一个处理名额；没有空闲名额时把任务标记为排队中并等待"""
+    if not task_slots.acquire(blocking=False):
+        with task_lock:
+            task_status.setdefault(task_id, {}).update({
+                "status": "pending",
+                "message": "排队中，等待空闲的处理进程..."
+            })
+        save_task_status()
+        print(f"INFO: 任务排队等待处理名额: {task_id}")
+        task_slots.acquire()
+    try:
+        yield
+    finally:
+        task_slots.release()
+
+
+def process_and_cache_background(task_id: str, dance_path: Path, bgm_path: Path, output_dir: Path,
+                                 result_key: Optional[str] = None):
+    """后台处理；两个版本都成功时缓存输出，结束后注销进行中的登记（之后的相同提交直接命中缓存）"""
+    try:
+        with task_slot(task_id):
+            process_video_background(task_id, dance_path, bgm_path, output_dir)
+        if result_key is None:
+            return
+        with task_lock:
+            status = dict(task_status.get(task_id, {}))
+        if status.get("modular_status") == "success" and status.get("v2_status") == "success":
+            result_cache = get_result_cache()
+            if result_cache is not None and result_cache.store_outputs(
+                    result_key, {"modular": status.get("modular_output"), "v2": status.get("v2_output")}):
+                print(f"INFO: 处理结果已缓存: {task_id}")
+    except Exception as e:
+        print(f"WARNING: 缓存处理结果失败: {e}")
+    finally:
+        if result_key is not None:
+            inflight_tasks.release(result_key, task_id)
+
+
 @app.post("/api/process")
 async def process_video(
     dance_file_id: str = Form(...),
@@ -730,9 +794,11 @@ async def process_video(
         authorization: 可选的用户Token（用于订阅系统）
     
     返回:
-        task_id: 任务ID
-        status: 任务状态（pending）
+        task_id: 任务ID（相同的视频组合正在处理时为该任务的ID）
+        status: 任务状态（pending；命中结果缓存时为success）
         message: 提示信息
+        cached: 是否直接使用了缓存的处理结果
+        deduplicated: 是否关联到了正在处理的相同任务
     """
     import sys
     import time
@@ -812,7 +878,46 @@ async def process_video(
         print(f"INFO: [步骤2] 创建输出目录完成 (耗时{time.time()-step_time:.3f}s): {output_dir}", file=sys.stderr, flush=True)
         sys.stderr.flush()
         
-        # 记录处理次数（如果订阅系统启用且有用户ID）
+        # 按内容去重：相同组合正在处理时关联到该任务；处理过时直接返回缓存的结果
+        # （上传时已算好内容摘要，这里不再读取文件）
+        result_key = None
+        if RESULT_CACHE_ENABLED:
+            try:
+                result_key = result_cache_key(str(dance_path), str(bgm_path))
+            except Exception as key_error:
+                print(f"WARNING: 计算结果缓存键失败，不去重: {key_error}", file=sys.stderr, flush=True)
+        if result_key is not None:
+            existing = inflight_tasks.claim(result_key, task_id, (dance_path, bgm_path))
+            if existing is not None:
+                existing_task_id, existing_inputs = existing
+                shutil.rmtree(output_dir, ignore_errors=True)
+                with task_lock:
+                    existing_status = task_status.get(existing_task_id, {}).get("status", "pending")
+                # 重新上传的同一视频不再需要（重复点击时是同一组文件，由已有任务处理后清理）
+                for path in (dance_path, bgm_path):
+                    if path not in existing_inputs and path.exists():
+                        path.unlink()
+                result = {
+                    "task_id": existing_task_id,
+                    "status": existing_status,
+                    "message": "相同的视频正在处理，已关联到该任务",
+                    "deduplicated": True
+                }
+                print(f"INFO: [API/process] 关联到进行中的任务 {existing_task_id} "
+                      f"(耗时{time.time()-start_time:.3f}s)", file=sys.stderr, flush=True)
+                return JSONResponse(content=result)
+        
+        # 结果缓存：命中时把输出硬链接到新任务目录，不再启动处理
+        result_cache = get_result_cache() if result_key is not None else None
+        cached_outputs = None
+        if result_cache is not None:
+            try:
+                cached_outputs = result_cache.link_outputs(result_key, str(output_dir), task_id)
+            except Exception as cache_error:
+                print(f"WARNING: 读取结果缓存失败: {cache_error}", file=sys.stderr, flush=True)
+        
+        # 记录处理次数（如果订阅系统启用且有用户ID），在去重与结果缓存检查之后：
+        # 关联到进行中的任务不计数（该任务提交时已计数）；命中结果缓存计数（用户得到一个新的处理结果，与服务端是否缓存无关）
         if SUBSCRIPTION_AVAILABLE and user_id:
             try:
                 record_process(user_id, task_id)
@@ -820,6 +925,35 @@ async def process_video(
                 print(f"WARNING: 记录处理次数失败: {record_error}", file=sys.stderr, flush=True)
                 # 记录失败不影响处理流程
         
+        if cached_outputs is not None:
+            inflight_tasks.release(result_key, task_id)
+            now = datetime.now().isoformat()
+            with task_lock:
+                task_status[task_id] = {
+                    "status": "success",
+                    "message": "处理完成",
+                    "created_at": now,
+                    "completed_at": now,
+                    "modular_status": "success",
+                    "modular_output": cached_outputs["modular"],
+                    "v2_status": "success",
+                    "v2_output": cached_outputs["v2"],
+                    "cached": True
+                }
+            save_task_status()
+            for path in (dance_path, bgm_path):
+                if path.exists():
+                    path.unlink()
+            result = {
+                "task_id": task_id,
+                "status": "success",
+                "message": "相同的视频已处理过，直接返回结果",
+                "cached": True
+            }
+            print(f"INFO: [API/process] 命中结果缓存 (耗时{time.time()-start_time:.3f}s): {task_id}",
+                  file=sys.stderr, flush=True)
+            return JSONResponse(content=result)
+        
         # 初始化任务状态（快速操作，使用锁但快速释放）
         step_time = time.time()
         try:
@@ -842,13 +976,15 @@ async def process_video(
         step_time = time.time()
         try:
             thread = threading.Thread(
-                target=process_video_background,
-                args=(task_id, dance_path, bgm_path, output_dir),
+                target=process_and_cache_background,
+                args=(task_id, dance_path, bgm_path, output_dir, result_key),
                 daemon=True  # 设置为守护线程，主进程退出时自动退出
             )
             thread.start()
             print(f"INFO: [步骤4] 后台处理线程已启动 (耗时{time.time()-step_time:.3f}s): {task_id}", file=sys.stderr, flush=True)
         except Exception as thread_error:
+            if result_key is not None:
+                inflight_tasks.release(result_key, task_id)
             print(f"ERROR: 启动后台处理线程失败: {thread_error}", file=sys.stderr, flush=True)
             import traceback
             traceback.print_exc(file=sys.stderr)
@@ -968,10 +1104,9 @@ async def preview_result(task_id: str, version: Optional[str] = None):
         raise HTTPException(status_code=404, detail="任务不存在")
     
     modular_output = output_dir / f"{task_id}_modular.mp4"
-    modular_intermediate = output_dir / f"{task_id}_modular_module1_aligned.mp4"
     v2_output = output_dir / f"{task_id}_v2.mp4"
     
-    # 根据version参数选择文件（优先使用最终文件，如果没有则使用中间文件）
+    # 根据version参数选择文件
     if version == "v2" and v2_output.exists():
         output_file = v2_output
         filename = f"v2_{task_id}.mp4"
@@ -979,9 +1114,6 @@ async def preview_result(task_id: str, version: Optional[str] = None):
         if modular_output.exists():
             output_file = modular_output
             filename = f"modular_{task_id}.mp4"
-        elif modular_intermediate.exists():
-            output_file = modular_intermediate
-            filename = f"modular_{task_id}_intermediate.mp4"
         else:
             raise HTTPException(status_code=404, detail="Modular版本输出文件不存在")
     elif modular_output.exists():
@@ -1041,10 +1173,9 @@ async def download_result(
         raise HTTPException(status_code=404, detail="任务不存在")
     
     modular_output = output_dir / f"{task_id}_modular.mp4"
-    modular_intermediate = output_dir / f"{task_id}_modular_module1_aligned.mp4"
     v2_output = output_dir / f"{task_id}_v2.mp4"
     
-    # 根据version参数选择文件（优先使用最终文件，如果没有则使用中间文件）
+    # 根据version参数选择文件
     if version == "v2" and v2_output.exists():
         output_file = v2_output
         filename = f"v2_{task_id}.mp4"
@@ -1052,9 +1183,6 @@ async def download_result(
         if modular_output.exists():
             output_file = modular_output
             filename = f"modular_{task_id}.mp4"
-        elif modular_intermediate.exists():
-            output_file = modular_intermediate
-            filename = f"modular_{task_id}_intermediate.mp4"
         else:
             raise HTTPException(status_code=404, detail="Modular版本输出文件不存在")
     elif modular_output.exists():
@@ -1789,6 +1917,16 @@ async def health_check():
     }
 
 
+def get_shared_worker_pool():
+    """返回常驻工作进程池（预加载librosa等库并完成numba预热），创建失败时返回None"""
+    try:
+        from beatsync_worker_pool import get_worker_pool
+        return get_worker_pool()
+    except Exception as e:
+        print(f"WARNING: 工作进程池不可用，改为每个任务新建进程池: {e}")
+        return None
+
+
 # 启动时初始化订阅系统数据库
 @app.on_event("startup")
 async def startup_event():
@@ -1818,6 +1956,30 @@ async def startup_event():
     cleanup_thread = threading.Thread(target=background_cleanup, daemon=True)
     cleanup_thread.start()
     print("INFO: 后台清理任务已启动（不阻塞服务启动）")
+    
+    # 启动常驻工作进程池并预热（后台执行，不阻塞服务启动）
+    def warm_up_workers():
+        pool = get_shared_worker_pool()
+        if pool is None:
+            return
+        try:
+            from beatsync_worker_pool import warm_up_pool
+            pids = warm_up_pool(pool)
+            print(f"INFO: 工作进程池已预热: {len(pids)} 个工作进程")
+        except Exception as e:
+            print(f"WARNING: 工作进程池预热失败: {e}")
+    
+    threading.Thread(target=warm_up_workers, daemon=True).start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """关闭时停止常驻工作进程池"""
+    try:
+        from beatsync_worker_pool import shutdown_worker_pool
+        shutdown_worker_pool()
+    except Exception as e:
+        print(f"WARNING: 关闭工作进程池失败: {e}")
 
 
 def cleanup_old_files():